@@ -17,5 +17,24 @@ function dimAssertions(keyColumn, nameColumn) {
   };
 }
 
-module.exports = { sourceRef, dimAssertions };
+// High-watermark of an incremental model, for its pre_operations: the newest
+// source ModifiedDate it has loaded (its source_modified_date column) less
+// incremental_lookback_days, so rows that reach the source late are merged
+// again. Declared up front so the model's filter compares against a constant.
+// type is the column's BigQuery type; INT64 watermarks have no lookback.
+const WATERMARK_FLOOR = { DATE: "DATE '1900-01-01'", TIMESTAMP: "TIMESTAMP '1900-01-01'", INT64: "0" };
+
+function declareWatermark(target, type) {
+  const days = Number(dataform.projectConfig.vars.incremental_lookback_days || 0);
+  let newest = "MAX(source_modified_date)";
+  if (type === "DATE") {
+    newest = `DATE_SUB(${newest}, INTERVAL ${days} DAY)`;
+  } else if (type === "TIMESTAMP") {
+    newest = `TIMESTAMP_SUB(${newest}, INTERVAL ${days} DAY)`;
+  }
+  // An empty target has no watermark: load everything
+  return `DECLARE source_watermark ${type} DEFAULT (SELECT COALESCE(${newest}, ${WATERMARK_FLOOR[type]}) FROM ${target})`;
+}
+
+module.exports = { sourceRef, dimAssertions, declareWatermark };
 
@@ -1,14 +1,19 @@
 import streamlit as st
 import pandas as pd
-import plotly.express as px
-import plotly.graph_objects as go
 from datetime import datetime
 import os
+import uuid
 from dotenv import load_dotenv
 
 # Import custom modules
 from gemini_client import GeminiClient
 from looker_client import LookerClient
+from large_results import is_large, TABLE_PREVIEW_ROWS
+from result_store import result_store, SessionResults
+from conversation_store import conversation_store
+from render_cache import RenderCache, build_artifacts, message_id, summary_line, HISTORY_RENDER_LAST
+import tracing
+from query_validator import QueryValidationError
 
 # Load environment variables
 load_dotenv()
@@ -24,7 +29,12 @@ st.set_page_config(
 @st.cache_resource
 def init_clients():
     gemini = GeminiClient()
-    looker = LookerClient()
+    if os.getenv('WAREHOUSE_BACKEND', 'looker').lower() == 'local':
+        # Offline: same run_query contract, answered by DuckDB over local Parquet
+        from local_warehouse import LocalWarehouseClient
+        looker = LocalWarehouseClient(catalog=gemini.catalog)
+    else:
+        looker = LookerClient()
     return gemini, looker
 
 # Custom CSS - Enterprise Theme
@@ -140,23 +150,27 @@ st.markdown('<h1 class="main-header">Adventure Works AI Assistant</h1>', unsafe_
 st.markdown('<p class="sub-header">Natural language analytics powered by AI</p>', unsafe_allow_html=True)
 
 # Initialize session state
+# Conversations are persisted in SQLite under a workspace ID kept in the page URL,
+# so a restart or another replica finds them again
+if 'workspace' not in st.session_state:
+    workspace = st.experimental_get_query_params().get('workspace', [None])[0] or uuid.uuid4().hex
+    st.experimental_set_query_params(workspace=workspace)
+    st.session_state.workspace = workspace
 if 'conversations' not in st.session_state:
-    st.session_state.conversations = {}
+    # Metadata only; messages are loaded when a conversation is opened
+    st.session_state.conversations = conversation_store.list_conversations(st.session_state.workspace)
+    if not st.session_state.conversations:
+        first = conversation_store.create_conversation(st.session_state.workspace, 'Chat 1')
+        st.session_state.conversations[first['id']] = first
 if 'active_conversation_id' not in st.session_state:
-    st.session_state.active_conversation_id = 'default'
-    st.session_state.conversations['default'] = {
-        'name': 'Chat 1',
-        'messages': [],
-        'created_at': datetime.now(),
-        'total_queries': 0,
-        'avg_response_time': 0
-    }
-if 'message_counter' not in st.session_state:
-    st.session_state.message_counter = 0
-if 'query_cache' not in st.session_state:
-    st.session_state.query_cache = {}
+    st.session_state.active_conversation_id = list(st.session_state.conversations.keys())[-1]
 if 'show_query_details' not in st.session_state:
     st.session_state.show_query_details = False
+if 'result_store' not in st.session_state:
+    st.session_state.result_store = SessionResults(result_store, loader=conversation_store.load_result)
+if 'render_cache' not in st.session_state:
+    # Charts and download bytes count toward the session's result budget
+    st.session_state.render_cache = RenderCache(results=st.session_state.result_store)
 
 # Initialize clients
 try:
@@ -167,6 +181,24 @@ except Exception as e:
 
 # Get active conversation early for sidebar
 active_conv = st.session_state.conversations[st.session_state.active_conversation_id]
+if not active_conv['loaded']:
+    # Latest page of history; earlier pages load on request
+    active_conv['messages'], active_conv['has_earlier'] = conversation_store.load_messages(active_conv['id'])
+    active_conv['loaded'] = True
+
+
+def add_message(conv, message, df=None, trace=None):
+    """Persist a message (and its result) and append it to the conversation"""
+    # Mock data is never offered for reuse
+    reusable = trace is None or not trace.flags().get('mock_fallback')
+    message['id'] = conversation_store.add_message(conv['id'], message, trace=trace, reusable=reusable)
+    if df is not None:
+        frame = st.session_state.result_store.put(message['id'], df, persisted=True)
+        # A reused result is already stored, under the message it came from
+        if message.get('result_of') is None:
+            conversation_store.save_result(message['id'], frame)
+    conv['messages'].append(message)
+    conv['message_count'] += 1
 
 # Sidebar - Conversation Management
 with st.sidebar:
@@ -176,15 +208,11 @@ with st.sidebar:
     col1, col2 = st.columns([3, 1])
     with col1:
         if st.button("+ New Chat", use_container_width=True, type="primary"):
-            new_id = f"chat_{len(st.session_state.conversations) + 1}"
-            st.session_state.conversations[new_id] = {
-                'name': f"Chat {len(st.session_state.conversations) + 1}",
-                'messages': [],
-                'created_at': datetime.now(),
-                'total_queries': 0,
-                'avg_response_time': 0
-            }
-            st.session_state.active_conversation_id = new_id
+            new_conv = conversation_store.create_conversation(
+                st.session_state.workspace, f"Chat {len(st.session_state.conversations) + 1}"
+            )
+            st.session_state.conversations[new_conv['id']] = new_conv
+            st.session_state.active_conversation_id = new_conv['id']
             st.rerun()
     with col2:
         # Settings toggle
@@ -200,7 +228,7 @@ with st.sidebar:
         with col1:
             is_active = conv_id == st.session_state.active_conversation_id
             if st.button(
-                f"{'●' if is_active else '○'} {conv['name']} ({len(conv['messages'])})",
+                f"{'●' if is_active else '○'} {conv['name']} ({conv['message_count']})",
                 key=f"conv_{conv_id}",
                 use_container_width=True,
                 type="primary" if is_active else "secondary"
@@ -210,6 +238,9 @@ with st.sidebar:
         with col2:
             if len(st.session_state.conversations) > 1:
                 if st.button("×", key=f"delete_{conv_id}"):
+                    st.session_state.render_cache.discard([message_id(m) for m in conv['messages']])
+                    st.session_state.result_store.discard([message_id(m) for m in conv['messages']])
+                    conversation_store.delete_conversation(conv_id)
                     del st.session_state.conversations[conv_id]
                     if conv_id == st.session_state.active_conversation_id:
                         st.session_state.active_conversation_id = list(st.session_state.conversations.keys())[0]
@@ -225,6 +256,22 @@ with st.sidebar:
             st.metric("Queries", active_conv['total_queries'])
         with cols[1]:
             st.metric("Avg Time", f"{active_conv.get('avg_response_time', 0):.1f}s")
+        
+        # Memory used by this session's results (shown with query details)
+        if st.session_state.show_query_details:
+            report = st.session_state.result_store.report()
+            st.caption(
+                f"Results: {report['in_memory']} in memory ({report['memory_bytes'] / 1024 / 1024:.1f} of "
+                f"{report['budget_bytes'] / 1024 / 1024:.0f} MB, {report['render_bytes'] / 1024 / 1024:.1f} MB "
+                f"of it charts and downloads), {report['spilled']} on disk "
+                f"({report['disk_bytes'] / 1024 / 1024:.1f} MB). "
+                f"Downcasting saved {report['downcast_saved_bytes'] / 1024 / 1024:.1f} MB."
+            )
+            # Result cache hit rate per explore
+            explores = looker_client.cache_stats()['explores']
+            if explores:
+                st.caption("Cache hits: " + ", ".join(
+                    f"{name} {stats['hit_rate']:.0%}" for name, stats in sorted(explores.items())))
         st.divider()
     
     st.markdown("### Quick Start")
@@ -247,173 +294,155 @@ with st.sidebar:
     
     st.caption("Data: 2011-2014 | 5 Explores")
 
+def render_answer(msg):
+    """Draw one assistant answer from its memoized render artifacts"""
+    if 'error' in msg:
+        st.error(msg['error'])
+        st.info("**Tip:** Try rephrasing your question or use one of the examples from the sidebar.")
+        return
+    
+    msg_key = message_id(msg)
+    # Read back from disk if it was spilled while out of view
+    df = st.session_state.result_store.get(msg_key)
+    if df is None:
+        st.warning("This result is no longer available. Ask the question again to refresh it.")
+        return
+    
+    # Response metadata
+    response_time = msg.get('response_time', 0)
+    row_count = msg.get('row_count', len(df))
+    # Open until first shown: the chart render is the last span of the question's trace
+    trace = msg.get('trace')
+    pending_trace = trace if trace is not None and not trace.exported else None
+    artifacts = st.session_state.render_cache.get(
+        msg_key, lambda: build_artifacts(df, large=msg.get('large', False), trace=pending_trace)
+    )
+    
+    # Show insights if available
+    if msg.get('insight'):
+        st.markdown(f"**Insight:** {msg['insight']}")
+        st.divider()
+    
+    # Metadata badges
+    col1, col2 = st.columns([1, 1])
+    with col1:
+        st.markdown(f'<span class="status-badge badge-success">{row_count} rows</span>', unsafe_allow_html=True)
+        # Messages loaded from the conversation store carry their trace's flags instead
+        flags = trace.flags() if trace is not None else msg.get('flags', {})
+        if flags.get('mock_fallback'):
+            st.markdown('<span class="status-badge badge-warning">mock data</span>', unsafe_allow_html=True)
+    with col2:
+        st.markdown(f'<span class="status-badge badge-info">{response_time:.2f}s</span>', unsafe_allow_html=True)
+    
+    # Key metrics
+    if artifacts['metrics']:
+        metric_cols = st.columns(len(artifacts['metrics']))
+        for metric_col, (label, formatted) in zip(metric_cols, artifacts['metrics']):
+            with metric_col:
+                st.metric(label=label, value=formatted)
+    
+    st.divider()
+    
+    # Smart Visualization Selection
+    if len(df) > 0 and len(df.columns) >= 2:
+        viz_col1, viz_col2 = st.columns([2, 1])
+        
+        with viz_col1:
+            if artifacts['figure'] is not None:
+                st.plotly_chart(artifacts['figure'], use_container_width=True, key=f"chart_{msg_key}")
+            else:
+                st.info("Chart not generated - query returned data that may need manual visualization.")
+        
+        with viz_col2:
+            # Statistics for numeric columns
+            if artifacts['stats']:
+                st.markdown("**Statistics**")
+                for col_label, col_max, col_min, col_avg in artifacts['stats']:
+                    st.markdown(f"**{col_label}**")
+                    st.markdown(f"Max: {col_max:,.0f}")
+                    st.markdown(f"Min: {col_min:,.0f}")
+                    st.markdown(f"Avg: {col_avg:,.0f}")
+        
+        # Data table (collapsed)
+        with st.expander("View Data Table", expanded=False):
+            download_name = f"results_{msg['timestamp'].strftime('%Y%m%d_%H%M%S')}.csv"
+            if msg.get('large') and len(df) > TABLE_PREVIEW_ROWS:
+                st.dataframe(df.head(TABLE_PREVIEW_ROWS), use_container_width=True, hide_index=True)
+                st.caption(f"First {TABLE_PREVIEW_ROWS:,} of {len(df):,} rows - download for the full result")
+            else:
+                st.dataframe(df, use_container_width=True, hide_index=True)
+            
+            spooled = artifacts['csv_path']
+            if spooled:
+                # Written to disk while streaming; only read when the user asks for it, since
+                # Streamlit holds download data in memory for as long as the button is shown
+                if st.button("Prepare CSV download", key=f"prepare_{msg_key}"):
+                    try:
+                        with open(spooled, 'rb') as f:
+                            st.download_button(
+                                label="Download CSV",
+                                data=f.read(),
+                                file_name=download_name,
+                                mime="text/csv",
+                                key=f"download_{msg_key}"
+                            )
+                    except OSError:
+                        st.warning("The CSV for this result is no longer available. Ask the question again to refresh it.")
+            else:
+                # Download button
+                st.download_button(
+                    label="Download CSV",
+                    data=artifacts['csv'],
+                    file_name=download_name,
+                    mime="text/csv",
+                    key=f"download_{msg_key}"
+                )
+    
+    # Trace is complete once the chart has rendered
+    if pending_trace is not None:
+        tracing.exporter.export(pending_trace)
+    
+    # Show query details if enabled
+    if st.session_state.show_query_details and 'query' in msg:
+        with st.expander("Query Details", expanded=False):
+            st.json(msg['query'])
+            record = trace.to_dict() if trace is not None else msg.get('trace_record')
+            if record is not None:
+                st.markdown(f"**Timing** ({record['total_ms']:.0f} ms)")
+                st.dataframe(
+                    pd.DataFrame(tracing.span_rows(record)),
+                    use_container_width=True,
+                    hide_index=True
+                )
+
+
 # Display conversation history
 if active_conv['messages']:
     st.header(f"{active_conv['name']}")
     
-    for msg in active_conv['messages']:
+    if active_conv['has_earlier']:
+        if st.button("Load earlier messages", key=f"earlier_{active_conv['id']}"):
+            earlier, active_conv['has_earlier'] = conversation_store.load_messages(
+                active_conv['id'], before_id=active_conv['messages'][0]['id']
+            )
+            active_conv['messages'][:0] = earlier
+            st.rerun()
+    
+    # Only the most recent answers are drawn in full; older ones expand on request
+    first_full = max(0, len(active_conv['messages']) - HISTORY_RENDER_LAST)
+    for position, msg in enumerate(active_conv['messages']):
         # User question
         with st.chat_message("user"):
             st.write(msg['question'])
         
         # Assistant response
         with st.chat_message("assistant"):
-            if 'error' in msg:
-                st.error(msg['error'])
-                st.info("**Tip:** Try rephrasing your question or use one of the examples from the sidebar.")
+            if position >= first_full or 'error' in msg:
+                render_answer(msg)
             else:
-                # Display results
-                df = msg['results']
-                
-                # Response metadata
-                response_time = msg.get('response_time', 0)
-                row_count = msg.get('row_count', len(df))
-                
-                # Show insights if available
-                if msg.get('insight'):
-                    st.markdown(f"**Insight:** {msg['insight']}")
-                    st.divider()
-                
-                # Metadata badges
-                col1, col2 = st.columns([1, 1])
-                with col1:
-                    st.markdown(f'<span class="status-badge badge-success">{row_count} rows</span>', unsafe_allow_html=True)
-                with col2:
-                    st.markdown(f'<span class="status-badge badge-info">{response_time:.2f}s</span>', unsafe_allow_html=True)
-                
-                # Key metrics with better formatting
-                if not df.empty:
-                    metric_cols = st.columns(min(4, len(df.columns)))
-                    for idx, col in enumerate(df.columns[:4]):
-                        with metric_cols[idx]:
-                            if pd.api.types.is_numeric_dtype(df[col]):
-                                value = df[col].sum() if len(df) > 1 else df[col].iloc[0]
-                                # Format based on size
-                                if value > 1000000:
-                                    formatted = f"${value/1000000:.1f}M" if 'amount' in col.lower() or 'sales' in col.lower() or 'revenue' in col.lower() else f"{value/1000000:.1f}M"
-                                elif value > 1000:
-                                    formatted = f"${value/1000:.1f}K" if 'amount' in col.lower() or 'sales' in col.lower() or 'revenue' in col.lower() else f"{value/1000:.1f}K"
-                                else:
-                                    formatted = f"${value:,.0f}" if 'amount' in col.lower() or 'sales' in col.lower() or 'revenue' in col.lower() else f"{value:,.0f}"
-                                
-                                st.metric(
-                                    label=col.replace('_', ' ').replace('.', ' ').title(),
-                                    value=formatted
-                                )
-                
-                st.divider()
-                
-                # Smart Visualization Selection
-                if len(df) > 0 and len(df.columns) >= 2:
-                    # Identify dimension (grouping) and measure (metric) columns
-                    # Dimensions: year, category, name fields OR columns with few unique values
-                    # Measures: columns starting with fct_ or metric-like names
-                    
-                    dimension_col = None
-                    measure_col = None
-                    
-                    for col in df.columns:
-                        col_lower = col.lower()
-                        # Identify dimension columns
-                        if any(keyword in col_lower for keyword in ['dim_', 'year', 'month', 'quarter', 'category', 'name', 'type', 'status']):
-                            if dimension_col is None:
-                                dimension_col = col
-                        # Identify measure columns
-                        elif any(keyword in col_lower for keyword in ['fct_', 'total', 'count', 'amount', 'average', 'sum', 'revenue', 'sales', 'quantity']):
-                            if measure_col is None:
-                                measure_col = col
-                    
-                    # Fallback: first column is dimension, second is measure
-                    if dimension_col is None and len(df.columns) >= 1:
-                        dimension_col = df.columns[0]
-                    if measure_col is None and len(df.columns) >= 2:
-                        measure_col = df.columns[1]
-                    
-                    # Convert dimension to string for better display
-                    if dimension_col and pd.api.types.is_numeric_dtype(df[dimension_col]):
-                        df[dimension_col] = df[dimension_col].astype(str)
-                    
-                    viz_col1, viz_col2 = st.columns([2, 1])
-                    
-                    with viz_col1:
-                        if dimension_col and measure_col:
-                            # Determine chart type based on data
-                            row_count = len(df)
-                            
-                            # Clean up labels
-                            dim_label = dimension_col.replace('dim_', '').replace('fct_', '').replace('_', ' ').replace('.', ' - ').title()
-                            measure_label = measure_col.replace('dim_', '').replace('fct_', '').replace('_', ' ').replace('.', ' - ').title()
-                            
-                            if row_count <= 15:
-                                # Bar chart for comparisons
-                                fig = px.bar(
-                                    df,
-                                    x=dimension_col,
-                                    y=measure_col,
-                                    title=f"{measure_label} by {dim_label}",
-                                    template="plotly_white",
-                                    color=measure_col,
-                                    color_continuous_scale="Blues",
-                                    text=measure_col
-                                )
-                                fig.update_traces(texttemplate='%{text:.2s}', textposition='outside')
-                                fig.update_layout(
-                                    xaxis_tickangle=-45,
-                                    showlegend=False,
-                                    height=400,
-                                    xaxis_title=dim_label,
-                                    yaxis_title=measure_label
-                                )
-                            else:
-                                # Line chart for trends
-                                fig = px.line(
-                                    df.head(20),
-                                    x=dimension_col,
-                                    y=measure_col,
-                                    title=f"{measure_label} Trend",
-                                    template="plotly_white",
-                                    markers=True
-                                )
-                                fig.update_layout(
-                                    height=400,
-                                    xaxis_title=dim_label,
-                                    yaxis_title=measure_label
-                                )
-                            
-                            st.plotly_chart(fig, use_container_width=True, key=f"chart_{msg['timestamp']}")
-                        else:
-                            st.info("Chart not generated - query returned data that may need manual visualization.")
-                    
-                    with viz_col2:
-                        # Statistics for numeric columns
-                        numeric_cols = df.select_dtypes(include=['number']).columns.tolist()
-                        if len(numeric_cols) > 0:
-                            st.markdown("**Statistics**")
-                            for col in numeric_cols[:2]:
-                                col_label = col.replace('_', ' ').replace('.', ' - ').title()
-                                st.markdown(f"**{col_label}**")
-                                st.markdown(f"Max: {df[col].max():,.0f}")
-                                st.markdown(f"Min: {df[col].min():,.0f}")
-                                st.markdown(f"Avg: {df[col].mean():,.0f}")
-                    
-                    # Data table (collapsed)
-                    with st.expander("View Data Table", expanded=False):
-                        st.dataframe(df, use_container_width=True, hide_index=True)
-                        
-                        # Download button
-                        csv = df.to_csv(index=False)
-                        st.download_button(
-                            label="Download CSV",
-                            data=csv,
-                            file_name=f"results_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv",
-                            mime="text/csv",
-                            key=f"download_{msg['timestamp']}"
-                        )
-                
-                # Show query details if enabled
-                if st.session_state.show_query_details and 'query' in msg:
-                    with st.expander("Query Details", expanded=False):
-                        st.json(msg['query'])
+                st.caption(summary_line(msg))
+                if st.toggle("Show full answer", key=f"expand_{message_id(msg)}"):
+                    render_answer(msg)
 
 # Input area at bottom
 st.divider()
@@ -445,7 +474,8 @@ with st.expander("Type a longer question"):
 
 # Process question
 if question and question.strip():
-    start_time = datetime.now()
+    # One trace per question on a monotonic clock; the clients add nested spans on this thread
+    trace = tracing.start_trace('question', question=question)
     
     # Progressive loading states
     status_placeholder = st.empty()
@@ -456,76 +486,98 @@ if question and question.strip():
         status_placeholder.info("**Analyzing question...**")
         progress_bar.progress(25)
         
-        # Pass conversation history for context
-        looker_query = gemini_client.translate_to_looker_query(
-            question, 
-            conversation_history=active_conv['messages']
-        )
+        # Pass conversation history for context. The query comes back checked against
+        # the LookML catalog (near-miss fields repaired, one re-prompt on anything worse)
+        with trace.span('translate'):
+            looker_query = gemini_client.translate_to_looker_query(
+                question, 
+                conversation_history=active_conv['messages']
+            )
         
-        # Step 2: Validate query
+        # Step 2: Fetch data
         status_placeholder.info("**Fetching data from Looker...**")
         progress_bar.progress(50)
         
         # Step 3: Execute query via Looker API
-        results = looker_client.run_query(looker_query)
+        large = is_large(looker_query)
+        with trace.span('run_query', explore=looker_query.get('explore'), large=large):
+            # The same query answered recently (by any session or replica) is reused as is,
+            # unless its explore's datagroup has fired since
+            data_version = looker_client.data_version(looker_query)
+            reused = conversation_store.find_result(looker_query, data_version=data_version)
+            reused_id = None
+            if reused is not None:
+                reused_id, df = reused
+                tracing.annotate(reused_message=reused_id)
+            elif large:
+                # Large-result mode: show the first batch while the rest streams in
+                preview_placeholder = st.empty()
+                stream = looker_client.run_query_stream(looker_query)
+                try:
+                    first_page = stream.first_page()
+                    if first_page is not None:
+                        preview_placeholder.dataframe(first_page.head(TABLE_PREVIEW_ROWS),
+                                                      use_container_width=True, hide_index=True)
+                    for rows in stream.fetch():
+                        status_placeholder.info(f"**Fetching data from Looker...** {rows:,} rows so far")
+                    df = stream.frame()
+                finally:
+                    stream.close()
+                    preview_placeholder.empty()
+                tracing.annotate(**stream.stats())
+            else:
+                df = looker_client.run_query_frame(looker_query)
         progress_bar.progress(75)
         
         # Step 4: Process results
         status_placeholder.info("**Processing results...**")
         
-        if results:
-            # Ensure results is a list
-            if not isinstance(results, list):
-                results = [results]
-            
-            # Handle empty results
-            if len(results) == 0:
-                raise ValueError("No data returned from query")
-            
-            df = pd.DataFrame(results)
-            
-            # Verify DataFrame has data
-            if df.empty:
-                raise ValueError("Query returned empty dataset")
+        # Typed DataFrame straight from the backend (numeric measures, categorical dimensions)
+        if df is not None and not df.empty:
+            # Generate AI insight (optional)
+            insight = None
+            if st.session_state.show_query_details:
+                with trace.span('insight'):
+                    insight = gemini_client.generate_insight(question, df)
             
-            # Calculate response time
-            response_time = (datetime.now() - start_time).total_seconds()
+            # Calculate response time (the chart render is traced when the answer is displayed)
+            response_time = trace.total_ms() / 1000
             
             # Update conversation stats
             active_conv['total_queries'] += 1
             total_time = active_conv.get('avg_response_time', 0) * (active_conv['total_queries'] - 1)
             active_conv['avg_response_time'] = (total_time + response_time) / active_conv['total_queries']
             
-            # Generate AI insight (optional)
-            insight = None
-            if st.session_state.show_query_details:
-                insight = gemini_client.generate_insight(question, df)
-            
             progress_bar.progress(100)
             status_placeholder.success(f"**Results retrieved in {response_time:.2f}s**")
             
-            # Add to conversation
-            active_conv['messages'].append({
-                'timestamp': datetime.now(),
-                'question': question,
-                'results': df,
-                'query': looker_query,
-                'response_time': response_time,
-                'insight': insight,
-                'row_count': len(df)
-            })
+            # Add to conversation (persisted; the result itself lives in the result store)
+            with trace.span('persist'):
+                add_message(active_conv, {
+                    'timestamp': datetime.now(),
+                    'question': question,
+                    'query': looker_query,
+                    'response_time': response_time,
+                    'insight': insight,
+                    'row_count': len(df),
+                    'large': large,
+                    'data_version': data_version,
+                    'result_of': reused_id,
+                    'trace': trace
+                }, df=df, trace=trace)
             
             # Clear status
-            import time
-            time.sleep(1)
+            tracing.detach()
             status_placeholder.empty()
             progress_bar.empty()
             
             st.rerun()
         else:
+            tracing.detach()
+            tracing.exporter.export(trace, status='empty')
             progress_bar.empty()
             # Add error message to conversation
-            active_conv['messages'].append({
+            add_message(active_conv, {
                 'timestamp': datetime.now(),
                 'question': question,
                 'error': "No results found for your query."
@@ -533,12 +585,27 @@ if question and question.strip():
             status_placeholder.empty()
             st.rerun()
     
+    except QueryValidationError as e:
+        # Nothing went to Looker - tell the user which fields could not be matched
+        tracing.detach()
+        tracing.exporter.export(trace, status='invalid_query')
+        add_message(active_conv, {
+            'timestamp': datetime.now(),
+            'question': question,
+            'error': str(e)
+        })
+        progress_bar.empty()
+        status_placeholder.empty()
+        st.rerun()
+    
     except Exception as e:
         # Add detailed error to conversation
         import traceback
         error_details = f"Error: {str(e)}\n\nDetails: {traceback.format_exc()}"
+        tracing.detach()
+        tracing.exporter.export(trace, status='error')
         
-        active_conv['messages'].append({
+        add_message(active_conv, {
             'timestamp': datetime.now(),
             'question': question,
             'error': str(e)
@@ -578,7 +645,11 @@ if active_conv['messages']:
 
 """
             
-            for idx, msg in enumerate(active_conv['messages'], 1):
+            # The whole conversation, including pages not loaded into the history yet
+            all_messages, _ = conversation_store.load_messages(
+                active_conv['id'], limit=max(active_conv['message_count'], 1)
+            )
+            for idx, msg in enumerate(all_messages, 1):
                 export_text += f"## Query {idx}\n\n"
                 export_text += f"**Question:** {msg['question']}\n\n"
                 
@@ -586,15 +657,17 @@ if active_conv['messages']:
                     export_text += f"**Status:** ❌ Error\n\n"
                     export_text += f"**Message:** {msg['error']}\n\n"
                 else:
+                    results = st.session_state.result_store.get(message_id(msg))
                     export_text += f"**Status:** ✅ Success\n\n"
-                    export_text += f"**Rows Returned:** {len(msg['results'])}\n\n"
+                    export_text += f"**Rows Returned:** {msg.get('row_count', 0)}\n\n"
                     export_text += f"**Response Time:** {msg.get('response_time', 0):.2f}s\n\n"
                     
                     if msg.get('insight'):
                         export_text += f"**AI Insight:** {msg['insight']}\n\n"
                     
-                    export_text += "**Data:**\n\n"
-                    export_text += msg['results'].to_markdown(index=False) + "\n\n"
+                    if results is not None:
+                        export_text += "**Data:**\n\n"
+                        export_text += results.to_markdown(index=False) + "\n\n"
                 
                 export_text += "---\n\n"
             
@@ -0,0 +1,446 @@
+"""
+Headless batch runner: answer a file of questions without the Streamlit UI
+
+Each question takes the same path as in app.py: GeminiClient translates it,
+the warehouse client runs the query (streamed when it is large), and
+optionally Gemini writes an insight. Questions run on --concurrency worker
+threads, paced by an optional --rate limit (questions per second), while the
+usual backend pools cap what reaches Gemini and Looker. For every question the
+runner writes:
+
+- results/NNNN-<slug>.parquet (and/or .csv) under --out
+- one line of manifest.jsonl: question, status, query, row count, output
+  files and per-stage timings, including time spent waiting for the rate
+  limit, a batch worker and each backend pool
+
+report.json sums it up: throughput, and a saturation analysis naming the
+limit that capped throughput (a backend pool, the rate limit, or the batch's
+own --concurrency). --sweep reruns the questions at several concurrency
+levels with cold caches and reports where throughput stops scaling.
+
+Input is one question per line, or JSONL with {"question", ["id"], ["query"]}
+("query" is what the --stub Gemini answers with); blank lines and lines starting with # are skipped. "-" (the default) reads stdin.
+
+    python batch.py questions.txt --out digests/2024-06-01 --concurrency 8
+    cat questions.txt | python batch.py - --out digest --rate 2 --format csv
+    python batch.py eval/labelled_questions.jsonl --stub --time-scale 0.1 --sweep 1 2 4 8 16
+"""
+import io
+import os
+import re
+import sys
+import json
+import time
+import random
+import argparse
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Any, Dict, List, Optional, Tuple
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+from dotenv import load_dotenv
+
+import tracing
+from concurrency import BackendPool, BackendSaturatedError, RateLimiter, SingleFlight
+from large_results import is_large
+
+# Stages reported per question, in pipeline order
+STAGES = ['rate_limit', 'batch_queue', 'translate', 'gemini.queue', 'run_query', 'looker.queue',
+          'warehouse.queue', 'insight', 'write', 'total']
+# A sweep level scaling worse than this fraction of linear counts as saturated
+SATURATION_EFFICIENCY = 0.8
+# A limit is named as the bottleneck once questions spend this share of their time waiting on it
+WAIT_SHARE_THRESHOLD = 0.05
+
+
+def read_questions(path: str) -> List[Dict[str, Any]]:
+    """Questions from a text or JSONL file, or stdin for "-" """
+    handle = sys.stdin if path == '-' else open(path, 'r')
+    try:
+        items = []
+        for line in handle:
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            if line.startswith('{'):
+                row = json.loads(line)
+                items.append({'question': row['question'], 'id': row.get('id'), 'query': row.get('query')})
+            else:
+                items.append({'question': line, 'id': None, 'query': None})
+        return items
+    finally:
+        if handle is not sys.stdin:
+            handle.close()
+
+
+def _slug(text: str, length: int = 60) -> str:
+    return re.sub(r'[^a-z0-9]+', '-', text.lower()).strip('-')[:length] or 'question'
+
+
+def build_clients(args, items: List[Dict[str, Any]], cold: bool):
+    """
+    Gemini and warehouse clients with pools of their own, so each run's pool stats stand alone
+
+    cold=True gives them fresh, unpersisted caches (used by --sweep, so every
+    level does the same work); otherwise they share the app's persisted caches.
+    """
+    from gemini_client import GeminiClient, TranslationCache
+    from question_index import QuestionIndex
+    from looker_client import LookerClient, QueryResultCache, QueryIdRegistry
+
+    pools = {
+        'gemini': BackendPool('gemini', args.gemini_workers),
+        'looker': BackendPool('looker', args.looker_workers),
+        'warehouse': BackendPool('warehouse', args.warehouse_workers),
+    }
+    if cold:
+        gemini = GeminiClient(cache=TranslationCache(path=None), index=QuestionIndex(path=None),
+                              flights=SingleFlight('gemini'), pool=pools['gemini'])
+    else:
+        gemini = GeminiClient(pool=pools['gemini'])
+
+    if args.stub:
+        from benchmark_pipeline import LatencyDistribution, StubGenerativeModel, StubLookerSDK
+        rng = random.Random(args.seed)
+
+        def latency(spec: str) -> LatencyDistribution:
+            return LatencyDistribution(spec, random.Random(rng.random()), args.time_scale)
+
+        answers = {item['question']: item['query'] for item in items if item.get('query')}
+        gemini.model = StubGenerativeModel(answers, latency(args.llm_latency), latency(args.insight_latency))
+        gemini.question_log_path = os.devnull
+        sdk = StubLookerSDK(gemini.catalog, latency(args.create_latency), latency(args.run_latency),
+                            random.Random(rng.random()))
+        looker = LookerClient(cache=QueryResultCache(), registry=QueryIdRegistry(path=None), sdk=sdk,
+                              flights=SingleFlight('looker'), pool=pools['looker'], catalog=gemini.catalog)
+    elif args.backend == 'local':
+        from local_warehouse import LocalWarehouseClient
+        looker = LocalWarehouseClient(args.data_dir, catalog=gemini.catalog,
+                                      cache=QueryResultCache() if cold else None, pool=pools['warehouse'])
+    else:
+        looker = LookerClient(cache=QueryResultCache() if cold else None,
+                              flights=SingleFlight('looker') if cold else None, pool=pools['looker'])
+    return gemini, looker, pools
+
+
+def write_result(df, out_dir: str, name: str, formats: List[str]) -> List[str]:
+    os.makedirs(out_dir, exist_ok=True)
+    paths = []
+    if 'parquet' in formats:
+        path = os.path.join(out_dir, f"{name}.parquet")
+        pq.write_table(pa.Table.from_pandas(df, preserve_index=False), path, compression='zstd')
+        paths.append(path)
+    if 'csv' in formats:
+        path = os.path.join(out_dir, f"{name}.csv")
+        df.to_csv(path, index=False)
+        paths.append(path)
+    return paths
+
+
+def stage_timings(record: Dict[str, Any]) -> Dict[str, float]:
+    """Milliseconds per stage from a trace record (repeated spans, e.g. two Gemini calls, add up)"""
+    timings: Dict[str, float] = {}
+    for span in record['spans']:
+        if span['name'] in STAGES:
+            timings[span['name']] = round(timings.get(span['name'], 0.0) + span['duration_ms'], 3)
+    return timings
+
+
+def answer(index: int, item: Dict[str, Any], gemini, looker, limiter: RateLimiter, submitted: float,
+           out_dir: Optional[str], formats: List[str], insight: bool) -> Dict[str, Any]:
+    """Run one question end to end on this worker thread and return its manifest entry"""
+    from query_validator import QueryValidationError
+
+    batch_queue_ms = (time.perf_counter() - submitted) * 1000
+    rate_limit_ms = limiter.acquire()
+    question = item['question']
+    trace = tracing.start_trace('batch', question=question)
+    entry: Dict[str, Any] = {'index': index, 'id': item.get('id'), 'question': question,
+                             'started_at': datetime.now().isoformat(timespec='milliseconds')}
+    status = 'ok'
+    try:
+        with trace.span('translate'):
+            query = gemini.translate_to_looker_query(question)
+        entry['query'] = query
+        large = is_large(query)
+        with trace.span('run_query', explore=query.get('explore'), large=large):
+            if large:
+                stream = looker.run_query_stream(query, spool_dir=None)
+                try:
+                    df = stream.frame()
+                finally:
+                    stream.close()
+            else:
+                df = looker.run_query_frame(query)
+        entry['rows'] = len(df)
+        if trace.flags().get('mock_fallback'):
+            # Never put mock numbers in a digest
+            status = 'error'
+            entry['error'] = "Warehouse unavailable: the client fell back to mock data, nothing written"
+        elif df.empty:
+            status = 'empty'
+        else:
+            if insight:
+                with trace.span('insight'):
+                    entry['insight'] = gemini.generate_insight(question, df)
+            if out_dir is not None:
+                name = f"{index:04d}-{_slug(item.get('id') or question)}"
+                with trace.span('write'):
+                    entry['files'] = write_result(df, os.path.join(out_dir, 'results'), name, formats)
+            entry['columns'] = list(df.columns)
+        entry['source'] = trace.flags().get('source')
+    except QueryValidationError as e:
+        status = 'invalid_query'
+        entry['error'] = str(e)
+    except BackendSaturatedError as e:
+        status = 'saturated'
+        entry['error'] = str(e)
+    except Exception as e:
+        status = 'error'
+        entry['error'] = f"{type(e).__name__}: {e}"
+    finally:
+        tracing.detach()
+        tracing.exporter.export(trace, status=status)
+
+    record = trace.to_dict()
+    entry['status'] = status
+    entry['trace_id'] = record['trace_id']
+    entry['timings_ms'] = {
+        'rate_limit': round(rate_limit_ms, 3),
+        'batch_queue': round(batch_queue_ms, 3),
+        **stage_timings(record),
+        'total': record['total_ms'],
+    }
+    return entry
+
+
+def run_batch(items: List[Dict[str, Any]], gemini, looker, concurrency: int, limiter: RateLimiter,
+              out_dir: Optional[str], formats: List[str], insight: bool, progress=None) -> Tuple[List[Dict[str, Any]], float]:
+    """Answer every question on `concurrency` threads; returns (manifest entries, wall seconds)"""
+    entries = []
+    manifest = open(os.path.join(out_dir, 'manifest.jsonl'), 'w') if out_dir is not None else None
+    start = time.perf_counter()
+    try:
+        with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='batch-worker') as executor:
+            futures = [
+                executor.submit(answer, index, item, gemini, looker, limiter, time.perf_counter(),
+                                out_dir, formats, insight)
+                for index, item in enumerate(items, 1)
+            ]
+            for future in as_completed(futures):
+                entry = future.result()
+                entries.append(entry)
+                if manifest is not None:
+                    # Written as questions finish, so an interrupted run leaves a usable manifest
+                    manifest.write(json.dumps(entry, default=str) + '\n')
+                    manifest.flush()
+                if progress is not None:
+                    progress(len(entries), len(items), entry)
+    finally:
+        if manifest is not None:
+            manifest.close()
+    return sorted(entries, key=lambda entry: entry['index']), time.perf_counter() - start
+
+
+def saturation(entries: List[Dict[str, Any]], pools: Dict[str, BackendPool], limiter: RateLimiter,
+               concurrency: int, wall: float) -> Dict[str, Any]:
+    """
+    Where the batch spent its waiting time, and which limit that points at
+
+    Each question's time is split into working and waiting: for the rate
+    limit and for each backend pool. The limit with the largest share of
+    question time is the bottleneck once the share passes
+    WAIT_SHARE_THRESHOLD; a pool only counts if all its workers were busy at
+    some point (otherwise the wait was worker start-up). Below that, if the
+    batch workers were always busy, --concurrency itself is the limit.
+    """
+    busy_ms = sum(entry['timings_ms']['total'] + entry['timings_ms']['rate_limit'] for entry in entries) or 1.0
+    limits = {'rate limit': sum(entry['timings_ms']['rate_limit'] for entry in entries) / busy_ms}
+    backends = {}
+    for name, pool in pools.items():
+        stats = pool.stats()
+        if not stats['completed']:
+            continue
+        waited = sum(entry['timings_ms'].get(f'{name}.queue', 0.0) for entry in entries)
+        backends[name] = dict(stats, wait_share=round(waited / busy_ms, 4))
+        if stats['peak_active'] >= stats['workers']:
+            limits[name] = waited / busy_ms
+    # Average questions in flight: question time (incl. rate-limit waits) over wall time
+    in_flight = busy_ms / 1000 / wall if wall else 0.0
+    bottleneck, share = max(limits.items(), key=lambda item: item[1])
+    if share >= WAIT_SHARE_THRESHOLD:
+        if bottleneck == 'rate limit':
+            verdict = (f"rate limit: questions spent {share:.0%} of their time waiting for "
+                       f"--rate {limiter.rate:g}/s")
+        else:
+            pool = backends[bottleneck]
+            verdict = (f"{bottleneck} pool: {pool['peak_active']}/{pool['workers']} workers busy at peak, "
+                       f"questions spent {share:.0%} of their time queued for it "
+                       f"(p95 wait {pool['queue_ms_p95']:.0f} ms)")
+    elif in_flight >= 0.9 * concurrency:
+        bottleneck = 'concurrency'
+        verdict = (f"batch concurrency: {in_flight:.1f} of {concurrency} questions in flight on average "
+                   f"and the backends had spare capacity - raise --concurrency")
+    else:
+        bottleneck = None
+        verdict = f"not saturated: {in_flight:.1f} of {concurrency} questions in flight on average"
+    return {
+        'bottleneck': bottleneck,
+        'verdict': verdict,
+        'avg_in_flight': round(in_flight, 2),
+        'wait_shares': {name: round(value, 4) for name, value in limits.items()},
+        'backends': backends,
+        'rate_limit': limiter.stats(),
+    }
+
+
+def summarize(entries: List[Dict[str, Any]], wall: float) -> Dict[str, Any]:
+    statuses: Dict[str, int] = {}
+    for entry in entries:
+        statuses[entry['status']] = statuses.get(entry['status'], 0) + 1
+    stages = {}
+    for stage in STAGES:
+        values = [entry['timings_ms'][stage] for entry in entries if stage in entry['timings_ms']]
+        if values and any(values):
+            stages[stage] = {'p50_ms': round(tracing.percentile(values, 50), 1),
+                             'p95_ms': round(tracing.percentile(values, 95), 1),
+                             'max_ms': round(max(values), 1)}
+    return {
+        'questions': len(entries),
+        'statuses': statuses,
+        'wall_seconds': round(wall, 3),
+        'throughput_qps': round(len(entries) / wall, 3) if wall else 0.0,
+        'stages': stages,
+    }
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Answer a file of questions headlessly and write the results")
+    parser.add_argument('questions', nargs='?', default='-', help="Text or JSONL file of questions, - for stdin")
+    parser.add_argument('--out', default=None, help="Output directory (default: batch-<timestamp>)")
+    parser.add_argument('--format', choices=['parquet', 'csv', 'both'], default='parquet')
+    parser.add_argument('--concurrency', type=int, default=8, help="Questions in flight at once")
+    parser.add_argument('--rate', type=float, default=0.0, help="Max questions started per second (0 = no limit)")
+    parser.add_argument('--burst', type=int, default=1, help="Questions that may start at once under --rate")
+    parser.add_argument('--gemini-workers', type=int, default=int(os.getenv('GEMINI_MAX_CONCURRENCY', '8')))
+    parser.add_argument('--looker-workers', type=int, default=int(os.getenv('LOOKER_MAX_CONCURRENCY', '4')))
+    parser.add_argument('--warehouse-workers', type=int,
+                        default=int(os.getenv('LOCAL_WAREHOUSE_MAX_CONCURRENCY', '4')))
+    parser.add_argument('--backend', choices=['looker', 'local'],
+                        default=os.getenv('WAREHOUSE_BACKEND', 'looker').lower())
+    parser.add_argument('--data-dir', default=None, help="Parquet directory for --backend local")
+    parser.add_argument('--insight', action='store_true', help="Also ask Gemini for an insight per question")
+    parser.add_argument('--limit', type=int, default=None, help="Only the first N questions")
+    parser.add_argument('--cold', action='store_true', help="Fresh in-memory caches instead of the app's")
+    parser.add_argument('--sweep', type=int, nargs='+', default=None, metavar='N',
+                        help="Measure throughput at each concurrency level (cold caches, no result files)")
+    parser.add_argument('--stub', action='store_true', help="Stub Gemini and Looker (offline rehearsal)")
+    parser.add_argument('--llm-latency', default='lognormal:900,0.35', help="--stub translation latency")
+    parser.add_argument('--insight-latency', default='lognormal:1200,0.3', help="--stub insight latency")
+    parser.add_argument('--create-latency', default='lognormal:150,0.3', help="--stub Looker create_query")
+    parser.add_argument('--run-latency', default='lognormal:700,0.5', help="--stub Looker run_query")
+    parser.add_argument('--time-scale', type=float, default=1.0, help="Multiply --stub latencies")
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--verbose', action='store_true', help="Show client logging")
+    args = parser.parse_args(argv)
+
+    load_dotenv()
+    if args.stub:
+        # The stub model is never sent anywhere, the client just needs a key to construct
+        os.environ.setdefault('GEMINI_API_KEY', 'offline-batch')
+    items = read_questions(args.questions)[:args.limit]
+    if not items:
+        print("No questions to run")
+        return 1
+    formats = ['parquet', 'csv'] if args.format == 'both' else [args.format]
+    out_dir = args.out or f"batch-{datetime.now().strftime('%Y%m%d_%H%M%S')}"
+    os.makedirs(out_dir, exist_ok=True)
+
+    console = sys.stdout
+    # The clients log every call with print(); keep them out of the progress output
+    sink = sys.stdout if args.verbose else io.StringIO()
+
+    def progress(done: int, total: int, entry: Dict[str, Any]) -> None:
+        seconds = entry['timings_ms']['total'] / 1000
+        print(f"[{done:>4}/{total}] {entry['status']:<13} {seconds:6.2f}s {entry.get('rows', 0):>7} rows  "
+              f"{entry['question'][:70]}", file=console, flush=True)
+
+    report: Dict[str, Any] = {
+        'run': {
+            'timestamp': datetime.now().isoformat(timespec='seconds'),
+            'questions_file': args.questions,
+            'backend': 'stub' if args.stub else args.backend,
+            'concurrency': args.concurrency,
+            'rate': args.rate,
+            'workers': {'gemini': args.gemini_workers, 'looker': args.looker_workers,
+                        'warehouse': args.warehouse_workers},
+            'insight': args.insight,
+        },
+    }
+
+    if args.sweep:
+        levels = []
+        baseline_qps = None
+        saturated_at = None
+        print(f"Sweeping {len(items)} questions over concurrency {args.sweep} (cold caches)")
+        for level in args.sweep:
+            sys.stdout = sink
+            try:
+                gemini, looker, pools = build_clients(args, items, cold=True)
+                limiter = RateLimiter(args.rate, args.burst)
+                entries, wall = run_batch(items, gemini, looker, level, limiter, None, formats, args.insight)
+            finally:
+                sys.stdout = console
+            summary = summarize(entries, wall)
+            analysis = saturation(entries, pools, limiter, level, wall)
+            qps = summary['throughput_qps']
+            if baseline_qps is None:
+                baseline_qps = qps / args.sweep[0] if args.sweep[0] else qps
+            efficiency = qps / (baseline_qps * level) if baseline_qps else 0.0
+            if saturated_at is None and efficiency < SATURATION_EFFICIENCY:
+                saturated_at = level
+            levels.append({'concurrency': level, **summary, 'efficiency': round(efficiency, 3),
+                           'saturation': analysis})
+            print(f"  concurrency {level:>3}: {qps:7.2f} q/s, {efficiency:4.0%} of linear  {analysis['verdict']}")
+        report['sweep'] = levels
+        if saturated_at is None:
+            report['saturated_at'] = None
+            print(f"Scaled within {SATURATION_EFFICIENCY:.0%} of linear up to concurrency {args.sweep[-1]}")
+        else:
+            level = next(row for row in levels if row['concurrency'] == saturated_at)
+            report['saturated_at'] = {'concurrency': saturated_at, 'bottleneck': level['saturation']['bottleneck'],
+                                      'verdict': level['saturation']['verdict']}
+            print(f"Throughput stopped scaling at concurrency {saturated_at}: {level['saturation']['verdict']}")
+    else:
+        print(f"Answering {len(items)} questions, concurrency {args.concurrency}"
+              f"{f', rate {args.rate:g}/s' if args.rate else ''} -> {out_dir}/")
+        sys.stdout = sink
+        try:
+            gemini, looker, pools = build_clients(args, items, cold=args.cold or args.stub)
+            limiter = RateLimiter(args.rate, args.burst)
+            entries, wall = run_batch(items, gemini, looker, args.concurrency, limiter, out_dir, formats,
+                                      args.insight, progress)
+        finally:
+            sys.stdout = console
+        report.update(summarize(entries, wall))
+        report['saturation'] = saturation(entries, pools, limiter, args.concurrency, wall)
+        report['caches'] = {'gemini': gemini.cache_stats(), 'looker': looker.cache_stats()}
+        print(f"\n{report['questions']} questions in {wall:.1f}s ({report['throughput_qps']:.2f}/s): "
+              f"{report['statuses']}")
+        print(f"{'stage':<16} {'p50':>9} {'p95':>9} {'max':>9}  (ms)")
+        for stage, values in report['stages'].items():
+            print(f"{stage:<16} {values['p50_ms']:>9.1f} {values['p95_ms']:>9.1f} {values['max_ms']:>9.1f}")
+        print(f"Saturation: {report['saturation']['verdict']}")
+        print(f"Manifest: {os.path.join(out_dir, 'manifest.jsonl')}")
+
+    with open(os.path.join(out_dir, 'report.json'), 'w') as f:
+        json.dump(report, f, indent=2, default=str)
+    print(f"Report: {os.path.join(out_dir, 'report.json')}")
+    if args.sweep:
+        return 0
+    return 0 if all(entry['status'] in ('ok', 'empty') for entry in entries) else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,143 @@
+"""
+Aggregate awareness: bytes scanned and latency, base tables vs rollups
+
+Runs every labelled query twice against the local warehouse, once with
+aggregate awareness off (fct_* joined to its dimensions, as Looker runs it
+without aggregate tables) and once with it on, and reports per query which
+rollup answered it, the bytes BigQuery would scan for each SQL (the full
+size of every referenced column) and the DuckDB latency. The two results
+are compared, so a rollup that changes an answer shows up as a mismatch.
+
+    python local_warehouse.py --build-aggregates --data-dir warehouse
+    python benchmark_aggregates.py eval/labelled_questions.jsonl --data-dir warehouse
+    python benchmark_aggregates.py eval/labelled_questions.jsonl --repeat 10 --output aggregates.json
+"""
+import sys
+import json
+import time
+import argparse
+import statistics
+from typing import Dict, Any, List
+
+import pandas as pd
+
+from looker_client import QueryResultCache, canonical_query_key
+from lookml_catalog import load_catalog
+from tracing import percentile
+from local_warehouse import LocalWarehouseClient
+
+
+def _summary(values: List[float]) -> Dict[str, float]:
+    return {
+        'mean': statistics.mean(values) if values else 0.0,
+        'p50': percentile(values, 50),
+        'p95': percentile(values, 95),
+    }
+
+
+def _size(value: float) -> str:
+    if value < 1024 * 1024:
+        return f"{value / 1024:,.1f} KB"
+    return f"{value / 1024 / 1024:,.1f} MB"
+
+
+def _same_result(left: pd.DataFrame, right: pd.DataFrame) -> bool:
+    """Equal up to row order (ties in the sort) and float rounding"""
+    if list(left.columns) != list(right.columns) or len(left) != len(right):
+        return False
+    left = left.sort_values(list(left.columns)).reset_index(drop=True)
+    right = right.sort_values(list(right.columns)).reset_index(drop=True)
+    try:
+        pd.testing.assert_frame_equal(left, right, check_dtype=False, check_categorical=False, rtol=1e-6)
+    except AssertionError:
+        return False
+    return True
+
+
+def _timed(client: LocalWarehouseClient, query: Dict[str, Any], repeat: int):
+    timings, frame = [], None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        frame = client.run_query_frame(query)
+        timings.append((time.perf_counter() - start) * 1000)
+    return statistics.median(timings), frame
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark queries on base tables vs aggregate tables")
+    parser.add_argument('questions', help="JSONL with {question, query} rows")
+    parser.add_argument('--data-dir', default=None)
+    parser.add_argument('--repeat', type=int, default=5, help="Timed runs per query and mode (median kept)")
+    parser.add_argument('--show-sql', action='store_true')
+    parser.add_argument('--output', help="Write the JSON report here as well")
+    args = parser.parse_args(argv)
+
+    catalog = load_catalog()
+    # Caches off, so every run executes
+    base = LocalWarehouseClient(args.data_dir, catalog=catalog, cache=QueryResultCache(max_bytes=0),
+                                aggregate_awareness=False, wide_explores=False)
+    rolled = LocalWarehouseClient(args.data_dir, catalog=catalog, cache=QueryResultCache(max_bytes=0),
+                                  aggregate_awareness=True, wide_explores=False)
+    if not rolled.aggregates:
+        print("No aggregate tables built - run: python local_warehouse.py --build-aggregates")
+        return 1
+
+    with open(args.questions, 'r') as f:
+        rows = [json.loads(line) for line in f if line.strip()]
+    queries, seen = [], set()
+    for row in rows:
+        if row.get('query') and canonical_query_key(row['query']) not in seen:
+            seen.add(canonical_query_key(row['query']))
+            queries.append((row['question'], row['query']))
+
+    results = []
+    for question, query in queries:
+        aggregate = rolled.compiler.aggregate_table(query)
+        base_sql, rolled_sql = base.compile(query), rolled.compile(query)
+        if args.show_sql and aggregate:
+            print(f"-- {question}\n{base_sql};\n-- from {aggregate}\n{rolled_sql};\n")
+        base_ms, base_frame = _timed(base, query, args.repeat)
+        rolled_ms, rolled_frame = _timed(rolled, query, args.repeat)
+        results.append({
+            'question': question,
+            'explore': query.get('explore'),
+            'aggregate': aggregate,
+            'bytes_base': base.scanned_bytes(base_sql),
+            'bytes_aggregate': rolled.scanned_bytes(rolled_sql),
+            'ms_base': round(base_ms, 2),
+            'ms_aggregate': round(rolled_ms, 2),
+            'same_result': _same_result(base_frame, rolled_frame),
+        })
+
+    print(f"\n{'Question':48} {'Aggregate table':36} {'Scanned':>21} {'Latency (ms)':>17}")
+    for r in results:
+        print(f"{r['question'][:48]:48} {(r['aggregate'] or '-'):36} "
+              f"{_size(r['bytes_base']):>9} -> {_size(r['bytes_aggregate']):>9} "
+              f"{r['ms_base']:>7.1f} -> {r['ms_aggregate']:>6.1f}"
+              + ("" if r['same_result'] else "  MISMATCH"))
+
+    routed = [r for r in results if r['aggregate']]
+    bytes_base = sum(r['bytes_base'] for r in results)
+    bytes_rolled = sum(r['bytes_aggregate'] for r in results)
+    report: Dict[str, Any] = {
+        'queries': len(results),
+        'answered_from_aggregates': len(routed),
+        'aggregate_tables_used': sorted({r['aggregate'] for r in routed}),
+        'bytes_scanned_base': bytes_base,
+        'bytes_scanned_aggregate': bytes_rolled,
+        'bytes_reduction': 1 - bytes_rolled / bytes_base if bytes_base else 0.0,
+        'latency_ms_base': _summary([r['ms_base'] for r in results]),
+        'latency_ms_aggregate': _summary([r['ms_aggregate'] for r in results]),
+        'routed_latency_ms_base': _summary([r['ms_base'] for r in routed]),
+        'routed_latency_ms_aggregate': _summary([r['ms_aggregate'] for r in routed]),
+        'mismatches': [r['question'] for r in results if not r['same_result']],
+    }
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'report': report, 'queries': results}, f, indent=2)
+    return 0 if not report['mismatches'] else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,240 @@
+"""
+Incremental fct_sales: a daily delta merge vs today's full rebuild
+
+Runs the real phase_3 fct_sales model with dataform_runner on DuckDB. The
+OLTP sources it reads (Sales_SalesOrderHeader, Sales_SalesOrderDetail,
+Sales_SpecialOfferProduct) are derived from a synthetic warehouse's
+fct_sales, with ModifiedDate = OrderDate, and its dimensions are loaded
+as-is (they are full rebuilds either way, so they are left out of both
+sides of the comparison).
+
+After an initial build, each simulated day adds a day's worth of new orders
+(some of them arriving late, with a ModifiedDate inside the lookback window)
+and updates a share of the last month's orders, then:
+
+- runs fct_sales incrementally (watermark filter + merge on sales_order_detail_id)
+- rebuilds it from scratch on the same sources, as every run does today
+- checks both tables hold the same rows (loaded_at aside)
+
+and reports wall-clock time and the bytes BigQuery would bill for each.
+
+    python synthetic_warehouse.py --sales-rows 2000000 --out warehouse
+    python benchmark_incremental.py --data-dir warehouse --days 3
+"""
+import os
+import sys
+import json
+import glob
+import argparse
+import statistics
+from typing import Dict, Any, List
+
+from dataform_runner import LocalDataformRunner
+from synthetic_warehouse import DEFAULT_OUT_DIR
+
+DIMENSIONS = ['dim_customer', 'dim_product', 'dim_territory', 'dim_salesperson', 'dim_ship_method',
+              'dim_special_offer', 'dim_credit_card', 'dim_address']
+
+
+def _parquet(data_dir: str, table: str) -> str:
+    single = os.path.join(data_dir, f"{table}.parquet")
+    if os.path.isfile(single):
+        return f"read_parquet('{single}')"
+    if not glob.glob(os.path.join(data_dir, table, '**', '*.parquet'), recursive=True):
+        raise FileNotFoundError(f"{table} not found in {data_dir}")
+    return f"read_parquet('{os.path.join(data_dir, table, '**', '*.parquet')}', hive_partitioning = true)"
+
+
+def _date(key: str) -> str:
+    return f"CAST(strptime(CAST({key} AS VARCHAR), '%Y%m%d') AS DATE)"
+
+
+def load_sources(runner: LocalDataformRunner, data_dir: str) -> Dict[str, int]:
+    """The fct_sales sources in the OLTP column layout (raw_schema.csv types), plus its dimensions"""
+    rows = {table: runner.load_table(table, f"SELECT * FROM {_parquet(data_dir, table)}") for table in DIMENSIONS}
+    runner.load_table('fct_sales_source', f"SELECT * FROM {_parquet(data_dir, 'fct_sales')}")
+    rows['Sales_SalesOrderHeader'] = runner.load_table('Sales_SalesOrderHeader', f"""
+        SELECT
+          sales_order_id AS SalesOrderID,
+          1 AS RevisionNumber,
+          {_date('ANY_VALUE(order_date_key)')} AS OrderDate,
+          {_date('ANY_VALUE(due_date_key)')} AS DueDate,
+          {_date('ANY_VALUE(ship_date_key)')} AS ShipDate,
+          ANY_VALUE(order_status) AS Status,
+          ANY_VALUE(is_online_order) AS OnlineOrderFlag,
+          ANY_VALUE(sales_order_number) AS SalesOrderNumber,
+          ANY_VALUE(purchase_order_number) AS PurchaseOrderNumber,
+          ANY_VALUE(account_number) AS AccountNumber,
+          NULLIF(ANY_VALUE(customer_key), -1) AS CustomerID,
+          CAST(NULLIF(ANY_VALUE(salesperson_key), -1) AS DOUBLE) AS SalesPersonID,
+          NULLIF(ANY_VALUE(territory_key), -1) AS TerritoryID,
+          NULLIF(ANY_VALUE(bill_to_address_key), -1) AS BillToAddressID,
+          NULLIF(ANY_VALUE(ship_to_address_key), -1) AS ShipToAddressID,
+          NULLIF(ANY_VALUE(ship_method_key), -1) AS ShipMethodID,
+          CAST(NULLIF(ANY_VALUE(credit_card_key), -1) AS DOUBLE) AS CreditCardID,
+          ANY_VALUE(order_subtotal) AS SubTotal,
+          ANY_VALUE(tax_amount) AS TaxAmt,
+          ANY_VALUE(freight) AS Freight,
+          ANY_VALUE(total_due) AS TotalDue,
+          {_date('ANY_VALUE(order_date_key)')} AS ModifiedDate
+        FROM fct_sales_source
+        GROUP BY sales_order_id""")
+    rows['Sales_SalesOrderDetail'] = runner.load_table('Sales_SalesOrderDetail', f"""
+        SELECT
+          sales_order_id AS SalesOrderID,
+          sales_order_detail_id AS SalesOrderDetailID,
+          order_quantity AS OrderQty,
+          NULLIF(product_key, -1) AS ProductID,
+          NULLIF(special_offer_key, -1) AS SpecialOfferID,
+          unit_price AS UnitPrice,
+          unit_price_discount AS UnitPriceDiscount,
+          line_total AS LineTotal,
+          {_date('order_date_key')} AS ModifiedDate
+        FROM fct_sales_source""")
+    rows['Sales_SpecialOfferProduct'] = runner.load_table('Sales_SpecialOfferProduct', """
+        SELECT DISTINCT SpecialOfferID, ProductID
+        FROM Sales_SalesOrderDetail
+        WHERE SpecialOfferID IS NOT NULL AND ProductID IS NOT NULL""")
+    runner.con.execute('DROP TABLE fct_sales_source')
+    return rows
+
+
+def apply_daily_delta(runner: LocalDataformRunner, late_share: float, update_share: float, seed: float) -> Dict[str, int]:
+    """
+    One day of source changes: new orders dated the day after the latest one
+    (late_share of them with a ModifiedDate two days earlier, as if they had
+    reached the source late) and update_share of the last 30 days' orders
+    revised, with their ModifiedDate moved to that day
+    """
+    con = runner.con
+    con.execute(f"SELECT setseed({seed})")
+    today, orders_per_day, next_order, next_line = con.execute("""
+        SELECT MAX(OrderDate) + 1,
+               COUNT(*) // COUNT(DISTINCT OrderDate),
+               MAX(SalesOrderID) + 1,
+               (SELECT MAX(SalesOrderDetailID) + 1 FROM Sales_SalesOrderDetail)
+        FROM Sales_SalesOrderHeader""").fetchone()
+    con.execute(f"""
+        CREATE OR REPLACE TEMP TABLE new_orders AS
+        SELECT SalesOrderID AS template_id,
+               {next_order} + ROW_NUMBER() OVER (ORDER BY SalesOrderID) - 1 AS SalesOrderID,
+               CASE WHEN random() < {late_share} THEN DATE '{today}' - 2 ELSE DATE '{today}' END AS ModifiedDate
+        FROM Sales_SalesOrderHeader
+        WHERE OrderDate >= DATE '{today}' - 365
+        ORDER BY random()
+        LIMIT {orders_per_day}""")
+    con.execute(f"""
+        INSERT INTO Sales_SalesOrderHeader BY NAME
+        SELECT h.* REPLACE (
+                 n.SalesOrderID AS SalesOrderID,
+                 DATE '{today}' AS OrderDate,
+                 DATE '{today}' + 12 AS DueDate,
+                 DATE '{today}' + 7 AS ShipDate,
+                 'SO' || n.SalesOrderID AS SalesOrderNumber,
+                 n.ModifiedDate AS ModifiedDate)
+        FROM new_orders n JOIN Sales_SalesOrderHeader h ON h.SalesOrderID = n.template_id""")
+    con.execute(f"""
+        INSERT INTO Sales_SalesOrderDetail BY NAME
+        SELECT d.* REPLACE (
+                 n.SalesOrderID AS SalesOrderID,
+                 {next_line} + ROW_NUMBER() OVER (ORDER BY d.SalesOrderDetailID) - 1 AS SalesOrderDetailID,
+                 n.ModifiedDate AS ModifiedDate)
+        FROM new_orders n JOIN Sales_SalesOrderDetail d ON d.SalesOrderID = n.template_id""")
+    new_lines = con.execute("SELECT COUNT(*) FROM Sales_SalesOrderDetail WHERE SalesOrderID >= ?",
+                            [next_order]).fetchone()[0]
+    con.execute(f"""
+        CREATE OR REPLACE TEMP TABLE revised AS
+        SELECT SalesOrderID FROM Sales_SalesOrderHeader
+        WHERE OrderDate BETWEEN DATE '{today}' - 30 AND DATE '{today}' - 1 AND random() < {update_share}""")
+    # Header changes (status, ship date) and line changes (quantity) both move the watermark
+    con.execute(f"""
+        UPDATE Sales_SalesOrderHeader
+        SET Status = 5, ShipDate = ShipDate + 1, RevisionNumber = RevisionNumber + 1, ModifiedDate = DATE '{today}'
+        WHERE SalesOrderID IN (SELECT SalesOrderID FROM revised)""")
+    con.execute(f"""
+        UPDATE Sales_SalesOrderDetail
+        SET OrderQty = OrderQty + 1, LineTotal = (OrderQty + 1) * UnitPrice * (1 - UnitPriceDiscount),
+            ModifiedDate = DATE '{today}'
+        WHERE SalesOrderID IN (SELECT SalesOrderID FROM revised) AND SalesOrderDetailID % 2 = 0""")
+    revised = con.execute("SELECT COUNT(*) FROM revised").fetchone()[0]
+    return {'day': str(today), 'new_orders': orders_per_day, 'new_lines': new_lines, 'revised_orders': revised}
+
+
+def _differences(runner: LocalDataformRunner, left: str, right: str) -> int:
+    """Rows in one table and not the other, loaded_at aside"""
+    return runner.con.execute(f"""
+        SELECT (SELECT COUNT(*) FROM (SELECT * EXCLUDE (loaded_at) FROM "{left}"
+                                      EXCEPT ALL SELECT * EXCLUDE (loaded_at) FROM "{right}"))
+             + (SELECT COUNT(*) FROM (SELECT * EXCLUDE (loaded_at) FROM "{right}"
+                                      EXCEPT ALL SELECT * EXCLUDE (loaded_at) FROM "{left}"))""").fetchone()[0]
+
+
+def _size(value: float) -> str:
+    if value < 1024 * 1024:
+        return f"{value / 1024:,.1f} KB"
+    return f"{value / 1024 / 1024:,.1f} MB"
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark incremental fct_sales runs against full rebuilds")
+    parser.add_argument('--data-dir', default=None)
+    parser.add_argument('--days', type=int, default=3, help="Simulated daily deltas")
+    parser.add_argument('--late-share', type=float, default=0.05,
+                        help="Share of a day's new orders that reach the source late")
+    parser.add_argument('--update-share', type=float, default=0.02,
+                        help="Share of the last 30 days' orders revised per day")
+    parser.add_argument('--output', help="Write the JSON report here as well")
+    args = parser.parse_args(argv)
+
+    data_dir = args.data_dir or os.getenv('LOCAL_WAREHOUSE_DIR', DEFAULT_OUT_DIR)
+    runner = LocalDataformRunner()
+    sources = load_sources(runner, data_dir)
+    print(f"Sources: {sources['Sales_SalesOrderHeader']:,} orders, {sources['Sales_SalesOrderDetail']:,} lines")
+    initial = runner.run('fct_sales', full_refresh=True)
+    print(f"Initial build: {initial['rows']:,} rows in {initial['seconds']:.2f}s")
+
+    days: List[Dict[str, Any]] = []
+    for day in range(args.days):
+        delta = apply_daily_delta(runner, args.late_share, args.update_share, seed=(day + 1) / (args.days + 1))
+        incremental = runner.run('fct_sales')
+        runner.load_table('fct_sales_incremental', 'SELECT * FROM fct_sales')
+        rebuild = runner.run('fct_sales', full_refresh=True)
+        days.append({
+            **delta,
+            'merged_rows': incremental['changed_rows'],
+            'rows': rebuild['rows'],
+            'seconds_incremental': incremental['seconds'],
+            'seconds_rebuild': rebuild['seconds'],
+            'bytes_incremental': incremental['bytes_processed'],
+            'bytes_rebuild': rebuild['bytes_processed'],
+            'bytes_merge_target': incremental['bytes_merge_target'],
+            'differences': _differences(runner, 'fct_sales_incremental', 'fct_sales'),
+        })
+
+    print(f"\n{'Day':10} {'New lines':>9} {'Revised':>7} {'Merged':>7} {'Wall clock (s)':>17} {'Bytes billed':>23}")
+    for d in days:
+        print(f"{d['day']:10} {d['new_lines']:>9,} {d['revised_orders']:>7,} {d['merged_rows']:>7,} "
+              f"{d['seconds_rebuild']:>7.2f} -> {d['seconds_incremental']:>5.2f} "
+              f"{_size(d['bytes_rebuild']):>10} -> {_size(d['bytes_incremental']):>9}"
+              + ("" if not d['differences'] else f"  {d['differences']} DIFFERENT ROWS"))
+
+    report: Dict[str, Any] = {
+        'days': len(days),
+        'rows': days[-1]['rows'] if days else initial['rows'],
+        'merged_rows_per_day': statistics.median(d['merged_rows'] for d in days) if days else 0,
+        'seconds_rebuild': statistics.median(d['seconds_rebuild'] for d in days) if days else 0.0,
+        'seconds_incremental': statistics.median(d['seconds_incremental'] for d in days) if days else 0.0,
+        'bytes_rebuild': statistics.median(d['bytes_rebuild'] for d in days) if days else 0,
+        'bytes_incremental': statistics.median(d['bytes_incremental'] for d in days) if days else 0,
+        'bytes_merge_target': statistics.median(d['bytes_merge_target'] for d in days) if days else 0,
+        'mismatched_days': [d['day'] for d in days if d['differences']],
+    }
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'report': report, 'days': days}, f, indent=2)
+    return 0 if not report['mismatched_days'] else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,103 @@
+"""
+Partition pruning: bytes scanned by the standard questions, before and after
+
+Compiles every labelled query against the base tables (aggregate awareness
+off, so the facts themselves are read) twice and prices each SQL the way
+on-demand BigQuery bills it:
+
+- before: the query as the explores compiled it before partitioning, with
+  no condition on the fact's partition column
+- after: year filters also repeated on the partition column as a date range
+  (lookml_catalog.partition_query), as both backends send them now
+
+Pruning is not assumed from the SQL text. Each SQL is planned with EXPLAIN,
+the local stand-in for a BigQuery dry run, and only filters the planner
+pushes into the fact's scan prune its partitions (scanned_bytes). Both SQLs
+are also run and their results compared, so a partition filter that changes
+an answer shows up as a mismatch. Clustering is not priced: its savings
+depend on BigQuery's block layout and never show in estimates.
+
+    python benchmark_partitions.py eval/labelled_questions.jsonl --data-dir warehouse
+    python benchmark_partitions.py eval/labelled_questions.jsonl --output partitions.json
+"""
+import sys
+import json
+import argparse
+from typing import Dict, Any
+
+from looker_client import QueryResultCache, canonical_query_key
+from lookml_catalog import load_catalog
+from local_warehouse import LocalWarehouseClient
+from benchmark_aggregates import _size, _same_result
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Bytes scanned with and without partitioned facts")
+    parser.add_argument('questions', help="JSONL with {question, query} rows")
+    parser.add_argument('--data-dir', default=None)
+    parser.add_argument('--show-sql', action='store_true')
+    parser.add_argument('--output', help="Write the JSON report here as well")
+    args = parser.parse_args(argv)
+
+    catalog = load_catalog()
+    before = LocalWarehouseClient(args.data_dir, catalog=catalog, cache=QueryResultCache(max_bytes=0),
+                                  aggregate_awareness=False, wide_explores=False, partition_filters=False)
+    client = LocalWarehouseClient(args.data_dir, catalog=catalog, cache=QueryResultCache(max_bytes=0),
+                                  aggregate_awareness=False, wide_explores=False)
+
+    with open(args.questions, 'r') as f:
+        rows = [json.loads(line) for line in f if line.strip()]
+    queries, seen = [], set()
+    for row in rows:
+        if row.get('query') and canonical_query_key(row['query']) not in seen:
+            seen.add(canonical_query_key(row['query']))
+            queries.append((row['question'], row['query']))
+
+    results = []
+    cursor = client._con.cursor()
+    for question, query in queries:
+        after_sql = client.compile(query)
+        before_sql = before.compile(query)
+        if args.show_sql and before_sql != after_sql:
+            print(f"-- {question}\n{after_sql};\n")
+        bytes_before, bytes_after = client.scanned_bytes(before_sql), client.scanned_bytes(after_sql)
+        results.append({
+            'question': question,
+            'explore': query.get('explore'),
+            'partition_filter': before_sql != after_sql,
+            'pruned': bytes_after < bytes_before,
+            'bytes_before': bytes_before,
+            'bytes_after': bytes_after,
+            'same_result': _same_result(cursor.execute(before_sql).df(), cursor.execute(after_sql).df()),
+        })
+    cursor.close()
+
+    print(f"\n{'Question':60} {'Scanned':>21}")
+    for r in results:
+        print(f"{r['question'][:60]:60} {_size(r['bytes_before']):>9} -> {_size(r['bytes_after']):>9}"
+              + ("" if r['same_result'] else "  MISMATCH"))
+
+    pruned = [r for r in results if r['pruned']]
+    bytes_before = sum(r['bytes_before'] for r in results)
+    bytes_after = sum(r['bytes_after'] for r in results)
+    pruned_before = sum(r['bytes_before'] for r in pruned)
+    pruned_after = sum(r['bytes_after'] for r in pruned)
+    report: Dict[str, Any] = {
+        'queries': len(results),
+        'queries_with_partition_filter': sum(r['partition_filter'] for r in results),
+        'queries_pruned': len(pruned),
+        'bytes_scanned_before': bytes_before,
+        'bytes_scanned_after': bytes_after,
+        'bytes_reduction': 1 - bytes_after / bytes_before if bytes_before else 0.0,
+        'pruned_queries_bytes_reduction': 1 - pruned_after / pruned_before if pruned_before else 0.0,
+        'mismatches': [r['question'] for r in results if not r['same_result']],
+    }
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'report': report, 'queries': results}, f, indent=2)
+    return 0 if not report['mismatches'] else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
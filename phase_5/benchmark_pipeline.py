@@ -0,0 +1,463 @@
+"""
+End-to-end latency benchmark: question -> query -> results -> DataFrame -> chart -> insight
+
+Replays a question corpus through the same calls app.py makes
+(GeminiClient.translate_to_looker_query, run_query_frame, chart building,
+generate_insight). --json-results uses the older run_query + pd.DataFrame
+path instead, which adds a "dataframe" stage. The Gemini model and the Looker SDK are
+replaced with stubs whose latencies are drawn from configurable, seeded
+distributions, so runs are offline and repeatable. With --backend local
+the stub Looker is replaced with the DuckDB warehouse instead.
+
+Latency specs are "const:MS", "uniform:LO,HI", "normal:MEAN,SD" or
+"lognormal:MEDIAN,SIGMA" (milliseconds).
+
+    python benchmark_pipeline.py --output results.json
+    python benchmark_pipeline.py --llm-latency lognormal:900,0.4 --passes 3 --compare results.json
+    python benchmark_pipeline.py --force-llm --time-scale 0 --rows 50000
+    python benchmark_pipeline.py --json-results --rows 50000 --output json.json   # pre-typed-ingestion path
+"""
+import io
+import os
+import csv
+import re
+import ast
+import sys
+import json
+import time
+import random
+import argparse
+import platform
+import tempfile
+import contextlib
+from datetime import datetime
+from typing import Dict, Any, List, Optional
+from types import SimpleNamespace
+
+from dotenv import load_dotenv
+
+STAGES = ['translate', 'first_page', 'run_query', 'dataframe', 'chart', 'insight', 'total']
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+class LatencyDistribution:
+    """Seeded latency sampler parsed from a spec such as "lognormal:900,0.4" (milliseconds)"""
+
+    KINDS = {'const': 1, 'uniform': 2, 'normal': 2, 'lognormal': 2}
+
+    def __init__(self, spec: str, rng: random.Random, time_scale: float = 1.0):
+        kind, _, args = spec.partition(':')
+        params = [float(value) for value in args.split(',') if value.strip()]
+        if kind not in self.KINDS or len(params) != self.KINDS[kind]:
+            raise ValueError(f"Bad latency spec {spec!r}: expected const:MS, uniform:LO,HI, "
+                             f"normal:MEAN,SD or lognormal:MEDIAN,SIGMA")
+        self.spec = spec
+        self.kind = kind
+        self.params = params
+        self.rng = rng
+        self.time_scale = time_scale
+
+    def sample(self) -> float:
+        if self.kind == 'const':
+            value = self.params[0]
+        elif self.kind == 'uniform':
+            value = self.rng.uniform(*self.params)
+        elif self.kind == 'normal':
+            value = self.rng.gauss(*self.params)
+        else:
+            value = self.params[0] * self.rng.lognormvariate(0.0, self.params[1])
+        return max(0.0, value)
+
+    def wait(self) -> None:
+        """Sleep for one sampled latency (scaled; --time-scale 0 keeps the draws but skips the sleep)"""
+        delay = self.sample() * self.time_scale / 1000
+        if delay > 0:
+            time.sleep(delay)
+
+
+class StubGenerativeModel:
+    """
+    Stands in for genai.GenerativeModel
+
+    Translation prompts are answered with the labelled query for the
+    question when the corpus has one, otherwise a generic sales query;
+    insight prompts get a canned summary.
+    """
+
+    FALLBACK_QUERY = {
+        "explore": "sales_analysis",
+        "dimensions": ["dim_product.category_name"],
+        "measures": ["fct_sales.total_sales_amount"],
+        "filters": {},
+        "sorts": ["fct_sales.total_sales_amount desc"],
+        "limit": 10
+    }
+
+    def __init__(self, answers: Dict[str, Dict[str, Any]], translate_latency: LatencyDistribution,
+                 insight_latency: LatencyDistribution):
+        self.answers = answers
+        self.translate_latency = translate_latency
+        self.insight_latency = insight_latency
+        self.calls = {'translate': 0, 'insight': 0}
+
+    def generate_content(self, prompt: str):
+        match = re.search(r'USER QUESTION: "(.*)"', prompt)
+        if match:
+            self.calls['translate'] += 1
+            self.translate_latency.wait()
+            query = self.answers.get(match.group(1), self.FALLBACK_QUERY)
+            return SimpleNamespace(text=json.dumps(query))
+        self.calls['insight'] += 1
+        self.insight_latency.wait()
+        return SimpleNamespace(text="Bikes lead revenue by a wide margin, with Components a distant second.")
+
+
+class StubLookerSDK:
+    """
+    Stands in for the looker_sdk 4.0 client: create_query, run_query, run_inline_query
+    and all_datagroups (trigger values that never move: no load happens mid-run)
+
+    Results have one row per requested row (capped by the query limit unless
+    a fixed row count is forced), with string dimensions and numeric measures
+    so DataFrame and chart building do realistic work.
+    """
+
+    def __init__(self, catalog: Dict[str, Any], create_latency: LatencyDistribution,
+                 run_latency: LatencyDistribution, rng: random.Random, rows: Optional[int] = None):
+        self.catalog = catalog
+        self.create_latency = create_latency
+        self.run_latency = run_latency
+        self.rng = rng
+        self.rows = rows
+        self.queries: Dict[str, Any] = {}
+        self.calls = {'create_query': 0, 'run_query': 0, 'run_inline_query': 0, 'all_datagroups': 0}
+
+    def me(self):
+        return SimpleNamespace(display_name='benchmark stub')
+
+    def create_query(self, body):
+        self.calls['create_query'] += 1
+        self.create_latency.wait()
+        query_id = str(len(self.queries) + 1)
+        self.queries[query_id] = body
+        return SimpleNamespace(id=query_id, slug=f"stub{query_id}")
+
+    def run_query(self, query_id: str, result_format: str = 'json'):
+        self.calls['run_query'] += 1
+        self.run_latency.wait()
+        return self._payload(self.queries[query_id], result_format)
+
+    def run_inline_query(self, result_format: str, body):
+        self.calls['run_inline_query'] += 1
+        self.run_latency.wait()
+        return self._payload(body, result_format)
+
+    def all_datagroups(self):
+        self.calls['all_datagroups'] += 1
+        return [SimpleNamespace(model_name=self.catalog.get('model', ''), name=name, trigger_value='stub',
+                                trigger_error=None)
+                for name in self.catalog.get('datagroups', {})]
+
+    def _payload(self, body, result_format: str) -> str:
+        rows = self._rows(body)
+        if result_format != 'csv':
+            return json.dumps(rows)
+        # Looker's CSV header carries labels, not field names
+        fields = list(body.fields or [])
+        out = io.StringIO()
+        writer = csv.writer(out)
+        writer.writerow([field.split('.')[-1].replace('_', ' ').title() for field in fields])
+        writer.writerows([row[field] for field in fields] for row in rows)
+        return out.getvalue()
+
+    def _rows(self, body) -> List[Dict[str, Any]]:
+        fields = list(body.fields or [])
+        explore_fields = self.catalog['explores'].get(body.view, {}).get('fields', {})
+        count = self.rows if self.rows is not None else min(int(body.limit or 100), 50)
+        rows = []
+        for i in range(count):
+            row = {}
+            for field in fields:
+                meta = explore_fields.get(field, {})
+                if meta.get('kind') == 'measure' and meta.get('type') in ('count', 'count_distinct'):
+                    row[field] = int(self.rng.lognormvariate(6, 1.5))
+                elif meta.get('kind') == 'measure':
+                    row[field] = round(self.rng.lognormvariate(10, 1.5), 2)
+                elif field.endswith('.year'):
+                    row[field] = 2011 + i % 4
+                else:
+                    row[field] = f"{field.split('.')[-1]} {i + 1}"
+            rows.append(row)
+        return rows
+
+
+class _NoTemplates:
+    """Disables the template translator for --force-llm"""
+
+    def translate(self, question: str) -> None:
+        return None
+
+
+def _sidebar_questions(app_path: str) -> List[str]:
+    """The example_questions list from app.py, read without importing Streamlit"""
+    with open(app_path, 'r') as f:
+        tree = ast.parse(f.read())
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Assign) and any(
+                isinstance(target, ast.Name) and target.id == 'example_questions' for target in node.targets):
+            return list(ast.literal_eval(node.value))
+    return []
+
+
+def load_corpus(paths: List[str], include_examples: bool = True) -> List[Dict[str, Any]]:
+    """Sidebar examples, prompt few-shot examples and labelled JSONL files, deduplicated in order"""
+    from gemini_client import PROMPT_EXAMPLES
+
+    rows: List[Dict[str, Any]] = []
+    if include_examples:
+        rows += [{'question': q, 'corpus': 'sidebar'} for q in _sidebar_questions(os.path.join(BASE_DIR, 'app.py'))]
+        for _, text in PROMPT_EXAMPLES:
+            question, _, body = text.partition('\n')
+            rows.append({'question': question[len('Question: "'):-1], 'query': json.loads(body), 'corpus': 'prompt'})
+    for path in paths:
+        with open(path, 'r') as f:
+            rows += [dict(json.loads(line), corpus=os.path.basename(path)) for line in f if line.strip()]
+
+    corpus: Dict[str, Dict[str, Any]] = {}
+    for row in rows:
+        existing = corpus.setdefault(row['question'], row)
+        if 'query' not in existing and row.get('query'):
+            existing['query'] = row['query']
+    return list(corpus.values())
+
+
+def summarize(values: List[float]) -> Dict[str, float]:
+    # Imported here: tracing reads TRACE_LOG_PATH on import, after main() has loaded .env
+    from tracing import percentile
+    return {
+        'count': len(values),
+        'mean_ms': round(sum(values) / len(values), 3) if values else 0.0,
+        'p50_ms': round(percentile(values, 50), 3),
+        'p95_ms': round(percentile(values, 95), 3),
+        'p99_ms': round(percentile(values, 99), 3),
+        'max_ms': round(max(values), 3) if values else 0.0,
+    }
+
+
+def run_pipeline(question: str, gemini, looker, insight: bool, json_results: bool = False) -> Dict[str, float]:
+    """One question through the app's steps; returns milliseconds per stage"""
+    import pandas as pd
+    from charts import chart_columns, build_chart
+
+    timings = {}
+    start = time.perf_counter()
+
+    t0 = time.perf_counter()
+    query = gemini.translate_to_looker_query(question, conversation_history=[])
+    timings['translate'] = (time.perf_counter() - t0) * 1000
+
+    if json_results:
+        t0 = time.perf_counter()
+        results = looker.run_query(query)
+        timings['run_query'] = (time.perf_counter() - t0) * 1000
+        if not results:
+            raise ValueError("No data returned from query")
+
+        t0 = time.perf_counter()
+        df = pd.DataFrame(results if isinstance(results, list) else [results])
+        timings['dataframe'] = (time.perf_counter() - t0) * 1000
+    else:
+        from large_results import is_large
+        t0 = time.perf_counter()
+        if is_large(query):
+            stream = looker.run_query_stream(query, spool_dir=None)
+            stream.first_page()
+            timings['first_page'] = (time.perf_counter() - t0) * 1000
+            df = stream.frame()
+        else:
+            df = looker.run_query_frame(query)
+        timings['run_query'] = (time.perf_counter() - t0) * 1000
+        if df.empty:
+            raise ValueError("No data returned from query")
+
+    # Chart stage includes the figure JSON Streamlit serializes for the browser
+    t0 = time.perf_counter()
+    if len(df.columns) >= 2:
+        dimension_col, measure_col = chart_columns(df)
+        build_chart(df, dimension_col, measure_col).to_json()
+    timings['chart'] = (time.perf_counter() - t0) * 1000
+
+    if insight:
+        t0 = time.perf_counter()
+        gemini.generate_insight(question, df)
+        timings['insight'] = (time.perf_counter() - t0) * 1000
+
+    timings['total'] = (time.perf_counter() - start) * 1000
+    return timings
+
+
+def compare(baseline: Dict[str, Any], current: Dict[str, Any]) -> List[str]:
+    """Per-stage p50/p95 change against an earlier results file"""
+    lines = [f"{'stage':<10} {'p50 base':>10} {'p50 now':>10} {'change':>8} {'p95 base':>10} {'p95 now':>10} {'change':>8}"]
+    for stage in STAGES:
+        old, new = baseline['stages'].get(stage), current['stages'].get(stage)
+        if not old or not new:
+            continue
+        cells = []
+        for key in ('p50_ms', 'p95_ms'):
+            change = (new[key] - old[key]) / old[key] * 100 if old[key] else 0.0
+            cells.append(f"{old[key]:>10.1f} {new[key]:>10.1f} {change:>+7.1f}%")
+        lines.append(f"{stage:<10} {' '.join(cells)}")
+    old_qps, new_qps = baseline.get('throughput_qps', 0), current.get('throughput_qps', 0)
+    lines.append(f"throughput {old_qps:.2f} -> {new_qps:.2f} questions/s")
+    return lines
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="End-to-end pipeline latency with stub Gemini and Looker")
+    parser.add_argument('--corpus', action='append', default=None,
+                        help="JSONL with {question, [query]} rows (repeatable, default eval/labelled_questions.jsonl)")
+    parser.add_argument('--no-examples', action='store_true', help="Skip the sidebar and prompt example questions")
+    parser.add_argument('--passes', type=int, default=2, help="Replays of the corpus (later passes hit warm caches)")
+    parser.add_argument('--llm-latency', default='lognormal:900,0.35')
+    parser.add_argument('--insight-latency', default='lognormal:1200,0.3')
+    parser.add_argument('--create-latency', default='lognormal:150,0.3', help="Looker create_query")
+    parser.add_argument('--run-latency', default='lognormal:700,0.5', help="Looker run_query")
+    parser.add_argument('--time-scale', type=float, default=1.0,
+                        help="Multiply stub sleeps (0 measures pure pipeline overhead)")
+    parser.add_argument('--rows', type=int, default=None, help="Force the stub result size (default: query limit, max 50)")
+    parser.add_argument('--backend', choices=['stub', 'local'], default='stub',
+                        help="local runs queries on the DuckDB warehouse instead of the stub Looker")
+    parser.add_argument('--data-dir', default=None, help="Parquet directory for --backend local")
+    parser.add_argument('--force-llm', action='store_true',
+                        help="Bypass translation cache, templates and question index")
+    parser.add_argument('--no-insight', action='store_true', help="Skip generate_insight (app default)")
+    parser.add_argument('--json-results', action='store_true',
+                        help="Fetch JSON and build the DataFrame from a list of dicts (the pre-Arrow path)")
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output', help="Write the JSON results here")
+    parser.add_argument('--compare', help="Earlier results JSON to compare against")
+    parser.add_argument('--verbose', action='store_true', help="Show client logging")
+    args = parser.parse_args(argv)
+
+    load_dotenv()
+    # The stub model is never sent anywhere, the client just needs a key to construct
+    os.environ.setdefault('GEMINI_API_KEY', 'offline-benchmark')
+
+    from gemini_client import GeminiClient, TranslationCache
+    from question_index import QuestionIndex
+    from looker_client import LookerClient, QueryResultCache, QueryIdRegistry
+
+    corpus = load_corpus(args.corpus or [os.path.join(BASE_DIR, 'eval', 'labelled_questions.jsonl')],
+                         include_examples=not args.no_examples)
+    answers = {row['question']: row['query'] for row in corpus if row.get('query')}
+    rng = random.Random(args.seed)
+
+    def latency(spec: str) -> LatencyDistribution:
+        return LatencyDistribution(spec, random.Random(rng.random()), args.time_scale)
+
+    workdir = tempfile.mkdtemp(prefix='pipeline-bench-')
+    # Fresh, unpersisted caches: every run starts cold and leaves nothing behind
+    gemini = GeminiClient(
+        cache=TranslationCache(path=None, max_entries=0 if args.force_llm else 2000),
+        index=QuestionIndex(path=None, threshold=1.01 if args.force_llm else 0.85),
+    )
+    gemini.question_log_path = os.path.join(workdir, 'question_log.jsonl')
+    gemini.model = StubGenerativeModel(answers, latency(args.llm_latency), latency(args.insight_latency))
+    if args.force_llm:
+        gemini.templates = _NoTemplates()
+
+    if args.backend == 'local':
+        from local_warehouse import LocalWarehouseClient
+        looker = LocalWarehouseClient(args.data_dir, catalog=gemini.catalog)
+        sdk = None
+    else:
+        sdk = StubLookerSDK(gemini.catalog, latency(args.create_latency), latency(args.run_latency),
+                            random.Random(rng.random()), rows=args.rows)
+        looker = LookerClient(cache=QueryResultCache(), registry=QueryIdRegistry(path=None),
+                              inline_queries=False, sdk=sdk)
+
+    stage_values: Dict[str, List[float]] = {stage: [] for stage in STAGES}
+    per_pass = []
+    errors = []
+    print(f"Replaying {len(corpus)} questions x {args.passes} passes "
+          f"({args.backend} backend, time scale {args.time_scale})")
+    started = time.perf_counter()
+    for pass_number in range(1, args.passes + 1):
+        pass_start = time.perf_counter()
+        totals = []
+        for row in corpus:
+            sink = io.StringIO()
+            try:
+                with contextlib.redirect_stdout(sys.stdout if args.verbose else sink):
+                    timings = run_pipeline(row['question'], gemini, looker, insight=not args.no_insight,
+                                           json_results=args.json_results)
+            except Exception as e:
+                errors.append({'pass': pass_number, 'question': row['question'], 'error': str(e)})
+                continue
+            for stage, value in timings.items():
+                stage_values[stage].append(value)
+            totals.append(timings['total'])
+        seconds = time.perf_counter() - pass_start
+        per_pass.append({'pass': pass_number, 'seconds': round(seconds, 3),
+                         'throughput_qps': round(len(totals) / seconds, 3) if seconds else 0.0,
+                         'total': summarize(totals)})
+        print(f"  pass {pass_number}: {len(totals)} questions in {seconds:.1f}s, "
+              f"p50 {per_pass[-1]['total']['p50_ms']:.0f}ms, p95 {per_pass[-1]['total']['p95_ms']:.0f}ms")
+    wall = time.perf_counter() - started
+
+    with open(gemini.question_log_path, 'r') as f:
+        sources: Dict[str, int] = {}
+        for line in f:
+            source = json.loads(line)['source']
+            sources[source] = sources.get(source, 0) + 1
+
+    completed = len(stage_values['total'])
+    report = {
+        'run': {
+            'timestamp': datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'questions': len(corpus),
+            'passes': args.passes,
+            'backend': args.backend,
+            'force_llm': args.force_llm,
+            'insight': not args.no_insight,
+            'json_results': args.json_results,
+            'seed': args.seed,
+            'time_scale': args.time_scale,
+            'latency': {
+                'llm': args.llm_latency, 'insight': args.insight_latency,
+                'create_query': args.create_latency, 'run_query': args.run_latency,
+            },
+            'rows': args.rows,
+        },
+        'stages': {stage: summarize(values) for stage, values in stage_values.items() if values},
+        'wall_seconds': round(wall, 3),
+        'throughput_qps': round(completed / wall, 3) if wall else 0.0,
+        'passes': per_pass,
+        'translation_sources': sources,
+        'stub_calls': {'gemini': gemini.model.calls, 'looker': sdk.calls if sdk else None},
+        'caches': {'gemini': gemini.cache_stats(), 'looker': looker.cache_stats()},
+        'errors': errors,
+    }
+
+    print(f"\n{'stage':<10} {'count':>6} {'p50':>9} {'p95':>9} {'p99':>9} {'max':>9}  (ms)")
+    for stage, summary in report['stages'].items():
+        print(f"{stage:<10} {summary['count']:>6} {summary['p50_ms']:>9.1f} {summary['p95_ms']:>9.1f} "
+              f"{summary['p99_ms']:>9.1f} {summary['max_ms']:>9.1f}")
+    print(f"throughput {report['throughput_qps']:.2f} questions/s, sources {sources}, errors {len(errors)}")
+
+    if args.compare:
+        with open(args.compare, 'r') as f:
+            baseline = json.load(f)
+        print()
+        print('\n'.join(compare(baseline, report)))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"Results written to {args.output}")
+    return 0 if not errors else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,125 @@
+"""
+Prompt size and translation latency: full catalog vs routed per-explore prompt
+
+Offline (default) reports estimated prompt tokens, routing time and routing
+accuracy on a fixed question set. Prompt sizes are also compared with the
+same prompt built on the hand-written field list the catalog replaced
+(eval/baseline_lookml_context.txt). With --live, each question is also sent to
+Gemini with both prompts and wall-clock latency and exact token counts are
+reported.
+
+    python benchmark_prompts.py eval/labelled_questions.jsonl
+    python benchmark_prompts.py eval/labelled_questions.jsonl --live --repeat 3
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import statistics
+from typing import Dict, Any, List
+
+from dotenv import load_dotenv
+
+
+def _summary(values: List[float]) -> Dict[str, float]:
+    # Imported here: tracing reads TRACE_LOG_PATH on import, after main() has loaded .env
+    from tracing import percentile
+    return {
+        'mean': statistics.mean(values) if values else 0.0,
+        'p50': percentile(values, 50),
+        'p95': percentile(values, 95),
+    }
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark full vs routed translation prompts")
+    parser.add_argument('questions', help="JSONL with {question, [query]} rows")
+    parser.add_argument('--live', action='store_true', help="Call Gemini and time both prompts")
+    parser.add_argument('--repeat', type=int, default=1, help="Live calls per question and prompt")
+    parser.add_argument('--baseline', default=os.path.join(os.path.dirname(os.path.abspath(__file__)), 'eval',
+                                                           'baseline_lookml_context.txt'),
+                        help="Field list to compare prompt sizes with")
+    parser.add_argument('--output', help="Write the JSON report here as well")
+    args = parser.parse_args(argv)
+
+    load_dotenv()
+    if not args.live:
+        # The model is never called offline, the client just needs a key to construct
+        os.environ.setdefault('GEMINI_API_KEY', 'offline-benchmark')
+
+    from gemini_client import GeminiClient
+
+    with open(args.questions, 'r') as f:
+        rows = [json.loads(line) for line in f if line.strip()]
+    with open(args.baseline, 'r') as f:
+        baseline_context = f.read()
+
+    client = GeminiClient()
+
+    def count_tokens(prompt: str) -> int:
+        if args.live:
+            return client.model.count_tokens(prompt).total_tokens
+        # Rough estimate for English prompts with JSON: ~4 characters per token
+        return len(prompt) // 4
+
+    full_tokens, routed_tokens, baseline_tokens, route_ms = [], [], [], []
+    full_latency, routed_latency = [], []
+    correct_routes = labelled = full_fallbacks = 0
+
+    for row in rows:
+        question = row['question']
+        full_prompt = client.build_prompt(question)
+
+        start = time.perf_counter()
+        explores = client.router.route(question)
+        routed_prompt = client.build_prompt(question, explores=explores)
+        route_ms.append((time.perf_counter() - start) * 1000)
+
+        full_tokens.append(count_tokens(full_prompt))
+        # The same prompt with the hand-written field list in place of the catalog's
+        baseline_tokens.append(count_tokens(full_prompt.replace(client.lookml_context.strip(), baseline_context.strip())))
+        routed_tokens.append(count_tokens(routed_prompt))
+        if explores is None:
+            full_fallbacks += 1
+        if row.get('query'):
+            labelled += 1
+            if explores is None or row['query']['explore'] in explores:
+                correct_routes += 1
+
+        if args.live:
+            pairs = [(full_prompt, full_latency), (routed_prompt, routed_latency)]
+            for i in range(args.repeat):
+                # Alternate order so neither prompt always gets the warm connection
+                for prompt, sink in (pairs if i % 2 == 0 else pairs[::-1]):
+                    start = time.perf_counter()
+                    client.model.generate_content(prompt)
+                    sink.append(time.perf_counter() - start)
+
+    report: Dict[str, Any] = {
+        'questions': len(rows),
+        'token_counting': 'gemini count_tokens' if args.live else 'estimate (chars / 4)',
+        'prompt_tokens_full': _summary(full_tokens),
+        'prompt_tokens_routed': _summary(routed_tokens),
+        'prompt_tokens_baseline': _summary(baseline_tokens),
+        'catalog_tokens': count_tokens(client.lookml_context),
+        'baseline_catalog_tokens': count_tokens(baseline_context),
+        'full_vs_baseline': (sum(full_tokens) / sum(baseline_tokens)) - 1 if baseline_tokens else 0.0,
+        'token_reduction': 1 - (sum(routed_tokens) / sum(full_tokens)) if full_tokens else 0.0,
+        'routing_ms': _summary(route_ms),
+        'routing_accuracy': correct_routes / labelled if labelled else None,
+        'full_context_fallbacks': full_fallbacks,
+    }
+    if args.live:
+        report['latency_s_full'] = _summary(full_latency)
+        report['latency_s_routed'] = _summary(routed_latency)
+
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
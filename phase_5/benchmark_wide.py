@@ -0,0 +1,172 @@
+"""
+One-big-table: the sales questions on obt_sales vs the sales_analysis star
+
+--build runs the real phase_3 obt_sales model with dataform_runner on
+DuckDB, from a local warehouse's fct_sales and dimensions, and writes it
+next to them as <data_dir>/obt_sales/ (hive-partitioned by order year, like
+the facts), then runs it once more incrementally (only the lookback window
+is merged) to price a daily refresh.
+
+Every labelled query sales_analysis_wide can answer is then run both ways,
+with aggregate awareness off on both sides so the facts themselves are
+read: on the star explore (fct_sales joined to its dimensions) and routed
+to the wide explore (the pre-joined columns read from obt_sales, the
+remaining joins kept). Per query it reports the joins left, the bytes
+BigQuery would scan (partitioned tables) and the DuckDB latency, and checks
+both give the same result.
+
+    python benchmark_wide.py eval/labelled_questions.jsonl --data-dir warehouse --build
+    python benchmark_wide.py eval/labelled_questions.jsonl --repeat 10 --output wide.json
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import statistics
+from typing import Dict, Any
+
+from looker_client import QueryResultCache, canonical_query_key
+from lookml_catalog import load_catalog
+from local_warehouse import LocalWarehouseClient
+from dataform_runner import LocalDataformRunner
+from benchmark_incremental import _parquet
+from benchmark_aggregates import _size, _summary, _same_result
+
+WIDE_TABLE = 'obt_sales'
+SOURCES = ['fct_sales', 'dim_product', 'dim_customer', 'dim_date', 'dim_territory', 'dim_salesperson',
+           'dim_ship_method', 'dim_special_offer', 'dim_credit_card']
+
+
+def build_wide_table(data_dir: str) -> Dict[str, Any]:
+    """Run obt_sales (full, then incremental) and write it as <data_dir>/obt_sales/order_year=YYYY/"""
+    runner = LocalDataformRunner()
+    for table in SOURCES:
+        # The local hive partition column is not a fct_sales column
+        runner.load_table(table, f"SELECT * EXCLUDE (order_year) FROM {_parquet(data_dir, table)}"
+                          if table == 'fct_sales' else f"SELECT * FROM {_parquet(data_dir, table)}")
+    full = runner.run(WIDE_TABLE, full_refresh=True)
+    incremental = runner.run(WIDE_TABLE)
+
+    path = os.path.join(data_dir, WIDE_TABLE)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    runner.con.execute(f"COPY (SELECT *, EXTRACT(YEAR FROM order_date) AS order_year FROM \"{WIDE_TABLE}\") "
+                       f"TO '{tmp_path}' (FORMAT PARQUET, COMPRESSION ZSTD, PARTITION_BY (order_year))")
+    shutil.rmtree(path, ignore_errors=True)
+    os.replace(tmp_path, path)
+    return {
+        'full': full,
+        'incremental': incremental,
+        'storage_bytes_fct_sales': sum(runner.column_bytes('fct_sales').values()),
+        'storage_bytes_obt_sales': sum(runner.column_bytes(WIDE_TABLE).values()),
+    }
+
+
+def _timed(client: LocalWarehouseClient, query: Dict[str, Any], repeat: int):
+    sql, params = client.compiler.compile(query)
+    timings, frame = [], None
+    cursor = client._con.cursor()
+    try:
+        for _ in range(repeat):
+            start = time.perf_counter()
+            frame = cursor.execute(sql, params).df()
+            timings.append((time.perf_counter() - start) * 1000)
+    finally:
+        cursor.close()
+    return statistics.median(timings), frame
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark sales queries on the star explore vs the wide table")
+    parser.add_argument('questions', help="JSONL with {question, query} rows")
+    parser.add_argument('--data-dir', default=None)
+    parser.add_argument('--build', action='store_true', help="(Re)build obt_sales from the warehouse first")
+    parser.add_argument('--repeat', type=int, default=5, help="Timed runs per query and mode (median kept)")
+    parser.add_argument('--show-sql', action='store_true')
+    parser.add_argument('--output', help="Write the JSON report here as well")
+    args = parser.parse_args(argv)
+
+    build = None
+    if args.build:
+        data_dir = args.data_dir or os.getenv('LOCAL_WAREHOUSE_DIR', os.path.join(
+            os.path.dirname(os.path.abspath(__file__)), 'warehouse'))
+        build = build_wide_table(data_dir)
+        for mode in ('full', 'incremental'):
+            run = build[mode]
+            print(f"{WIDE_TABLE} {mode}: {run['changed_rows']:,} rows in {run['seconds']:.2f}s, "
+                  f"{_size(run['bytes_processed'])} billed")
+        print(f"Storage: fct_sales {_size(build['storage_bytes_fct_sales'])}, "
+              f"{WIDE_TABLE} {_size(build['storage_bytes_obt_sales'])}")
+
+    catalog = load_catalog()
+    star = LocalWarehouseClient(args.data_dir, catalog=catalog, cache=QueryResultCache(max_bytes=0),
+                                aggregate_awareness=False, wide_explores=False)
+    wide = LocalWarehouseClient(args.data_dir, catalog=catalog, cache=QueryResultCache(max_bytes=0),
+                                aggregate_awareness=False, wide_explores=True)
+    if not wide.wide:
+        print(f"{WIDE_TABLE} is not built or is stale - run with --build")
+        return 1
+
+    with open(args.questions, 'r') as f:
+        rows = [json.loads(line) for line in f if line.strip()]
+    queries, seen = [], set()
+    for row in rows:
+        if row.get('query') and canonical_query_key(row['query']) not in seen:
+            seen.add(canonical_query_key(row['query']))
+            queries.append((row['question'], row['query']))
+
+    results, skipped = [], 0
+    for question, query in queries:
+        if not wide.compiler.wide_query(query):
+            skipped += 1
+            continue
+        star_sql, wide_sql = star.compile(query), wide.compile(query)
+        if args.show_sql:
+            print(f"-- {question}\n{star_sql};\n-- wide\n{wide_sql};\n")
+        star_ms, star_frame = _timed(star, query, args.repeat)
+        wide_ms, wide_frame = _timed(wide, query, args.repeat)
+        results.append({
+            'question': question,
+            'joins_star': star_sql.count(' JOIN '),
+            'joins_wide': wide_sql.count(' JOIN '),
+            'bytes_star': star.scanned_bytes(star_sql),
+            'bytes_wide': wide.scanned_bytes(wide_sql),
+            'ms_star': round(star_ms, 2),
+            'ms_wide': round(wide_ms, 2),
+            'same_result': _same_result(star_frame, wide_frame),
+        })
+
+    print(f"\n{'Question':52} {'Joins':>6} {'Scanned':>21} {'Latency (ms)':>17}")
+    for r in results:
+        print(f"{r['question'][:52]:52} {r['joins_star']:>2} -> {r['joins_wide']} "
+              f"{_size(r['bytes_star']):>9} -> {_size(r['bytes_wide']):>9} "
+              f"{r['ms_star']:>7.1f} -> {r['ms_wide']:>6.1f}"
+              + ("" if r['same_result'] else "  MISMATCH"))
+
+    bytes_star = sum(r['bytes_star'] for r in results)
+    bytes_wide = sum(r['bytes_wide'] for r in results)
+    report: Dict[str, Any] = {
+        'queries': len(results) + skipped,
+        'answered_from_wide_table': len(results),
+        'single_table_scans': sum(1 for r in results if r['joins_wide'] == 0),
+        'bytes_scanned_star': bytes_star,
+        'bytes_scanned_wide': bytes_wide,
+        'bytes_change': bytes_wide / bytes_star - 1 if bytes_star else 0.0,
+        'latency_ms_star': _summary([r['ms_star'] for r in results]),
+        'latency_ms_wide': _summary([r['ms_wide'] for r in results]),
+        'latency_ms_total_star': round(sum(r['ms_star'] for r in results), 1),
+        'latency_ms_total_wide': round(sum(r['ms_wide'] for r in results), 1),
+        'mismatches': [r['question'] for r in results if not r['same_result']],
+    }
+    if build:
+        report['build'] = build
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'report': report, 'queries': results}, f, indent=2)
+    return 0 if not report['mismatches'] else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
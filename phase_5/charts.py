@@ -0,0 +1,147 @@
+"""
+Chart selection and construction for query results
+
+Shared by app.py and the pipeline benchmark so both build exactly the same
+figures. Long series are downsampled with Largest-Triangle-Three-Buckets
+(LTTB), which keeps the first and last points and each bucket's most
+visually significant point, so peaks and dips survive; the old line chart
+simply dropped everything after the first 20 rows.
+"""
+import os
+from typing import Optional, Tuple
+
+import numpy as np
+import pandas as pd
+import plotly.express as px
+
+# Column-name keywords that mark grouping columns and metric columns
+DIMENSION_KEYWORDS = ['dim_', 'year', 'month', 'quarter', 'category', 'name', 'type', 'status']
+MEASURE_KEYWORDS = ['fct_', 'total', 'count', 'amount', 'average', 'sum', 'revenue', 'sales', 'quantity']
+
+# Points sent to the browser for one line chart
+CHART_MAX_POINTS = int(os.getenv('CHART_MAX_POINTS', '1000'))
+
+
+def chart_columns(df: pd.DataFrame) -> Tuple[Optional[str], Optional[str]]:
+    """
+    Pick the dimension (x axis) and measure (y axis) columns
+
+    Dimensions are year, category or name fields; measures are fct_ or
+    metric-like names. Falls back to the first and second columns.
+    """
+    dimension_col = None
+    measure_col = None
+
+    for col in df.columns:
+        col_lower = col.lower()
+        if any(keyword in col_lower for keyword in DIMENSION_KEYWORDS):
+            if dimension_col is None:
+                dimension_col = col
+        elif any(keyword in col_lower for keyword in MEASURE_KEYWORDS):
+            if measure_col is None:
+                measure_col = col
+
+    if dimension_col is None and len(df.columns) >= 1:
+        dimension_col = df.columns[0]
+    if measure_col is None and len(df.columns) >= 2:
+        measure_col = df.columns[1]
+    return dimension_col, measure_col
+
+
+def _label(col: str) -> str:
+    return col.replace('dim_', '').replace('fct_', '').replace('_', ' ').replace('.', ' - ').title()
+
+
+def lttb_indices(y, threshold: int, x=None) -> np.ndarray:
+    """
+    Row positions LTTB keeps when reducing a series to `threshold` points
+
+    x defaults to the row position, which suits category axes (product names,
+    month labels) where only the order is meaningful. Missing y values count
+    as zero when choosing points.
+    """
+    y = np.nan_to_num(np.asarray(y, dtype=float))
+    n = len(y)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+    x = np.arange(n, dtype=float) if x is None else np.asarray(x, dtype=float)
+
+    every = (n - 2) / (threshold - 2)
+    keep = np.empty(threshold, dtype=np.int64)
+    keep[0], keep[-1] = 0, n - 1
+    a = 0
+    for i in range(threshold - 2):
+        # Average of the next bucket is the third vertex of the triangle
+        next_start = int((i + 1) * every) + 1
+        next_end = min(int((i + 2) * every) + 1, n)
+        avg_x = x[next_start:next_end].mean()
+        avg_y = y[next_start:next_end].mean()
+
+        start = int(i * every) + 1
+        end = int((i + 1) * every) + 1
+        areas = np.abs((x[a] - avg_x) * (y[start:end] - y[a]) - (x[a] - x[start:end]) * (avg_y - y[a]))
+        a = start + int(np.argmax(areas))
+        keep[i + 1] = a
+    return keep
+
+
+def downsample(df: pd.DataFrame, dimension_col: str, measure_col: str,
+               max_points: int = CHART_MAX_POINTS) -> pd.DataFrame:
+    """At most max_points rows of df, chosen by LTTB on the measure (df itself when already small)"""
+    if len(df) <= max_points:
+        return df
+    return df.iloc[lttb_indices(df[measure_col].to_numpy(dtype=float, na_value=np.nan), max_points)]
+
+
+def _categorical_x(df: pd.DataFrame, dimension_col: str) -> pd.DataFrame:
+    # A numeric dimension (e.g. year) is plotted as labels, not a continuous axis
+    if pd.api.types.is_numeric_dtype(df[dimension_col]):
+        return df.assign(**{dimension_col: df[dimension_col].astype(str)})
+    return df
+
+
+def build_chart(df: pd.DataFrame, dimension_col: str, measure_col: str, max_points: int = CHART_MAX_POINTS):
+    """Bar chart for up to 15 rows, otherwise a line chart of the whole series (LTTB-downsampled)"""
+    dim_label = _label(dimension_col)
+    measure_label = _label(measure_col)
+
+    if len(df) <= 15:
+        # Bar chart for comparisons
+        fig = px.bar(
+            _categorical_x(df, dimension_col),
+            x=dimension_col,
+            y=measure_col,
+            title=f"{measure_label} by {dim_label}",
+            template="plotly_white",
+            color=measure_col,
+            color_continuous_scale="Blues",
+            text=measure_col
+        )
+        fig.update_traces(texttemplate='%{text:.2s}', textposition='outside')
+        fig.update_layout(
+            xaxis_tickangle=-45,
+            showlegend=False,
+            height=400,
+            xaxis_title=dim_label,
+            yaxis_title=measure_label
+        )
+    else:
+        # Line chart for trends
+        plotted = downsample(df, dimension_col, measure_col, max_points)
+        title = f"{measure_label} Trend"
+        if len(plotted) < len(df):
+            title += f" ({len(plotted):,} of {len(df):,} points)"
+        fig = px.line(
+            _categorical_x(plotted, dimension_col),
+            x=dimension_col,
+            y=measure_col,
+            title=title,
+            template="plotly_white",
+            markers=len(plotted) <= 100
+        )
+        fig.update_layout(
+            height=400,
+            xaxis_title=dim_label,
+            yaxis_title=measure_label
+        )
+    return fig
@@ -0,0 +1,325 @@
+"""
+Single-flight request coalescing and bounded per-backend worker pools
+
+Streamlit runs every session on its own thread, and all of them share the
+clients built once by app.init_clients(). Two pieces keep that safe and cheap:
+
+- SingleFlight: concurrent identical requests (same canonical query key or
+  translation key) share one in-flight call and its result instead of each
+  paying for a Looker round trip or a Gemini call.
+- BackendPool: a fixed number of worker threads per backend, so a burst of
+  sessions queues up instead of opening unbounded connections. Time spent
+  waiting for a worker is recorded as a "<backend>.queue" span on the
+  caller's trace (and so in the Prometheus histograms) and summarized in
+  stats().
+
+RateLimiter is a token bucket for callers that must also stay under a
+request rate, such as batch.py's --rate.
+
+Limits come from LOOKER_MAX_CONCURRENCY, GEMINI_MAX_CONCURRENCY and
+LOCAL_WAREHOUSE_MAX_CONCURRENCY; a *_MAX_QUEUE of 0 means an unbounded queue.
+
+    python concurrency.py --threads 32 --distinct 4   # coalescing/queueing demo
+"""
+import os
+import sys
+import time
+import argparse
+import threading
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional, Tuple
+
+import tracing
+
+
+class BackendSaturatedError(RuntimeError):
+    """Raised when a backend's wait queue is full"""
+
+
+class _Flight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.value: Any = None
+        self.error: Optional[BaseException] = None
+        self.followers = 0
+
+
+class SingleFlight:
+    """
+    Collapse concurrent calls with the same key into one execution
+
+    The first caller for a key (the leader) runs the function; callers that
+    arrive while it is running wait and receive the same value, or the same
+    exception. Nothing is remembered once the call finishes - caching stays
+    the job of QueryResultCache and TranslationCache.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._flights: Dict[str, _Flight] = {}
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.executions = 0
+        self.coalesced = 0
+
+    def do(self, key: str, fn: Callable[[], Any]) -> Tuple[Any, bool]:
+        """
+        Run fn once for all concurrent callers with this key
+
+        Returns:
+            (value, shared) - shared is True for callers that reused another call's result
+        """
+        with self._lock:
+            self.calls += 1
+            flight = self._flights.get(key)
+            if flight is None:
+                flight = self._flights[key] = _Flight()
+                self.executions += 1
+                leader = True
+            else:
+                flight.followers += 1
+                self.coalesced += 1
+                leader = False
+
+        if not leader:
+            with tracing.span(f'{self.name}.coalesced', coalesced=True):
+                flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.value, True
+
+        try:
+            flight.value = fn()
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            # Unregister before waking followers so late arrivals start a fresh call
+            with self._lock:
+                self._flights.pop(key, None)
+            flight.done.set()
+        return flight.value, False
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'calls': self.calls,
+                'executions': self.executions,
+                'coalesced': self.coalesced,
+                'in_flight': len(self._flights),
+                'coalesce_rate': self.coalesced / self.calls if self.calls else 0.0,
+            }
+
+
+class BackendPool:
+    """
+    Fixed-size worker pool for one backend, with queue-time accounting
+
+    run() blocks the caller until its call finishes on a worker thread. The
+    caller's trace is carried over, so spans opened by the call land in the
+    right trace.
+    """
+
+    def __init__(self, name: str, max_workers: int, max_queue: int = 0, samples: int = 1000):
+        self.name = name
+        self.max_workers = max(1, int(max_workers))
+        self.max_queue = max(0, int(max_queue))
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._lock = threading.Lock()
+        self._waits = deque(maxlen=samples)
+        self.queued = 0
+        self.active = 0
+        self.peak_queued = 0
+        self.peak_active = 0
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+
+    def _pool(self) -> ThreadPoolExecutor:
+        # Created on first use so importing the module never starts threads
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.max_workers,
+                                                thread_name_prefix=f'{self.name}-worker')
+        return self._executor
+
+    def run(self, fn: Callable[..., Any], *args, **kwargs) -> Any:
+        """Run fn(*args, **kwargs) on a worker and return its result (or raise its exception)"""
+        return self._submit(fn, args, kwargs, tracing.current_trace()).result()
+
+    def submit(self, fn: Callable[..., Any], *args, **kwargs) -> Future:
+        """
+        Start fn on a worker without waiting, e.g. a producer feeding a result stream
+
+        The caller's trace is not carried over: the caller keeps recording its own
+        spans while fn runs, and a Trace is not safe to share between running threads.
+        """
+        return self._submit(fn, args, kwargs, None)
+
+    def _submit(self, fn: Callable[..., Any], args: tuple, kwargs: Dict[str, Any],
+                trace: Optional[tracing.Trace]) -> Future:
+        submitted = time.perf_counter()
+        with self._lock:
+            if self.max_queue and self.queued >= self.max_queue:
+                self.rejected += 1
+                raise BackendSaturatedError(
+                    f"{self.name}: {self.queued} requests already waiting for {self.max_workers} workers"
+                )
+            self.queued += 1
+            self.peak_queued = max(self.peak_queued, self.queued)
+            executor = self._pool()
+
+        def task():
+            started = time.perf_counter()
+            with self._lock:
+                self.queued -= 1
+                self.active += 1
+                self.peak_active = max(self.peak_active, self.active)
+                self._waits.append((started - submitted) * 1000)
+            tracing.attach(trace)
+            try:
+                if trace is not None:
+                    trace.record(f'{self.name}.queue', submitted, started)
+                result = fn(*args, **kwargs)
+            except BaseException:
+                with self._lock:
+                    self.failed += 1
+                raise
+            finally:
+                tracing.detach()
+                with self._lock:
+                    self.active -= 1
+                    self.completed += 1
+            return result
+
+        return executor.submit(task)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            waits = sorted(self._waits)
+            return {
+                'workers': self.max_workers,
+                'max_queue': self.max_queue,
+                'active': self.active,
+                'queued': self.queued,
+                'peak_active': self.peak_active,
+                'peak_queued': self.peak_queued,
+                'completed': self.completed,
+                'failed': self.failed,
+                'rejected': self.rejected,
+                'queue_ms_p50': waits[len(waits) // 2] if waits else 0.0,
+                'queue_ms_p95': waits[min(len(waits) - 1, int(len(waits) * 0.95))] if waits else 0.0,
+                'queue_ms_max': waits[-1] if waits else 0.0,
+            }
+
+
+class RateLimiter:
+    """
+    Token bucket: at most `rate` acquisitions per second on average, bursts of up to `burst`
+
+    acquire() blocks until a token is free and returns how long it waited (ms).
+    A rate of 0 disables the limit.
+    """
+
+    def __init__(self, rate: float, burst: int = 1):
+        self.rate = max(0.0, float(rate))
+        self.burst = max(1, int(burst))
+        self._tokens = float(self.burst)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+        self.acquired = 0
+        self.waited = 0
+        self.wait_ms = 0.0
+
+    def acquire(self) -> float:
+        if not self.rate:
+            with self._lock:
+                self.acquired += 1
+            return 0.0
+        start = time.monotonic()
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            # Reserve a token now (possibly going negative) so waiters are served in order
+            self._tokens -= 1
+            delay = -self._tokens / self.rate if self._tokens < 0 else 0.0
+            self.acquired += 1
+        if delay > 0:
+            time.sleep(delay)
+        waited = (time.monotonic() - start) * 1000
+        with self._lock:
+            if delay > 0:
+                self.waited += 1
+            self.wait_ms += waited
+        return waited
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'rate': self.rate,
+                'burst': self.burst,
+                'acquired': self.acquired,
+                'waited': self.waited,
+                'wait_ms_total': round(self.wait_ms, 1),
+            }
+
+
+# Process-wide pools shared by every client and every Streamlit session
+looker_pool = BackendPool(
+    'looker',
+    max_workers=int(os.getenv('LOOKER_MAX_CONCURRENCY', '4')),
+    max_queue=int(os.getenv('LOOKER_MAX_QUEUE', '64')),
+)
+
+gemini_pool = BackendPool(
+    'gemini',
+    max_workers=int(os.getenv('GEMINI_MAX_CONCURRENCY', '8')),
+    max_queue=int(os.getenv('GEMINI_MAX_QUEUE', '64')),
+)
+
+warehouse_pool = BackendPool(
+    'warehouse',
+    max_workers=int(os.getenv('LOCAL_WAREHOUSE_MAX_CONCURRENCY', '4')),
+    max_queue=int(os.getenv('LOCAL_WAREHOUSE_MAX_QUEUE', '0')),
+)
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Fire concurrent identical calls through SingleFlight and a BackendPool")
+    parser.add_argument('--threads', type=int, default=32, help="Concurrent callers")
+    parser.add_argument('--distinct', type=int, default=4, help="Distinct request keys among them")
+    parser.add_argument('--workers', type=int, default=2, help="Pool size")
+    parser.add_argument('--call-ms', type=float, default=200.0, help="Simulated backend latency")
+    args = parser.parse_args(argv)
+
+    flights = SingleFlight('demo')
+    pool = BackendPool('demo', args.workers)
+    backend_calls = []
+
+    def call(key: str) -> str:
+        backend_calls.append(key)
+        time.sleep(args.call_ms / 1000)
+        return key.upper()
+
+    def caller(i: int) -> None:
+        key = f"q{i % args.distinct}"
+        flights.do(key, lambda: pool.run(call, key))
+
+    start = time.perf_counter()
+    threads = [threading.Thread(target=caller, args=(i,)) for i in range(args.threads)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    print(f"{args.threads} callers, {args.distinct} distinct keys, {args.workers} workers: "
+          f"{len(backend_calls)} backend calls in {elapsed:.2f}s")
+    print(f"single-flight: {flights.stats()}")
+    print(f"pool:          {pool.stats()}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
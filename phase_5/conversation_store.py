@@ -0,0 +1,460 @@
+"""
+Conversations, messages and results persisted in SQLite
+
+st.session_state only lives as long as one browser session on one server
+process. This store keeps everything the app needs to rebuild a
+conversation in one SQLite file (CONVERSATION_DB_PATH), so a restart or
+another replica on the same host picks up where the last one stopped:
+
+- conversations: name, creation time, query count and average response time
+- messages: question, query config, timings, insight, error and trace,
+  indexed by conversation (history) and by canonical query key (reuse), with
+  the datagroup trigger values the result was computed under
+- results: each message's DataFrame as a zstd Parquet blob, in its own
+  table so reading history never touches result bytes
+
+Conversations belong to a workspace, an unguessable ID the app keeps in the
+page URL (?workspace=...), since Streamlit sessions carry no user identity.
+
+The database runs in WAL mode: readers never block, and writers from any
+number of threads or processes take turns (BEGIN IMMEDIATE, waiting up to
+CONVERSATION_DB_BUSY_TIMEOUT seconds for the lock). Each thread has its own
+connection.
+
+    python conversation_store.py --processes 4 --messages 200   # concurrent writers, lookup latency
+    python conversation_store.py --summary                      # what the database holds
+"""
+import os
+import sys
+import json
+import time
+import uuid
+import sqlite3
+import argparse
+import threading
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+CONVERSATION_DB_PATH = os.getenv(
+    'CONVERSATION_DB_PATH', os.path.join(os.path.dirname(os.path.abspath(__file__)), '.conversations.db')
+)
+CONVERSATION_DB_BUSY_TIMEOUT = float(os.getenv('CONVERSATION_DB_BUSY_TIMEOUT', '30'))
+# Messages loaded per page when a conversation is opened or scrolled back
+HISTORY_PAGE_SIZE = int(os.getenv('HISTORY_PAGE_SIZE', '20'))
+# A stored result for the same canonical query younger than this is reused (0 disables)
+RESULT_REUSE_SECONDS = float(os.getenv('RESULT_REUSE_SECONDS', '900'))
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS conversations (
+    id TEXT PRIMARY KEY,
+    workspace TEXT NOT NULL,
+    name TEXT NOT NULL,
+    created_at TEXT NOT NULL,
+    total_queries INTEGER NOT NULL DEFAULT 0,
+    avg_response_time REAL NOT NULL DEFAULT 0,
+    message_count INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS conversations_by_workspace ON conversations (workspace, created_at);
+
+CREATE TABLE IF NOT EXISTS messages (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    conversation_id TEXT NOT NULL REFERENCES conversations (id) ON DELETE CASCADE,
+    created_at TEXT NOT NULL,
+    question TEXT NOT NULL,
+    query_json TEXT,
+    query_key TEXT,
+    response_time REAL,
+    insight TEXT,
+    row_count INTEGER,
+    large INTEGER NOT NULL DEFAULT 0,
+    error TEXT,
+    trace_json TEXT,
+    flags_json TEXT,
+    data_version TEXT,
+    result_of INTEGER
+);
+CREATE INDEX IF NOT EXISTS messages_by_conversation ON messages (conversation_id, id);
+CREATE INDEX IF NOT EXISTS messages_by_query ON messages (query_key, created_at) WHERE query_key IS NOT NULL;
+
+CREATE TABLE IF NOT EXISTS results (
+    message_id INTEGER PRIMARY KEY REFERENCES messages (id) ON DELETE CASCADE,
+    rows INTEGER NOT NULL,
+    bytes INTEGER NOT NULL,
+    attrs_json TEXT,
+    parquet BLOB NOT NULL
+);
+"""
+
+
+def frame_to_parquet(df: pd.DataFrame) -> bytes:
+    sink = pa.BufferOutputStream()
+    pq.write_table(pa.Table.from_pandas(df, preserve_index=False), sink, compression='zstd')
+    return sink.getvalue().to_pybytes()
+
+
+def frame_from_parquet(blob: bytes) -> pd.DataFrame:
+    # Dictionary columns come back as categoricals, Arrow-backed ones as ArrowDtype
+    return pq.read_table(pa.BufferReader(blob)).to_pandas()
+
+
+class ConversationStore:
+    """
+    SQLite-backed conversations for the app, safe across threads and processes
+
+    Nothing touches the database until the first call, so importing the
+    module never creates the file.
+    """
+
+    def __init__(self, path: str = CONVERSATION_DB_PATH, busy_timeout: float = CONVERSATION_DB_BUSY_TIMEOUT):
+        self.path = path
+        self.busy_timeout = busy_timeout
+        self._local = threading.local()
+        self._schema_ready = False
+        self._schema_lock = threading.Lock()
+
+    # --- connections ---
+
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        # A forked worker must not reuse its parent's connection
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=self.busy_timeout, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.execute('PRAGMA foreign_keys=ON')
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+            self._ensure_schema(conn)
+        return conn
+
+    def _ensure_schema(self, conn: sqlite3.Connection) -> None:
+        with self._schema_lock:
+            if self._schema_ready:
+                return
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                for statement in SCHEMA.split(';'):
+                    if statement.strip():
+                        conn.execute(statement)
+                # Databases created before results carried their datagroup trigger values
+                columns = {row['name'] for row in conn.execute('PRAGMA table_info(messages)')}
+                if 'data_version' not in columns:
+                    conn.execute('ALTER TABLE messages ADD COLUMN data_version TEXT')
+                # ... and before a reused result pointed at the message holding it
+                if 'result_of' not in columns:
+                    conn.execute('ALTER TABLE messages ADD COLUMN result_of INTEGER')
+                conn.execute('COMMIT')
+            except BaseException:
+                conn.execute('ROLLBACK')
+                raise
+            self._schema_ready = True
+
+    @contextmanager
+    def _write(self):
+        """A write transaction; takes the database write lock up front so it cannot deadlock on upgrade"""
+        conn = self._connection()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            yield conn
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        conn.execute('COMMIT')
+
+    def _read(self, sql: str, params: tuple = ()) -> List[sqlite3.Row]:
+        return self._connection().execute(sql, params).fetchall()
+
+    # --- conversations ---
+
+    def create_conversation(self, workspace: str, name: str) -> Dict[str, Any]:
+        conversation = {
+            'id': uuid.uuid4().hex,
+            'name': name,
+            'messages': [],
+            'created_at': datetime.now(),
+            'total_queries': 0,
+            'avg_response_time': 0,
+            'message_count': 0,
+            'has_earlier': False,
+            'loaded': True,
+        }
+        with self._write() as conn:
+            conn.execute(
+                'INSERT INTO conversations (id, workspace, name, created_at) VALUES (?, ?, ?, ?)',
+                (conversation['id'], workspace, name, conversation['created_at'].isoformat()),
+            )
+        return conversation
+
+    def list_conversations(self, workspace: str) -> Dict[str, Dict[str, Any]]:
+        """A workspace's conversations, oldest first, without their messages (see load_messages)"""
+        rows = self._read(
+            'SELECT * FROM conversations WHERE workspace = ? ORDER BY created_at', (workspace,)
+        )
+        return {
+            row['id']: {
+                'id': row['id'],
+                'name': row['name'],
+                'messages': [],
+                'created_at': datetime.fromisoformat(row['created_at']),
+                'total_queries': row['total_queries'],
+                'avg_response_time': row['avg_response_time'],
+                'message_count': row['message_count'],
+                'has_earlier': row['message_count'] > 0,
+                'loaded': False,
+            }
+            for row in rows
+        }
+
+    def delete_conversation(self, conversation_id: str) -> None:
+        """
+        Remove a conversation with its messages and results
+
+        A result that messages in other conversations reuse moves to the
+        oldest of them first, and the rest point at it there.
+        """
+        with self._write() as conn:
+            heirs = conn.execute(
+                'SELECT r.message_id AS holder, MIN(m.id) AS heir FROM results r '
+                'JOIN messages h ON h.id = r.message_id JOIN messages m ON m.result_of = r.message_id '
+                'WHERE h.conversation_id = ? AND m.conversation_id != ? GROUP BY r.message_id',
+                (conversation_id, conversation_id),
+            ).fetchall()
+            for row in heirs:
+                conn.execute('UPDATE results SET message_id = ? WHERE message_id = ?', (row['heir'], row['holder']))
+                conn.execute('UPDATE messages SET result_of = CASE WHEN id = ? THEN NULL ELSE ? END '
+                             'WHERE result_of = ?', (row['heir'], row['heir'], row['holder']))
+            conn.execute('DELETE FROM conversations WHERE id = ?', (conversation_id,))
+
+    # --- messages ---
+
+    def add_message(self, conversation_id: str, message: Dict[str, Any], trace=None,
+                    reusable: bool = True) -> int:
+        """
+        Persist a message and return its ID (unique across processes)
+
+        Successful messages also update the conversation's query count and
+        average response time. Unless reusable is False (e.g. mock data),
+        a successful message is indexed by its canonical query key, with
+        message['data_version'] (the backend's data_version()) for find_result.
+        message['result_of'] is the ID of the message whose stored result it
+        reuses; load_result reads that one instead of a copy.
+        """
+        from looker_client import canonical_query_key
+        query = message.get('query')
+        ok = 'error' not in message
+        query_key = canonical_query_key(query) if ok and query and reusable else None
+        with self._write() as conn:
+            cursor = conn.execute(
+                'INSERT INTO messages (conversation_id, created_at, question, query_json, query_key, '
+                'response_time, insight, row_count, large, error, trace_json, flags_json, data_version, '
+                'result_of) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                (
+                    conversation_id,
+                    message['timestamp'].isoformat(),
+                    message['question'],
+                    json.dumps(query) if query is not None else None,
+                    query_key,
+                    message.get('response_time'),
+                    message.get('insight'),
+                    message.get('row_count'),
+                    int(bool(message.get('large'))),
+                    message.get('error'),
+                    json.dumps(trace.to_dict(), default=str) if trace is not None else None,
+                    json.dumps(trace.flags(), default=str) if trace is not None else None,
+                    message.get('data_version') or None,
+                    message.get('result_of'),
+                ),
+            )
+            if ok:
+                conn.execute(
+                    'UPDATE conversations SET message_count = message_count + 1, '
+                    'avg_response_time = (avg_response_time * total_queries + ?) / (total_queries + 1), '
+                    'total_queries = total_queries + 1 WHERE id = ?',
+                    (message.get('response_time') or 0.0, conversation_id),
+                )
+            else:
+                conn.execute('UPDATE conversations SET message_count = message_count + 1 WHERE id = ?',
+                             (conversation_id,))
+        return cursor.lastrowid
+
+    @staticmethod
+    def _message(row: sqlite3.Row) -> Dict[str, Any]:
+        message = {
+            'id': row['id'],
+            'timestamp': datetime.fromisoformat(row['created_at']),
+            'question': row['question'],
+        }
+        if row['error'] is not None:
+            message['error'] = row['error']
+            return message
+        message.update({
+            'query': json.loads(row['query_json']) if row['query_json'] else None,
+            'response_time': row['response_time'] or 0.0,
+            'insight': row['insight'],
+            'row_count': row['row_count'] or 0,
+            'large': bool(row['large']),
+            # The live Trace is gone; its record still feeds Query Details
+            'trace': None,
+            'trace_record': json.loads(row['trace_json']) if row['trace_json'] else None,
+            'flags': json.loads(row['flags_json']) if row['flags_json'] else {},
+        })
+        return message
+
+    def load_messages(self, conversation_id: str, before_id: Optional[int] = None,
+                      limit: int = HISTORY_PAGE_SIZE) -> Tuple[List[Dict[str, Any]], bool]:
+        """
+        The newest `limit` messages older than before_id, oldest first
+
+        Returns:
+            (messages, has_earlier) - has_earlier is True when older messages remain
+        """
+        rows = self._read(
+            'SELECT * FROM messages WHERE conversation_id = ? AND id < ? ORDER BY id DESC LIMIT ?',
+            (conversation_id, before_id if before_id is not None else sys.maxsize, limit + 1),
+        )
+        has_earlier = len(rows) > limit
+        return [self._message(row) for row in reversed(rows[:limit])], has_earlier
+
+    # --- results ---
+
+    def save_result(self, message_id: int, df: pd.DataFrame) -> int:
+        """Store a message's result as a Parquet blob; returns its size in bytes"""
+        blob = frame_to_parquet(df)
+        attrs = {key: value for key, value in df.attrs.items() if isinstance(value, (str, int, float, bool))}
+        with self._write() as conn:
+            conn.execute(
+                'INSERT OR REPLACE INTO results (message_id, rows, bytes, attrs_json, parquet) VALUES (?, ?, ?, ?, ?)',
+                (message_id, len(df), len(blob), json.dumps(attrs), blob),
+            )
+        return len(blob)
+
+    def load_result(self, message_id: int) -> Optional[pd.DataFrame]:
+        """A message's stored result, or the one it reuses"""
+        rows = self._read(
+            'SELECT r.attrs_json, r.parquet FROM messages m '
+            'JOIN results r ON r.message_id = COALESCE(m.result_of, m.id) WHERE m.id = ?',
+            (message_id,),
+        )
+        if not rows:
+            return None
+        df = frame_from_parquet(rows[0]['parquet'])
+        df.attrs = json.loads(rows[0]['attrs_json'] or '{}')
+        return df
+
+    def find_result(self, query_config: Dict[str, Any], max_age_seconds: float = RESULT_REUSE_SECONDS,
+                    data_version: Optional[str] = '') -> Optional[Tuple[int, pd.DataFrame]]:
+        """
+        The newest stored result for the same canonical query, if younger than max_age_seconds
+
+        Only results stored under the same data_version (the backend's
+        datagroup trigger values for the explore) match, so a result is not
+        reused once a load has fired its datagroup. None means the current
+        values are unknown, and nothing is reused.
+        """
+        if max_age_seconds <= 0 or data_version is None:
+            return None
+        from looker_client import canonical_query_key
+        cutoff = (datetime.now() - timedelta(seconds=max_age_seconds)).isoformat()
+        rows = self._read(
+            'SELECT m.id FROM messages m JOIN results r ON r.message_id = m.id '
+            "WHERE m.query_key = ? AND m.created_at >= ? AND COALESCE(m.data_version, '') = ? "
+            'ORDER BY m.created_at DESC LIMIT 1',
+            (canonical_query_key(query_config), cutoff, data_version),
+        )
+        if not rows:
+            return None
+        df = self.load_result(rows[0]['id'])
+        return (rows[0]['id'], df) if df is not None else None
+
+    def summary(self) -> Dict[str, Any]:
+        row = self._read(
+            'SELECT (SELECT COUNT(*) FROM conversations) AS conversations, '
+            '(SELECT COUNT(DISTINCT workspace) FROM conversations) AS workspaces, '
+            '(SELECT COUNT(*) FROM messages) AS messages, '
+            '(SELECT COUNT(*) FROM results) AS results, '
+            '(SELECT COALESCE(SUM(bytes), 0) FROM results) AS result_bytes'
+        )[0]
+        return dict(row)
+
+
+# Process-wide store shared by every Streamlit session
+conversation_store = ConversationStore()
+
+
+def _writer(path: str, worker: int, messages: int, queue) -> None:
+    """One process appending to its own conversation and looking up results by query"""
+    import numpy as np
+    store = ConversationStore(path)
+    conversation = store.create_conversation(f"bench-{worker}", f"Worker {worker}")
+    df = pd.DataFrame({'dim_product.category_name': ['Bikes', 'Components', 'Clothing', 'Accessories'] * 25,
+                       'fct_sales.total_sales_amount': np.arange(100, dtype=float)})
+    write_ms, lookup_ms = [], []
+    for i in range(messages):
+        query = {'explore': 'sales_analysis', 'dimensions': ['dim_product.category_name'],
+                 'measures': ['fct_sales.total_sales_amount'], 'limit': i % 50 + 1}
+        message = {'timestamp': datetime.now(), 'question': f"q{i}", 'query': query,
+                   'response_time': 0.5, 'row_count': len(df)}
+        start = time.perf_counter()
+        message_id = store.add_message(conversation['id'], message)
+        store.save_result(message_id, df)
+        write_ms.append((time.perf_counter() - start) * 1000)
+        start = time.perf_counter()
+        store.find_result(query, max_age_seconds=3600)
+        lookup_ms.append((time.perf_counter() - start) * 1000)
+    queue.put((write_ms, lookup_ms))
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Exercise or inspect the SQLite conversation store")
+    parser.add_argument('--db', default=None, help="Database file (default: a temporary one; CONVERSATION_DB_PATH with --summary)")
+    parser.add_argument('--processes', type=int, default=4, help="Concurrent writer processes")
+    parser.add_argument('--messages', type=int, default=200, help="Messages (each with a result) per process")
+    parser.add_argument('--summary', action='store_true', help="Print what the database holds and exit")
+    args = parser.parse_args(argv)
+
+    if args.summary:
+        print(json.dumps(ConversationStore(args.db or CONVERSATION_DB_PATH).summary(), indent=2))
+        return 0
+
+    import tempfile
+    import multiprocessing
+    path = args.db or os.path.join(tempfile.mkdtemp(prefix='conversation_store_'), 'bench.db')
+    queue = multiprocessing.Queue()
+    start = time.perf_counter()
+    workers = [multiprocessing.Process(target=_writer, args=(path, i, args.messages, queue))
+               for i in range(args.processes)]
+    for worker in workers:
+        worker.start()
+    timings = [queue.get() for _ in workers]
+    for worker in workers:
+        worker.join()
+    elapsed = time.perf_counter() - start
+
+    store = ConversationStore(path)
+    summary = store.summary()
+    expected = args.processes * args.messages
+    write_ms = sorted(ms for writes, _ in timings for ms in writes)
+    lookup_ms = sorted(ms for _, lookups in timings for ms in lookups)
+    print(f"{args.processes} processes x {args.messages} messages in {elapsed:.2f}s: "
+          f"{summary['messages']}/{expected} messages, {summary['results']}/{expected} results stored")
+    print(f"write (message + result) p50 {write_ms[len(write_ms) // 2]:.1f} ms, "
+          f"p95 {write_ms[int(len(write_ms) * 0.95)]:.1f} ms")
+    print(f"find_result by query     p50 {lookup_ms[len(lookup_ms) // 2]:.1f} ms, "
+          f"p95 {lookup_ms[int(len(lookup_ms) * 0.95)]:.1f} ms")
+
+    start = time.perf_counter()
+    conversations = store.list_conversations('bench-0')
+    page, has_earlier = store.load_messages(next(iter(conversations)))
+    print(f"open a conversation (list + last {len(page)} messages, earlier={has_earlier}): "
+          f"{(time.perf_counter() - start) * 1000:.1f} ms")
+    return 0 if summary['messages'] == expected and summary['results'] == expected else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
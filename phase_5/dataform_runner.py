@@ -0,0 +1,730 @@
+"""
+Local execution of the Dataform models (phase_3/dataform) on DuckDB
+
+A .sqlx file is a config block plus a SQL body that Dataform evaluates as a
+JavaScript template literal, so the models are rendered the way Dataform
+does it: by Node, with the project's includes/*.js as globals, the
+workflow_settings.yaml vars in dataform.projectConfig.vars and ref(), self(),
+incremental() and when() bound per model. ref() renders as a quoted DuckDB
+table name, so the rendered BigQuery SQL only needs its dialect translated
+(to_duckdb) before DuckDB runs it. A pre_operations DECLARE (or SET) becomes
+a DuckDB variable (SET VARIABLE / getvariable), so a declared watermark is a
+constant in the model's filter the way it is in BigQuery's script, and a
+CREATE TEMP TABLE lives until the run ends, as it does in the script. A
+model's js { } block is evaluated before each of its templates.
+
+Models run with Dataform's semantics: "table" and "view" are replaced, an
+"incremental" model is created on its first run (or with full_refresh) and
+afterwards its incremental SQL is merged into the existing table on the
+config's uniqueKey (delete the matched keys, insert the new rows - the same
+result as BigQuery's MERGE with every column updated).
+
+Each run also reports the bytes BigQuery would bill for it, from the
+columns the DuckDB plan scans and BigQuery's logical column sizes
+(8 bytes per INT64/FLOAT64/DATE/TIMESTAMP value, 2 + UTF-8 length per
+STRING, NULL free). A MERGE into a non-partitioned table is billed for the
+whole target table on top of its query; into a partitioned one with an
+updatePartitionFilter (bigquery config), only for the partitions that
+filter selects, which is also the part of the table the merge may change.
+
+Run as a script, it runs the whole project (or some actions) offline: the
+ref()s and config dependencies form a DAG whose leaves must be the sources
+declared in definitions/staging/sources.js, read from one Parquet file per
+source. Models whose dependencies are done run in parallel, each on its own
+DuckDB connection, and each model's runtime, row count and estimated bytes
+are reported with the run's critical path. --init-sources writes synthetic
+source files with the OLTP column layout (raw_schema.csv) to run against.
+
+    python dataform_runner.py --sources oltp --init-sources --rows 100000
+    python dataform_runner.py --sources oltp --workers 4 --output dataform_run.json
+    python dataform_runner.py --sources oltp --actions fct_sales --include-deps
+"""
+import os
+import re
+import sys
+import csv
+import json
+import glob
+import time
+import argparse
+import threading
+import subprocess
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from typing import Dict, Any, List, Optional, Callable, Set
+
+import duckdb
+
+DEFAULT_PROJECT_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                                   'phase_3', 'dataform')
+# The OLTP tables as loaded into BigQuery: TABLE_NAME,COLUMN_NAME,DATA_TYPE,ORDINAL_POSITION
+DEFAULT_SOURCE_SCHEMA = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'raw_schema.csv')
+
+# Evaluates each model's config block and renders its SQL and operations twice
+# (full and incremental); reads {includes, vars, models: [{name, config,
+# js, pre_operations, body, post_operations}]} on stdin
+RENDER_JS = r"""
+const fs = require('fs');
+const path = require('path');
+const vm = require('vm');
+const input = JSON.parse(fs.readFileSync(0, 'utf8'));
+global.dataform = { projectConfig: { vars: input.vars } };
+const includes = {};
+for (const file of input.includes) {
+  includes[path.basename(file, '.js')] = require(file);
+}
+const quote = name => '"' + name + '"';
+const out = {};
+for (const model of input.models) {
+  const config = model.config ? vm.runInNewContext('(' + model.config + ')') : {};
+  const refs = new Set();
+  const render = (template, flag) => vm.runInNewContext((model.js || '') + '\n`' + template + '`', Object.assign({}, includes, {
+    dataform: global.dataform,
+    ref: target => { const name = typeof target === 'object' ? target.name : target; refs.add(name); return quote(name); },
+    resolve: target => quote(typeof target === 'object' ? target.name : target),
+    self: () => quote(model.name),
+    name: () => model.name,
+    incremental: () => flag,
+    when: (condition, yes, no = '') => condition ? yes : no,
+  }));
+  const stages = flag => ({
+    pre_operations: render(model.pre_operations, flag),
+    sql: render(model.body, flag),
+    post_operations: render(model.post_operations, flag),
+  });
+  out[model.name] = { config, table: stages(false), incremental: stages(true), refs: [...refs] };
+}
+process.stdout.write(JSON.stringify(out));
+"""
+
+# BigQuery logical bytes per non-NULL value, by DuckDB column type
+FIXED_WIDTH_BYTES = {
+    'BIGINT': 8, 'INTEGER': 8, 'SMALLINT': 8, 'TINYINT': 8, 'HUGEINT': 8, 'UBIGINT': 8,
+    'DOUBLE': 8, 'FLOAT': 8, 'DATE': 8, 'TIMESTAMP': 8, 'TIMESTAMP WITH TIME ZONE': 8,
+    'BOOLEAN': 1,
+}
+
+# "DECLARE source_watermark DATE DEFAULT (SELECT ...)" in pre_operations (DEFAULT optional)
+DECLARE = re.compile(r'^\s*(?:--[^\n]*\n\s*)*DECLARE\s+(\w+)(?:\s+\w+)?(?:\s+DEFAULT\s+(.*))?$',
+                     re.IGNORECASE | re.DOTALL)
+# "SET oldest_changed_date = (SELECT ...)" assigning a declared variable
+SET = re.compile(r'^\s*(?:--[^\n]*\n\s*)*SET\s+(\w+)\s*=\s*(.*)$', re.IGNORECASE | re.DOTALL)
+SET_VARIABLE = re.compile(r'^\s*SET VARIABLE \w+ =', re.IGNORECASE)
+# "CREATE TEMP TABLE changed_sales_lines AS SELECT ..." in pre_operations
+CREATE_TEMP = re.compile(r'^\s*(?:--[^\n]*\n\s*)*CREATE\s+(?:OR\s+REPLACE\s+)?TEMP(?:ORARY)?\s+TABLE\s+(\w+)\s+AS\s+', re.IGNORECASE)
+
+INTERVAL_SUB = re.compile(r'^(.*),\s*INTERVAL\s+(.+?)\s+(DAY|HOUR|MINUTE|SECOND|MONTH|YEAR)$', re.IGNORECASE | re.DOTALL)
+# BigQuery names UNNEST's column after the alias; DuckDB names the table
+UNNEST_ALIAS = re.compile(r'\bUNNEST\((.*?)\)\s+AS\s+(\w+)(?!\s*\()', re.DOTALL)
+
+# declare({ ..., name: "Sales_SalesOrderHeader" }) in definitions/**/*.js
+DECLARATION = re.compile(r'\bdeclare\(\s*\{[^}]*?\bname:\s*["\']([^"\']+)["\'][^}]*\}\s*\)')
+
+
+def _block(text: str, keyword: str) -> Dict[str, str]:
+    """The first top-level `keyword { ... }` block of a .sqlx file: its content and the text around it"""
+    match = re.search(rf'(^|\n)\s*{keyword}\s*\{{', text)
+    if not match:
+        return {'block': '', 'rest': text}
+    start = match.end()
+    depth, quote, i = 1, None, start
+    while i < len(text):
+        char = text[i]
+        if quote:
+            if char == '\\':
+                i += 1
+            elif char == quote:
+                quote = None
+        elif char in '"\'':
+            quote = char
+        elif char == '{':
+            depth += 1
+        elif char == '}':
+            depth -= 1
+            if depth == 0:
+                break
+        i += 1
+    return {'block': text[start:i], 'rest': text[:match.start()] + '\n' + text[i + 1:]}
+
+
+def split_sqlx(text: str) -> Dict[str, str]:
+    """
+    The parts of a .sqlx file: config (a JS object literal, braces included),
+    js (JavaScript run before each template), pre_operations and
+    post_operations (SQL templates) and the SQL body
+    """
+    parts = {}
+    config = _block(text, 'config')
+    parts['config'] = '{' + config['block'] + '}' if config['block'] else ''
+    text = config['rest']
+    js = _block(text, 'js')
+    parts['js'], text = js['block'], js['rest']
+    for keyword in ('pre_operations', 'post_operations'):
+        block = _block(text, keyword)
+        parts[keyword], text = block['block'], block['rest']
+    parts['body'] = text
+    return parts
+
+
+def read_vars(settings_path: str) -> Dict[str, str]:
+    """The vars map of workflow_settings.yaml (flat "key: value" entries only)"""
+    values, in_vars = {}, False
+    with open(settings_path, 'r') as f:
+        for line in f:
+            if not line.strip() or line.lstrip().startswith('#'):
+                continue
+            if not line.startswith((' ', '\t')):
+                in_vars = line.strip() == 'vars:'
+                continue
+            if in_vars and ':' in line:
+                key, value = line.strip().split(':', 1)
+                values[key.strip()] = value.strip().strip('"\'')
+    return values
+
+
+def _split_args(text: str) -> List[str]:
+    """Top-level comma-separated arguments of a function call"""
+    args, depth, quote, current = [], 0, None, ''
+    for char in text:
+        if quote:
+            quote = None if char == quote else quote
+        elif char in '"\'':
+            quote = char
+        elif char == '(':
+            depth += 1
+        elif char == ')':
+            depth -= 1
+        elif char == ',' and depth == 0:
+            args.append(current.strip())
+            current = ''
+            continue
+        current += char
+    args.append(current.strip())
+    return args
+
+
+def split_statements(sql: str) -> List[str]:
+    """The non-empty statements of a ;-separated script"""
+    statements, quote, current = [], None, ''
+    for char in sql:
+        if quote:
+            quote = None if char == quote else quote
+        elif char in '"\'':
+            quote = char
+        elif char == ';':
+            statements.append(current.strip())
+            current = ''
+            continue
+        current += char
+    statements.append(current.strip())
+    return [statement for statement in statements if statement]
+
+
+def rewrite_calls(sql: str, function: str, rewrite: Callable[[List[str]], str]) -> str:
+    """Replace every FUNCTION(args) call (upper case, as the models write them) with rewrite(args)"""
+    pattern = re.compile(rf'\b{function}\s*\(')
+    while True:
+        matches = list(pattern.finditer(sql))
+        if not matches:
+            return sql
+        match = matches[-1]
+        depth, i = 1, match.end()
+        while depth and i < len(sql):
+            depth += {'(': 1, ')': -1}.get(sql[i], 0)
+            i += 1
+        sql = sql[:match.start()] + rewrite(_split_args(sql[match.end():i - 1])) + sql[i:]
+
+
+def read_declarations(project_dir: str) -> Set[str]:
+    """The names of the source tables declare()d in definitions/**/*.js"""
+    names = set()
+    for path in glob.glob(os.path.join(project_dir, 'definitions', '**', '*.js'), recursive=True):
+        with open(path, 'r') as f:
+            names.update(DECLARATION.findall(f.read()))
+    return names
+
+
+def read_source_schema(path: str = DEFAULT_SOURCE_SCHEMA) -> Dict[str, List[tuple]]:
+    """{table: [(column, BigQuery type), ...] in ordinal order} from a TABLE_NAME,COLUMN_NAME,DATA_TYPE,... CSV"""
+    with open(path, 'r', newline='') as f:
+        rows = sorted(csv.DictReader(f), key=lambda row: (row['TABLE_NAME'], int(row['ORDINAL_POSITION'])))
+    tables: Dict[str, List[tuple]] = {}
+    for row in rows:
+        tables.setdefault(row['TABLE_NAME'], []).append((row['COLUMN_NAME'], row['DATA_TYPE']))
+    return tables
+
+
+# DuckDB types of the synthetic key columns
+KEY_TYPES = {'INT64': 'BIGINT', 'FLOAT64': 'DOUBLE', 'STRING': 'VARCHAR'}
+
+
+def _synthetic_column(column: str, data_type: str, first: bool, rows: int) -> str:
+    """A DuckDB expression over range(rows) t(i) for one source column"""
+    value = f"hash(i, '{column}')"
+    if (column.endswith('ID') and data_type in ('INT64', 'FLOAT64')) or (column.endswith('Code') and data_type == 'STRING'):
+        # Keys: the first column numbers the rows, the others point into the same 1..rows range
+        key = 'i + 1' if first else f"1 + {value} % {rows}"
+        return f"CAST({key} AS {KEY_TYPES[data_type]})"
+    day = f"(DATE '2011-05-31' + CAST({value} % 1127 AS INTEGER))"
+    return {
+        'INT64': f"CAST({value} % 100 AS BIGINT)",
+        'FLOAT64': f"round(CAST({value} % 100000 AS DOUBLE) / 100, 2)",
+        'STRING': f"'{column} ' || CAST({value} % 50 AS VARCHAR)",
+        'DATE': day,
+        'TIMESTAMP': f"CAST({day} AS TIMESTAMP)",
+        'BOOL': f"{value} % 2 = 0",
+        'TIME': f"TIME '00:00:00' + to_seconds(CAST({value} % 86400 AS BIGINT))",
+    }.get(data_type, 'CAST(NULL AS BLOB)')
+
+
+def write_sources(out_dir: str, tables: Dict[str, List[tuple]], rows: int = 100000) -> Dict[str, str]:
+    """
+    Write a synthetic <out_dir>/<table>.parquet with each table's columns and
+    `rows` rows; every table has the same row count, so keys join. Returns
+    {table: path}.
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    con = duckdb.connect()
+    paths = {}
+    for table, columns in sorted(tables.items()):
+        select = ', '.join(f'{_synthetic_column(column, data_type, i == 0, rows)} AS "{column}"'
+                           for i, (column, data_type) in enumerate(columns))
+        paths[table] = os.path.join(out_dir, f'{table}.parquet')
+        con.execute(f"COPY (SELECT {select} FROM range({rows}) t(i)) TO '{paths[table]}' (FORMAT PARQUET)")
+    con.close()
+    return paths
+
+
+def _interval_sub(args: List[str]) -> str:
+    match = INTERVAL_SUB.match(', '.join(args))
+    return f"({match.group(1)} - INTERVAL ({match.group(2)}) {match.group(3)})"
+
+
+def to_duckdb(sql: str) -> str:
+    """Translate the BigQuery functions and types the models use to DuckDB"""
+    sql = re.sub(r'\bCURRENT_TIMESTAMP\(\)', 'current_timestamp', sql)
+    sql = re.sub(r'\bCURRENT_DATE\(\)', 'current_date', sql)
+    sql = re.sub(r'\bFLOAT64\b', 'DOUBLE', sql)
+    sql = re.sub(r'\bCOUNTIF\s*\(', 'count_if(', sql)
+    sql = re.sub(r'\bFORMAT\s*\(', 'printf(', sql)
+    sql = UNNEST_ALIAS.sub(r'UNNEST(\1) AS \2(\2)', sql)
+    sql = rewrite_calls(sql, 'GENERATE_DATE_ARRAY', lambda a: (
+        f"CAST(generate_series(CAST({a[0]} AS DATE), CAST({a[1]} AS DATE), {a[2] if len(a) > 2 else 'INTERVAL 1 DAY'})"
+        f" AS DATE[])"))
+    # DuckDB counts days of the week from 0 (Sunday), BigQuery from 1
+    sql = rewrite_calls(sql, 'EXTRACT', lambda a: (
+        f"(dayofweek({a[0].split(None, 2)[2]}) + 1)" if re.match(r'DAYOFWEEK\s+FROM\s', a[0], re.IGNORECASE)
+        else f"extract({a[0]})"))
+    sql = rewrite_calls(sql, 'FORMAT_DATE', lambda a: f"strftime({a[1]}, {a[0]})")
+    sql = rewrite_calls(sql, 'DATE', lambda a: f"CAST({a[0]} AS DATE)")
+    sql = rewrite_calls(sql, 'DATE_SUB', _interval_sub)
+    sql = rewrite_calls(sql, 'TIMESTAMP_SUB', _interval_sub)
+    sql = rewrite_calls(sql, 'DATE_TRUNC', lambda a: f"date_trunc('{a[1].lower()}', {a[0]})")
+    sql = rewrite_calls(sql, 'DATE_DIFF', lambda a: f"date_diff('{a[2].lower()}', {a[1]}, {a[0]})")
+    sql = rewrite_calls(sql, 'SAFE_DIVIDE', lambda a: f"({a[0]} / NULLIF({a[1]}, 0))")
+    return sql
+
+
+class DataformProject:
+    """The models of a Dataform project, rendered for DuckDB"""
+
+    def __init__(self, project_dir: Optional[str] = None, vars: Optional[Dict[str, str]] = None):
+        self.project_dir = project_dir or os.getenv('DATAFORM_PROJECT_DIR', DEFAULT_PROJECT_DIR)
+        self.vars = read_vars(os.path.join(self.project_dir, 'workflow_settings.yaml'))
+        self.vars.update(vars or {})
+        paths = sorted(glob.glob(os.path.join(self.project_dir, 'definitions', '**', '*.sqlx'), recursive=True))
+        self.paths = {os.path.splitext(os.path.basename(path))[0]: path for path in paths}
+        self.sources = read_declarations(self.project_dir)
+        self.models = self._render()
+
+    def _render(self) -> Dict[str, Dict[str, Any]]:
+        models = []
+        for name, path in self.paths.items():
+            with open(path, 'r') as f:
+                models.append({'name': name, **split_sqlx(f.read())})
+        payload = {
+            'includes': sorted(glob.glob(os.path.join(self.project_dir, 'includes', '*.js'))),
+            'vars': self.vars,
+            'models': models,
+        }
+        result = subprocess.run(['node', '-e', RENDER_JS], input=json.dumps(payload),
+                                capture_output=True, text=True, check=False)
+        if result.returncode != 0:
+            raise RuntimeError(f"Rendering the Dataform models failed: {result.stderr.strip()}")
+        return json.loads(result.stdout)
+
+    def statements(self, name: str, incremental: bool = False) -> Dict[str, Any]:
+        """
+        A model in DuckDB SQL, as Dataform would run it on a first or an
+        incremental run: {pre_operations: [...], sql: SELECT, post_operations: [...],
+        update_partition_filter: the config's filter on the MERGE target, or '',
+        temp_tables: the tables pre_operations create for the run}
+        """
+        rendered = self.models[name]['incremental' if incremental else 'table']
+        variables, pre_operations, temp_tables = [], [], []
+        for statement in split_statements(rendered['pre_operations']):
+            declared, assigned = DECLARE.match(statement), SET.match(statement)
+            if declared:
+                statement = f"SET VARIABLE {declared.group(1)} = {declared.group(2) or 'NULL'}"
+                variables.append(declared.group(1))
+            elif assigned and assigned.group(1) in variables:
+                statement = f"SET VARIABLE {assigned.group(1)} = {assigned.group(2)}"
+            created = CREATE_TEMP.match(statement)
+            if created:
+                # Replaced, should a failed run have left it behind on the connection
+                statement = CREATE_TEMP.sub(f'CREATE OR REPLACE TEMP TABLE {created.group(1)} AS ', statement)
+                temp_tables.append(created.group(1))
+            pre_operations.append(self._variables(to_duckdb(statement), variables))
+        return {
+            'pre_operations': pre_operations,
+            'temp_tables': temp_tables,
+            'sql': self._variables(to_duckdb(rendered['sql']), variables),
+            # Dataform prefixes it with the MERGE target's alias
+            'update_partition_filter': self._variables(
+                to_duckdb(self.models[name]['config'].get('bigquery', {}).get('updatePartitionFilter', '')), variables),
+            'post_operations': [to_duckdb(statement) for statement in split_statements(rendered['post_operations'])],
+        }
+
+    @staticmethod
+    def _variables(sql: str, variables: List[str]) -> str:
+        for variable in variables:
+            # Not the name being assigned ("SET VARIABLE name =")
+            sql = re.sub(rf"(?<!SET VARIABLE )\b{variable}\b", f"getvariable('{variable}')", sql)
+        return sql
+
+    def sql(self, name: str, incremental: bool = False) -> str:
+        """A model's SELECT in DuckDB SQL"""
+        return self.statements(name, incremental)['sql']
+
+    def dependencies(self, name: str) -> Set[str]:
+        """What a model reads: its ref()s (models or declared sources) and its config dependencies"""
+        model = self.models[name]
+        return set(model['refs']) | set(model['config'].get('dependencies') or [])
+
+    def dag(self, actions: Optional[List[str]] = None, include_deps: bool = False) -> Dict[str, Set[str]]:
+        """
+        {model: the models it waits for} for the given actions (all models by
+        default), with everything upstream of them if include_deps. Raises
+        ValueError on a ref to neither a model nor a declared source, or on a cycle.
+        """
+        names = list(self.models) if actions is None else list(actions)
+        for name in names:
+            if name not in self.models:
+                raise ValueError(f"Unknown action: {name}")
+        graph: Dict[str, Set[str]] = {}
+        while names:
+            name = names.pop()
+            if name in graph:
+                continue
+            unknown = self.dependencies(name) - set(self.models) - self.sources
+            if unknown:
+                raise ValueError(f"{name} depends on {', '.join(sorted(unknown))}, "
+                                 f"neither a model nor a declared source")
+            graph[name] = self.dependencies(name) & set(self.models)
+            if include_deps:
+                names.extend(graph[name])
+        graph = {name: upstream & set(graph) for name, upstream in graph.items()}
+
+        done: Set[str] = set()
+        while len(done) < len(graph):
+            ready = {name for name, upstream in graph.items() if name not in done and upstream <= done}
+            if not ready:
+                raise ValueError(f"Dependency cycle among {', '.join(sorted(set(graph) - done))}")
+            done |= ready
+        return graph
+
+    def source_tables(self, graph: Dict[str, Set[str]]) -> Set[str]:
+        """The declared sources the models of a DAG read"""
+        return {table for name in graph for table in self.dependencies(name) if table in self.sources}
+
+
+class LocalDataformRunner:
+    """Runs Dataform models against source tables in a DuckDB database"""
+
+    def __init__(self, project: Optional[DataformProject] = None, database: str = ':memory:'):
+        self.project = project or DataformProject()
+        self.con = duckdb.connect(database)
+        self._sizes: Dict[str, Dict[str, int]] = {}
+        self._local = threading.local()
+
+    def _con(self) -> duckdb.DuckDBPyConnection:
+        """self.con on the main thread, a connection of the thread's own elsewhere (DuckDB variables are per connection)"""
+        if threading.current_thread() is threading.main_thread():
+            return self.con
+        if not hasattr(self._local, 'con'):
+            self._local.con = self.con.cursor()
+        return self._local.con
+
+    def load_sources(self, sources_dir: str, tables: Set[str]) -> Dict[str, int]:
+        """Load each source table from <sources_dir>/<table>.parquet; returns {table: rows}"""
+        missing = sorted(table for table in tables
+                         if not os.path.exists(os.path.join(sources_dir, f'{table}.parquet')))
+        if missing:
+            raise FileNotFoundError(f"No Parquet file in {sources_dir} for {', '.join(missing)}")
+        return {table: self.load_table(table, f"SELECT * FROM read_parquet('{os.path.join(sources_dir, table)}.parquet')")
+                for table in sorted(tables)}
+
+    def load_table(self, name: str, sql: str) -> int:
+        """Create or replace a (source) table from a query, e.g. SELECT * FROM read_parquet(...)"""
+        self._con().execute(f'CREATE OR REPLACE TABLE "{name}" AS {sql}')
+        self._sizes.pop(name, None)
+        return self._con().execute(f'SELECT COUNT(*) FROM "{name}"').fetchone()[0]
+
+    def exists(self, name: str) -> bool:
+        return bool(self._con().execute(
+            "SELECT COUNT(*) FROM information_schema.tables WHERE table_name = ?", [name]).fetchone()[0])
+
+    def column_bytes(self, table: str, where: str = '') -> Dict[str, int]:
+        """BigQuery logical bytes per column of a DuckDB table (of its rows matching where, if given)"""
+        if table in self._sizes and not where:
+            return self._sizes[table]
+        columns = self._con().execute(
+            "SELECT column_name, data_type FROM information_schema.columns WHERE table_name = ?",
+            [table]).fetchall()
+        terms = []
+        for column, data_type in columns:
+            if data_type == 'VARCHAR':
+                terms.append(f'COALESCE(SUM(2 + strlen("{column}")), 0)')
+            else:
+                terms.append(f'{FIXED_WIDTH_BYTES.get(data_type, 8)} * COUNT("{column}")')
+        condition = f' WHERE {where}' if where else ''
+        row = self._con().execute(f'SELECT {", ".join(terms)} FROM "{table}"{condition}').fetchone() if terms else []
+        sizes = {column: int(value) for (column, _), value in zip(columns, row)}
+        if not where:
+            self._sizes[table] = sizes
+        return sizes
+
+    def _merge_target_bytes(self, name: str, config: Dict[str, Any], update_filter: str) -> int:
+        """What a MERGE reads of its target: all of it, or the partitions its updatePartitionFilter keeps"""
+        partition = to_duckdb(config.get('bigquery', {}).get('partitionBy', ''))
+        if not partition or not update_filter:
+            return sum(self.column_bytes(name).values())
+        kept = f'{partition} IN (SELECT DISTINCT {partition} FROM "{name}" WHERE {update_filter})'
+        return sum(self.column_bytes(name, kept).values())
+
+    def scanned_bytes(self, sql: str) -> int:
+        """Bytes BigQuery bills for a query: every column the plan reads, in full, in each table it scans"""
+        sql = CREATE_TEMP.sub('', SET_VARIABLE.sub('SELECT', sql))
+        plan = json.loads(self._con().execute(f'EXPLAIN (FORMAT JSON) {sql}').fetchall()[0][1])
+        scanned: Dict[str, set] = {}
+
+        def walk(node: Dict[str, Any]):
+            info = node.get('extra_info') or {}
+            if node.get('name', '').strip() in ('SEQ_SCAN', 'TABLE_SCAN') and info.get('Text'):
+                columns = scanned.setdefault(info['Text'], set())
+                for key in ('Projections', 'Filters'):
+                    value = info.get(key) or []
+                    columns.update(re.findall(r'\w+', value if isinstance(value, str) else ' '.join(value)))
+            for child in node.get('children', []):
+                walk(child)
+
+        for node in plan:
+            walk(node)
+        return sum(size for table, columns in scanned.items()
+                   for column, size in self.column_bytes(table).items() if column in columns)
+
+    def run(self, name: str, full_refresh: bool = False) -> Dict[str, Any]:
+        """
+        Run one model and report what it cost
+
+        Returns {model, type, mode, rows, changed_rows, seconds, bytes_processed,
+        bytes_merge_target}: mode is "create" for tables, views and first (or
+        full-refresh) runs of incremental models, "merge" for incremental runs
+        into an existing table; bytes_merge_target is the part of
+        bytes_processed billed for the MERGE target. seconds leaves out the
+        byte accounting.
+        """
+        config = self.project.models[name]['config']
+        kind = config.get('type', 'table')
+        merge = kind == 'incremental' and not full_refresh and self.exists(name)
+        statements = self.project.statements(name, incremental=merge)
+        sql, update_filter = statements['sql'], statements['update_partition_filter']
+        # Each billed against the tables as the statements before it left them
+        processed, seconds = 0, 0.0
+        for statement in statements['pre_operations']:
+            processed += self.scanned_bytes(statement)
+            start = time.perf_counter()
+            self._con().execute(statement)
+            seconds += time.perf_counter() - start
+            created = CREATE_TEMP.match(statement)
+            if created:
+                self._sizes.pop(created.group(1), None)
+        # Planned once the declared variables are set, as BigQuery's script would
+        processed += self.scanned_bytes(sql)
+        target = self._merge_target_bytes(name, config, update_filter) if merge else 0
+
+        start = time.perf_counter()
+        if kind == 'view':
+            self._con().execute(f'CREATE OR REPLACE VIEW "{name}" AS {sql}')
+            changed = 0
+        elif not merge:
+            self._con().execute(f'CREATE OR REPLACE TABLE "{name}" AS {sql}')
+            changed = self._con().execute(f'SELECT COUNT(*) FROM "{name}"').fetchone()[0]
+        else:
+            keys = config.get('uniqueKey') or []
+            self._con().execute(f'CREATE OR REPLACE TEMP TABLE "{name}__delta" AS {sql}')
+            if keys:
+                matched = ' AND '.join(f'"{name}"."{key}" = delta."{key}"' for key in keys)
+                if update_filter:
+                    matched += f' AND "{name}".{update_filter}'
+                self._con().execute(f'DELETE FROM "{name}" USING "{name}__delta" AS delta WHERE {matched}')
+            self._con().execute(f'INSERT INTO "{name}" BY NAME SELECT * FROM "{name}__delta"')
+            changed = self._con().execute(f'SELECT COUNT(*) FROM "{name}__delta"').fetchone()[0]
+            self._con().execute(f'DROP TABLE "{name}__delta"')
+        for statement in statements['post_operations']:
+            self._con().execute(statement)
+        seconds += time.perf_counter() - start
+
+        processed += sum(self.scanned_bytes(statement) for statement in statements['post_operations'])
+        # The script's temp tables end with it
+        for table in statements['temp_tables']:
+            self._con().execute(f'DROP TABLE IF EXISTS "{table}"')
+            self._sizes.pop(table, None)
+        self._sizes.pop(name, None)
+        rows = self._con().execute(f'SELECT COUNT(*) FROM "{name}"').fetchone()[0]
+        return {
+            'model': name,
+            'type': kind,
+            'mode': 'merge' if merge else 'create',
+            'rows': rows,
+            'changed_rows': changed,
+            'seconds': round(seconds, 3),
+            'bytes_processed': processed + target,
+            'bytes_merge_target': target,
+        }
+
+    def run_all(self, graph: Dict[str, Set[str]], full_refresh: bool = False, workers: int = 4) -> List[Dict[str, Any]]:
+        """
+        Run the models of a DAG (DataformProject.dag), each as soon as the
+        models it waits for are done, up to `workers` at once. Returns run()'s
+        report per model in completion order, with started/finished (seconds
+        since the run began); a model that fails is reported with its error,
+        and the models downstream of it as skipped.
+        """
+        reports: List[Dict[str, Any]] = []
+        done: Set[str] = set()
+        failed: Set[str] = set()
+        pending = dict(graph)
+        begin = time.perf_counter()
+
+        def timed(name: str) -> Dict[str, Any]:
+            started = time.perf_counter() - begin
+            try:
+                report = self.run(name, full_refresh=full_refresh)
+            except duckdb.Error as exc:
+                report = {'model': name, 'type': self.project.models[name]['config'].get('type', 'table'),
+                          'error': str(exc).splitlines()[0]}
+            return {**report, 'started': round(started, 3), 'finished': round(time.perf_counter() - begin, 3)}
+
+        with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+            running = {}
+            while pending or running:
+                for name in [name for name, upstream in pending.items() if upstream & failed]:
+                    del pending[name]
+                    failed.add(name)
+                    reports.append({'model': name, 'skipped': True,
+                                    'error': f"upstream failed: {', '.join(sorted(graph[name] & failed))}"})
+                for name in sorted(name for name, upstream in pending.items() if upstream <= done):
+                    del pending[name]
+                    running[pool.submit(timed, name)] = name
+                if not running:
+                    continue
+                finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    name = running.pop(future)
+                    report = future.result()
+                    (failed if 'error' in report else done).add(name)
+                    reports.append(report)
+        return reports
+
+
+def critical_path(graph: Dict[str, Set[str]], reports: List[Dict[str, Any]]) -> List[str]:
+    """The chain of models with the most model time end to end: the floor on the run's wall time"""
+    seconds = {report['model']: report.get('seconds', 0.0) for report in reports}
+    best: Dict[str, tuple] = {}
+
+    def longest(name: str) -> tuple:
+        if name not in best:
+            upstream = max((longest(dep) for dep in graph[name]), default=(0.0, []))
+            best[name] = (upstream[0] + seconds.get(name, 0.0), upstream[1] + [name])
+        return best[name]
+
+    return max((longest(name) for name in graph), default=(0.0, []))[1]
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Run the Dataform models offline on DuckDB from Parquet sources")
+    parser.add_argument('--project-dir', default=None, help="Dataform project (default: phase_3/dataform)")
+    parser.add_argument('--sources', default='oltp', help="Directory with one <source>.parquet per declared source")
+    parser.add_argument('--init-sources', action='store_true',
+                        help="(Re)write synthetic source files from --schema first")
+    parser.add_argument('--schema', default=DEFAULT_SOURCE_SCHEMA, help="Source column layout CSV")
+    parser.add_argument('--rows', type=int, default=100000, help="Rows per synthetic source table")
+    parser.add_argument('--actions', nargs='+', help="Models to run (default: all)")
+    parser.add_argument('--include-deps', action='store_true', help="Run the models the actions depend on too")
+    parser.add_argument('--full-refresh', action='store_true')
+    parser.add_argument('--workers', type=int, default=4, help="Models run at once")
+    parser.add_argument('--database', default=':memory:', help="DuckDB database file to keep the results in")
+    parser.add_argument('--output', help="Write the JSON report here as well")
+    args = parser.parse_args(argv)
+
+    project = DataformProject(args.project_dir)
+    try:
+        graph = project.dag(args.actions, include_deps=args.include_deps)
+    except ValueError as exc:
+        print(exc)
+        return 1
+    sources = project.source_tables(graph)
+    if args.init_sources:
+        schema = read_source_schema(args.schema)
+        missing = sorted(project.sources - set(schema))
+        if missing:
+            print(f"No columns in {args.schema} for {', '.join(missing)}")
+            return 1
+        start = time.perf_counter()
+        write_sources(args.sources, {table: schema[table] for table in project.sources}, args.rows)
+        print(f"Wrote {len(project.sources)} source tables of {args.rows:,} rows to {args.sources} "
+              f"in {time.perf_counter() - start:.2f}s")
+
+    runner = LocalDataformRunner(project, args.database)
+    start = time.perf_counter()
+    # Models the actions read but do not run: kept from an earlier run in --database, else from the sources
+    upstream = {dep for name in graph for dep in project.dependencies(name)
+                if dep in project.models and dep not in graph and not runner.exists(dep)}
+    loaded = runner.load_sources(args.sources, sources | upstream)
+    load_seconds = time.perf_counter() - start
+    start = time.perf_counter()
+    reports = runner.run_all(graph, full_refresh=args.full_refresh, workers=args.workers)
+    wall_seconds = time.perf_counter() - start
+
+    print(f"\n{'Model':40} {'Type':12} {'Mode':7} {'Rows':>10} {'Seconds':>8} {'Billed':>10}")
+    for report in sorted(reports, key=lambda r: r.get('started', float('inf'))):
+        if 'error' in report:
+            print(f"{report['model']:40} {'skipped' if report.get('skipped') else 'FAILED'}: {report['error']}")
+            continue
+        print(f"{report['model']:40} {report['type']:12} {report['mode']:7} {report['rows']:>10,} "
+              f"{report['seconds']:>8.3f} {report['bytes_processed'] / 1e6:>8.1f}MB")
+
+    path = critical_path(graph, [report for report in reports if 'error' not in report])
+    summary = {
+        'models': len(graph),
+        'succeeded': sum(1 for report in reports if 'error' not in report),
+        'failed': sorted(report['model'] for report in reports if 'error' in report and not report.get('skipped')),
+        'skipped': sorted(report['model'] for report in reports if report.get('skipped')),
+        'workers': args.workers,
+        'source_tables': len(loaded),
+        'source_rows': sum(loaded.values()),
+        'source_load_seconds': round(load_seconds, 3),
+        'wall_seconds': round(wall_seconds, 3),
+        'model_seconds': round(sum(report.get('seconds', 0.0) for report in reports), 3),
+        'critical_path': path,
+        'critical_path_seconds': round(sum(report['seconds'] for report in reports if report['model'] in path), 3),
+    }
+    print(json.dumps(summary, indent=2))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'summary': summary, 'models': reports}, f, indent=2)
+    return 0 if not summary['failed'] else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,165 @@
+"""
+Datagroup-driven result caching, in step with Looker's
+
+The LookML model declares one datagroup per Dataform fact, triggered on the
+fact's MAX(loaded_at), and every explore persists with the datagroup of its
+fact (persist_with). Looker checks each sql_trigger on its regenerator
+schedule; when the value moves, the explore's cached results are stale and
+its aggregate tables (datagroup_trigger) are rebuilt.
+
+DatagroupPolicy applies the same rule to the app's QueryResultCache. At most
+every DATAGROUP_CHECK_SECONDS it reads the trigger values - LookerClient from
+Looker's datagroup API, so both caches turn over on the same value;
+LocalWarehouseClient by running each sql_trigger on DuckDB - and drops the
+cached results of the explores whose datagroup moved. An explore with a wide
+twin (sales_analysis_wide) also follows the twin's datagroup, since its
+queries may be routed there. Between loads, results live for the
+datagroup's max_cache_age rather than the cache's TTL - but only once the
+explore's trigger values have been read, since nothing could drop them
+otherwise; until then, and for explores without a datagroup, the cache's
+TTL applies. DATAGROUP_CHECK_SECONDS=0 turns the policy off.
+
+The first read only records the values: the result cache lives in the same
+process, so nothing in it predates the policy. Results kept beyond the
+process (the conversation store) carry data_version(), the trigger values
+they were computed under, and are reused only while those still hold.
+"""
+import os
+import re
+import time
+import threading
+from typing import Dict, Any, List, Optional, Callable
+
+import tracing
+
+DATAGROUP_CHECK_SECONDS = float(os.getenv('DATAGROUP_CHECK_SECONDS', '60'))
+
+# max_cache_age: "24 hours"
+DURATION = re.compile(r'^\s*(\d+(?:\.\d+)?)\s*(second|minute|hour|day)s?\s*$', re.IGNORECASE)
+UNIT_SECONDS = {'second': 1, 'minute': 60, 'hour': 3600, 'day': 86400}
+
+
+def parse_duration(text: str) -> Optional[float]:
+    """Seconds in a LookML duration such as "24 hours" (None if it is not one)"""
+    match = DURATION.match(text or '')
+    return float(match.group(1)) * UNIT_SECONDS[match.group(2).lower()] if match else None
+
+
+def explore_datagroups(catalog: Dict[str, Any]) -> Dict[str, List[str]]:
+    """Explore -> the datagroups its cached results follow: its persist_with, and its wide twin's"""
+    datagroups, explores = catalog.get('datagroups', {}), catalog['explores']
+    groups = {}
+    for name, explore in explores.items():
+        names = [explore.get('persist_with', ''), explores.get(f"{name}_wide", {}).get('persist_with', '')]
+        names = [group for group in dict.fromkeys(names) if group in datagroups]
+        if names:
+            groups[name] = names
+    return groups
+
+
+class DatagroupPolicy:
+    """Drops an explore's cached results when one of its datagroups' trigger values moves"""
+
+    def __init__(self, catalog: Dict[str, Any], read_triggers: Callable[[List[str]], Dict[str, Any]],
+                 check_seconds: Optional[float] = None, backend: str = 'looker'):
+        """
+        Args:
+            catalog: Compiled LookML catalog (datagroups and each explore's persist_with)
+            read_triggers: Returns {datagroup: trigger value} for the given datagroups;
+                a datagroup left out (trigger error) keeps its last value
+            check_seconds: Minimum time between trigger reads (default DATAGROUP_CHECK_SECONDS)
+            backend: Span prefix for tracing ("looker" -> "looker.datagroups")
+        """
+        self.datagroups = catalog.get('datagroups', {})
+        self.explores = explore_datagroups(catalog)
+        self.read_triggers = read_triggers
+        self.check_seconds = DATAGROUP_CHECK_SECONDS if check_seconds is None else check_seconds
+        self.backend = backend
+        self._values: Dict[str, Any] = {}
+        self._checked_at: Optional[float] = None
+        self._lock = threading.Lock()
+        self.checks = 0
+        self.errors = 0
+        self.fired: Dict[str, int] = {}
+        self.invalidated = 0
+
+    def enabled(self) -> bool:
+        return bool(self.explores) and self.check_seconds > 0
+
+    def ttl_seconds(self, explore: str) -> Optional[float]:
+        """How long the explore's results may be served between loads (None: the cache's TTL)"""
+        groups = self.explores.get(explore, [])
+        with self._lock:
+            # No trigger read yet (no permission, network error): nothing would drop them early
+            if not groups or any(group not in self._values for group in groups):
+                return None
+        ages = [parse_duration(self.datagroups[group].get('max_cache_age', '')) for group in groups]
+        ages = [age for age in ages if age]
+        return min(ages) if ages and self.enabled() else None
+
+    def refresh(self, cache, force: bool = False) -> List[str]:
+        """
+        Read the trigger values if a check is due and drop the cached results
+        of the explores whose datagroup moved; returns those explores
+        """
+        if not self.enabled():
+            return []
+        now = time.monotonic()
+        with self._lock:
+            if not force and self._checked_at is not None and now - self._checked_at < self.check_seconds:
+                return []
+            # Claimed before reading, so concurrent callers skip the check instead of repeating it
+            self._checked_at = now
+        names = sorted({group for groups in self.explores.values() for group in groups})
+        try:
+            with tracing.span(f'{self.backend}.datagroups'):
+                values = self.read_triggers(names)
+        except Exception as e:
+            with self._lock:
+                self.errors += 1
+            print(f"   Datagroup trigger check failed ({str(e)}), keeping cached results")
+            return []
+
+        with self._lock:
+            self.checks += 1
+            fired = [group for group in names
+                     if group in values and group in self._values and values[group] != self._values[group]]
+            self._values.update({group: value for group, value in values.items() if group in names})
+            for group in fired:
+                self.fired[group] = self.fired.get(group, 0) + 1
+        stale = [explore for explore, groups in self.explores.items() if set(groups) & set(fired)]
+        if stale:
+            dropped = cache.invalidate(stale)
+            with self._lock:
+                self.invalidated += dropped
+            print(f"   Datagroup {', '.join(fired)} triggered: dropped {dropped} cached results "
+                  f"for {', '.join(sorted(stale))}")
+        return stale
+
+    def data_version(self, explore: str) -> Optional[str]:
+        """
+        The trigger values of the explore's datagroups, as one string
+
+        "" when the explore has no datagroup or the policy is off (results
+        only age out), None while a value is unknown (no check has succeeded).
+        """
+        if not self.enabled() or explore not in self.explores:
+            return ''
+        with self._lock:
+            if any(group not in self._values for group in self.explores[explore]):
+                return None
+            return ';'.join(f"{group}={self._values[group]}" for group in self.explores[explore])
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'enabled': self.enabled(),
+                'check_seconds': self.check_seconds,
+                'checks': self.checks,
+                'errors': self.errors,
+                'fired': dict(self.fired),
+                'invalidated': self.invalidated,
+                'trigger_values': {group: str(value) for group, value in self._values.items()},
+                'explores': dict(self.explores),
+            }
+
@@ -0,0 +1,129 @@
+import math
+import re
+import threading
+from typing import Dict, List, Optional, Tuple
+
+from question_text import normalize_question
+from question_index import is_follow_up
+
+# Words users reach for that don't appear in the field catalog itself
+EXPLORE_KEYWORDS = {
+    'sales_analysis': 'revenue sold sell selling buyer customer region rep salesperson order value territory country',
+    'product_reviews': 'rating rated stars feedback review reviewer sentiment opinion',
+    'inventory_analysis': 'stock stocked warehouse on hand availability available shelf bin location',
+    'purchasing_analysis': 'vendor supplier procurement purchase purchased buy bought received',
+    'manufacturing_analysis': 'scrap scrapped production produce manufacturing work order quality defect',
+}
+
+# Tokens that say nothing about which explore a question belongs to
+ROUTER_STOP_WORDS = {
+    'dim', 'fct', 'name', 'e', 'g', 'the', 'me', 'show', 'what', 'whats', 'which', 'by', 'for', 'of',
+    'and', 'or', 'in', 'to', 'a', 'an', 'is', 'are', 'our', 'use', 'dimension', 'measure', 'explore',
+    'total', 'count', 'average', 'top', 'how', 'many', 'much',
+}
+
+
+def _tokens(text: str) -> List[str]:
+    tokens = []
+    for word in re.split(r'[\s_.,()/:=-]+', normalize_question(text.replace('_', ' ').replace('.', ' '))):
+        if not word or word in ROUTER_STOP_WORDS or word.isdigit():
+            continue
+        # Crude stemming is enough to line up "vendors"/"vendor", "ratings"/"rating"
+        if len(word) > 3 and word.endswith('s') and not word.endswith('ss'):
+            word = word[:-1]
+        tokens.append(word)
+    return tokens
+
+
+class ExploreRouter:
+    """
+    Cheap local classifier that picks the explore(s) a question is about
+
+    Each explore is a TF-IDF document built from its section of the field
+    catalog plus a few keywords. The router returns the best explore, adds
+    the runner-up when it scores close, and returns None (meaning "send the
+    full catalog") when nothing in the question points anywhere, or only
+    weakly and in several directions.
+    """
+
+    def __init__(self, explore_context: Dict[str, str], min_score: float = 0.15, second_ratio: float = 0.6):
+        self.min_score = min_score
+        self.second_ratio = second_ratio
+        # Shared by every Streamlit session through the cached GeminiClient
+        self._lock = threading.Lock()
+        self.routed = 0
+        self.fallbacks = 0
+        self._weights: Dict[str, Dict[str, float]] = {}
+
+        documents = {}
+        for explore, text in explore_context.items():
+            documents[explore] = _tokens(f"{text} {EXPLORE_KEYWORDS.get(explore, '')}")
+
+        n_docs = len(documents)
+        doc_freq: Dict[str, int] = {}
+        for tokens in documents.values():
+            for token in set(tokens):
+                doc_freq[token] = doc_freq.get(token, 0) + 1
+
+        for explore, tokens in documents.items():
+            counts: Dict[str, int] = {}
+            for token in tokens:
+                counts[token] = counts.get(token, 0) + 1
+            weights = {
+                token: (1 + math.log(count)) * math.log(n_docs / doc_freq[token])
+                for token, count in counts.items()
+            }
+            norm = math.sqrt(sum(w * w for w in weights.values())) or 1.0
+            self._weights[explore] = {token: w / norm for token, w in weights.items() if w > 0}
+
+    def scores(self, question: str) -> List[Tuple[str, float]]:
+        """Explores ranked by how well the question's terms match them"""
+        tokens = set(_tokens(question))
+        ranked = [
+            (explore, sum(weights.get(token, 0.0) for token in tokens))
+            for explore, weights in self._weights.items()
+        ]
+        return sorted(ranked, key=lambda item: item[1], reverse=True)
+
+    def route(self, question: str, conversation_history: Optional[list] = None) -> Optional[List[str]]:
+        """
+        Pick the explores whose fields should go into the prompt
+
+        Args:
+            question: Natural language question
+            conversation_history: Previous messages; follow-ups keep the last explore so references resolve
+
+        Returns:
+            One or two explore names, or None to use the full catalog
+        """
+        ranked = self.scores(question)
+        previous = None
+        if conversation_history and is_follow_up(question):
+            previous = (conversation_history[-1].get('query') or {}).get('explore')
+
+        top_score = ranked[0][1] if ranked else 0.0
+        runner_up = ranked[1][1] if len(ranked) > 1 else 0.0
+        # Weak evidence is fine when it is unopposed ("revenue" only means sales); weak and contested is not
+        if top_score <= 0 or (top_score < self.min_score and runner_up > 0):
+            # Nothing topical in the question ("compare it to 2013") - stay on the previous explore
+            if previous in self._weights:
+                self._count('routed')
+                return [previous]
+            self._count('fallbacks')
+            return None
+
+        selected = [ranked[0][0]]
+        if len(ranked) > 1 and ranked[1][1] >= self.second_ratio * ranked[0][1]:
+            selected.append(ranked[1][0])
+        if previous in self._weights and previous not in selected:
+            selected.append(previous)
+        self._count('routed')
+        return selected
+
+    def _count(self, counter: str) -> None:
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {'routed': self.routed, 'full_context': self.fallbacks}
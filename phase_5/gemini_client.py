@@ -1,132 +1,227 @@
 import os
+import copy
 import json
+import hashlib
+import threading
+from datetime import datetime
+from collections import OrderedDict
 import google.generativeai as genai
-from typing import Dict, Any
+from typing import Dict, Any, List, Optional, Tuple
 
-class GeminiClient:
-    """Client for interacting with Google Gemini API for natural language to Looker query translation"""
-    
-    def __init__(self):
-        """Initialize Gemini client with API key"""
-        api_key = os.getenv('GEMINI_API_KEY')
-        if not api_key:
-            raise ValueError("GEMINI_API_KEY not found in environment variables")
-        
-        genai.configure(api_key=api_key)
-        # Use latest Gemini model
-        self.model = genai.GenerativeModel('gemini-2.0-flash')
-        
-        # LookML context from Phase 4
-        self.lookml_context = """
+from question_text import normalize_question
+from question_index import QuestionIndex, is_follow_up
+from template_translator import TemplateTranslator
+from explore_router import ExploreRouter
+from lookml_catalog import load_catalog
+from query_validator import QueryValidator, QueryValidationError, format_issues
+import tracing
+from concurrency import SingleFlight, BackendPool, gemini_pool
+
+def history_fingerprint(conversation_history: Optional[list]) -> str:
+    """
+    Fingerprint the parts of the conversation history that reach the prompt
+
+    Mirrors the context section of translate_to_looker_query: the last 3
+    messages' question, explore, dimensions and filters. Results, timings and
+    insights never reach the prompt and so do not affect the key.
+    """
+    if not conversation_history:
+        return ''
+    recent = []
+    for msg in conversation_history[-3:]:
+        query = msg.get('query') or {}
+        recent.append({
+            'question': normalize_question(msg.get('question', '')),
+            'explore': query.get('explore'),
+            'dimensions': query.get('dimensions', []),
+            'filters': query.get('filters', {}),
+        })
+    payload = json.dumps(recent, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()[:16]
+
+
+class TranslationCache:
+    """
+    Bounded LRU of question -> Looker query translations
+
+    Persisted as an append-only log of JSON lines, like the query ID registry:
+    each put appends one line, so processes sharing the file never drop each
+    other's translations. Other processes' entries are picked up at load and
+    at compaction, when the log holds twice max_entries lines and is
+    rewritten as one line per live entry.
+    """
+
+    def __init__(self, path: Optional[str] = None, max_entries: int = 2000):
+        self.path = path
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._logged = 0
+        self.hits = 0
+        self.misses = 0
+        self._load()
+
+    @staticmethod
+    def make_key(question: str, conversation_history: Optional[list] = None) -> str:
+        return f"{normalize_question(question)}|{history_fingerprint(conversation_history)}"
+
+    def _read(self) -> Tuple["OrderedDict[str, Dict[str, Any]]", int]:
+        """Replay the log (or a file in the older single-list format)"""
+        entries: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        with open(self.path, 'r') as f:
+            text = f.read()
+        try:
+            legacy = json.loads(text)
+        except ValueError:
+            legacy = None
+        if isinstance(legacy, list):
+            # Written as one list of [key, query] pairs before the log format
+            return OrderedDict(legacy), 0
+        lines = 0
+        for line in text.splitlines():
+            try:
+                record = json.loads(line)
+            except ValueError:
+                # A line torn by a crash mid-append
+                continue
+            lines += 1
+            entries.pop(record['key'], None)
+            if record.get('query') is not None:
+                entries[record['key']] = record['query']
+        return entries, lines
+
+    def _load(self) -> None:
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            self._entries, self._logged = self._read()
+        except OSError as e:
+            print(f"Translation cache could not be loaded, starting empty: {str(e)}")
+            self._entries = OrderedDict()
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        if self._entries and not self._logged:
+            self._compact()
+
+    def _write(self, entries: "OrderedDict[str, Dict[str, Any]]") -> None:
+        # Write to a temp file and rename so a crash never leaves a torn file
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp_path, 'w') as f:
+                for key, query in entries.items():
+                    f.write(json.dumps({'key': key, 'query': query}) + '\n')
+            os.replace(tmp_path, self.path)
+            self._entries = entries
+            self._logged = len(entries)
+        except OSError as e:
+            print(f"Translation cache could not be saved: {str(e)}")
+
+    def _compact(self) -> None:
+        """Rewrite the log as one line per live entry, keeping other processes' appends"""
+        try:
+            merged, _ = self._read() if os.path.exists(self.path) else (OrderedDict(), 0)
+        except OSError:
+            merged = OrderedDict()
+        # This process's entries win, most recently used last
+        for key, query in self._entries.items():
+            merged.pop(key, None)
+            merged[key] = query
+        while len(merged) > self.max_entries:
+            merged.popitem(last=False)
+        self._write(merged)
+
+    def _save(self, key: str, query: Dict[str, Any]) -> None:
+        if not self.path:
+            return
+        if self._logged >= 2 * self.max_entries:
+            self._compact()
+            return
+        try:
+            # One line per write, so appends from several processes do not interleave
+            with open(self.path, 'a') as f:
+                f.write(json.dumps({'key': key, 'query': query}) + '\n')
+            self._logged += 1
+        except OSError as e:
+            print(f"Translation cache could not be saved: {str(e)}")
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            query = self._entries.get(key)
+            if query is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            # Callers may edit the query (e.g. repairs), so hand out a copy
+            return copy.deepcopy(query)
+
+    def put(self, key: str, query: Dict[str, Any]) -> None:
+        with self._lock:
+            self._entries[key] = copy.deepcopy(query)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            self._save(key, self._entries[key])
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            if self.path:
+                self._write(OrderedDict())
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+            }
+
+
+# Process-wide translation cache shared by every GeminiClient
+translation_cache = TranslationCache(
+    path=os.getenv(
+        'GEMINI_TRANSLATION_CACHE_PATH',
+        os.path.join(os.path.dirname(os.path.abspath(__file__)), '.translation_cache.json')
+    ),
+    max_entries=int(os.getenv('GEMINI_TRANSLATION_CACHE_SIZE', '2000'))
+)
+
+# Process-wide paraphrase index of past (question -> validated query) pairs
+question_index = QuestionIndex(
+    path=os.getenv(
+        'GEMINI_QUESTION_INDEX_PATH',
+        os.path.join(os.path.dirname(os.path.abspath(__file__)), '.question_index.json')
+    ),
+    threshold=float(os.getenv('GEMINI_SIMILARITY_THRESHOLD', '0.85'))
+)
+
+# Concurrent identical translations (same question and context) share one model call
+translation_flights = SingleFlight('gemini')
+
+
+# Example values Looker can't tell us - the field list itself comes from the compiled LookML catalog
+FIELD_HINTS = {
+    'category_name': 'e.g., Bikes, Components, Clothing, Accessories',
+    'subcategory_name': 'e.g., Mountain Bikes, Road Bikes',
+    'territory_name': 'e.g., Northwest, Northeast',
+    'customer_type': 'Individual or Store',
+    'stock_status': 'Out of Stock, Low Stock, Medium Stock, Well Stocked',
+    'rating': '1-5 stars',
+}
+
+LOOKML_HEADER = """
 You are a data analyst assistant for Adventure Works, a bicycle manufacturer.
 Convert user questions to Looker queries using the fields below.
+"""
 
-=== EXPLORE: sales_analysis ===
-Use for: Sales, revenue, orders, customers, territories
-Dimensions:
-- dim_product.category_name (e.g., Bikes, Clothing, Accessories)
-- dim_product.subcategory_name (e.g., Mountain Bikes, Road Bikes)
-- dim_product.product_name (Specific product name)
-- dim_customer.customer_name
-- dim_customer.customer_type (Individual or Store)
-- dim_territory.territory_name (e.g., Northwest, Northeast)
-- dim_territory.country_name (e.g., United States, Canada)
-- dim_date_order.year, dim_date_order.month_name, dim_date_order.quarter (Order date)
-- dim_date_ship.year, dim_date_ship.month_name (Ship date - optional)
-- dim_salesperson.salesperson_name
-Measures:
-- fct_sales.total_sales_amount (Revenue)
-- fct_sales.order_count (Number of orders)
-- fct_sales.average_order_value
-- fct_sales.line_item_count
-
-=== EXPLORE: product_reviews ===
-Use for: Product ratings, reviews, customer feedback
-Dimensions:
-- dim_product.product_name
-- dim_product.category_name
-- dim_product.subcategory_name
-- fct_product_reviews.reviewer_name
-- fct_product_reviews.sentiment
-Measures:
-- fct_product_reviews.average_rating (1-5 stars)
-- fct_product_reviews.review_count
-
-=== EXPLORE: inventory_analysis ===
-Use for: Stock levels, inventory, warehouse, product availability
-Dimensions:
-- dim_product.product_name (Product name)
-- dim_product.category_name (Bikes, Components, etc.)
-- dim_product.subcategory_name (Mountain Bikes, etc.)
-- dim_location.location_name (Warehouse/facility name)
-- fct_product_inventory.stock_status (Out of Stock, Low Stock, Medium Stock, Well Stocked)
-- fct_product_inventory.shelf (Shelf location)
-Measures:
-- fct_product_inventory.total_inventory (Total quantity on hand)
-- fct_product_inventory.average_inventory
-- fct_product_inventory.out_of_stock_count
-- fct_product_inventory.low_stock_count
-- fct_product_inventory.inventory_location_count
-
-=== EXPLORE: purchasing_analysis ===
-Use for: Vendor orders, procurement, purchasing
-Dimensions:
-- dim_vendor.vendor_name
-- dim_product.product_name
-- dim_product.category_name
-- dim_employee.employee_name (Purchasing employee)
-- dim_date_order.year, dim_date_order.month_name (Order date)
-Measures:
-- fct_purchases.total_order_quantity
-- fct_purchases.total_received_quantity
-- fct_purchases.total_line_total (Purchase amount)
-
-=== EXPLORE: manufacturing_analysis ===
-Use for: Production, work orders, scrap, quality
-Dimensions:
-- dim_product.product_name
-- dim_scrap_reason.scrap_reason_name
-Measures:
-- fct_work_orders.total_order_qty
-- fct_work_orders.total_scrapped_qty
-- fct_work_orders.scrap_rate
-
+LOOKML_FOOTER = """
 Date range: 2011-2014
 """
-    
-    def translate_to_looker_query(self, user_question: str, conversation_history: list = None) -> Dict[str, Any]:
-        """
-        Translate natural language question to Looker query structure
-        
-        Args:
-            user_question: Natural language question from user
-            conversation_history: List of previous messages for context (optional)
-            
-        Returns:
-            Dictionary with explore, dimensions, measures, and filters
-        """
-        
-        # Build conversation context if available
-        context_section = ""
-        if conversation_history and len(conversation_history) > 0:
-            context_section = "\n\nCONVERSATION HISTORY (for context):\n"
-            # Include last 3 messages for context
-            recent_messages = conversation_history[-3:] if len(conversation_history) > 3 else conversation_history
-            for i, msg in enumerate(recent_messages, 1):
-                context_section += f"{i}. User asked: \"{msg.get('question', '')}\"\n"
-                if 'query' in msg:
-                    context_section += f"   Explored: {msg['query'].get('explore', 'N/A')}, "
-                    context_section += f"Dimensions: {msg['query'].get('dimensions', [])}, "
-                    context_section += f"Filters: {msg['query'].get('filters', {})}\n"
-            context_section += "\nUse this context to understand references like 'compare it', 'same data', 'that category', etc.\n"
-        
-        prompt = f"""{self.lookml_context}
-{context_section}
-USER QUESTION: "{user_question}"
-
-Convert this to a Looker query. Return ONLY valid JSON with this structure:
 
-CRITICAL RULES FOR ACTIONABLE QUERIES:
+PROMPT_RULES = """CRITICAL RULES FOR ACTIONABLE QUERIES:
 1. ALWAYS include at least one dimension AND at least one measure
 2. If conversation history is provided, use it to resolve references:
    - "compare it to" or "vs" → add to filters or dimensions from previous query
@@ -144,130 +239,367 @@ CRITICAL RULES FOR ACTIONABLE QUERIES:
 7. Sort by the main measure descending to show top performers
 8. Set reasonable limits (Top N: exact number, comparisons: items compared, categories: 10-15, trends: 12-24)
 9. Make queries visualization-friendly: pair one dimension with one measure
+"""
 
-EXAMPLES:
-
-Question: "What were total sales for road bikes last year?"
-{{
+# Few-shot examples, tagged with the explore they demonstrate
+PROMPT_EXAMPLES = [
+    ('sales_analysis', """Question: "What were total sales for road bikes last year?"
+{
     "explore": "sales_analysis",
     "dimensions": ["dim_product.subcategory_name"],
     "measures": ["fct_sales.total_sales_amount"],
-    "filters": {{"dim_product.subcategory_name": "Road Bikes", "dim_date_order.year": "2014"}},
+    "filters": {"dim_product.subcategory_name": "Road Bikes", "dim_date_order.year": "2014"},
     "sorts": ["fct_sales.total_sales_amount desc"],
     "limit": 10
-}}
-
-Question: "Show me current inventory levels by category"
-{{
+}"""),
+    ('inventory_analysis', """Question: "Show me current inventory levels by category"
+{
     "explore": "inventory_analysis",
     "dimensions": ["dim_product.category_name"],
     "measures": ["fct_product_inventory.total_inventory"],
-    "filters": {{}},
+    "filters": {},
     "sorts": ["fct_product_inventory.total_inventory desc"],
     "limit": 10
-}}
-
-Question: "Show me top 5 products by revenue"
-{{
+}"""),
+    ('sales_analysis', """Question: "Show me top 5 products by revenue"
+{
     "explore": "sales_analysis",
     "dimensions": ["dim_product.product_name"],
     "measures": ["fct_sales.total_sales_amount"],
-    "filters": {{}},
+    "filters": {},
     "sorts": ["fct_sales.total_sales_amount desc"],
     "limit": 5
-}}
-
-Question: "What's the average product rating by category?"
-{{
+}"""),
+    ('product_reviews', """Question: "What's the average product rating by category?"
+{
     "explore": "product_reviews",
     "dimensions": ["dim_product.category_name"],
     "measures": ["fct_product_reviews.average_rating"],
-    "filters": {{}},
+    "filters": {},
     "sorts": ["fct_product_reviews.average_rating desc"],
     "limit": 10
-}}
-
-Question: "Show me sales by month for 2014"
-{{
+}"""),
+    ('sales_analysis', """Question: "Show me sales by month for 2014"
+{
     "explore": "sales_analysis",
     "dimensions": ["dim_date_order.month_name"],
     "measures": ["fct_sales.total_sales_amount"],
-    "filters": {{"dim_date_order.year": "2014"}},
+    "filters": {"dim_date_order.year": "2014"},
     "sorts": ["fct_sales.total_sales_amount desc"],
     "limit": 12
-}}
+}"""),
+    ('purchasing_analysis', """Question: "Which vendors have the highest order volumes?"
+{
+    "explore": "purchasing_analysis",
+    "dimensions": ["dim_vendor.vendor_name"],
+    "measures": ["fct_purchases.total_order_quantity"],
+    "filters": {},
+    "sorts": ["fct_purchases.total_order_quantity desc"],
+    "limit": 10
+}"""),
+    ('manufacturing_analysis', """Question: "What's our scrap rate by product?"
+{
+    "explore": "manufacturing_analysis",
+    "dimensions": ["dim_product.product_name"],
+    "measures": ["fct_work_orders.overall_scrap_rate"],
+    "filters": {},
+    "sorts": ["fct_work_orders.overall_scrap_rate desc"],
+    "limit": 10
+}"""),
+]
 
-CONTEXT-AWARE EXAMPLES:
+CONTEXT_EXAMPLES = """CONTEXT-AWARE EXAMPLES:
 Previous: User asked "Show me sales by category for 2014"
 Current: "Now compare it to 2013"
-{{
+{
     "explore": "sales_analysis",
     "dimensions": ["dim_product.category_name", "dim_date_order.year"],
     "measures": ["fct_sales.total_sales_amount"],
-    "filters": {{"dim_date_order.year": "2013,2014"}},
+    "filters": {"dim_date_order.year": "2013,2014"},
     "sorts": ["fct_sales.total_sales_amount desc"],
     "limit": 10
-}}
+}
 
 Previous: User asked "Show me sales for Bikes"
 Current: "What about Components?"
-{{
+{
     "explore": "sales_analysis",
     "dimensions": ["dim_product.category_name"],
     "measures": ["fct_sales.total_sales_amount"],
-    "filters": {{"dim_product.category_name": "Components"}},
+    "filters": {"dim_product.category_name": "Components"},
     "sorts": ["fct_sales.total_sales_amount desc"],
     "limit": 10
-}}
+}
+"""
+
+
+def render_explore_context(catalog: Dict[str, Any]) -> Dict[str, str]:
+    """
+    Render one prompt section per explore from the compiled LookML catalog.
 
+    Only the visible fields, by name: keys and IDs are left out (questions name
+    things, they don't number them), a dimension group's timeframes share one
+    entry and a role-playing join with the same fields as an earlier one points
+    back to it. The base view's measures carry their LookML description.
+    """
+    sections = {}
+    for name, explore in catalog['explores'].items():
+        if explore.get('hidden'):
+            continue
+        dimensions: Dict[str, List[str]] = {}
+        measures: Dict[str, List[str]] = {}
+        for field_name, field in explore['fields'].items():
+            if field['hidden'] or field.get('primary_key'):
+                continue
+            alias, short_name = field_name.split('.', 1)
+            if field['kind'] == 'measure':
+                describe = alias == explore.get('base_alias') and field['description']
+                measures.setdefault(alias, []).append(
+                    f"{short_name} ({field['description']})" if describe else short_name)
+            elif short_name.endswith(('_id', '_key')):
+                continue
+            elif field['type'].startswith('date_'):
+                # created_date, created_week, ... -> created_{date,week}
+                timeframe = field['type'][len('date_'):]
+                group = short_name[:-len(timeframe) - 1] + '_{'
+                fields = dimensions.setdefault(alias, [])
+                entry = next((i for i, text in enumerate(fields) if text.startswith(group)), None)
+                if entry is None:
+                    fields.append(f"{group}{timeframe}}}")
+                else:
+                    fields[entry] = f"{fields[entry][:-1]},{timeframe}}}"
+            else:
+                hint = FIELD_HINTS.get(short_name)
+                dimensions.setdefault(alias, []).append(f"{short_name} ({hint})" if hint else short_name)
+
+        lines = [f"=== EXPLORE: {name} ===", f"Use for: {explore['description']}", "Dimensions:"]
+        rendered: Dict[str, Any] = {}
+        for alias, fields in dimensions.items():
+            join = explore['joins'].get(alias, {})
+            role = ""
+            if join.get('from') and join['from'] != alias:
+                # Role-playing joins (dim_date_order, dim_address_ship) - name the key they hang off
+                key = join['sql_on'].split('.', 1)[-1].split('}', 1)[0]
+                role = f" ({key.replace('_key', '').replace('_', ' ')})"
+            view = join.get('from', alias)
+            if rendered.get(view, (None, None))[1] == fields:
+                lines.append(f"- {alias}{role}: same fields as {rendered[view][0]}")
+                continue
+            rendered.setdefault(view, (alias, fields))
+            lines.append(f"- {alias}{role}: {', '.join(fields)}")
+        lines.append("Measures:")
+        lines.extend(f"- {alias}: {', '.join(fields)}" for alias, fields in measures.items())
+        sections[name] = '\n'.join(lines)
+    return sections
+
+
+def build_lookml_context(explore_context: Dict[str, str], explores: Optional[List[str]] = None) -> str:
+    """
+    Field catalog for the given explores (all of them when None). A view's
+    field list already given for an earlier explore is only referred to.
+    """
+    names = explores if explores else list(explore_context.keys())
+    seen: Dict[tuple, str] = {}
+    sections = []
+    for name in names:
+        if name not in explore_context:
+            continue
+        lines, heading = [], ''
+        for line in explore_context[name].strip().split('\n'):
+            if not line.startswith('- '):
+                heading = line
+            elif (heading, line) in seen:
+                line = f"{line.split(': ', 1)[0]}: as in {seen[(heading, line)]}"
+            else:
+                seen[(heading, line)] = name
+            lines.append(line)
+        sections.append('\n'.join(lines))
+    return f"{LOOKML_HEADER}\n" + '\n\n'.join(sections) + f"\n{LOOKML_FOOTER}"
+
+
+class GeminiClient:
+    """Client for interacting with Google Gemini API for natural language to Looker query translation"""
+    
+    def __init__(self, cache: Optional[TranslationCache] = None, index: Optional[QuestionIndex] = None,
+                 flights: Optional[SingleFlight] = None, pool: Optional[BackendPool] = None):
+        """Initialize Gemini client with API key"""
+        self.cache = cache if cache is not None else translation_cache
+        self.question_index = index if index is not None else question_index
+        self.flights = flights if flights is not None else translation_flights
+        # GenerativeModel is safe to share (one gRPC channel); the pool caps concurrent calls
+        self.pool = pool if pool is not None else gemini_pool
+        # Every question and how it was answered, for template coverage reports
+        self.question_log_path = os.getenv(
+            'GEMINI_QUESTION_LOG_PATH',
+            os.path.join(os.path.dirname(os.path.abspath(__file__)), '.question_log.jsonl')
+        )
+        
+        api_key = os.getenv('GEMINI_API_KEY')
+        if not api_key:
+            raise ValueError("GEMINI_API_KEY not found in environment variables")
+        
+        genai.configure(api_key=api_key)
+        # Use latest Gemini model
+        self.model = genai.GenerativeModel('gemini-2.0-flash')
+        
+        # LookML field catalog compiled from phase_4 (cached on disk, reparsed only when the files change)
+        self.catalog = load_catalog()
+        self.explore_context = render_explore_context(self.catalog)
+        self.lookml_context = build_lookml_context(self.explore_context)
+        self.router = ExploreRouter(self.explore_context)
+        self.templates = TemplateTranslator(self.catalog)
+        self.validator = QueryValidator(self.catalog, cutoff=float(os.getenv('QUERY_REPAIR_CUTOFF', '0.8')))
+    
+    def build_prompt(self, user_question: str, conversation_history: list = None,
+                     explores: Optional[List[str]] = None) -> str:
+        """
+        Build the translation prompt
+        
+        Args:
+            user_question: Natural language question from user
+            conversation_history: List of previous messages for context (optional)
+            explores: Explores to include fields and examples for (all when None)
+            
+        Returns:
+            Prompt text for the model
+        """
+        
+        # Build conversation context if available
+        context_section = ""
+        if conversation_history and len(conversation_history) > 0:
+            context_section = "\n\nCONVERSATION HISTORY (for context):\n"
+            # Include last 3 messages for context
+            recent_messages = conversation_history[-3:] if len(conversation_history) > 3 else conversation_history
+            for i, msg in enumerate(recent_messages, 1):
+                context_section += f"{i}. User asked: \"{msg.get('question', '')}\"\n"
+                if 'query' in msg:
+                    context_section += f"   Explored: {msg['query'].get('explore', 'N/A')}, "
+                    context_section += f"Dimensions: {msg['query'].get('dimensions', [])}, "
+                    context_section += f"Filters: {msg['query'].get('filters', {})}\n"
+            context_section += "\nUse this context to understand references like 'compare it', 'same data', 'that category', etc.\n"
+        
+        lookml_context = build_lookml_context(self.explore_context, explores) if explores else self.lookml_context
+        examples = '\n\n'.join(
+            text for explore, text in PROMPT_EXAMPLES
+            if not explores or explore in explores
+        )
+        # Follow-up examples only matter when there is history to follow up on
+        context_examples = CONTEXT_EXAMPLES if context_section else ""
+        
+        return f"""{lookml_context}
+{context_section}
+USER QUESTION: "{user_question}"
+
+Convert this to a Looker query. Return ONLY valid JSON with this structure:
+
+{PROMPT_RULES}
+EXAMPLES:
+
+{examples}
+
+{context_examples}
 Now convert the user's question. Return ONLY the JSON, no markdown, no explanations:
 """
+    
+    def translate_to_looker_query(self, user_question: str, conversation_history: list = None) -> Dict[str, Any]:
+        """
+        Translate natural language question to Looker query structure
+        
+        Args:
+            user_question: Natural language question from user
+            conversation_history: List of previous messages for context (optional)
+            
+        Returns:
+            Dictionary with explore, dimensions, measures, and filters
+        """
+        
+        # Repeated question in the same conversational context - skip the model call
+        cache_key = self.cache.make_key(user_question, conversation_history)
+        with tracing.span('translate.cache'):
+            cached = self._checked(self.cache.get(cache_key))
+            tracing.annotate(cache_hit=cached is not None)
+        if cached is not None:
+            self._log_question(user_question, 'cache')
+            return cached
+        
+        # Common question shapes are translated locally in microseconds
+        if not (conversation_history and is_follow_up(user_question)):
+            with tracing.span('translate.template'):
+                templated = self.templates.translate(user_question)
+                tracing.annotate(matched=templated is not None)
+            if templated is not None:
+                self._log_question(user_question, 'template')
+                return templated
+        
+        # Paraphrase of a past question - reuse its query with numbers/entities swapped
+        with tracing.span('translate.index'):
+            similar = self._checked(self.question_index.lookup(user_question, conversation_history))
+            tracing.annotate(cache_hit=similar is not None)
+        if similar is not None:
+            print(f"Answered from question index: {user_question}")
+            self.cache.put(cache_key, similar)
+            self._log_question(user_question, 'index')
+            return similar
+        
+        # The same question asked in several sessions at once costs one model call
+        query, shared = self.flights.do(
+            cache_key, lambda: self._translate_with_model(user_question, conversation_history, cache_key)
+        )
+        if shared:
+            self._log_question(user_question, 'coalesced')
+            return copy.deepcopy(query)
+        return query
+    
+    def _translate_with_model(self, user_question: str, conversation_history: Optional[list],
+                              cache_key: str) -> Dict[str, Any]:
+        """Prompt Gemini, validate (re-prompting once) and cache the translation"""
+        self._log_question(user_question, 'gemini')
+        
+        # Only send the fields of the explores the question is likely about
+        with tracing.span('translate.prompt_build'):
+            explores = self.router.route(user_question, conversation_history)
+            prompt = self.build_prompt(user_question, conversation_history, explores)
 
         try:
-            response = self.model.generate_content(prompt)
-            response_text = response.text.strip()
-            
-            # Clean up response (remove markdown code blocks if present)
-            if response_text.startswith('```'):
-                lines = response_text.split('\n')
-                # Remove first and last lines if they're markdown delimiters
-                if lines[0].startswith('```'):
-                    lines = lines[1:]
-                if lines and lines[-1].startswith('```'):
-                    lines = lines[:-1]
-                response_text = '\n'.join(lines).strip()
-            
-            # Remove any "json" prefix
-            if response_text.lower().startswith('json'):
-                response_text = response_text[4:].strip()
-            
-            # Parse JSON
-            query = json.loads(response_text)
+            with tracing.span('translate.model_call'):
+                response_text = self.pool.run(self.model.generate_content, prompt).text.strip()
+            with tracing.span('translate.parse'):
+                query = self._parse_query(response_text)
             
-            # Validate required fields
-            required_fields = ['explore', 'dimensions', 'measures']
-            for field in required_fields:
-                if field not in query:
-                    raise ValueError(f"Missing required field: {field}")
-            
-            # Ensure dimensions and measures are lists with at least one item
-            if not isinstance(query['dimensions'], list) or len(query['dimensions']) == 0:
-                raise ValueError("dimensions must be a non-empty list")
-            if not isinstance(query['measures'], list) or len(query['measures']) == 0:
-                raise ValueError("measures must be a non-empty list")
-            
-            # Set defaults for optional fields
-            if 'filters' not in query:
-                query['filters'] = {}
-            if 'sorts' not in query:
-                query['sorts'] = []
-            if 'limit' not in query:
-                query['limit'] = 10
+            # Check every field against the explore before Looker sees it; repair near misses
+            with tracing.span('translate.validate'):
+                checked = self.validator.validate(query)
+            if checked['errors']:
+                # One targeted retry with the exact problems, then give up loudly
+                print(f"Invalid query from model, re-prompting: {format_issues(checked['errors'])}")
+                retry_prompt = self.build_correction_prompt(
+                    user_question, conversation_history, explores, query, checked['errors']
+                )
+                try:
+                    with tracing.span('translate.model_call', reprompt=True):
+                        retry_text = self.pool.run(self.model.generate_content, retry_prompt).text.strip()
+                    retry = self._parse_query(retry_text)
+                except (json.JSONDecodeError, ValueError):
+                    raise QueryValidationError(checked['errors'])
+                checked = self.validator.validate(retry, reprompt=True)
+                if checked['errors']:
+                    raise QueryValidationError(checked['errors'])
+            if checked['repairs']:
+                print(f"Repaired query: {format_issues(checked['repairs'])}")
+            query = checked['query']
             
+            # Only successful translations are cached, never the fallbacks below
+            self.cache.put(cache_key, query)
+            if not is_follow_up(user_question):
+                self.question_index.add(user_question, query)
             return query
             
+        except QueryValidationError:
+            # Surface it - a fallback query would answer a different question
+            raise
         except json.JSONDecodeError as e:
             # Fallback: simple sales query
+            tracing.annotate(fallback_query=True)
             print(f"JSON decode error: {str(e)}")
             print(f"Response was: {response_text[:200]}")
             return {
@@ -280,6 +612,7 @@ Now convert the user's question. Return ONLY the JSON, no markdown, no explanati
             }
         except Exception as e:
             print(f"Error translating question: {str(e)}")
+            tracing.annotate(fallback_query=True)
             # Return fallback instead of raising
             return {
                 "explore": "sales_analysis",
@@ -290,6 +623,96 @@ Now convert the user's question. Return ONLY the JSON, no markdown, no explanati
                 "limit": 10
             }
     
+    def build_correction_prompt(self, user_question: str, conversation_history: Optional[list],
+                                explores: Optional[List[str]], query: Dict[str, Any],
+                                issues: List[Dict[str, Any]]) -> str:
+        """Translation prompt plus the rejected answer and what was wrong with it"""
+        # Make sure the explore the model picked is described, so "closest" hints make sense
+        if explores and query.get('explore') in self.explore_context and query['explore'] not in explores:
+            explores = list(explores) + [query['explore']]
+        prompt = self.build_prompt(user_question, conversation_history, explores)
+        return f"""{prompt}
+YOUR PREVIOUS ANSWER WAS REJECTED:
+{json.dumps(query)}
+
+Problems:
+{format_issues(issues)}
+
+Use only fields listed under the chosen explore above. Return ONLY the corrected JSON:
+"""
+    
+    def _parse_query(self, response_text: str) -> Dict[str, Any]:
+        """Parse the model's JSON answer and fill in optional keys"""
+        # Clean up response (remove markdown code blocks if present)
+        if response_text.startswith('```'):
+            lines = response_text.split('\n')
+            # Remove first and last lines if they're markdown delimiters
+            if lines[0].startswith('```'):
+                lines = lines[1:]
+            if lines and lines[-1].startswith('```'):
+                lines = lines[:-1]
+            response_text = '\n'.join(lines).strip()
+        
+        # Remove any "json" prefix
+        if response_text.lower().startswith('json'):
+            response_text = response_text[4:].strip()
+        
+        # Parse JSON
+        query = json.loads(response_text)
+        
+        # Validate required fields
+        required_fields = ['explore', 'dimensions', 'measures']
+        for field in required_fields:
+            if field not in query:
+                raise ValueError(f"Missing required field: {field}")
+        
+        # Ensure dimensions and measures are lists with at least one item
+        if not isinstance(query['dimensions'], list) or len(query['dimensions']) == 0:
+            raise ValueError("dimensions must be a non-empty list")
+        if not isinstance(query['measures'], list) or len(query['measures']) == 0:
+            raise ValueError("measures must be a non-empty list")
+        
+        # Set defaults for optional fields
+        if 'filters' not in query:
+            query['filters'] = {}
+        if 'sorts' not in query:
+            query['sorts'] = []
+        if 'limit' not in query:
+            query['limit'] = 10
+        return query
+    
+    def _checked(self, query: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+        """Repaired query, or None when a cached/reused query no longer fits the LookML"""
+        if query is None:
+            return None
+        checked = self.validator.validate(query)
+        return None if checked['errors'] else checked['query']
+    
+    def _log_question(self, question: str, source: str):
+        """Append the question and the path that answered it to the question log"""
+        tracing.annotate(source=source)
+        if not self.question_log_path:
+            return
+        try:
+            with open(self.question_log_path, 'a') as f:
+                f.write(json.dumps({
+                    'timestamp': datetime.now().isoformat(),
+                    'question': question,
+                    'source': source
+                }) + '\n')
+        except OSError as e:
+            print(f"Question log write failed: {str(e)}")
+    
+    def cache_stats(self) -> Dict[str, Any]:
+        """Hit/miss counters for the translation cache and question index, validation, coalescing and queueing"""
+        return {
+            'translations': self.cache.stats(),
+            'question_index': self.question_index.stats(),
+            'validation': self.validator.stats(),
+            'single_flight': self.flights.stats(),
+            'pool': self.pool.stats(),
+        }
+    
     def generate_insight(self, question: str, results_df) -> str:
         """
         Generate natural language insight from query results
@@ -316,7 +739,7 @@ DATA:
 SUMMARY:"""
 
         try:
-            response = self.model.generate_content(prompt)
+            response = self.pool.run(self.model.generate_content, prompt)
             return response.text.strip()
         except Exception as e:
             return f"Query returned {len(results_df)} results."
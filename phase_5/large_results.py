@@ -0,0 +1,282 @@
+"""
+Large-result mode: results streamed in Arrow batches instead of one blob
+
+Queries whose limit is above LARGE_RESULT_ROWS are fetched through
+run_query_stream() instead of run_query_frame(). A backend worker feeds
+record batches into a ResultStream (bounded, so a slow reader holds the
+producer back), and the app:
+
+- renders the first batch as soon as it arrives, then a running row count
+- gets the whole result as one typed DataFrame at the end, built from the
+  same Arrow buffers (no JSON rows, no second copy)
+- offers the full result as CSV, which the stream wrote to RESULT_SPOOL_DIR
+  batch by batch, so a download never re-serializes the DataFrame in memory
+
+The spool is private to the app: it is not under static/, files are only
+handed out through st.download_button in the session that owns the result,
+and a result's file is deleted with it (see ResultStore.discard and
+drop_session), or after RESULT_SPOOL_TTL_HOURS if the process died first.
+
+DuckDB hands over batches of RESULT_BATCH_ROWS while it executes. Looker's
+run_query API has no row offset to page with, so one CSV call fetches the
+result and it is parsed and handed over a block at a time.
+
+    python large_results.py --data-dir warehouse --limit 200000   # time to first batch vs full result
+"""
+import os
+import sys
+import glob
+import time
+import uuid
+import queue
+import argparse
+import threading
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.csv as pa_csv
+
+from concurrency import BackendPool
+from result_frames import frame_from_arrow
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+LARGE_RESULT_ROWS = int(os.getenv('LARGE_RESULT_ROWS', '5000'))
+RESULT_BATCH_ROWS = int(os.getenv('RESULT_BATCH_ROWS', '10000'))
+TABLE_PREVIEW_ROWS = int(os.getenv('TABLE_PREVIEW_ROWS', '1000'))
+RESULT_SPOOL_DIR = os.getenv('RESULT_SPOOL_DIR', os.path.join(BASE_DIR, '.result_spool'))
+RESULT_SPOOL_TTL_HOURS = float(os.getenv('RESULT_SPOOL_TTL_HOURS', '24'))
+
+_DONE = object()
+
+
+class _StreamClosed(Exception):
+    """Raised inside the producer once the reader has gone away"""
+
+
+def is_large(query_config: Dict[str, Any]) -> bool:
+    """True when a query may return more rows than the regular path should hold in one blob"""
+    try:
+        return int(query_config.get('limit') or 0) > LARGE_RESULT_ROWS
+    except (TypeError, ValueError):
+        return False
+
+
+def spooled_csv(df: pd.DataFrame) -> Optional[str]:
+    """Path of the CSV the stream wrote for df, if it still exists"""
+    path = df.attrs.get('csv_path')
+    if not path or not os.path.exists(path):
+        return None
+    return path
+
+
+def remove_spool(path: Optional[str]) -> None:
+    """Delete a result's spooled CSV (anything outside a spool file name is left alone)"""
+    if not path or not os.path.basename(path).startswith('results_'):
+        return
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+def _expire_spool(spool_dir: str) -> None:
+    cutoff = time.time() - RESULT_SPOOL_TTL_HOURS * 3600
+    for path in glob.glob(os.path.join(spool_dir, 'results_*.csv')):
+        try:
+            if os.path.getmtime(path) < cutoff:
+                os.remove(path)
+        except OSError:
+            pass
+
+
+class ResultStream:
+    """
+    Arrow record batches produced on a backend worker and read by the app
+
+    first_page() blocks for the first batch, fetch() yields the running row
+    count as the rest arrive, and frame() returns the complete typed DataFrame
+    (waiting for whatever is still in flight).
+    """
+
+    def __init__(self, types: Dict[str, Dict[str, str]], spool_dir: Optional[str] = RESULT_SPOOL_DIR,
+                 on_complete: Optional[Callable[[pd.DataFrame], None]] = None, max_buffered: int = 4):
+        self.types = types
+        self.spool_dir = spool_dir
+        self.on_complete = on_complete
+        self.rows = 0
+        self.batches = 0
+        self.first_batch_ms: Optional[float] = None
+        self.total_ms: Optional[float] = None
+        self.csv_path: Optional[str] = None
+        self._queue: "queue.Queue" = queue.Queue(maxsize=max_buffered)
+        self._received: List[pa.RecordBatch] = []
+        self._closed = threading.Event()
+        self._finished = False
+        self._future = None
+        self._writer = None
+        self._frame: Optional[pd.DataFrame] = None
+        self._started = time.perf_counter()
+
+    @classmethod
+    def start(cls, pool: BackendPool, produce: Callable[[Callable[[pa.RecordBatch], None]], None],
+              types: Dict[str, Dict[str, str]], **kwargs) -> 'ResultStream':
+        """Run produce(emit) on a pool worker; it calls emit(batch) for each record batch"""
+        stream = cls(types, **kwargs)
+        stream._future = pool.submit(stream._produce, produce)
+        return stream
+
+    @classmethod
+    def completed(cls, frame: pd.DataFrame) -> 'ResultStream':
+        """A stream that is already done, e.g. for a cached result or mock data"""
+        stream = cls({}, spool_dir=None)
+        stream._frame = frame
+        stream._finished = True
+        stream.rows = len(frame)
+        stream.csv_path = frame.attrs.get('csv_path')
+        stream.first_batch_ms = stream.total_ms = 0.0
+        return stream
+
+    # --- producer side (backend worker thread) ---
+
+    def _put(self, item) -> None:
+        while not self._closed.is_set():
+            try:
+                self._queue.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+        raise _StreamClosed()
+
+    def _produce(self, produce) -> None:
+        try:
+            produce(self._put)
+        except _StreamClosed:
+            return
+        finally:
+            try:
+                self._put(_DONE)
+            except _StreamClosed:
+                pass
+
+    # --- reader side (app thread) ---
+
+    def _next(self) -> Optional[pa.RecordBatch]:
+        """The next batch, or None once the producer has finished (re-raising its error)"""
+        if self._finished:
+            return None
+        item = self._queue.get()
+        if item is _DONE:
+            self._finished = True
+            self._future.result()
+            return None
+        if self.first_batch_ms is None:
+            self.first_batch_ms = (time.perf_counter() - self._started) * 1000
+        self._received.append(item)
+        self.rows += item.num_rows
+        self.batches += 1
+        self._spool(item)
+        return item
+
+    def _spool(self, batch: pa.RecordBatch) -> None:
+        if not self.spool_dir:
+            return
+        if self._writer is None:
+            os.makedirs(self.spool_dir, exist_ok=True)
+            _expire_spool(self.spool_dir)
+            # Unguessable name, in case the spool directory is ever shared
+            self.csv_path = os.path.join(self.spool_dir, f"results_{uuid.uuid4().hex}.csv")
+            self._writer = pa_csv.CSVWriter(self.csv_path, batch.schema)
+        self._writer.write_batch(batch)
+
+    def first_page(self) -> Optional[pd.DataFrame]:
+        """Typed DataFrame of the first batch (None for an empty or already-finished stream)"""
+        if self._frame is not None:
+            return None
+        batch = self._next()
+        if batch is None:
+            return None
+        return frame_from_arrow(pa.Table.from_batches([batch]), self.types)
+
+    def fetch(self) -> Iterator[int]:
+        """Read the remaining batches, yielding the running row count after each"""
+        while self._next() is not None:
+            yield self.rows
+
+    def frame(self) -> pd.DataFrame:
+        """The whole result as one typed DataFrame"""
+        if self._frame is not None:
+            return self._frame
+        for _ in self.fetch():
+            pass
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+        if self._received:
+            table = pa.Table.from_batches(self._received)
+        else:
+            table = pa.table({field: pa.array([], type=pa.string()) for field in self.types})
+        self._received = []
+        self._frame = frame_from_arrow(table, self.types)
+        self._frame.attrs['csv_path'] = self.csv_path
+        self.total_ms = (time.perf_counter() - self._started) * 1000
+        if self.on_complete is not None:
+            self.on_complete(self._frame)
+        return self._frame
+
+    def close(self) -> None:
+        """Stop the producer if the reader gives up early, dropping the partial spool file"""
+        self._closed.set()
+        if self._frame is None:
+            # Given up early or failed in the producer: the CSV holds only part of the result
+            if self._writer is not None:
+                self._writer.close()
+                self._writer = None
+            remove_spool(self.csv_path)
+            self.csv_path = None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'rows': self.rows,
+            'batches': self.batches,
+            'first_batch_ms': round(self.first_batch_ms or 0.0, 1),
+            'total_ms': round(self.total_ms or 0.0, 1),
+        }
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Stream a large local-warehouse result and time its batches")
+    parser.add_argument('--data-dir', default=None, help="Parquet directory (default LOCAL_WAREHOUSE_DIR)")
+    parser.add_argument('--limit', type=int, default=200000)
+    parser.add_argument('--batch-rows', type=int, default=RESULT_BATCH_ROWS)
+    args = parser.parse_args(argv)
+
+    from local_warehouse import LocalWarehouseClient
+    from charts import downsample
+    client = LocalWarehouseClient(args.data_dir)
+    query = {
+        'explore': 'sales_analysis',
+        'dimensions': ['dim_customer.customer_name', 'dim_product.product_name'],
+        'measures': ['fct_sales.total_sales_amount'],
+        'sorts': ['fct_sales.total_sales_amount desc'],
+        'limit': args.limit,
+    }
+
+    start = time.perf_counter()
+    stream = client.run_query_stream(query, batch_rows=args.batch_rows, spool_dir=None)
+    stream.first_page()
+    first = (time.perf_counter() - start) * 1000
+    df = stream.frame()
+    total = (time.perf_counter() - start) * 1000
+    start = time.perf_counter()
+    plotted = downsample(df, 'dim_product.product_name', 'fct_sales.total_sales_amount')
+    lttb_ms = (time.perf_counter() - start) * 1000
+    print(f"{len(df):,} rows in {stream.batches} batches: first batch {first:.0f} ms, "
+          f"complete {total:.0f} ms, frame {df.memory_usage(deep=True).sum() / 1e6:.1f} MB")
+    print(f"chart: {len(plotted):,} LTTB points in {lttb_ms:.0f} ms")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,604 @@
+"""
+Offline execution backend: LookML queries on DuckDB over Parquet
+
+LocalWarehouseClient has LookerClient's run_query(query_config),
+run_query_frame(query_config) and run_query_stream(query_config) contracts but
+compiles the query to SQL from the LookML catalog (lookml_sql.py) and runs it
+with DuckDB against Parquet files shaped like the Dataform tables. Each table
+is either <data_dir>/<table>.parquet or a directory of Parquet files under
+<data_dir>/<table>/ (hive partitions allowed).
+
+The explores' aggregate tables are built the way Looker materializes them,
+from the base tables into <data_dir>/<aggregate>.parquet (or, for a rollup
+with partition_keys, <data_dir>/<aggregate>/part=<value>/), and queries they
+cover are answered from them as long as they are newer than the tables they
+summarize (AGGREGATE_AWARENESS=false always reads the base tables). Queries
+on an explore with a wide twin (sales_analysis_wide over obt_sales) go to
+the twin instead when WIDE_EXPLORES=true and no rollup covers them, as long
+as its table is newer than the tables it pre-joins. Cached results follow
+the LookML datagroups (datagroups.py), whose sql_triggers run on the local
+tables.
+
+    python local_warehouse.py eval/labelled_questions.jsonl --repeat 5
+    python local_warehouse.py --build-aggregates
+"""
+import os
+import re
+import sys
+import json
+import time
+import glob
+import argparse
+import shutil
+import datetime
+import decimal
+import threading
+from typing import Dict, Any, List, Optional, Set, Tuple
+
+import duckdb
+import pandas as pd
+import pyarrow.parquet as pq
+
+from looker_client import QueryResultCache, canonical_query_key
+from lookml_catalog import load_catalog
+from lookml_sql import LookMLSqlCompiler, bare_table_name, aggregate_column
+from datagroups import DatagroupPolicy
+import tracing
+from concurrency import SingleFlight, BackendPool, warehouse_pool
+from result_frames import field_types, frame_from_arrow
+from large_results import ResultStream, RESULT_BATCH_ROWS, RESULT_SPOOL_DIR
+
+DEFAULT_DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'warehouse')
+
+# "FROM fct_sales AS fct_sales" / "LEFT JOIN dim_date AS dim_date_order" in compiled SQL
+TABLE_ALIAS = re.compile(r'\b(?:FROM|JOIN)\s+"?(\w+)"?\s+AS\s+(\w+)', re.IGNORECASE)
+QUOTED = re.compile(r'"[^"]*"')
+BACKTICKED = re.compile(r'`[^`]+`')
+# Scan operators in DuckDB's EXPLAIN output, and the column a filter pushed into one reads
+SCAN_OPERATORS = {'READ_PARQUET', 'PARQUET_SCAN', 'SEQ_SCAN', 'TABLE_SCAN'}
+SCAN_FILTER_COLUMN = re.compile(r'^[\s(]*"?([A-Za-z_]\w*)"?')
+
+# The facts' partition columns in BigQuery (the Dataform models' bigquery.partitionBy);
+# locally they are hive-partitioned by the year of that column
+PARTITION_COLUMNS = {'fct_sales': 'order_date', 'fct_purchases': 'order_date', 'fct_work_orders': 'start_date',
+                     'obt_sales': 'order_date'}
+
+
+def _filter_column(scan_filter: str) -> str:
+    """order_date>='2014-01-01'::DATE AND order_date IS NOT NULL -> order_date"""
+    match = SCAN_FILTER_COLUMN.match(scan_filter)
+    return match.group(1) if match else ''
+
+
+def _json_value(value: Any) -> Any:
+    """Match the value types Looker's JSON results carry"""
+    if isinstance(value, decimal.Decimal):
+        return float(value)
+    if isinstance(value, datetime.datetime):
+        return value.strftime('%Y-%m-%d %H:%M:%S')
+    if isinstance(value, datetime.date):
+        return value.isoformat()
+    return value
+
+
+class LocalWarehouseClient:
+    """Drop-in replacement for LookerClient that answers from local Parquet files"""
+
+    def __init__(self, data_dir: Optional[str] = None, catalog: Optional[Dict[str, Any]] = None,
+                 cache: Optional[QueryResultCache] = None, threads: Optional[int] = None,
+                 pool: Optional[BackendPool] = None, aggregate_awareness: Optional[bool] = None,
+                 wide_explores: Optional[bool] = None, datagroups: Optional[DatagroupPolicy] = None,
+                 partition_filters: bool = True):
+        self.data_dir = data_dir or os.getenv('LOCAL_WAREHOUSE_DIR', DEFAULT_DATA_DIR)
+        self.catalog = catalog if catalog is not None else load_catalog()
+        # Own cache by default: local and Looker answers must never be mixed up in one process
+        self.cache = cache if cache is not None else QueryResultCache(
+            ttl_seconds=float(os.getenv('LOOKER_CACHE_TTL_SECONDS', '900')),
+            max_bytes=int(os.getenv('LOOKER_CACHE_MAX_MB', '64')) * 1024 * 1024,
+        )
+        if aggregate_awareness is None:
+            aggregate_awareness = os.getenv('AGGREGATE_AWARENESS', 'true').lower() == 'true'
+        if wide_explores is None:
+            wide_explores = os.getenv('WIDE_EXPLORES', 'false').lower() == 'true'
+        self.aggregates: set = set()
+        self.wide: set = set()
+        # Rollups with partition_keys are partitioned on that column, like the facts on theirs
+        self.partition_columns = dict(PARTITION_COLUMNS)
+        for explore in self.catalog['explores'].values():
+            for name, aggregate in explore.get('aggregate_tables', {}).items():
+                if aggregate.get('partition_keys'):
+                    self.partition_columns[name] = aggregate_column(aggregate['partition_keys'][0])
+        self.compiler = LookMLSqlCompiler(
+            self.catalog, aggregates=(lambda name: name in self.aggregates) if aggregate_awareness else None,
+            wide=(lambda name: name in self.wide) if wide_explores else None, partitions=partition_filters)
+        # Flights follow the cache (per client); the pool caps concurrent DuckDB queries process-wide
+        self.flights = SingleFlight('warehouse')
+        self.pool = pool if pool is not None else warehouse_pool
+        self._lock = threading.Lock()
+        self.queries = 0
+        self.total_ms = 0.0
+
+        self._con = duckdb.connect(database=':memory:')
+        if threads:
+            self._con.execute(f"SET threads = {int(threads)}")
+        self.tables = self._register_tables()
+        # The LookML datagroups' sql_triggers, run on the local tables, turn the cache over
+        self.datagroups = datagroups if datagroups is not None else DatagroupPolicy(
+            self.catalog, self._datagroup_triggers, backend='warehouse')
+        missing = sorted({bare_table_name(v['sql_table_name']) for v in self.catalog['views'].values()}
+                         - set(self.tables))
+        base_tables = set(self.tables) - set(self._aggregate_tables())
+        print(f"Local warehouse: {len(base_tables)} tables from {self.data_dir}"
+              + (f", {len(self.aggregates)} aggregate tables" if self.aggregates else "")
+              + (f", {len(self.wide)} wide explores" if self.wide else "")
+              + (f" (missing: {', '.join(missing)})" if missing else ""))
+
+    def _aggregate_tables(self) -> Dict[str, List[str]]:
+        """Aggregate table name -> the tables it summarizes"""
+        sources = {}
+        for explore in self.catalog['explores'].values():
+            for name, aggregate in explore.get('aggregate_tables', {}).items():
+                aliases = {field.split('.', 1)[0] for field in aggregate['dimensions'] + aggregate['measures']}
+                views = {explore['base_view']} | {explore['joins'][a]['from'] for a in aliases if a in explore['joins']}
+                sources[name] = sorted(bare_table_name(self.catalog['views'][v]['sql_table_name'])
+                                       for v in views if v in self.catalog['views'])
+        return sources
+
+    def _wide_tables(self) -> Dict[str, Any]:
+        """Wide explore name -> (its table, the tables pre-joined into it)"""
+        explores, views = self.catalog['explores'], self.catalog['views']
+        wide_tables = {}
+        for name, explore in explores.items():
+            wide = explores.get(f"{name}_wide")
+            if not wide or wide['base_view'] not in views:
+                continue
+            columns = [field.split('.', 1)[1] for field in wide['fields'] if field.startswith(wide['base_alias'] + '.')]
+            aliases = [alias for alias in explore['joins'] if any(c.startswith(alias + '_') for c in columns)]
+            sources = {explore['base_view']} | {explore['joins'][alias]['from'] for alias in aliases}
+            wide_tables[f"{name}_wide"] = (bare_table_name(views[wide['base_view']]['sql_table_name']),
+                                          sorted(bare_table_name(views[v]['sql_table_name'])
+                                                 for v in sources if v in views))
+        return wide_tables
+
+    def _stale(self, table: str, sources: List[str]) -> List[str]:
+        """The source tables with a file newer than the oldest file of table"""
+        built = min(os.path.getmtime(path) for path in self.table_files(table))
+        return [t for t in sources if any(os.path.getmtime(f) > built for f in self.table_files(t))]
+
+    def table_files(self, table: str) -> List[str]:
+        """The Parquet files behind a table: <table>.parquet or every part under <table>/"""
+        single = os.path.join(self.data_dir, f"{table}.parquet")
+        if os.path.isfile(single):
+            return [single]
+        return sorted(glob.glob(os.path.join(self.data_dir, table, '**', '*.parquet'), recursive=True))
+
+    def _register_tables(self) -> Dict[str, str]:
+        """Create one DuckDB view per Parquet table the LookML views and aggregate tables read"""
+        tables = {}
+        self._file_bytes: Dict[str, Dict[str, int]] = {}
+        aggregates = self._aggregate_tables()
+        names = [bare_table_name(view['sql_table_name']) for view in self.catalog['views'].values()]
+        for table in names + list(aggregates):
+            if not table or table in tables:
+                continue
+            files = self.table_files(table)
+            if not files:
+                continue
+            if files == [os.path.join(self.data_dir, f"{table}.parquet")]:
+                source = f"read_parquet('{files[0]}')"
+            else:
+                pattern = os.path.join(self.data_dir, table, '**', '*.parquet')
+                source = f"read_parquet('{pattern}', hive_partitioning = true, union_by_name = true)"
+            self._con.execute(f'CREATE OR REPLACE VIEW "{table}" AS SELECT * FROM {source}')
+            tables[table] = source
+
+        # Like a datagroup trigger: a rollup older than any table it summarizes is not used
+        self.aggregates = set()
+        for name, sources in aggregates.items():
+            if name not in tables:
+                continue
+            stale = self._stale(name, sources)
+            if stale:
+                print(f"Aggregate table {name} is older than {', '.join(stale)} - run --build-aggregates")
+            else:
+                self.aggregates.add(name)
+        # The same for one-big-tables, which are built by Dataform (benchmark_wide.py --build locally)
+        self.wide = set()
+        for name, (table, sources) in self._wide_tables().items():
+            if table not in tables:
+                continue
+            stale = self._stale(table, sources)
+            if stale:
+                print(f"Wide table {table} is older than {', '.join(stale)} - rebuild it")
+            else:
+                self.wide.add(name)
+        return tables
+
+    def build_aggregate_tables(self) -> Dict[str, int]:
+        """
+        Materialize every aggregate table from the base tables, as Looker would
+
+        Returns:
+            Aggregate table name -> rows written
+        """
+        base = LookMLSqlCompiler(self.catalog)
+        built = {}
+        cursor = self._con.cursor()
+        try:
+            for explore_name, explore in self.catalog['explores'].items():
+                for name, aggregate in explore.get('aggregate_tables', {}).items():
+                    query = {'explore': explore_name, 'dimensions': aggregate['dimensions'],
+                             'measures': aggregate['measures'], 'filters': aggregate['filters'], 'limit': -1}
+                    sql, params = base.compile(query)
+                    columns = ', '.join(f'"{field}" AS {aggregate_column(field)}'
+                                        for field in aggregate['dimensions'] + aggregate['measures'])
+                    cursor.execute(f"CREATE OR REPLACE TEMP TABLE build AS "
+                                   f"SELECT {columns}, current_timestamp AS loaded_at FROM ({sql})", params)
+                    self._write_aggregate(cursor, name)
+                    built[name] = cursor.execute("SELECT count(*) FROM build").fetchone()[0]
+                    cursor.execute("DROP TABLE build")
+        finally:
+            cursor.close()
+        self.tables = self._register_tables()
+        self.invalidate_cache()
+        return built
+
+    def _write_aggregate(self, cursor, name: str) -> None:
+        """
+        Replace a rollup's files with the build table
+
+        A rollup with a partition column is written one directory per value
+        (<name>/part=2013/), so filters on that column prune it. The column
+        stays in the files and the directory key is a copy, as for the facts.
+        """
+        path = os.path.join(self.data_dir, f"{name}.parquet")
+        directory = os.path.join(self.data_dir, name)
+        partition = self.partition_columns.get(name)
+        if not partition:
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            cursor.execute(f"COPY build TO '{tmp_path}' (FORMAT PARQUET, COMPRESSION ZSTD)")
+            os.replace(tmp_path, path)
+            shutil.rmtree(directory, ignore_errors=True)
+            return
+        tmp_dir = f"{directory}.{os.getpid()}.tmp"
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        cursor.execute(f"COPY (SELECT *, {partition} AS part FROM build) TO '{tmp_dir}' "
+                       f"(FORMAT PARQUET, COMPRESSION ZSTD, PARTITION_BY (part))")
+        # <name>.parquet would shadow the directory (table_files)
+        if os.path.exists(path):
+            os.remove(path)
+        old_dir = f"{directory}.{os.getpid()}.old"
+        if os.path.isdir(directory):
+            os.replace(directory, old_dir)
+        os.replace(tmp_dir, directory)
+        shutil.rmtree(old_dir, ignore_errors=True)
+
+    def column_bytes(self, table: str, files: Optional[List[str]] = None) -> Dict[str, int]:
+        """Uncompressed bytes per column of a table (or of some of its files), from the Parquet footers"""
+        sizes: Dict[str, int] = {}
+        for path in self.table_files(table) if files is None else files:
+            if path not in self._file_bytes:
+                metadata = pq.ParquetFile(path).metadata
+                file_sizes: Dict[str, int] = {}
+                for group in range(metadata.num_row_groups):
+                    row_group = metadata.row_group(group)
+                    for i in range(row_group.num_columns):
+                        column = row_group.column(i)
+                        file_sizes[column.path_in_schema] = \
+                            file_sizes.get(column.path_in_schema, 0) + column.total_uncompressed_size
+                self._file_bytes[path] = file_sizes
+            for column, size in self._file_bytes[path].items():
+                sizes[column] = sizes.get(column, 0) + size
+        return sizes
+
+    def scan_filters(self, sql: str) -> Optional[List[Tuple[Set[str], List[str]]]]:
+        """
+        The table scans in DuckDB's plan for sql: (columns read, filters pushed into the scan)
+
+        Like a BigQuery dry run, EXPLAIN plans the query without running it.
+        The planner pushes into a scan only conditions comparing a bare
+        column with constants - the ones BigQuery prunes partitions on - and
+        keeps conditions in a LEFT JOIN's ON clause or on EXTRACT(...) of
+        the column above the scan. Each pushed filter reads one column.
+        None when the SQL cannot be planned.
+        """
+        cursor = self._con.cursor()
+        try:
+            plan = json.loads(cursor.execute(f"EXPLAIN (FORMAT JSON) {sql}").fetchall()[0][1])
+        except (duckdb.Error, ValueError, IndexError):
+            return None
+        finally:
+            cursor.close()
+        scans, nodes = [], list(plan)
+        while nodes:
+            node = nodes.pop()
+            nodes.extend(node.get('children', []))
+            info = node.get('extra_info') or {}
+            if node.get('name', '').strip() not in SCAN_OPERATORS:
+                continue
+            projections, filters = info.get('Projections', []), info.get('Filters', [])
+            projections = [projections] if isinstance(projections, str) else projections
+            filters = [filters] if isinstance(filters, str) else filters
+            columns = set(projections) | {_filter_column(f) for f in filters} - {''}
+            scans.append((columns, filters))
+        return scans
+
+    def _pruned_files(self, table: str, scans: Optional[List[Tuple[Set[str], List[str]]]]) -> List[str]:
+        """The files of a partitioned table its scans in the plan read, after the partition column's filters"""
+        files = self.table_files(table)
+        column, names = self.partition_columns[table], set(self.column_bytes(table))
+        scans = [(columns, filters) for columns, filters in scans or [] if columns and columns <= names]
+        kept = set()
+        for _, filters in scans:
+            pushed = [f for f in filters if _filter_column(f) == column]
+            if not pushed:
+                return files
+            listed = ', '.join(f"'{path}'" for path in files)
+            try:
+                kept |= {row[0] for row in self._con.execute(
+                    f"SELECT DISTINCT filename FROM read_parquet([{listed}], filename = true, "
+                    f"hive_partitioning = true) WHERE {' AND '.join(f'({f})' for f in pushed)}").fetchall()}
+            except duckdb.Error:
+                return files
+        return [path for path in files if path in kept] if scans else files
+
+    def scanned_bytes(self, sql: str) -> int:
+        """
+        Bytes BigQuery would scan for compiled SQL
+
+        On-demand BigQuery bills the full (uncompressed) size of every column
+        a query references in each table it reads, whatever the filters,
+        so this sums those columns' sizes from the local Parquet files.
+        Partitioned tables (the facts in PARTITION_COLUMNS and the rollups with
+        partition_keys) are the exception: only the partitions their scan's
+        filters on the partition column can match are read. Which filters reach the scan is taken from the query plan
+        (scan_filters), not from the SQL text, so a condition that cannot
+        prune is priced as a full scan. The local files split the facts by
+        year, so pruning is modelled at year granularity - exact for year
+        ranges, a little high for narrower ones.
+        """
+        bare = QUOTED.sub('', sql)
+        aliases = set(TABLE_ALIAS.findall(bare))
+        scans = self.scan_filters(sql) if any(table in self.partition_columns for table, _ in aliases) else None
+        total = 0
+        for table, alias in aliases:
+            files = self._pruned_files(table, scans) if table in self.partition_columns else None
+            sizes = self.column_bytes(table, files)
+            columns = set(re.findall(rf'\b{re.escape(alias)}\.(\w+)', bare))
+            total += sum(sizes.get(column, 0) for column in columns)
+        return total
+
+    def _datagroup_triggers(self, names: List[str]) -> Dict[str, Any]:
+        """Each datagroup's sql_trigger value on the local tables (left out where a table is missing)"""
+        values = {}
+        cursor = self._con.cursor()
+        try:
+            for name in names:
+                sql = BACKTICKED.sub(lambda m: f'"{bare_table_name(m.group(0))}"',
+                                     self.catalog['datagroups'][name].get('sql_trigger', ''))
+                try:
+                    values[name] = cursor.execute(sql).fetchone()[0]
+                except duckdb.Error:
+                    continue
+        finally:
+            cursor.close()
+        return values
+
+    def _cached(self, cache_key: str, explore: str):
+        """The cached result for a key, once results a datagroup trigger has outdated are dropped"""
+        self.datagroups.refresh(self.cache)
+        with tracing.span('warehouse.cache'):
+            cached = self.cache.get(cache_key, explore)
+            tracing.annotate(cache_hit=cached is not None, explore=explore)
+        return cached
+
+    def _cache_put(self, cache_key: str, results, explore: str) -> None:
+        self.cache.put(cache_key, results, explore, self.datagroups.ttl_seconds(explore))
+
+    def data_version(self, query_config: Dict[str, Any]) -> Optional[str]:
+        """The local tables' datagroup trigger values for the query's explore (LookerClient.data_version)"""
+        self.datagroups.refresh(self.cache)
+        return self.datagroups.data_version(query_config.get('explore', 'sales_analysis'))
+
+    def _compile(self, query_config: Dict[str, Any]):
+        with tracing.span('warehouse.compile'):
+            sql, params = self.compiler.compile(query_config)
+            aggregate = self.compiler.aggregate_table(query_config)
+            if aggregate:
+                tracing.annotate(aggregate=aggregate)
+            elif self.compiler.wide_query(query_config):
+                tracing.annotate(wide=True)
+        return sql, params
+
+    def compile(self, query_config: Dict[str, Any]) -> str:
+        """The SQL run_query would execute, with filter values inlined for display"""
+        sql, params = self.compiler.compile(query_config)
+        for value in params:
+            literal = str(value) if isinstance(value, (int, float)) else "'" + str(value).replace("'", "''") + "'"
+            sql = sql.replace('?', literal, 1)
+        return sql
+
+    def run_query(self, query_config: Dict[str, Any]) -> List[Dict]:
+        """
+        Execute a query config against the local Parquet tables
+
+        Args:
+            query_config: Dictionary with explore, dimensions, measures, filters, etc.
+
+        Returns:
+            List of dictionaries keyed by "view.field", like Looker's JSON results
+        """
+        cache_key = canonical_query_key(query_config)
+        explore = query_config.get('explore', 'sales_analysis')
+        cached = self._cached(cache_key, explore)
+        if cached is not None:
+            return cached
+
+        sql, params = self._compile(query_config)
+        results, _ = self.flights.do(cache_key, lambda: self.pool.run(self._execute, sql, params, cache_key, explore))
+        return results
+
+    def _execute(self, sql: str, params: List[Any], cache_key: str, explore: str = '') -> List[Dict]:
+        """Run compiled SQL on a fresh cursor and cache the rows"""
+        start = time.perf_counter()
+        # Cursors are independent connections to the same database - safe across Streamlit threads
+        cursor = self._con.cursor()
+        try:
+            with tracing.span('warehouse.execute'):
+                cursor.execute(sql, params)
+                columns = [column[0] for column in cursor.description]
+                rows = cursor.fetchall()
+            with tracing.span('warehouse.convert', rows=len(rows)):
+                results = [
+                    {column: _json_value(value) for column, value in zip(columns, row)}
+                    for row in rows
+                ]
+        finally:
+            cursor.close()
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        with self._lock:
+            self.queries += 1
+            self.total_ms += elapsed_ms
+
+        self._cache_put(cache_key, results, explore)
+        return results
+
+    def run_query_frame(self, query_config: Dict[str, Any]) -> pd.DataFrame:
+        """Execute a query config and return a typed DataFrame straight from DuckDB's Arrow result"""
+        cache_key = 'frame|' + canonical_query_key(query_config)
+        explore = query_config.get('explore', 'sales_analysis')
+        cached = self._cached(cache_key, explore)
+        if cached is not None:
+            return cached.copy(deep=False)
+
+        sql, params = self._compile(query_config)
+        fields = list(query_config.get('dimensions', [])) + list(query_config.get('measures', []))
+        types = field_types(self.catalog, explore, fields)
+        frame, _ = self.flights.do(cache_key, lambda: self.pool.run(self._execute_frame, sql, params, types,
+                                                                    cache_key, explore))
+        return frame.copy(deep=False)
+
+    def _execute_frame(self, sql: str, params: List[Any], types: Dict[str, Dict[str, str]],
+                       cache_key: str, explore: str = '') -> pd.DataFrame:
+        """Run compiled SQL on a fresh cursor, fetch Arrow and cache the typed frame"""
+        start = time.perf_counter()
+        cursor = self._con.cursor()
+        try:
+            with tracing.span('warehouse.execute'):
+                table = cursor.execute(sql, params).fetch_arrow_table()
+            with tracing.span('warehouse.convert', rows=table.num_rows):
+                frame = frame_from_arrow(table, types)
+        finally:
+            cursor.close()
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        with self._lock:
+            self.queries += 1
+            self.total_ms += elapsed_ms
+
+        self._cache_put(cache_key, frame, explore)
+        return frame
+
+    def run_query_stream(self, query_config: Dict[str, Any], batch_rows: int = RESULT_BATCH_ROWS,
+                         spool_dir: Optional[str] = RESULT_SPOOL_DIR) -> ResultStream:
+        """Execute a query config and hand over DuckDB's result in record batches as they are produced"""
+        cache_key = 'frame|' + canonical_query_key(query_config)
+        explore = query_config.get('explore', 'sales_analysis')
+        cached = self._cached(cache_key, explore)
+        if cached is not None:
+            return ResultStream.completed(cached.copy(deep=False))
+
+        sql, params = self._compile(query_config)
+        fields = list(query_config.get('dimensions', [])) + list(query_config.get('measures', []))
+        types = field_types(self.catalog, explore, fields)
+
+        def produce(emit):
+            start = time.perf_counter()
+            cursor = self._con.cursor()
+            try:
+                for batch in cursor.execute(sql, params).fetch_record_batch(batch_rows):
+                    emit(batch)
+            finally:
+                cursor.close()
+            elapsed_ms = (time.perf_counter() - start) * 1000
+            with self._lock:
+                self.queries += 1
+                self.total_ms += elapsed_ms
+
+        return ResultStream.start(self.pool, produce, types, spool_dir=spool_dir,
+                                  on_complete=lambda frame: self._cache_put(cache_key, frame, explore))
+
+    def test_connection(self) -> bool:
+        """True when every fact table the explores start from is present"""
+        bases = {bare_table_name(self.catalog['views'][e['base_view']]['sql_table_name'])
+                 for e in self.catalog['explores'].values() if e['base_view'] in self.catalog['views']}
+        return bases.issubset(self.tables)
+
+    def invalidate_cache(self, explores: Optional[List[str]] = None) -> None:
+        """Drop cached results, all of them or those of some explores (e.g. after regenerating the Parquet files)"""
+        self.cache.invalidate(explores)
+
+    def cache_stats(self) -> Dict[str, Any]:
+        stats = self.cache.stats()
+        stats['datagroups'] = self.datagroups.stats()
+        with self._lock:
+            stats['queries'] = self.queries
+            stats['avg_query_ms'] = self.total_ms / self.queries if self.queries else 0.0
+        stats['single_flight'] = self.flights.stats()
+        stats['pool'] = self.pool.stats()
+        return stats
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Run labelled queries against the local DuckDB warehouse")
+    parser.add_argument('path', nargs='?', help="JSONL with {question, query} rows")
+    parser.add_argument('--data-dir', default=None)
+    parser.add_argument('--repeat', type=int, default=3, help="Timed runs per query (cache bypassed)")
+    parser.add_argument('--show-sql', action='store_true')
+    parser.add_argument('--build-aggregates', action='store_true',
+                        help="(Re)build the explores' aggregate tables from the base tables first")
+    args = parser.parse_args(argv)
+    if not args.path and not args.build_aggregates:
+        parser.error("a questions file or --build-aggregates is required")
+
+    client = LocalWarehouseClient(args.data_dir, cache=QueryResultCache(max_bytes=0))
+    if args.build_aggregates:
+        start = time.perf_counter()
+        for name, rows in client.build_aggregate_tables().items():
+            print(f"{name}: {rows:,} rows")
+        print(f"Aggregate tables built in {time.perf_counter() - start:.1f}s")
+        if not args.path:
+            return 0
+    with open(args.path, 'r') as f:
+        rows = [json.loads(line) for line in f if line.strip()]
+
+    timings, failures = [], []
+    for row in rows:
+        query = row.get('query')
+        if not query:
+            continue
+        if args.show_sql:
+            print(f"-- {row['question']}\n{client.compile(query)};\n")
+        try:
+            for _ in range(args.repeat):
+                start = time.perf_counter()
+                results = client.run_query(query)
+                timings.append((time.perf_counter() - start) * 1000)
+            if not results:
+                failures.append({'question': row['question'], 'error': 'no rows'})
+        except Exception as e:
+            failures.append({'question': row['question'], 'error': str(e)})
+
+    timings.sort()
+    report = {
+        'queries': len(timings),
+        'p50_ms': timings[len(timings) // 2] if timings else 0.0,
+        'p95_ms': timings[min(len(timings) - 1, int(len(timings) * 0.95))] if timings else 0.0,
+        'max_ms': timings[-1] if timings else 0.0,
+        'failures': failures,
+    }
+    print(json.dumps(report, indent=2))
+    return 0 if not failures else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,17 +1,349 @@
 import os
+import json
+import time
+import hashlib
+import threading
+from collections import OrderedDict
 import looker_sdk
 from looker_sdk import models40 as models
-from typing import Dict, Any, List
+from typing import Dict, Any, Iterable, List, Optional, Tuple
 import pandas as pd
 
+import tracing
+from concurrency import SingleFlight, BackendPool, looker_pool
+from lookml_catalog import load_catalog, wide_query, partition_query
+from datagroups import DatagroupPolicy
+from result_frames import field_types, frame_from_csv, csv_batches
+from large_results import ResultStream, RESULT_BATCH_ROWS, RESULT_SPOOL_DIR
+
+
+def normalize_filters(filters: Dict[str, Any]) -> Dict[str, str]:
+    """Convert filter values to the comma-separated strings Looker expects"""
+    normalized_filters = {}
+    for key, value in (filters or {}).items():
+        if isinstance(value, list):
+            # Convert list to comma-separated string
+            normalized_filters[key] = ','.join(str(v) for v in value)
+        else:
+            normalized_filters[key] = str(value)
+    return normalized_filters
+
+
+def canonical_query_key(query_config: Dict[str, Any]) -> str:
+    """
+    Build a canonical cache key for a query configuration
+
+    Two configs that Looker would answer identically (same explore, same
+    fields in any order, same normalized filters, sorts and limit) map to
+    the same key.
+    """
+    fields = list(query_config.get('dimensions', [])) + list(query_config.get('measures', []))
+    canonical = {
+        'explore': query_config.get('explore', 'sales_analysis'),
+        'fields': sorted(fields),
+        'filters': normalize_filters(query_config.get('filters', {})),
+        'sorts': [str(s).strip().lower() for s in query_config.get('sorts', [])],
+        'limit': str(query_config.get('limit', 100)),
+    }
+    return json.dumps(canonical, sort_keys=True, separators=(',', ':'))
+
+
+class QueryResultCache:
+    """
+    Thread-safe TTL + LRU cache for Looker query results (rows or DataFrames), bounded by memory
+
+    Entries may be tagged with the explore they answer, so the results of one
+    explore can be dropped when its data is reloaded (see datagroups.py) and
+    hit rates are counted per explore; an entry may also carry its own TTL.
+    """
+
+    def __init__(self, ttl_seconds: float = 900, max_bytes: int = 64 * 1024 * 1024):
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        # key -> (stored_at, size, results, explore, ttl_seconds)
+        self._entries: "OrderedDict[str, Tuple[float, int, Any, str, Optional[float]]]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        # explore -> {hits, misses, invalidated}
+        self._explores: Dict[str, Dict[str, int]] = {}
+
+    @staticmethod
+    def _estimate_size(results) -> int:
+        if isinstance(results, pd.DataFrame):
+            return int(results.memory_usage(deep=True).sum())
+        return len(json.dumps(results, default=str))
+
+    def _count(self, explore: str, counter: str, n: int = 1) -> None:
+        if explore:
+            counts = self._explores.setdefault(explore, {'hits': 0, 'misses': 0, 'invalidated': 0})
+            counts[counter] += n
+
+    def get(self, key: str, explore: str = '') -> Optional[List[Dict]]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                self._count(explore, 'misses')
+                return None
+            stored_at, size, results, _, ttl_seconds = entry
+            ttl_seconds = self.ttl_seconds if ttl_seconds is None else ttl_seconds
+            if ttl_seconds and time.monotonic() - stored_at > ttl_seconds:
+                # Expired - drop it and count as a miss
+                del self._entries[key]
+                self._bytes -= size
+                self.misses += 1
+                self._count(explore, 'misses')
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            self._count(explore, 'hits')
+            return results
+
+    def put(self, key: str, results: List[Dict], explore: str = '', ttl_seconds: Optional[float] = None) -> None:
+        size = self._estimate_size(results)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._bytes -= self._entries.pop(key)[1]
+            self._entries[key] = (time.monotonic(), size, results, explore, ttl_seconds)
+            self._bytes += size
+            # Evict least recently used entries until under the budget
+            while self._bytes > self.max_bytes and self._entries:
+                _, (_, old_size, _, _, _) = self._entries.popitem(last=False)
+                self._bytes -= old_size
+                self.evictions += 1
+
+    def invalidate(self, explores: Optional[Iterable[str]] = None) -> int:
+        """
+        Drop every cached result (e.g. after the Dataform facts rebuild), or only
+        those tagged with one of the given explores; returns how many were dropped
+        """
+        with self._lock:
+            if explores is None:
+                dropped = len(self._entries)
+                self._entries.clear()
+                self._bytes = 0
+                return dropped
+            explores = set(explores)
+            stale = [key for key, entry in self._entries.items() if entry[3] in explores]
+            for key in stale:
+                _, size, _, explore, _ = self._entries.pop(key)
+                self._bytes -= size
+                self._count(explore, 'invalidated')
+            return len(stale)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            entries: Dict[str, int] = {}
+            for entry in self._entries.values():
+                entries[entry[3]] = entries.get(entry[3], 0) + 1
+            explores = {}
+            for explore, counts in sorted(self._explores.items()):
+                explore_lookups = counts['hits'] + counts['misses']
+                explores[explore] = dict(counts, entries=entries.get(explore, 0),
+                                         hit_rate=counts['hits'] / explore_lookups if explore_lookups else 0.0)
+            return {
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'explores': explores,
+            }
+
+
+class QueryIdRegistry:
+    """
+    Maps a hash of each query definition to the Looker query ID created for it
+
+    Looker query definitions are immutable, so an identical definition can be
+    run by ID without another create_query round trip. The mapping is an LRU
+    of at most max_entries, kept in an append-only log of JSON lines so it
+    survives process restarts: each new ID (or dropped one) appends a line.
+    Processes sharing the file pick up each other's IDs when they load it
+    and when they compact it, not in between; the log is compacted when it
+    holds twice max_entries lines, merged with whatever other processes
+    appended since it was read.
+    """
+
+    def __init__(self, path: Optional[str] = None, max_entries: int = 10000):
+        self.path = path
+        self.max_entries = max_entries
+        self._ids: "OrderedDict[str, Dict[str, str]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._logged = 0
+        self._load()
+
+    @staticmethod
+    def definition_hash(definition: Dict[str, Any]) -> str:
+        payload = json.dumps(definition, sort_keys=True, separators=(',', ':'))
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def _read(self) -> Tuple["OrderedDict[str, Dict[str, str]]", int]:
+        """Replay the log (or a file in the older single-object format)"""
+        ids: "OrderedDict[str, Dict[str, str]]" = OrderedDict()
+        with open(self.path, 'r') as f:
+            text = f.read()
+        try:
+            legacy = json.loads(text)
+        except ValueError:
+            legacy = None
+        if isinstance(legacy, dict) and 'hash' not in legacy:
+            # Written as one JSON object before the log format
+            return OrderedDict(legacy), 0
+        lines = 0
+        for line in text.splitlines():
+            try:
+                record = json.loads(line)
+            except ValueError:
+                # A line torn by a crash mid-append
+                continue
+            lines += 1
+            ids.pop(record['hash'], None)
+            if record.get('id') is not None:
+                ids[record['hash']] = {'id': record['id'], 'slug': record.get('slug', '')}
+        return ids, lines
+
+    def _load(self) -> None:
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            self._ids, self._logged = self._read()
+        except OSError as e:
+            print(f"Query registry could not be loaded, starting empty: {str(e)}")
+            self._ids = OrderedDict()
+        while len(self._ids) > self.max_entries:
+            self._ids.popitem(last=False)
+        if self._ids and not self._logged:
+            self._compact()
+
+    def _compact(self) -> None:
+        """Rewrite the log as one line per live ID, keeping other processes' appends"""
+        try:
+            merged, _ = self._read() if os.path.exists(self.path) else (OrderedDict(), 0)
+        except OSError:
+            merged = OrderedDict()
+        # This process's entries win, most recently used last
+        for definition_hash, entry in self._ids.items():
+            merged.pop(definition_hash, None)
+            merged[definition_hash] = entry
+        while len(merged) > self.max_entries:
+            merged.popitem(last=False)
+        # Write to a temp file and rename so a crash never leaves a torn file
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp_path, 'w') as f:
+                for definition_hash, entry in merged.items():
+                    f.write(json.dumps({'hash': definition_hash, **entry}) + '\n')
+            os.replace(tmp_path, self.path)
+            self._ids = merged
+            self._logged = len(merged)
+        except OSError as e:
+            print(f"Query registry could not be saved: {str(e)}")
+
+    def _save(self, definition_hash: str, entry: Optional[Dict[str, str]]) -> None:
+        if not self.path:
+            return
+        if self._logged >= 2 * self.max_entries:
+            self._compact()
+            return
+        try:
+            # One short line per write, so appends from several processes do not interleave
+            with open(self.path, 'a') as f:
+                f.write(json.dumps({'hash': definition_hash, **(entry or {'id': None})}) + '\n')
+            self._logged += 1
+        except OSError as e:
+            print(f"Query registry could not be saved: {str(e)}")
+
+    def get(self, definition_hash: str) -> Optional[Dict[str, str]]:
+        with self._lock:
+            entry = self._ids.get(definition_hash)
+            if entry is not None:
+                self._ids.move_to_end(definition_hash)
+            return entry
+
+    def put(self, definition_hash: str, query_id: str, slug: Optional[str] = None) -> None:
+        with self._lock:
+            entry = {'id': str(query_id), 'slug': slug or ''}
+            self._ids[definition_hash] = entry
+            self._ids.move_to_end(definition_hash)
+            while len(self._ids) > self.max_entries:
+                self._ids.popitem(last=False)
+            self._save(definition_hash, entry)
+
+    def discard(self, definition_hash: str) -> None:
+        with self._lock:
+            if self._ids.pop(definition_hash, None) is not None:
+                self._save(definition_hash, None)
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+
+# Process-wide cache shared by every LookerClient (and every Streamlit session)
+result_cache = QueryResultCache(
+    ttl_seconds=float(os.getenv('LOOKER_CACHE_TTL_SECONDS', '900')),
+    max_bytes=int(os.getenv('LOOKER_CACHE_MAX_MB', '64')) * 1024 * 1024,
+)
+
+query_registry = QueryIdRegistry(
+    os.getenv(
+        'LOOKER_QUERY_REGISTRY_PATH',
+        os.path.join(os.path.dirname(os.path.abspath(__file__)), '.looker_query_registry.json')
+    ),
+    max_entries=int(os.getenv('LOOKER_QUERY_REGISTRY_SIZE', '10000'))
+)
+
+# Concurrent identical queries from different sessions share one Looker call
+query_flights = SingleFlight('looker')
+
+
 class LookerClient:
     """Client for interacting with Looker API"""
     
-    def __init__(self):
-        """Initialize Looker SDK"""
+    def __init__(self, cache: Optional[QueryResultCache] = None,
+                 registry: Optional[QueryIdRegistry] = None,
+                 inline_queries: Optional[bool] = None, sdk: Optional[Any] = None,
+                 flights: Optional[SingleFlight] = None, pool: Optional[BackendPool] = None,
+                 catalog: Optional[Dict[str, Any]] = None, wide_explores: Optional[bool] = None,
+                 datagroups: Optional[DatagroupPolicy] = None):
+        """Initialize Looker SDK (or use the given one, e.g. a benchmark stub)"""
+        self.cache = cache if cache is not None else result_cache
+        self.registry = registry if registry is not None else query_registry
+        self.flights = flights if flights is not None else query_flights
+        self.pool = pool if pool is not None else looker_pool
+        # LookML field types for typed results; loaded on the first run_query_frame
+        self.catalog = catalog
+        # The SDK's requests session and auth token refresh are not thread-safe, so every
+        # pool worker gets its own SDK instance; an injected SDK is shared as given
+        self._sdk_factory = None
+        self._local = threading.local()
+        # Inline mode sends the definition with the run call (one round trip, no query ID)
+        if inline_queries is None:
+            inline_queries = os.getenv('LOOKER_INLINE_QUERIES', 'false').lower() == 'true'
+        self.inline_queries = inline_queries
+        # Route queries to <explore>_wide explores (the obt_sales one-big-table); off until
+        # the Dataform wide tables are deployed
+        if wide_explores is None:
+            wide_explores = os.getenv('WIDE_EXPLORES', 'false').lower() == 'true'
+        self.wide_explores = wide_explores
+        # Drops cached results when Looker's datagroup triggers move; built with the catalog
+        self.datagroups = datagroups
+        # Tells which queries Looker answers from an aggregate table; built with the catalog
+        self._rollups = None
+        if sdk is not None:
+            self.sdk = sdk
+            return
         # Looker SDK reads from looker.ini or environment variables
         try:
             self.sdk = looker_sdk.init40()
+            self._sdk_factory = looker_sdk.init40
             # Test connection
             me = self.sdk.me()
             print(f"Looker connected successfully as: {me.display_name}")
@@ -34,73 +366,317 @@ class LookerClient:
         # If SDK not initialized, use mock data
         if self.sdk is None:
             print("Looker SDK not available, using mock data")
+            tracing.annotate(mock_fallback=True, mock_reason='no_sdk')
             return self._get_mock_data(query_config)
         
+        # Serve repeated questions from the shared result cache
+        cache_key = canonical_query_key(query_config)
+        explore = query_config.get('explore', 'sales_analysis')
+        cached = self._cached(cache_key, explore)
+        if cached is not None:
+            print(f"   Cache hit for {explore} query")
+            return cached
+        
         try:
-            # Extract query parameters
-            explore = query_config.get('explore', 'sales_analysis')
-            dimensions = query_config.get('dimensions', [])
-            measures = query_config.get('measures', [])
-            filters = query_config.get('filters', {})
-            sorts = query_config.get('sorts', [])
-            limit = query_config.get('limit', 100)
-            
-            # Map explore names to model
-            model_name = "adventure_works"
+            definition = self._definition(query_config)
+            fields = self._fields(query_config)
+            results, shared = self.flights.do(cache_key, lambda: self._fetch(definition, cache_key, fields, explore))
+            if shared:
+                print(f"   Shared an in-flight {definition['view']} query")
+            return results
             
-            # Normalize filters - convert lists to comma-separated strings
-            normalized_filters = {}
-            for key, value in filters.items():
-                if isinstance(value, list):
-                    # Convert list to comma-separated string
-                    normalized_filters[key] = ','.join(str(v) for v in value)
-                else:
-                    normalized_filters[key] = str(value)
+        except Exception as e:
+            self._report_error(e)
+            return self._get_mock_data(query_config)
+    
+    def run_query_frame(self, query_config: Dict[str, Any]) -> pd.DataFrame:
+        """
+        Execute a Looker query and return a typed DataFrame
+        
+        Requests CSV instead of JSON and parses it column-wise with Arrow, typing
+        each column from the field's LookML type (see result_frames.py).
+        
+        Args:
+            query_config: Dictionary with explore, dimensions, measures, filters, etc.
             
-            print(f"   Running Looker query:")
-            print(f"   Model: {model_name}")
-            print(f"   Explore: {explore}")
-            print(f"   Dimensions: {dimensions}")
-            print(f"   Measures: {measures}")
-            print(f"   Filters: {normalized_filters}")
+        Returns:
+            DataFrame with numeric measures and categorical string dimensions
+        """
+        
+        if self.sdk is None:
+            print("Looker SDK not available, using mock data")
+            tracing.annotate(mock_fallback=True, mock_reason='no_sdk')
+            return pd.DataFrame(self._get_mock_data(query_config))
+        
+        # Frames and JSON rows live side by side in the same cache
+        cache_key = 'frame|' + canonical_query_key(query_config)
+        explore = query_config.get('explore', 'sales_analysis')
+        cached = self._cached(cache_key, explore)
+        # Shallow copies: callers may replace columns, the cached frame stays as fetched
+        if cached is not None:
+            print(f"   Cache hit for {explore} query")
+            return cached.copy(deep=False)
+        
+        try:
+            definition = self._definition(query_config)
+            frame, shared = self.flights.do(
+                cache_key, lambda: self._fetch_frame(definition, cache_key, query_config))
+            if shared:
+                print(f"   Shared an in-flight {definition['view']} query")
+            return frame.copy(deep=False)
             
-            # Create Looker query
-            query = models.WriteQuery(
-                model=model_name,
-                view=explore,
-                fields=dimensions + measures,
-                filters=normalized_filters,
-                sorts=sorts,
-                limit=str(limit)
-            )
+        except Exception as e:
+            self._report_error(e)
+            return pd.DataFrame(self._get_mock_data(query_config))
+    
+    def run_query_stream(self, query_config: Dict[str, Any], batch_rows: int = RESULT_BATCH_ROWS,
+                         spool_dir: Optional[str] = RESULT_SPOOL_DIR) -> ResultStream:
+        """
+        Execute a large Looker query and hand its result over in record batches
+        
+        Looker's run_query has no row offset to page with, so the CSV arrives in
+        one call; it is then parsed and handed over about batch_rows at a time,
+        so the first page can render before the rest is parsed.
+        
+        Args:
+            query_config: Dictionary with explore, dimensions, measures, filters, etc.
+            batch_rows: Approximate rows per batch
+            spool_dir: Where the stream writes the full result as CSV (None to skip)
             
-            # Create and run query
-            query_result = self.sdk.create_query(query)
-            print(f"   Query ID: {query_result.id}")
+        Returns:
+            ResultStream; frame() gives the complete typed DataFrame
+        """
+        
+        if self.sdk is None:
+            print("Looker SDK not available, using mock data")
+            tracing.annotate(mock_fallback=True, mock_reason='no_sdk')
+            return ResultStream.completed(pd.DataFrame(self._get_mock_data(query_config)))
+        
+        cache_key = 'frame|' + canonical_query_key(query_config)
+        explore = query_config.get('explore', 'sales_analysis')
+        cached = self._cached(cache_key, explore)
+        if cached is not None:
+            print(f"   Cache hit for {explore} query")
+            return ResultStream.completed(cached.copy(deep=False))
+        
+        definition = self._definition(query_config)
+        fields = self._fields(query_config)
+        types = field_types(self._catalog(), explore, fields)
+        
+        def produce(emit):
+            payload = self._execute(definition, 'csv')
+            # About 64 bytes per CSV row for typical dimension/measure mixes
+            for batch in csv_batches(payload, fields, types, block_size=max(batch_rows * 64, 1 << 16)):
+                emit(batch)
+        
+        return ResultStream.start(self.pool, produce, types, spool_dir=spool_dir,
+                                  on_complete=lambda frame: self._cache_put(cache_key, frame, explore))
+    
+    def _catalog(self) -> Dict[str, Any]:
+        if self.catalog is None:
+            self.catalog = load_catalog()
+        return self.catalog
+    
+    def _partitioned(self, query_config: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        The query with its year filters repeated on the fact's partition column
+        (lookml_catalog.partition_query), unless an aggregate table answers it.
+        The rollups have no order_date, so the added filter would send Looker to
+        the fact; they are partitioned on their year column instead
+        (partition_keys), which the year filter prunes, and a year of a rollup
+        reads far less than a year of the fact
+        """
+        if self._rollups is None:
+            from lookml_sql import LookMLSqlCompiler  # lookml_sql imports this module
+            self._rollups = LookMLSqlCompiler(self._catalog(), aggregates=lambda name: True)
+        if self._rollups.aggregate_table(query_config):
+            return query_config
+        return partition_query(self._catalog(), query_config) or query_config
+    
+    def _policy(self) -> DatagroupPolicy:
+        if self.datagroups is None:
+            # Mock data has no datagroups to read: off, rather than a failed check every interval
+            self.datagroups = DatagroupPolicy(self._catalog(), self._datagroup_triggers, backend='looker',
+                                              check_seconds=0 if self.sdk is None else None)
+        return self.datagroups
+    
+    def _datagroup_triggers(self, names: List[str]) -> Dict[str, Any]:
+        """
+        Looker's current trigger value per datagroup: the value its regenerator
+        last read, so this cache turns over when Looker's does
+        """
+        model_name = self._catalog().get('model') or 'adventure_works'
+        groups = self.pool.run(lambda: self._worker_sdk().all_datagroups())
+        return {group.name: group.trigger_value for group in groups
+                if group.model_name == model_name and group.name in names and not group.trigger_error}
+    
+    def _cached(self, cache_key: str, explore: str):
+        """The cached result for a key, once results a datagroup trigger has outdated are dropped"""
+        self._policy().refresh(self.cache)
+        with tracing.span('looker.cache'):
+            cached = self.cache.get(cache_key, explore)
+            tracing.annotate(cache_hit=cached is not None, explore=explore)
+        return cached
+    
+    def _cache_put(self, cache_key: str, results, explore: str) -> None:
+        """Cache a result until its explore's datagroup fires (max_cache_age at most), or for the TTL"""
+        self.cache.put(cache_key, results, explore, self._policy().ttl_seconds(explore))
+    
+    def data_version(self, query_config: Dict[str, Any]) -> Optional[str]:
+        """
+        The datagroup trigger values the query would be answered under (see
+        DatagroupPolicy.data_version), read first if a check is due
+        """
+        policy = self._policy()
+        policy.refresh(self.cache)
+        return policy.data_version(query_config.get('explore', 'sales_analysis'))
+    
+    @staticmethod
+    def _fields(query_config: Dict[str, Any]) -> List[str]:
+        """The result's field names, in column order (the names the caller asked for)"""
+        return list(query_config.get('dimensions', [])) + list(query_config.get('measures', []))
+    
+    def _definition(self, query_config: Dict[str, Any]) -> Dict[str, Any]:
+        """WriteQuery keyword arguments for a query config"""
+        query_config = self._partitioned(query_config)
+        # The wide twin answers with the same columns, in the same order
+        if self.wide_explores:
+            query_config = wide_query(self._catalog(), query_config) or query_config
+        
+        # Extract query parameters
+        explore = query_config.get('explore', 'sales_analysis')
+        dimensions = query_config.get('dimensions', [])
+        measures = query_config.get('measures', [])
+        filters = query_config.get('filters', {})
+        sorts = query_config.get('sorts', [])
+        limit = query_config.get('limit', 100)
+        
+        # Map explore names to model
+        model_name = "adventure_works"
+        
+        # Normalize filters - convert lists to comma-separated strings
+        normalized_filters = normalize_filters(filters)
+        
+        print(f"   Running Looker query:")
+        print(f"   Model: {model_name}")
+        print(f"   Explore: {explore}")
+        print(f"   Dimensions: {dimensions}")
+        print(f"   Measures: {measures}")
+        print(f"   Filters: {normalized_filters}")
+        
+        return {
+            'model': model_name,
+            'view': explore,
+            'fields': dimensions + measures,
+            'filters': normalized_filters,
+            'sorts': sorts,
+            'limit': str(limit)
+        }
+    
+    def _report_error(self, e: Exception) -> None:
+        """Log a failed Looker call before falling back to mock data"""
+        # Log the error details
+        import traceback
+        print(f"   Looker API Error: {str(e)}")
+        print(f"   Error type: {type(e).__name__}")
+        print(f"   Traceback:")
+        traceback.print_exc()
+        print("   Using mock data as fallback...")
+        tracing.annotate(mock_fallback=True, mock_reason=type(e).__name__)
+    
+    def _fetch(self, definition: Dict[str, Any], cache_key: str, fields: Optional[List[str]] = None,
+               explore: str = ''):
+        """Run a definition on a Looker worker, decode it and cache the rows under the fields' names"""
+        results = self.pool.run(self._execute, definition)
+        
+        # Parse JSON string to Python objects
+        if isinstance(results, str):
+            with tracing.span('looker.json_decode', bytes=len(results)):
+                results = json.loads(results)
+        
+        # A routed (wide explore) query names its columns after the wide fields
+        renames = {routed: name for routed, name in zip(definition['fields'], fields or []) if routed != name}
+        if renames and isinstance(results, list):
+            results = [{renames.get(key, key): value for key, value in row.items()} for row in results]
+        
+        print(f"Query successful, returned {len(results) if isinstance(results, list) else 'N/A'} rows")
+        if isinstance(results, list):
+            self._cache_put(cache_key, results, explore or definition['view'])
+        return results
+    
+    def _fetch_frame(self, definition: Dict[str, Any], cache_key: str,
+                     query_config: Dict[str, Any]) -> pd.DataFrame:
+        """Run a definition as CSV on a Looker worker and parse it into a typed DataFrame"""
+        payload = self.pool.run(self._execute, definition, 'csv')
+        
+        with tracing.span('looker.parse_csv', bytes=len(payload)):
+            # CSV columns are positional: name and type them after the fields asked for
+            fields = self._fields(query_config)
+            types = field_types(self._catalog(), query_config.get('explore', 'sales_analysis'), fields)
+            frame = frame_from_csv(payload, fields, types)
+        
+        print(f"Query successful, returned {len(frame)} rows")
+        self._cache_put(cache_key, frame, query_config.get('explore', 'sales_analysis'))
+        return frame
+    
+    def _worker_sdk(self):
+        """This thread's SDK instance, logged in on its first call"""
+        if self._sdk_factory is None:
+            return self.sdk
+        sdk = getattr(self._local, 'sdk', None)
+        if sdk is None:
+            sdk = self._local.sdk = self._sdk_factory()
+        return sdk
+    
+    def _execute(self, definition: Dict[str, Any], result_format: str = 'json'):
+        """
+        Run a query definition with as few Looker round trips as possible
+        
+        Args:
+            definition: WriteQuery keyword arguments
+            result_format: "json" or "csv"
             
-            # Run query and get results
-            results = self.sdk.run_query(
+        Returns:
+            Raw result from the Looker SDK (JSON or CSV string)
+        """
+        sdk = self._worker_sdk()
+        
+        # Single call: definition travels with the run request
+        if self.inline_queries:
+            with tracing.span('looker.run_inline_query'):
+                return sdk.run_inline_query(
+                    result_format=result_format,
+                    body=models.WriteQuery(**definition)
+                )
+        
+        # Known definition: run the existing query ID directly
+        definition_hash = self.registry.definition_hash(definition)
+        known = self.registry.get(definition_hash)
+        if known is not None:
+            print(f"   Reusing Query ID: {known['id']}")
+            try:
+                with tracing.span('looker.run_query', registry_hit=True):
+                    return sdk.run_query(
+                        query_id=known['id'],
+                        result_format=result_format
+                    )
+            except Exception as e:
+                # Query IDs can disappear (instance reset, different instance) - recreate once
+                print(f"   Stored Query ID {known['id']} failed ({str(e)}), recreating")
+                self.registry.discard(definition_hash)
+        
+        # Create and run query
+        with tracing.span('looker.create_query'):
+            query_result = sdk.create_query(models.WriteQuery(**definition))
+        print(f"   Query ID: {query_result.id}")
+        self.registry.put(definition_hash, query_result.id, getattr(query_result, 'slug', None))
+        
+        # Run query and get results
+        with tracing.span('looker.run_query'):
+            return sdk.run_query(
                 query_id=query_result.id,
-                result_format="json"
+                result_format=result_format
             )
-            
-            # Parse JSON string to Python objects
-            import json
-            if isinstance(results, str):
-                results = json.loads(results)
-            
-            print(f"Query successful, returned {len(results) if isinstance(results, list) else 'N/A'} rows")
-            return results
-            
-        except Exception as e:
-            # Log the error details
-            import traceback
-            print(f"   Looker API Error: {str(e)}")
-            print(f"   Error type: {type(e).__name__}")
-            print(f"   Traceback:")
-            traceback.print_exc()
-            print("   Using mock data as fallback...")
-            return self._get_mock_data(query_config)
     
     def _get_mock_data(self, query_config: Dict[str, Any]) -> List[Dict]:
         """
@@ -169,6 +745,22 @@ class LookerClient:
                 {'explore': explore}
             ]
     
+    def invalidate_cache(self, explores: Optional[List[str]] = None):
+        """Drop cached query results, all of them or those of some explores (datagroups do this on each load)"""
+        self.cache.invalidate(explores)
+    
+    def cache_stats(self) -> Dict[str, Any]:
+        """
+        Hit/miss counters and size of the shared result cache (overall and per
+        explore), plus datagroup checks, coalescing and queueing
+        """
+        stats = self.cache.stats()
+        if self.datagroups is not None:
+            stats['datagroups'] = self.datagroups.stats()
+        stats['single_flight'] = self.flights.stats()
+        stats['pool'] = self.pool.stats()
+        return stats
+    
     def test_connection(self) -> bool:
         """Test if Looker connection is working"""
         if self.sdk is None:
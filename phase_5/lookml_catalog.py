@@ -0,0 +1,569 @@
+import os
+import re
+import sys
+import glob
+import json
+import time
+import hashlib
+import argparse
+from typing import Dict, Any, List, Optional, Tuple
+
+CATALOG_VERSION = 5
+
+DEFAULT_PROJECT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'phase_4', 'lookml')
+DEFAULT_CACHE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.lookml_catalog.json')
+
+# A role-playing date join: ${fct_sales.order_date_key} = ${dim_date_order.date_key}
+DATE_KEY_JOIN = re.compile(r'^\s*\$\{(\w+)\.(\w+)_key\}\s*=\s*\$\{(\w+)\.date_key\}\s*$')
+# The year filter terms a date range can stand for: 2014, >=2013, 2011 to 2013
+YEAR_TERM = re.compile(r'^(?:(>=|>|<=|<)\s*)?(\d{4})(?:\s+to\s+(\d{4}))?$', re.IGNORECASE)
+
+# Blocks that can appear many times in one scope, keyed by their name
+NAMED_BLOCKS = {'explore', 'view', 'join', 'dimension', 'dimension_group', 'measure', 'set', 'filter',
+                'parameter', 'datagroup', 'aggregate_table', 'access_grant'}
+
+
+class LookMLParseError(ValueError):
+    pass
+
+
+class _Parser:
+    """Small recursive-descent parser for the subset of LookML this project uses"""
+
+    def __init__(self, text: str, source: str = '<lookml>'):
+        self.text = text
+        self.source = source
+        self.pos = 0
+
+    def error(self, message: str):
+        line = self.text.count('\n', 0, self.pos) + 1
+        raise LookMLParseError(f"{self.source}:{line}: {message}")
+
+    def skip(self):
+        """Skip whitespace and # comments"""
+        while self.pos < len(self.text):
+            char = self.text[self.pos]
+            if char.isspace():
+                self.pos += 1
+            elif char == '#':
+                end = self.text.find('\n', self.pos)
+                self.pos = len(self.text) if end == -1 else end
+            else:
+                break
+
+    def peek(self) -> str:
+        self.skip()
+        return self.text[self.pos] if self.pos < len(self.text) else ''
+
+    def identifier(self) -> str:
+        self.skip()
+        start = self.pos
+        while self.pos < len(self.text) and (self.text[self.pos].isalnum() or self.text[self.pos] in '_.*+-/'):
+            self.pos += 1
+        if start == self.pos:
+            self.error(f"expected identifier, found {self.text[self.pos:self.pos + 10]!r}")
+        return self.text[start:self.pos]
+
+    def string(self) -> str:
+        self.pos += 1  # opening quote
+        chars = []
+        while self.pos < len(self.text):
+            char = self.text[self.pos]
+            if char == '\\' and self.pos + 1 < len(self.text):
+                chars.append(self.text[self.pos + 1])
+                self.pos += 2
+                continue
+            if char == '"':
+                self.pos += 1
+                return ''.join(chars)
+            chars.append(char)
+            self.pos += 1
+        self.error("unterminated string")
+
+    def sql(self) -> str:
+        """Raw SQL-ish value terminated by ;;"""
+        end = self.text.find(';;', self.pos)
+        if end == -1:
+            self.error("expected ;; after sql value")
+        value = self.text[self.pos:end].strip()
+        self.pos = end + 2
+        return value
+
+    def value(self) -> Any:
+        char = self.peek()
+        if char == '"':
+            return self.string()
+        if char == '[':
+            self.pos += 1
+            items = []
+            pairs = {}
+            while self.peek() != ']':
+                if self.peek() == '':
+                    self.error("unterminated list")
+                item = self.string() if self.peek() == '"' else self.identifier()
+                if self.peek() == ':':
+                    # Filter-style list: [field: "value", ...]
+                    self.pos += 1
+                    pairs[item] = self.value()
+                else:
+                    items.append(item)
+                if self.peek() == ',':
+                    self.pos += 1
+            self.pos += 1
+            return pairs if pairs else items
+        if char == '{':
+            return self.block()
+        return self.identifier()
+
+    def block(self) -> Dict[str, Any]:
+        self.pos += 1  # {
+        body = self.statements(closing='}')
+        self.pos += 1  # }
+        return body
+
+    def statements(self, closing: str = '') -> Dict[str, Any]:
+        result: Dict[str, Any] = {}
+        while True:
+            char = self.peek()
+            if char == closing:
+                return result
+            if char == '':
+                self.error("unexpected end of file")
+            key = self.identifier()
+            if self.peek() != ':':
+                self.error(f"expected ':' after {key}")
+            self.pos += 1
+            if key.startswith('sql') or key in ('html', 'expression'):
+                result[key] = self.sql()
+                continue
+            if key in NAMED_BLOCKS and self.peek() not in ('{', '"', '['):
+                name = self.identifier()
+                if self.peek() != '{':
+                    self.error(f"expected block for {key}: {name}")
+                result.setdefault(key, {})[name] = self.block()
+                continue
+            value = self.value()
+            if key == 'include':
+                result.setdefault(key, []).append(value)
+            else:
+                result[key] = value
+
+
+def parse_lookml(text: str, source: str = '<lookml>') -> Dict[str, Any]:
+    """Parse LookML text into nested dicts (named blocks keyed by name)"""
+    return _Parser(text, source).statements()
+
+
+def _is_yes(value: Any) -> bool:
+    return str(value).lower() == 'yes'
+
+
+def _compile_view(name: str, view: Dict[str, Any]) -> Dict[str, Any]:
+    fields: Dict[str, Dict[str, Any]] = {}
+    for kind in ('dimension', 'measure'):
+        for field_name, field in view.get(kind, {}).items():
+            fields[field_name] = {
+                'kind': kind,
+                'type': field.get('type', 'string' if kind == 'dimension' else 'count'),
+                'label': field.get('label', ''),
+                'description': field.get('description', ''),
+                'sql': field.get('sql', ''),
+                'hidden': _is_yes(field.get('hidden')),
+                'primary_key': _is_yes(field.get('primary_key')),
+            }
+            # Only what the SQL compiler needs, to keep the catalog small
+            for key in ('filters', 'tiers', 'style', 'order_by_field'):
+                if field.get(key):
+                    fields[field_name][key] = field[key]
+    # Dimension groups expand into one dimension per timeframe (e.g. date_year)
+    for group_name, group in view.get('dimension_group', {}).items():
+        for timeframe in group.get('timeframes', []):
+            fields[f"{group_name}_{timeframe}"] = {
+                'kind': 'dimension',
+                'type': f"date_{timeframe}",
+                'label': f"{group.get('label', group_name)} {timeframe.title()}",
+                'description': group.get('description', ''),
+                'sql': group.get('sql', ''),
+                'timeframe': timeframe,
+                'datatype': group.get('datatype', 'timestamp'),
+                'hidden': _is_yes(group.get('hidden')),
+                'primary_key': False,
+            }
+    sets = {set_name: list(body.get('fields', [])) for set_name, body in view.get('set', {}).items()}
+    return {
+        'sql_table_name': view.get('sql_table_name', ''),
+        'fields': fields,
+        'sets': sets,
+    }
+
+
+def _allowed_fields(alias: str, view: Dict[str, Any], restriction: Optional[List[str]]) -> List[str]:
+    """Expand a join's fields: [...] restriction (with set* references) for one alias"""
+    if not restriction:
+        return list(view['fields'].keys())
+    allowed = []
+    for item in restriction:
+        scope, _, ref = item.rpartition('.')
+        if scope and scope != alias:
+            continue
+        if ref.endswith('*'):
+            allowed.extend(view['sets'].get(ref[:-1], []))
+        else:
+            allowed.append(ref)
+    return [f for f in allowed if f in view['fields']]
+
+
+def _compile_explore(name: str, explore: Dict[str, Any], views: Dict[str, Any]) -> Dict[str, Any]:
+    base_view = explore.get('from', name)
+    base_alias = explore.get('view_name', name if 'from' not in explore else base_view)
+    joins = {}
+    for alias, join in explore.get('join', {}).items():
+        joins[alias] = {
+            'from': join.get('from', alias),
+            'type': join.get('type', 'left_outer'),
+            'relationship': join.get('relationship', 'many_to_one'),
+            'sql_on': join.get('sql_on', ''),
+            'fields': join.get('fields', []),
+        }
+
+    # Every queryable field of the explore, as "alias.field"
+    fields = {}
+    aliases = [(base_alias, base_view, None)] + [(a, j['from'], j['fields']) for a, j in joins.items()]
+    for alias, view_name, restriction in aliases:
+        view = views.get(view_name)
+        if view is None:
+            continue
+        for field_name in _allowed_fields(alias, view, restriction):
+            field = view['fields'][field_name]
+            fields[f"{alias}.{field_name}"] = {
+                'kind': field['kind'],
+                'type': field['type'],
+                'view': view_name,
+                'label': field['label'],
+                'description': field['description'],
+                'hidden': field['hidden'],
+                'primary_key': field['primary_key'],
+            }
+
+    # Rollups Looker may answer from instead of the base view (aggregate awareness)
+    aggregate_tables = {}
+    for table_name, table in explore.get('aggregate_table', {}).items():
+        query = table.get('query', {})
+        aggregate_tables[table_name] = {
+            'dimensions': list(query.get('dimensions', [])),
+            'measures': list(query.get('measures', [])),
+            'filters': dict(query.get('filters') or {}),
+            'partition_keys': list((table.get('materialization') or {}).get('partition_keys', [])),
+        }
+
+    return {
+        'label': explore.get('label', name),
+        'description': explore.get('description', ''),
+        # Hidden explores can be queried but are left out of the prompt
+        'hidden': _is_yes(explore.get('hidden')),
+        'base_view': base_view,
+        'base_alias': base_alias,
+        'joins': joins,
+        'persist_with': explore.get('persist_with', ''),
+        'fields': fields,
+        'aggregate_tables': aggregate_tables,
+    }
+
+
+def _merge(base: Dict[str, Any], override: Dict[str, Any]) -> Dict[str, Any]:
+    """Looker's extends: the extending object's parameters win, named blocks (fields, joins) merge by name"""
+    merged = dict(base)
+    for key, value in override.items():
+        if isinstance(value, dict) and isinstance(merged.get(key), dict):
+            merged[key] = _merge(merged[key], value)
+        else:
+            merged[key] = value
+    return merged
+
+
+def _resolve_extends(objects: Dict[str, Dict[str, Any]], kind: str) -> Dict[str, Dict[str, Any]]:
+    """Views or explores with their extends: [...] applied (extension: required is not inherited)"""
+    resolved: Dict[str, Dict[str, Any]] = {}
+
+    def resolve(name: str, chain: List[str]) -> Dict[str, Any]:
+        if name in resolved:
+            return resolved[name]
+        if name in chain:
+            raise LookMLParseError(f"{kind} {name} extends itself ({' -> '.join(chain + [name])})")
+        merged: Dict[str, Any] = {}
+        for parent in objects[name].get('extends') or []:
+            if parent not in objects:
+                raise LookMLParseError(f"{kind} {name} extends unknown {kind} {parent}")
+            inherited = {k: v for k, v in resolve(parent, chain + [name]).items() if k != 'extension'}
+            merged = _merge(merged, inherited)
+        resolved[name] = _merge(merged, {k: v for k, v in objects[name].items() if k != 'extends'})
+        return resolved[name]
+
+    for name in objects:
+        resolve(name, [])
+    return resolved
+
+
+def _project_files(project_dir: str) -> Tuple[List[str], List[str]]:
+    """Model files and the view files they include"""
+    models = sorted(glob.glob(os.path.join(project_dir, '*.model.lkml')))
+    views = set()
+    for model_path in models:
+        with open(model_path, 'r') as f:
+            model = parse_lookml(f.read(), model_path)
+        for pattern in model.get('include', []):
+            views.update(glob.glob(os.path.join(project_dir, pattern.lstrip('/'))))
+    return models, sorted(views)
+
+
+def compile_project(project_dir: str) -> Dict[str, Any]:
+    """Parse the model and view files into a JSON-serializable catalog"""
+    models, view_files = _project_files(project_dir)
+    parsed_views: Dict[str, Any] = {}
+    for path in view_files:
+        with open(path, 'r') as f:
+            parsed_views.update(parse_lookml(f.read(), path).get('view', {}))
+    views = {name: _compile_view(name, view)
+             for name, view in _resolve_extends(parsed_views, 'view').items()
+             if view.get('extension') != 'required'}
+
+    parsed_explores: Dict[str, Any] = {}
+    datagroups: Dict[str, Any] = {}
+    connection = ''
+    for path in models:
+        with open(path, 'r') as f:
+            model = parse_lookml(f.read(), path)
+        connection = model.get('connection', connection)
+        datagroups.update(model.get('datagroup', {}))
+        parsed_explores.update(model.get('explore', {}))
+    # Extension explores (extension: required) only exist to be extended
+    explores = {name: _compile_explore(name, explore, views)
+                for name, explore in _resolve_extends(parsed_explores, 'explore').items()
+                if explore.get('extension') != 'required'}
+
+    return {
+        'version': CATALOG_VERSION,
+        'model': os.path.basename(models[0]).replace('.model.lkml', '') if models else '',
+        'connection': connection,
+        'datagroups': datagroups,
+        'explores': explores,
+        'views': views,
+    }
+
+
+def _fingerprint(project_dir: str, paths: List[str]) -> Dict[str, List[int]]:
+    # Keyed relative to the project, so the cache holds whatever directory the app starts in
+    fingerprint = {}
+    for path in paths:
+        stat = os.stat(path)
+        fingerprint[os.path.relpath(path, project_dir)] = [stat.st_mtime_ns, stat.st_size]
+    return fingerprint
+
+
+def _content_hash(project_dir: str, paths: List[str]) -> str:
+    digest = hashlib.sha256()
+    for path in paths:
+        digest.update(os.path.relpath(path, project_dir).encode('utf-8'))
+        with open(path, 'rb') as f:
+            digest.update(f.read())
+    return digest.hexdigest()
+
+
+def load_catalog(project_dir: Optional[str] = None, cache_path: Optional[str] = None,
+                 rebuild: bool = False) -> Dict[str, Any]:
+    """
+    Load the compiled catalog, reparsing LookML only when the files changed
+
+    The cache is trusted while every file's mtime and size match; if they
+    moved but the contents hash is unchanged (fresh checkout, touch) the
+    fingerprint is refreshed without reparsing.
+
+    Args:
+        project_dir: LookML project directory (model + views)
+        cache_path: Where the compiled JSON catalog is kept
+        rebuild: Ignore the cache and reparse
+
+    Returns:
+        Catalog dict with explores, views and datagroups
+    """
+    project_dir = project_dir or os.getenv('LOOKML_PROJECT_DIR', DEFAULT_PROJECT_DIR)
+    cache_path = cache_path or os.getenv('LOOKML_CATALOG_PATH', DEFAULT_CACHE_PATH)
+
+    cached = None
+    if cache_path and os.path.exists(cache_path) and not rebuild:
+        try:
+            with open(cache_path, 'r') as f:
+                cached = json.load(f)
+        except (OSError, ValueError):
+            cached = None
+
+    if not os.path.isdir(project_dir):
+        # Deployed without the LookML sources - the compiled catalog is all we have
+        if cached and cached.get('catalog', {}).get('version') == CATALOG_VERSION:
+            return cached['catalog']
+        raise FileNotFoundError(f"LookML project not found at {project_dir} and no compiled catalog cached")
+
+    models, view_files = _project_files(project_dir)
+    paths = models + view_files
+    fingerprint = _fingerprint(project_dir, paths)
+
+    if cached and cached.get('catalog', {}).get('version') == CATALOG_VERSION:
+        if cached.get('fingerprint') == fingerprint:
+            return cached['catalog']
+        content_hash = _content_hash(project_dir, paths)
+        if cached.get('content_hash') == content_hash:
+            cached['fingerprint'] = fingerprint
+            _write_cache(cache_path, cached)
+            return cached['catalog']
+    else:
+        content_hash = _content_hash(project_dir, paths)
+
+    catalog = compile_project(project_dir)
+    _write_cache(cache_path, {'fingerprint': fingerprint, 'content_hash': content_hash, 'catalog': catalog})
+    return catalog
+
+
+def _write_cache(cache_path: str, payload: Dict[str, Any]) -> None:
+    if not cache_path:
+        return
+    tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+    try:
+        with open(tmp_path, 'w') as f:
+            json.dump(payload, f)
+        os.replace(tmp_path, cache_path)
+    except OSError as e:
+        print(f"LookML catalog could not be cached: {str(e)}")
+
+
+def explore_fields(catalog: Dict[str, Any], explore: str, kind: Optional[str] = None,
+                   include_hidden: bool = True) -> Dict[str, Dict[str, Any]]:
+    """Fields queryable from an explore, optionally only dimensions or measures"""
+    fields = catalog['explores'].get(explore, {}).get('fields', {})
+    return {
+        name: field for name, field in fields.items()
+        if (kind is None or field['kind'] == kind) and (include_hidden or not field['hidden'])
+    }
+
+
+def wide_query(catalog: Dict[str, Any], query_config: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """
+    The query config on the explore's one-big-table twin (<explore>_wide), or None
+
+    The twin reads a table with joined attributes pre-joined as
+    <base alias>.<join alias>_<field> columns, so each joined field that has
+    such a column is swapped for it; the rest (and the measures) keep their
+    names and are answered through the twin's joins. None when the explore
+    has no twin or nothing would be read from the wide columns. Fields stay
+    in order, so results line up with the original query's fields.
+    """
+    name = query_config.get('explore', 'sales_analysis')
+    explore, wide = catalog['explores'].get(name), catalog['explores'].get(f"{name}_wide")
+    if not explore or not wide or wide['base_alias'] != explore['base_alias']:
+        return None
+    fields = wide['fields']
+
+    def route(field: str) -> str:
+        alias, _, rest = field.partition('.')
+        if alias == wide['base_alias']:
+            return field
+        column = f"{wide['base_alias']}.{alias}_{rest}"
+        return column if column in fields else field
+
+    dimensions = [route(f) for f in query_config.get('dimensions') or []]
+    measures = list(query_config.get('measures') or [])
+    filters = {route(f): value for f, value in (query_config.get('filters') or {}).items()}
+    sorts = []
+    for sort in query_config.get('sorts') or []:
+        parts = str(sort).split(None, 1)
+        sorts.append(' '.join([route(parts[0])] + parts[1:]) if parts else sort)
+    if any(f not in fields for f in dimensions + measures + list(filters)):
+        return None
+    if dimensions == list(query_config.get('dimensions') or []) and \
+            list(filters) == list(query_config.get('filters') or {}):
+        return None
+    return dict(query_config, explore=f"{name}_wide", dimensions=dimensions, measures=measures,
+                filters=filters, sorts=sorts)
+
+
+def _year_range(expression: str) -> Optional[str]:
+    """
+    A Looker date filter covering every year a year filter selects, or None
+
+    "2014" -> "2014/01/01 to 2015/01/01", ">=2013" -> "after 2013/01/01".
+    Several terms are ORed, so their ranges are spanned. Negations, NULL
+    and anything else a range cannot stand for give None.
+    """
+    low, high, terms = None, None, [t.strip() for t in expression.split(',') if t.strip()]
+    for i, term in enumerate(terms):
+        match = YEAR_TERM.match(term)
+        if not match or (match.group(1) and match.group(3)):
+            return None
+        operator, first, last = match.group(1), int(match.group(2)), match.group(3)
+        term_low = None if operator in ('<', '<=') else first + 1 if operator == '>' else first
+        term_high = None if operator in ('>', '>=') else first if operator == '<' else int(last or first) + 1
+        low = term_low if i == 0 else None if low is None or term_low is None else min(low, term_low)
+        high = term_high if i == 0 else None if high is None or term_high is None else max(high, term_high)
+    if low is None and high is None:
+        return None
+    if low is not None and high is not None:
+        return f"{low}/01/01 to {high}/01/01" if low < high else None
+    return f"after {low}/01/01" if low is not None else f"before {high}/01/01"
+
+
+def partition_query(catalog: Dict[str, Any], query_config: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """
+    The query config with its year filters repeated on the fact's partition column, or None
+
+    The facts are partitioned on a DATE column (fct_sales.order_date), but
+    questions filter on the year of a role-playing date join
+    (dim_date_order.year). BigQuery prunes partitions only on a WHERE
+    condition on the partition column itself, so a year filter on a join
+    ${<fact>.<role>_key} = ${<join>.date_key} is repeated as the date range
+    it covers on the fact's hidden <role> date dimension, when the explore
+    has one. The range keeps every row the year filter keeps, so results are
+    unchanged. None when no filter can be repeated.
+    """
+    explore = catalog['explores'].get(query_config.get('explore', 'sales_analysis'))
+    if not explore:
+        return None
+    filters = dict(query_config.get('filters') or {})
+    added = {}
+    for alias, join in explore['joins'].items():
+        match = DATE_KEY_JOIN.match(join['sql_on'])
+        if not match or match.group(1) != explore['base_alias'] or match.group(3) != alias:
+            continue
+        year, partition = f"{alias}.year", f"{match.group(1)}.{match.group(2)}"
+        if year not in filters or partition in filters or explore['fields'].get(partition, {}).get('type') != 'date':
+            continue
+        value = filters[year]
+        date_range = _year_range(','.join(map(str, value)) if isinstance(value, list) else str(value))
+        if date_range:
+            added[partition] = date_range
+    if not added:
+        return None
+    return dict(query_config, filters=dict(filters, **added))
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Compile the LookML project into a JSON field catalog")
+    parser.add_argument('--project-dir', default=None)
+    parser.add_argument('--cache-path', default=None)
+    parser.add_argument('--rebuild', action='store_true', help="Ignore the cache and reparse")
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    catalog = load_catalog(args.project_dir, args.cache_path, rebuild=args.rebuild)
+    elapsed_ms = (time.perf_counter() - start) * 1000
+
+    for name, explore in catalog['explores'].items():
+        dimensions = explore_fields(catalog, name, 'dimension', include_hidden=False)
+        measures = explore_fields(catalog, name, 'measure', include_hidden=False)
+        print(f"{name}: {len(dimensions)} dimensions, {len(measures)} measures, {len(explore['joins'])} joins"
+              + (f", {len(explore['aggregate_tables'])} aggregate tables" if explore['aggregate_tables'] else "")
+              + (" (hidden)" if explore['hidden'] else ""))
+    print(f"{len(catalog['views'])} views loaded in {elapsed_ms:.1f} ms")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
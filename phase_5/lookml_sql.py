@@ -0,0 +1,638 @@
+"""
+Compile Looker query configs to DuckDB SQL from the LookML catalog
+
+Mirrors what Looker generates for the explores in adventure_works.model.lkml:
+the base view left-joined to only the views a query touches (role-playing
+joins such as dim_date_order/dim_date_ship become separate aliases of the
+same table), dimension and measure SQL taken from the view files, Looker
+filter expressions turned into WHERE/HAVING conditions, and symmetric
+aggregates for sums and averages on joined views so fan-out never inflates
+them. Templated filters in a join's sql_on ({% condition view.field %} sql
+{% endcondition %}) render as Looker renders them: the query's filter on that
+field applied to sql, or 1=1 when the field is not filtered.
+
+With aggregate awareness on, a query that an explore's aggregate_table
+covers is answered from that (much smaller) rollup instead, by the same rules
+Looker applies: every dimension, filter and sort key must be a dimension of
+the rollup, and every measure one of its sums or counts, which re-aggregate
+exactly. Rollups with partition_keys are partitioned on their year column,
+so their year filters prune as they are.
+
+A query read from the base view gets its year filters repeated on the
+fact's partition column as a date range (lookml_catalog.partition_query),
+as LookerClient sends it to Looker, so the WHERE clause is the one BigQuery
+prunes partitions on.
+
+With wide explores on, a query no rollup covers goes to the explore's
+one-big-table twin (<explore>_wide, see lookml_catalog.wide_query), so the
+attributes pre-joined there are read without their joins. The result keeps
+the original field names.
+"""
+import re
+from typing import Dict, Any, List, Optional, Tuple, Callable
+
+from looker_client import normalize_filters
+from lookml_catalog import wide_query, partition_query
+
+REFERENCE = re.compile(r'\$\{([A-Za-z0-9_.]+)\}')
+TEMPLATED_FILTER = re.compile(r'\{%\s*condition\s+([A-Za-z0-9_.]+)\s*%\}(.*?)\{%\s*endcondition\s*%\}', re.DOTALL)
+# 2014/01/01 or 2014-01-01 in a date filter
+DATE_VALUE = re.compile(r'^(\d{4})[/-](\d{1,2})[/-](\d{1,2})$')
+
+# BigQuery functions used in the view SQL, rewritten for DuckDB before references are resolved
+DIALECT_REWRITES = [
+    (re.compile(r'CURRENT_DATE\(\)', re.IGNORECASE), 'current_date'),
+    (re.compile(r'DATE_DIFF\(([^,()]+(?:\(\))?),\s*([^,()]+),\s*(\w+)\)', re.IGNORECASE),
+     lambda m: f"date_diff('{m.group(3).lower()}', {m.group(2)}, {m.group(1)})"),
+    (re.compile(r'DATE_TRUNC\(([^,]+),\s*(\w+)\)', re.IGNORECASE),
+     lambda m: f"date_trunc('{m.group(2).lower()}', {m.group(1)})"),
+    (re.compile(r'\bFORMAT\(', re.IGNORECASE), 'printf('),
+    (re.compile(r'\bSAFE_DIVIDE\(([^,]+),\s*([^)]+\)?)\)', re.IGNORECASE),
+     lambda m: f"(({m.group(1)}) / NULLIF({m.group(2)}, 0))"),
+]
+
+# Symmetric aggregates: distinct (hashed key, value) pairs survive fan-out from many_to_one joins
+SYMMETRIC_KEY = "CAST(hash({key}) % 10000000000000000 AS HUGEINT) * 1000000000000000"
+SYMMETRIC_VALUE = "CAST(ROUND(COALESCE({value}, 0) * 10000) AS HUGEINT)"
+
+NUMERIC_TYPES = {'number', 'sum', 'average', 'count', 'count_distinct', 'min', 'max', 'date_year'}
+
+# How a rollup's stored measure re-aggregates; averages and distinct counts do not
+ROLLUP_FUNCTIONS = {'sum': 'SUM', 'count': 'SUM', 'min': 'MIN', 'max': 'MAX'}
+
+
+class QueryCompileError(ValueError):
+    pass
+
+
+def to_duckdb(sql: str) -> str:
+    """Rewrite the BigQuery-only functions the LookML uses into DuckDB equivalents"""
+    for pattern, replacement in DIALECT_REWRITES:
+        sql = pattern.sub(replacement, sql)
+    return sql
+
+
+def bare_table_name(sql_table_name: str) -> str:
+    """`project.dataset.fct_sales` -> fct_sales"""
+    return sql_table_name.strip().strip('`').split('.')[-1] if sql_table_name else ''
+
+
+def aggregate_column(field: str) -> str:
+    """Rollup column for a field, named the way Looker aliases it: dim_product.category_name -> dim_product_category_name"""
+    return field.replace('.', '_')
+
+
+def _literal(value: Any) -> str:
+    """SQL literal for values that come from the LookML itself (measure filters)"""
+    if isinstance(value, (int, float)):
+        return str(value)
+    return "'" + str(value).replace("'", "''") + "'"
+
+
+def _split_terms(expression: str) -> List[str]:
+    """Split a Looker filter expression on commas, honouring the ^, escape"""
+    terms, current, i = [], '', 0
+    while i < len(expression):
+        char = expression[i]
+        if char == '^' and i + 1 < len(expression):
+            current += expression[i + 1]
+            i += 2
+            continue
+        if char == ',':
+            terms.append(current.strip())
+            current = ''
+        else:
+            current += char
+        i += 1
+    terms.append(current.strip())
+    return [t for t in terms if t != '']
+
+
+def _number(term: str) -> float:
+    try:
+        value = float(term)
+    except ValueError:
+        raise QueryCompileError(f"{term!r} is not a number")
+    return int(value) if value.is_integer() else value
+
+
+def _date(term: str) -> str:
+    match = DATE_VALUE.match(term.strip())
+    if not match:
+        raise QueryCompileError(f"{term!r} is not a date")
+    return '-'.join(f"{int(part):0{width}d}" for part, width in zip(match.groups(), (4, 2, 2)))
+
+
+def _date_condition(expr: str, expression: str, bind: Callable[[Any], str]) -> str:
+    """
+    A Looker date filter on a DATE column: "2014/01/01 to 2015/01/01" (end
+    excluded), "after 2013/01/01" (inclusive), "before 2014/01/01", one date
+    or NULL. Conditions compare the bare column, as partition pruning needs.
+    """
+    conditions = []
+    for term in _split_terms(str(expression).strip()):
+        range_match = re.match(r'^(.+?)\s+to\s+(.+)$', term, re.IGNORECASE)
+        bound = re.match(r'^(after|before)\s+(.+)$', term, re.IGNORECASE)
+        if term.upper() == 'NULL':
+            conditions.append(f"{expr} IS NULL")
+        elif range_match:
+            low, high = (f"CAST({bind(_date(value))} AS DATE)" for value in range_match.groups())
+            conditions.append(f"({expr} >= {low} AND {expr} < {high})")
+        elif bound:
+            operator = '>=' if bound.group(1).lower() == 'after' else '<'
+            conditions.append(f"{expr} {operator} CAST({bind(_date(bound.group(2)))} AS DATE)")
+        else:
+            conditions.append(f"{expr} = CAST({bind(_date(term))} AS DATE)")
+    if not conditions:
+        raise QueryCompileError(f"empty filter expression {expression!r}")
+    return '(' + ' OR '.join(conditions) + ')'
+
+
+def filter_condition(expr: str, field_type: str, expression: str,
+                     bind: Callable[[Any], str]) -> str:
+    """
+    Translate a Looker filter expression into a SQL condition on expr
+
+    Supports the forms the translator produces: value lists ("2013,2014"),
+    negation ("-Bikes"), wildcards ("%Bike%"), NULL/EMPTY, comparisons
+    (">0", "<=5"), ranges ("2011 to 2013"), yes/no and date ranges on date
+    fields. bind() turns a value into a placeholder (or a literal) for the SQL.
+    """
+    expression = str(expression).strip()
+    if field_type == 'date':
+        return _date_condition(expr, expression, bind)
+    if field_type == 'yesno':
+        truthy = expression.lower() in ('yes', 'true', '1')
+        return f"({expr})" if truthy else f"NOT COALESCE({expr}, FALSE)"
+
+    numeric = field_type in NUMERIC_TYPES
+    positive, negative = [], []
+    for term in _split_terms(expression):
+        upper = term.upper()
+        if upper in ('NULL', '-NULL', 'NOT NULL'):
+            (positive if upper == 'NULL' else negative).append(
+                f"{expr} IS NULL" if upper == 'NULL' else f"{expr} IS NOT NULL")
+            continue
+        if upper in ('EMPTY', '-EMPTY'):
+            condition = f"({expr} IS NULL OR CAST({expr} AS VARCHAR) = '')"
+            (positive if upper == 'EMPTY' else negative).append(
+                condition if upper == 'EMPTY' else f"NOT {condition}")
+            continue
+
+        negated = term.startswith('-') and not (numeric and term[1:2].isdigit())
+        if term.upper().startswith('NOT '):
+            negated, term = True, term[4:].strip()
+        elif negated:
+            term = term[1:]
+
+        range_match = re.match(r'^(.+?)\s+to\s+(.+)$', term, re.IGNORECASE)
+        comparison = re.match(r'^(>=|<=|!=|<>|>|<|=)\s*(.+)$', term)
+        if range_match:
+            low, high = range_match.groups()
+            if numeric:
+                low, high = _number(low), _number(high)
+            condition = f"{expr} BETWEEN {bind(low)} AND {bind(high)}"
+        elif comparison:
+            operator, value = comparison.groups()
+            value = _number(value) if numeric else value
+            condition = f"{expr} {'<>' if operator == '!=' else operator} {bind(value)}"
+        elif not numeric and '%' in term:
+            condition = f"{expr} LIKE {bind(term)}"
+        else:
+            value = _number(term) if numeric else term
+            condition = f"{expr} = {bind(value)}"
+
+        if negated:
+            negative.append(f"({expr} IS NULL OR NOT ({condition}))")
+        else:
+            positive.append(condition)
+
+    parts = []
+    if positive:
+        parts.append('(' + ' OR '.join(positive) + ')')
+    parts.extend(negative)
+    if not parts:
+        raise QueryCompileError(f"empty filter expression {expression!r}")
+    return ' AND '.join(parts)
+
+
+class LookMLSqlCompiler:
+    """
+    Turns {explore, dimensions, measures, filters, sorts, limit} into SQL
+
+    Args:
+        catalog: Compiled LookML catalog (lookml_catalog.load_catalog())
+        table_name: Maps a view's sql_table_name to the table to read;
+            defaults to the bare table name (fct_sales)
+        aggregates: Tells whether an aggregate table can be read (built and
+            fresh); None turns aggregate awareness off
+        wide: Tells whether a wide explore's table can be read (built and
+            fresh); None never routes queries to wide explores
+        partitions: Repeat year filters on the facts' partition columns
+            (False compiles the queries as they were before partitioning)
+    """
+
+    def __init__(self, catalog: Dict[str, Any], table_name: Optional[Callable[[str], str]] = None,
+                 aggregates: Optional[Callable[[str], bool]] = None,
+                 wide: Optional[Callable[[str], bool]] = None, partitions: bool = True):
+        self.catalog = catalog
+        self.table_name = table_name or bare_table_name
+        self.aggregates = aggregates
+        self.wide = wide
+        self.partitions = partitions
+
+    def _explore(self, name: str) -> Dict[str, Any]:
+        explore = self.catalog['explores'].get(name)
+        if explore is None:
+            raise QueryCompileError(f"unknown explore {name!r}")
+        return explore
+
+    @staticmethod
+    def _alias_view(explore: Dict[str, Any], alias: str) -> str:
+        if alias == explore['base_alias']:
+            return explore['base_view']
+        if alias in explore['joins']:
+            return explore['joins'][alias]['from']
+        raise QueryCompileError(f"{alias} is not joined in this explore")
+
+    def _field(self, explore: Dict[str, Any], alias: str, name: str) -> Dict[str, Any]:
+        view = self.catalog['views'].get(self._alias_view(explore, alias), {})
+        field = view.get('fields', {}).get(name)
+        if field is None:
+            raise QueryCompileError(f"{alias}.{name} does not exist")
+        return field
+
+    def _primary_key_sql(self, explore: Dict[str, Any], alias: str) -> str:
+        view = self.catalog['views'][self._alias_view(explore, alias)]
+        for name, field in view['fields'].items():
+            if field.get('primary_key'):
+                return self._dimension_sql(explore, alias, name)
+        raise QueryCompileError(f"{alias} has no primary key for a distinct count")
+
+    def _resolve(self, explore: Dict[str, Any], alias: str, sql: str, measures: bool) -> str:
+        """Substitute ${TABLE}, ${field} and ${view.field} references in a field's SQL"""
+        def substitute(match):
+            ref = match.group(1)
+            if ref == 'TABLE':
+                return alias
+            ref_alias, _, ref_name = ref.rpartition('.')
+            ref_alias = ref_alias or alias
+            field = self._field(explore, ref_alias, ref_name)
+            if field['kind'] == 'measure':
+                if not measures:
+                    raise QueryCompileError(f"dimension SQL references measure {ref}")
+                return f"({self._measure_sql(explore, ref_alias, ref_name)})"
+            return f"({self._dimension_sql(explore, ref_alias, ref_name, rendered=False)})"
+        return REFERENCE.sub(substitute, to_duckdb(sql))
+
+    def _base_sql(self, explore: Dict[str, Any], alias: str, name: str, field: Dict[str, Any]) -> str:
+        sql = field.get('sql') or f"${{TABLE}}.{name}"
+        return self._resolve(explore, alias, sql, measures=field['kind'] == 'measure')
+
+    def _dimension_sql(self, explore: Dict[str, Any], alias: str, name: str, rendered: bool = True) -> str:
+        """
+        SQL for a dimension
+
+        rendered=False is for ${...} references inside other SQL, where a
+        timeframe must stay a date (DATE_DIFF(CURRENT_DATE(), ${hire_date}, YEAR)).
+        """
+        field = self._field(explore, alias, name)
+        sql = self._base_sql(explore, alias, name, field)
+        timeframe = field.get('timeframe')
+        if timeframe:
+            value = sql if field.get('datatype') == 'date' else f"CAST({sql} AS TIMESTAMP)"
+            if not rendered:
+                return {
+                    'raw': value,
+                    'date': f"CAST({value} AS DATE)",
+                    'year': f"year({value})",
+                }.get(timeframe, f"CAST(date_trunc('{timeframe}', {value}) AS DATE)")
+            # Looker's JSON renders timeframes as strings (years as numbers)
+            return {
+                'raw': value,
+                'date': f"strftime(CAST({value} AS DATE), '%Y-%m-%d')",
+                'week': f"strftime(date_trunc('week', {value}), '%Y-%m-%d')",
+                'month': f"strftime({value}, '%Y-%m')",
+                'quarter': f"(strftime({value}, '%Y') || '-Q' || CAST(quarter({value}) AS VARCHAR))",
+                'year': f"year({value})",
+            }.get(timeframe, value)
+        if field['type'] == 'tier':
+            return self._tier_sql(sql, field)
+        return sql
+
+    @staticmethod
+    def _tier_sql(sql: str, field: Dict[str, Any]) -> str:
+        tiers = [_number(t) for t in field.get('tiers', [])]
+        integer = field.get('style') == 'integer'
+        cases = [f"WHEN {sql} < {tiers[0]} THEN 'Below {tiers[0]}'"] if tiers else []
+        for low, high in zip(tiers, tiers[1:]):
+            if integer:
+                label = f"{low}" if high - 1 == low else f"{low} to {high - 1}"
+            else:
+                label = f"[{low},{high})"
+            cases.append(f"WHEN {sql} < {high} THEN '{label}'")
+        if tiers:
+            cases.append(f"WHEN {sql} >= {tiers[-1]} THEN '{tiers[-1]} or Above'")
+        return f"CASE {' '.join(cases)} ELSE 'Undefined' END"
+
+    def _measure_filter(self, explore: Dict[str, Any], alias: str, field: Dict[str, Any]) -> Optional[str]:
+        conditions = []
+        for name, expression in (field.get('filters') or {}).items():
+            ref_alias, _, ref_name = name.rpartition('.')
+            ref_alias = ref_alias or alias
+            ref_field = self._field(explore, ref_alias, ref_name)
+            conditions.append(filter_condition(
+                self._dimension_sql(explore, ref_alias, ref_name), ref_field['type'], expression, _literal))
+        return ' AND '.join(conditions) if conditions else None
+
+    def _measure_sql(self, explore: Dict[str, Any], alias: str, name: str) -> str:
+        field = self._field(explore, alias, name)
+        kind = field['type']
+        if kind == 'number':
+            return self._base_sql(explore, alias, name, field)
+
+        condition = self._measure_filter(explore, alias, field)
+        joined = alias != explore['base_alias']
+        value = None if kind == 'count' else self._base_sql(explore, alias, name, field)
+
+        def when(expr: str) -> str:
+            return f"CASE WHEN {condition} THEN {expr} END" if condition else expr
+
+        if kind == 'count':
+            if joined:
+                return f"COUNT(DISTINCT {when(self._primary_key_sql(explore, alias))})"
+            return f"COUNT({when('1')})" if condition else "COUNT(*)"
+        if kind == 'count_distinct':
+            return f"COUNT(DISTINCT {when(value)})"
+        if kind in ('min', 'max'):
+            return f"{kind.upper()}({when(value)})"
+        if kind in ('sum', 'average'):
+            if not joined:
+                return f"{'SUM' if kind == 'sum' else 'AVG'}({when(value)})"
+            key = self._primary_key_sql(explore, alias)
+            hashed = SYMMETRIC_KEY.format(key=key)
+            total = (f"(CAST(SUM(DISTINCT {when(f'{hashed} + ' + SYMMETRIC_VALUE.format(value=value))})"
+                     f" - SUM(DISTINCT {when(hashed)}) AS DOUBLE) / 10000)")
+            if kind == 'sum':
+                return total
+            counted = f"CASE WHEN {value} IS NOT NULL THEN {key} END"
+            return f"{total} / NULLIF(COUNT(DISTINCT {when(counted)}), 0)"
+        raise QueryCompileError(f"measure type {kind!r} ({alias}.{name}) is not supported")
+
+    def _required_aliases(self, explore: Dict[str, Any], aliases: List[str]) -> List[str]:
+        """Joins needed for the referenced aliases, including joins their sql_on depends on"""
+        needed: List[str] = []
+        pending = list(aliases)
+        while pending:
+            alias = pending.pop()
+            if alias == explore['base_alias'] or alias in needed:
+                continue
+            if alias not in explore['joins']:
+                raise QueryCompileError(f"{alias} is not joined in this explore")
+            needed.append(alias)
+            for ref in REFERENCE.findall(explore['joins'][alias]['sql_on']):
+                pending.append(ref.split('.', 1)[0])
+        # Keep the model's join order so dependencies come first
+        return [alias for alias in explore['joins'] if alias in needed]
+
+    def compile(self, query_config: Dict[str, Any]) -> Tuple[str, List[Any]]:
+        """
+        Build the SQL for a query config
+
+        Returns:
+            (sql, params): DuckDB SQL with ? placeholders for user filter values
+        """
+        explore_name = query_config.get('explore', 'sales_analysis')
+        explore = self._explore(explore_name)
+        dimensions = list(query_config.get('dimensions') or [])
+        measures = list(query_config.get('measures') or [])
+        if not dimensions and not measures:
+            raise QueryCompileError("query selects no fields")
+        fields = explore['fields']
+        for name in dimensions + measures:
+            if name not in fields:
+                raise QueryCompileError(f"{name} is not a field of explore {explore_name}")
+
+        aggregate = self.aggregate_table(query_config)
+        if aggregate:
+            return self._compile_aggregate(explore, aggregate, query_config)
+        if self.partitions:
+            query_config = partition_query(self.catalog, query_config) or query_config
+        routed = self.wide_query(query_config)
+        if routed:
+            return self._compile_wide(query_config, routed)
+
+        def split(name: str) -> Tuple[str, str]:
+            alias, _, field = name.partition('.')
+            return alias, field
+
+        select = []
+        for name in dimensions + measures:
+            alias, field = split(name)
+            sql = (self._measure_sql(explore, alias, field) if fields[name]['kind'] == 'measure'
+                   else self._dimension_sql(explore, alias, field))
+            select.append(f'{sql} AS "{name}"')
+
+        params: List[Any] = []
+
+        def bind(value: Any) -> str:
+            params.append(value)
+            return '?'
+
+        where, having, referenced = [], [], [split(n)[0] for n in dimensions + measures]
+        having_params: List[Any] = []
+        filters = normalize_filters(query_config.get('filters'))
+        for name, expression in filters.items():
+            if name not in fields:
+                raise QueryCompileError(f"filter {name} is not a field of explore {explore_name}")
+            alias, field = split(name)
+            referenced.append(alias)
+            if fields[name]['kind'] == 'measure':
+                sql = self._measure_sql(explore, alias, field)
+                # HAVING comes after WHERE in the text, so bind its values last
+                having.append(filter_condition(sql, fields[name]['type'], expression,
+                                               lambda v: (having_params.append(v), '?')[1]))
+            else:
+                sql = self._dimension_sql(explore, alias, field)
+                where.append(filter_condition(sql, fields[name]['type'], expression, bind))
+        params.extend(having_params)
+
+        # Measure SQL can reach into other views (filters on joined fields)
+        for name in measures:
+            alias, field = split(name)
+            for ref in (self._field(explore, alias, field).get('filters') or {}):
+                if '.' in ref:
+                    referenced.append(ref.split('.', 1)[0])
+
+        joins = []
+        for alias in self._required_aliases(explore, referenced):
+            join = explore['joins'][alias]
+            view = self.catalog['views'][join['from']]
+            on = TEMPLATED_FILTER.sub(lambda m: self._templated_filter(fields, filters, m), join['sql_on'])
+            on = REFERENCE.sub(
+                lambda m: self._dimension_sql(explore, *split(m.group(1)), rendered=False), on)
+            kind = {'inner': 'INNER', 'full_outer': 'FULL OUTER', 'cross': 'CROSS'}.get(join['type'], 'LEFT')
+            joins.append(f"{kind} JOIN {self.table_name(view['sql_table_name'])} AS {alias} ON {on}")
+
+        base = self.catalog['views'][explore['base_view']]
+        sql = [f"SELECT {', '.join(select)}",
+               f"FROM {self.table_name(base['sql_table_name'])} AS {explore['base_alias']}"]
+        sql.extend(joins)
+        order = self._order_by(explore, query_config.get('sorts') or [], dimensions, measures,
+                               lambda alias, name: self._dimension_sql(explore, alias, name))
+        return self._finish(sql, query_config, dimensions, where, having, order), params
+
+    @staticmethod
+    def _templated_filter(fields: Dict[str, Any], filters: Dict[str, str], match: re.Match) -> str:
+        """{% condition field %} sql {% endcondition %}: the field's filter applied to sql, else 1=1"""
+        name, sql = match.group(1), match.group(2).strip()
+        if name not in filters or name not in fields:
+            return '1=1'
+        # Inlined rather than bound: the join text comes before the WHERE clause's placeholders
+        return '(' + filter_condition(sql, fields[name]['type'], filters[name], _literal) + ')'
+
+    @staticmethod
+    def _finish(sql: List[str], query_config: Dict[str, Any], dimensions: List[str], where: List[str],
+                having: List[str], order: List[str]) -> str:
+        """WHERE, GROUP BY, HAVING, ORDER BY and LIMIT after the FROM clause"""
+        if where:
+            sql.append('WHERE ' + ' AND '.join(where))
+        if dimensions:
+            sql.append('GROUP BY ' + ', '.join(str(i + 1) for i in range(len(dimensions))))
+        if having:
+            sql.append('HAVING ' + ' AND '.join(having))
+        if order:
+            sql.append('ORDER BY ' + ', '.join(order))
+        limit = int(query_config.get('limit') or 500)
+        if limit > 0:
+            sql.append(f"LIMIT {limit}")
+        return '\n'.join(sql)
+
+    def aggregate_table(self, query_config: Dict[str, Any]) -> Optional[str]:
+        """
+        The aggregate table that can answer a query, or None for the base view
+
+        Like Looker, the smallest eligible rollup wins; here that is the one
+        with the fewest dimensions, then the first declared.
+        """
+        if self.aggregates is None:
+            return None
+        explore = self.catalog['explores'].get(query_config.get('explore', 'sales_analysis'))
+        if not explore:
+            return None
+        best = None
+        for name, aggregate in explore.get('aggregate_tables', {}).items():
+            if not self._covers(explore, aggregate, query_config) or not self.aggregates(name):
+                continue
+            if best is None or len(aggregate['dimensions']) < len(explore['aggregate_tables'][best]['dimensions']):
+                best = name
+        return best
+
+    def wide_query(self, query_config: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """The query on the explore's wide twin when that is readable and no rollup covers it, else None"""
+        if self.wide is None or self.aggregate_table(query_config):
+            return None
+        routed = wide_query(self.catalog, query_config)
+        if routed is None or not self.wide(routed['explore']):
+            return None
+        return routed
+
+    def _compile_wide(self, query_config: Dict[str, Any], routed: Dict[str, Any]) -> Tuple[str, List[Any]]:
+        """Compile the routed query, then name its columns after the original fields"""
+        sql, params = self.compile(routed)
+        original = list(query_config.get('dimensions') or []) + list(query_config.get('measures') or [])
+        for name, routed_name in zip(original, routed['dimensions'] + routed['measures']):
+            if name != routed_name:
+                sql = sql.replace(f'"{routed_name}"', f'"{name}"')
+        return sql, params
+
+    def _covers(self, explore: Dict[str, Any], aggregate: Dict[str, Any], query_config: Dict[str, Any]) -> bool:
+        fields = explore['fields']
+        filters = normalize_filters(query_config.get('filters'))
+        # A filtered rollup only serves queries with exactly that filter
+        for name, expression in aggregate['filters'].items():
+            if str(filters.get(name, '')).strip() != str(expression).strip():
+                return False
+        dimensions = list(query_config.get('dimensions') or [])
+        measures = list(query_config.get('measures') or [])
+        for name in filters:
+            if name not in fields:
+                return False
+            if name in aggregate['filters']:
+                continue
+            (measures if fields[name]['kind'] == 'measure' else dimensions).append(name)
+        # Sorting month_name needs month_number from the rollup too
+        for sort in query_config.get('sorts') or []:
+            parts = str(sort).split()
+            if parts and parts[0] in dimensions:
+                alias, _, name = parts[0].partition('.')
+                order_by_field = self._field(explore, alias, name).get('order_by_field')
+                if order_by_field:
+                    dimensions.append(f"{alias}.{order_by_field}")
+        if not set(dimensions) <= set(aggregate['dimensions']):
+            return False
+        for name in measures:
+            if (name not in aggregate['measures'] or fields[name]['type'] not in ROLLUP_FUNCTIONS
+                    or name.split('.', 1)[0] != explore['base_alias']):
+                return False
+        return True
+
+    def _compile_aggregate(self, explore: Dict[str, Any], name: str,
+                           query_config: Dict[str, Any]) -> Tuple[str, List[Any]]:
+        """Re-aggregate a rollup: its columns are already the rendered dimensions and measures"""
+        fields = explore['fields']
+        dimensions = list(query_config.get('dimensions') or [])
+        measures = list(query_config.get('measures') or [])
+        aggregate = explore['aggregate_tables'][name]
+
+        def column(field: str) -> str:
+            if fields[field]['kind'] == 'measure':
+                return f"{ROLLUP_FUNCTIONS[fields[field]['type']]}(agg.{aggregate_column(field)})"
+            return f"agg.{aggregate_column(field)}"
+
+        select = [f'{column(field)} AS "{field}"' for field in dimensions + measures]
+        params: List[Any] = []
+        having_params: List[Any] = []
+        where, having = [], []
+        for field, expression in normalize_filters(query_config.get('filters')).items():
+            if field in aggregate['filters']:
+                continue
+            if fields[field]['kind'] == 'measure':
+                having.append(filter_condition(column(field), fields[field]['type'], expression,
+                                               lambda v: (having_params.append(v), '?')[1]))
+            else:
+                where.append(filter_condition(column(field), fields[field]['type'], expression,
+                                              lambda v: (params.append(v), '?')[1]))
+        params.extend(having_params)
+
+        sql = [f"SELECT {', '.join(select)}", f"FROM {name} AS agg"]
+        order = self._order_by(explore, query_config.get('sorts') or [], dimensions, measures,
+                               lambda alias, field: f"agg.{aggregate_column(f'{alias}.{field}')}")
+        return self._finish(sql, query_config, dimensions, where, having, order), params
+
+    def _order_by(self, explore: Dict[str, Any], sorts: List[str], dimensions: List[str],
+                  measures: List[str], order_key: Callable[[str, str], str]) -> List[str]:
+        fields = explore['fields']
+        order = []
+        for sort in sorts:
+            parts = str(sort).split()
+            if not parts or parts[0] not in dimensions + measures:
+                continue
+            direction = 'DESC' if len(parts) > 1 and parts[1].lower() == 'desc' else 'ASC'
+            alias, _, name = parts[0].partition('.')
+            field = self._field(explore, alias, name)
+            if field.get('order_by_field'):
+                # month_name sorts by month_number, not alphabetically
+                key = order_key(alias, field['order_by_field'])
+                order.append(f"MIN({key}) {direction}")
+            else:
+                order.append(f'"{parts[0]}" {direction}')
+        if order:
+            return order
+        # Looker's default: newest first for time dimensions, otherwise the first measure descending
+        for name in dimensions:
+            if fields[name]['type'].startswith('date_'):
+                return [f'"{name}" DESC']
+        if measures:
+            return [f'"{measures[0]}" DESC']
+        return [f'"{dimensions[0]}" ASC'] if dimensions else []
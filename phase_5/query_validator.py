@@ -0,0 +1,368 @@
+"""
+Pre-flight validation and repair of generated Looker queries
+
+Every dimension, measure, filter key and sort is checked against the fields
+reachable from the query's explore in the compiled LookML catalog before the
+query goes to Looker. Near misses (a typo, the right field on the wrong join
+alias, a bare field name) are repaired in place; anything else is reported
+so the caller can re-prompt with the exact problem instead of paying for a
+create_query/run_query round trip that fails.
+
+    python query_validator.py eval/labelled_questions.jsonl --perturb 3
+"""
+import os
+import sys
+import copy
+import json
+import random
+import difflib
+import argparse
+import threading
+from typing import Dict, Any, List, Optional, Tuple
+
+from lookml_catalog import load_catalog
+
+# Issues that make Looker reject the query (or return something else) if sent unrepaired
+FATAL_ISSUES = {'unknown_explore', 'wrong_explore', 'unknown_field', 'ambiguous_field',
+                'bad_sort', 'bad_limit', 'no_fields'}
+
+SORT_DIRECTIONS = {'asc': 'asc', 'ascending': 'asc', 'desc': 'desc', 'descending': 'desc'}
+
+# Largest row limit a query may ask for (large-result mode streams anything over LARGE_RESULT_ROWS)
+MAX_LIMIT = int(os.getenv('QUERY_MAX_LIMIT', '500000'))
+
+
+class QueryValidationError(ValueError):
+    """A generated query that could not be repaired"""
+
+    def __init__(self, issues: List[Dict[str, Any]]):
+        self.issues = issues
+        problems = '; '.join(issue['message'] for issue in issues)
+        super().__init__(f"Could not build a valid query for this question: {problems}")
+
+
+def limit_in_range(limit: int) -> bool:
+    """True for a row limit the validator would pass unchanged"""
+    return 1 <= limit <= MAX_LIMIT
+
+
+def _issue(kind: str, message: str, field: str = '', replacement: Optional[str] = None) -> Dict[str, Any]:
+    return {'type': kind, 'field': field, 'message': message, 'replacement': replacement}
+
+
+class QueryValidator:
+    """
+    Checks generated queries against the LookML join graph and repairs near misses
+
+    validate() returns {'query', 'repairs', 'errors'}: the repaired query, the
+    issues fixed on the way, and the issues it could not fix. Counters per
+    issue type show how many doomed Looker round trips were avoided.
+    """
+
+    def __init__(self, catalog: Optional[Dict[str, Any]] = None, cutoff: float = 0.8):
+        self.catalog = catalog if catalog is not None else load_catalog()
+        self.cutoff = cutoff
+        self._lock = threading.Lock()
+        self.checked = 0
+        self.valid = 0
+        self.repaired = 0
+        self.rejected = 0
+        self.reprompt_fixed = 0
+        self.reprompt_failed = 0
+        self.round_trips_avoided = 0
+        self.by_type: Dict[str, Dict[str, int]] = {}
+
+    def _fields(self, explore: str) -> Dict[str, Dict[str, Any]]:
+        return self.catalog['explores'].get(explore, {}).get('fields', {})
+
+    def resolve_field(self, explore: str, name: Any,
+                      kind: Optional[str] = None) -> Tuple[Optional[str], Optional[Dict[str, Any]]]:
+        """
+        Map a field reference to a field reachable from the explore
+
+        Returns (field, issue): the field and None for an exact match, the
+        repaired field and the repair, or None and the unrecoverable issue.
+        """
+        fields = self._fields(explore)
+        raw = str(name).strip()
+        if raw in fields:
+            return raw, None
+        text = raw.lower().replace(' ', '_')
+        if text in fields:
+            return text, _issue('unknown_field', f"{raw} -> {text}", raw, text)
+
+        # Right field, wrong or missing join alias ("dim_sales.total_sales_amount", "total_sales_amount")
+        short_name = text.rpartition('.')[2]
+        same_name = [f for f in fields if f.split('.', 1)[1] == short_name]
+        if kind and len(same_name) > 1:
+            same_name = [f for f in same_name if fields[f]['kind'] == kind] or same_name
+        if len(same_name) == 1:
+            return same_name[0], _issue('unknown_field', f"{raw} -> {same_name[0]}", raw, same_name[0])
+        if len(same_name) > 1:
+            # dim_date.year could be order or ship date - only the model can say which
+            return None, _issue(
+                'ambiguous_field',
+                f"{raw} is ambiguous in explore {explore}; use one of {', '.join(sorted(same_name))}",
+                raw)
+
+        # Typos and near-miss names ("total_sale_amount", "dim_products.category")
+        # Only fields the prompt shows are plausible targets, not hidden keys like category_id
+        visible = [f for f in fields if not fields[f]['hidden'] and not fields[f]['primary_key']]
+        candidates = [f for f in visible if not kind or fields[f]['kind'] == kind] or visible or list(fields)
+        scored = sorted(
+            ((difflib.SequenceMatcher(None, text, f).ratio(), f) for f in candidates),
+            reverse=True
+        )
+        if scored and scored[0][0] >= self.cutoff:
+            # Two equally plausible candidates is a guess, not a repair
+            if len(scored) == 1 or scored[0][0] - scored[1][0] >= 0.05:
+                best = scored[0][1]
+                return best, _issue('unknown_field', f"{raw} -> {best}", raw, best)
+
+        close = [f for score, f in scored[:3] if score >= 0.6]
+        hint = f" (closest: {', '.join(close)})" if close else ""
+        return None, _issue('unknown_field', f"{raw} is not a field of explore {explore}{hint}", raw)
+
+    def _resolve_explore(self, query: Dict[str, Any]) -> Tuple[Optional[str], Optional[Dict[str, Any]]]:
+        """Pick the explore to validate against, fixing a misspelt or mismatched one"""
+        explores = self.catalog['explores']
+        # Hidden explores (sales_analysis_wide) answer for a visible one and are never a correction
+        candidates = [name for name, explore in explores.items() if not explore.get('hidden')]
+        requested = str(query.get('explore', '')).strip()
+        references = [str(f).strip() for f in list(query.get('dimensions', [])) + list(query.get('measures', []))]
+
+        def holds_all(explore: str) -> bool:
+            fields = self._fields(explore)
+            return bool(references) and all(f in fields for f in references)
+
+        if requested in explores:
+            if holds_all(requested) or not references:
+                return requested, None
+            # Fields that all live together in a different explore mean the explore is what's wrong
+            others = [name for name in candidates if name != requested and holds_all(name)]
+            if len(others) == 1:
+                return others[0], _issue('wrong_explore', f"{requested} -> {others[0]}", requested, others[0])
+            return requested, None
+
+        matches = difflib.get_close_matches(requested.lower(), candidates, n=1, cutoff=self.cutoff)
+        if not matches:
+            # "sales" for sales_analysis
+            matches = [name for name in candidates if requested and name.startswith(requested.lower())]
+        if len(matches) == 1:
+            return matches[0], _issue('unknown_explore', f"{requested} -> {matches[0]}", requested, matches[0])
+        # Otherwise let the fields say where they live
+        resolvable = sorted(
+            ((sum(self.resolve_field(name, ref)[0] is not None for ref in references), name) for name in candidates),
+            reverse=True
+        )
+        if resolvable and resolvable[0][0] > 0 and (len(resolvable) == 1 or resolvable[0][0] > resolvable[1][0]):
+            home = resolvable[0][1]
+            return home, _issue('unknown_explore', f"{requested} -> {home}", requested, home)
+        return None, _issue(
+            'unknown_explore',
+            f"explore {requested!r} does not exist; use one of {', '.join(explores)}",
+            requested)
+
+    def check(self, query: Dict[str, Any]) -> Dict[str, Any]:
+        """Validate and repair without touching the counters"""
+        repairs: List[Dict[str, Any]] = []
+        errors: List[Dict[str, Any]] = []
+        repaired = copy.deepcopy(query)
+
+        explore, issue = self._resolve_explore(query)
+        if issue:
+            (repairs if explore else errors).append(issue)
+        if explore is None:
+            return {'query': repaired, 'repairs': repairs, 'errors': errors}
+        repaired['explore'] = explore
+        fields = self._fields(explore)
+
+        selected = {'dimensions': [], 'measures': []}
+        for slot, kind in (('dimensions', 'dimension'), ('measures', 'measure')):
+            for name in query.get(slot) or []:
+                field, issue = self.resolve_field(explore, name, kind)
+                if issue:
+                    (repairs if field else errors).append(issue)
+                if field is None:
+                    continue
+                # Looker takes one field list, but the app reads measures to pick chart axes
+                actual = 'dimensions' if fields[field]['kind'] == 'dimension' else 'measures'
+                if actual != slot:
+                    repairs.append(_issue('misplaced_field', f"{field} moved to {actual}", field, field))
+                if field not in selected[actual]:
+                    selected[actual].append(field)
+        repaired['dimensions'], repaired['measures'] = selected['dimensions'], selected['measures']
+        if not selected['dimensions'] and not selected['measures'] and not errors:
+            errors.append(_issue('no_fields', "query selects no fields"))
+
+        filters = {}
+        for key, value in (query.get('filters') or {}).items():
+            field, issue = self.resolve_field(explore, key)
+            if issue:
+                (repairs if field else errors).append(issue)
+            if field is None:
+                continue
+            if value is None or (isinstance(value, (list, str)) and len(value) == 0):
+                repairs.append(_issue('bad_filter', f"empty filter on {field} dropped", field))
+                continue
+            filters[field] = value
+        repaired['filters'] = filters
+
+        sorts = []
+        chosen = set(selected['dimensions']) | set(selected['measures'])
+        dropped_direction = None
+        for sort in query.get('sorts') or []:
+            parts = str(sort).split()
+            if not parts:
+                continue
+            direction = SORT_DIRECTIONS.get(parts[1].lower(), parts[1].lower()) if len(parts) > 1 else ''
+            if len(parts) > 2 or direction not in ('', 'asc', 'desc'):
+                repairs.append(_issue('bad_sort', f"sort {sort!r} dropped, expected '<field> [asc|desc]'", str(sort)))
+                continue
+            if len(parts) > 1 and direction != parts[1]:
+                repairs.append(_issue('bad_sort', f"{parts[1]} -> {direction}", str(sort), direction))
+            field, issue = self.resolve_field(explore, parts[0])
+            if issue:
+                issue['type'] = 'bad_sort'
+                if field is None:
+                    issue['message'] = f"sort on {parts[0]} dropped: {issue['message']}"
+                repairs.append(issue)
+            if field is not None and field not in chosen:
+                # Looker sorts by selected fields only
+                repairs.append(_issue('bad_sort', f"sort on unselected field {field} dropped", field))
+                field = None
+            if field is None:
+                dropped_direction = dropped_direction or direction or 'desc'
+                continue
+            sorts.append(f"{field} {direction}".strip())
+        if not sorts and dropped_direction and selected['measures']:
+            # A dropped sort was almost always "rank by the measure"
+            sorts.append(f"{selected['measures'][0]} {dropped_direction}")
+        repaired['sorts'] = sorts
+
+        limit = query.get('limit', 10)
+        try:
+            limit = int(str(limit).strip())
+            if limit <= 0:
+                raise ValueError(limit)
+        except ValueError:
+            repairs.append(_issue('bad_limit', f"limit {query.get('limit')!r} replaced with 10", 'limit'))
+            limit = 10
+        if limit > MAX_LIMIT:
+            repairs.append(_issue('bad_limit', f"limit {limit} lowered to {MAX_LIMIT}", 'limit'))
+            limit = MAX_LIMIT
+        repaired['limit'] = limit
+
+        return {'query': repaired, 'repairs': repairs, 'errors': errors}
+
+    def validate(self, query: Dict[str, Any], reprompt: bool = False) -> Dict[str, Any]:
+        """
+        Validate and repair a query, recording the outcome
+
+        Args:
+            query: Query config as produced by the translator
+            reprompt: True for the answer to a correction prompt
+
+        Returns:
+            {'query': repaired query, 'repairs': [...], 'errors': [...]}
+        """
+        result = self.check(query)
+        result['fatal'] = any(issue['type'] in FATAL_ISSUES for issue in result['repairs'] + result['errors'])
+        with self._lock:
+            self.checked += 1
+            if result['errors']:
+                self.rejected += 1
+            elif result['repairs']:
+                self.repaired += 1
+            else:
+                self.valid += 1
+            if reprompt:
+                if result['errors']:
+                    self.reprompt_failed += 1
+                else:
+                    self.reprompt_fixed += 1
+            for issue in result['repairs']:
+                counts = self.by_type.setdefault(issue['type'], {'repaired': 0, 'unrecoverable': 0})
+                counts['repaired'] += 1
+            for issue in result['errors']:
+                counts = self.by_type.setdefault(issue['type'], {'repaired': 0, 'unrecoverable': 0})
+                counts['unrecoverable'] += 1
+            if result['fatal']:
+                self.round_trips_avoided += 1
+        return result
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'checked': self.checked,
+                'valid': self.valid,
+                'repaired': self.repaired,
+                'rejected': self.rejected,
+                'reprompt_fixed': self.reprompt_fixed,
+                'reprompt_failed': self.reprompt_failed,
+                # Queries Looker would have rejected or mis-answered: each one a create_query/run_query pair
+                'round_trips_avoided': self.round_trips_avoided,
+                'by_type': {kind: dict(counts) for kind, counts in self.by_type.items()},
+            }
+
+
+def format_issues(issues: List[Dict[str, Any]]) -> str:
+    """Issue list as bullet lines for a correction prompt"""
+    return '\n'.join(f"- {issue['message']}" for issue in issues)
+
+
+def _perturb(query: Dict[str, Any], catalog: Dict[str, Any], rng: random.Random) -> Dict[str, Any]:
+    """Break one field reference the way models tend to: typo, wrong alias, bare name, plural"""
+    broken = copy.deepcopy(query)
+    slot = rng.choice([s for s in ('dimensions', 'measures') if broken.get(s)])
+    index = rng.randrange(len(broken[slot]))
+    alias, _, name = broken[slot][index].partition('.')
+    mode = rng.choice(['typo', 'alias', 'bare', 'plural'])
+    if mode == 'typo' and len(name) > 4:
+        cut = rng.randrange(1, len(name) - 1)
+        name = name[:cut] + name[cut + 1:]
+        broken[slot][index] = f"{alias}.{name}"
+    elif mode == 'alias':
+        aliases = {f.split('.', 1)[0] for f in catalog['explores'][broken['explore']]['fields']} - {alias}
+        broken[slot][index] = f"{rng.choice(sorted(aliases))}.{name}"
+    elif mode == 'bare':
+        broken[slot][index] = name
+    else:
+        broken[slot][index] = f"{alias}s.{name}"
+    return broken
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Validate labelled queries against the LookML catalog")
+    parser.add_argument('path', help="JSONL with {question, query} rows")
+    parser.add_argument('--perturb', type=int, default=0, help="Also check N broken copies of each query")
+    parser.add_argument('--seed', type=int, default=7)
+    args = parser.parse_args(argv)
+
+    validator = QueryValidator()
+    rng = random.Random(args.seed)
+    invalid_labels, wrong_repairs = [], 0
+    with open(args.path, 'r') as f:
+        rows = [json.loads(line) for line in f if line.strip()]
+    for row in rows:
+        query = row.get('query')
+        if not query:
+            continue
+        result = validator.validate(query)
+        if result['errors'] or result['repairs']:
+            invalid_labels.append({'question': row['question'], 'issues': result['repairs'] + result['errors']})
+        for _ in range(args.perturb):
+            broken = validator.validate(_perturb(query, validator.catalog, rng))
+            if not broken['errors'] and sorted(broken['query']['dimensions'] + broken['query']['measures']) != \
+                    sorted(query['dimensions'] + query['measures']):
+                wrong_repairs += 1
+
+    report = validator.stats()
+    report['labelled_with_issues'] = invalid_labels
+    report['wrong_repairs'] = wrong_repairs
+    print(json.dumps(report, indent=2))
+    return 0 if not invalid_labels and not wrong_repairs else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,398 @@
+import os
+import re
+import sys
+import copy
+import json
+import time
+import zlib
+import argparse
+import threading
+import numpy as np
+from typing import Dict, Any, List, Optional, Tuple
+
+from question_text import normalize_question
+
+# Words users swap freely when asking the same question
+SYNONYMS = {
+    'best': 'top', 'highest': 'top', 'most': 'top', 'largest': 'top', 'biggest': 'top', 'leading': 'top',
+    'worst': 'bottom', 'lowest': 'bottom', 'least': 'bottom', 'smallest': 'bottom',
+    'revenue': 'sales', 'sold': 'sales', 'selling': 'sales', 'sell': 'sales', 'income': 'sales',
+    'product': 'products', 'item': 'products', 'items': 'products',
+    'stock': 'inventory', 'stocks': 'inventory',
+    'rating': 'ratings', 'rated': 'ratings', 'reviews': 'ratings', 'review': 'ratings',
+    'vendor': 'vendors', 'supplier': 'vendors', 'suppliers': 'vendors',
+}
+
+# Filler words that carry no query meaning
+STOP_WORDS = {
+    'show', 'me', 'the', 'what', 'whats', 'which', 'were', 'was', 'is', 'are', 'our', 'a', 'an',
+    'of', 'please', 'give', 'list', 'tell', 'can', 'you', 'i', 'want', 'to', 'see', 'do', 'we', 'have',
+}
+
+# Phrases that only make sense against the previous answer - never reuse a stored query for these
+FOLLOW_UP_PATTERN = re.compile(
+    r'\b(it|that|those|them|same|compare|instead|also|drill|now|previous|again)\b|what about|break (it )?down'
+)
+
+YEAR_PATTERN = re.compile(r'\b(20\d{2})\b')
+NUMBER_PATTERN = re.compile(r'\b(\d+)\b')
+
+
+def canonical_text(question: str) -> str:
+    """Normalized question with synonyms folded, filler dropped and numbers masked"""
+    words = []
+    for word in normalize_question(question).split():
+        if word in STOP_WORDS:
+            continue
+        word = SYNONYMS.get(word, word)
+        if word.isdigit():
+            word = '#'
+        words.append(word)
+    return ' '.join(words)
+
+
+def is_follow_up(question: str) -> bool:
+    """True when the question refers back to a previous answer"""
+    return bool(FOLLOW_UP_PATTERN.search(normalize_question(question)))
+
+
+def extract_numbers(question: str) -> Tuple[List[str], List[str]]:
+    """Split the numbers in a question into years and plain numbers (e.g. Top N)"""
+    text = normalize_question(question)
+    years = YEAR_PATTERN.findall(text)
+    numbers = [n for n in NUMBER_PATTERN.findall(text) if n not in years]
+    return years, numbers
+
+
+class QuestionIndex:
+    """
+    Nearest-neighbour index over past (question -> validated query) pairs
+
+    Questions are embedded as TF-IDF weighted character n-grams hashed into a
+    fixed number of buckets, so new pairs are added incrementally without
+    refitting a vocabulary. Lookups return a stored query when cosine
+    similarity passes the threshold, with Top N limits, years and known
+    filter values swapped for the ones in the new question.
+
+    Term frequencies live in a ring of rows (grown by doubling up to
+    max_entries, then the oldest row is overwritten), entries are keyed by
+    normalized question, and the IDF-weighted, normalized matrix is built
+    once per add rather than once per lookup. The file is an append-only log
+    of JSON lines, compacted when it holds twice max_entries lines.
+    """
+
+    def __init__(self, path: Optional[str] = None, threshold: float = 0.85,
+                 dims: int = 4096, ngram_range: Tuple[int, int] = (3, 5), max_entries: int = 5000):
+        self.path = path
+        self.threshold = threshold
+        self.dims = dims
+        self.ngram_range = ngram_range
+        self.max_entries = max_entries
+        # Row i of _tf belongs to questions[i] / queries[i]
+        self.questions: List[str] = []
+        self.queries: List[Dict[str, Any]] = []
+        self._rows: Dict[str, int] = {}
+        # Once full, the row overwritten next (the oldest)
+        self._oldest = 0
+        self._tf = np.zeros((min(64, max_entries), dims), dtype=np.float32)
+        self._df = np.zeros(dims, dtype=np.float32)
+        # (idf, normalized weighted rows), rebuilt on the first lookup after an add
+        self._weighted: Optional[Tuple[np.ndarray, np.ndarray]] = None
+        self._logged = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self._load()
+
+    def _term_frequencies(self, question: str) -> np.ndarray:
+        text = f" {canonical_text(question)} "
+        vector = np.zeros(self.dims, dtype=np.float32)
+        low, high = self.ngram_range
+        for n in range(low, high + 1):
+            for i in range(len(text) - n + 1):
+                vector[zlib.crc32(text[i:i + n].encode('utf-8')) % self.dims] += 1.0
+        return vector
+
+    def _idf(self) -> np.ndarray:
+        n_docs = len(self.questions)
+        return np.log((1.0 + n_docs) / (1.0 + self._df)) + 1.0
+
+    @staticmethod
+    def _normalize_rows(matrix: np.ndarray) -> np.ndarray:
+        norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+        return matrix / np.maximum(norms, 1e-12)
+
+    def _load(self) -> None:
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, 'r') as f:
+                text = f.read()
+        except OSError as e:
+            print(f"Question index could not be loaded, starting empty: {str(e)}")
+            return
+        if text.lstrip().startswith('['):
+            # Written as one JSON list before the log format
+            try:
+                pairs = json.loads(text)
+            except ValueError as e:
+                print(f"Question index could not be loaded, starting empty: {str(e)}")
+                return
+        else:
+            pairs = []
+            for line in text.splitlines():
+                try:
+                    pairs.append(json.loads(line))
+                except ValueError:
+                    # A line torn by a crash mid-append
+                    continue
+        for pair in pairs:
+            self._add(pair['question'], pair['query'])
+        self._logged = len(pairs)
+        if text.lstrip().startswith('['):
+            self._compact()
+
+    def _pairs(self) -> List[Dict[str, Any]]:
+        """Stored pairs, oldest first"""
+        order = list(range(self._oldest, len(self.questions))) + list(range(self._oldest))
+        return [{'question': self.questions[i], 'query': self.queries[i]} for i in order]
+
+    def _compact(self) -> None:
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp_path, 'w') as f:
+                for pair in self._pairs():
+                    f.write(json.dumps(pair) + '\n')
+            os.replace(tmp_path, self.path)
+            self._logged = len(self.questions)
+        except OSError as e:
+            print(f"Question index could not be saved: {str(e)}")
+
+    def _save(self, question: str, query: Dict[str, Any]) -> None:
+        if not self.path:
+            return
+        if self._logged >= 2 * self.max_entries:
+            self._compact()
+            return
+        try:
+            with open(self.path, 'a') as f:
+                f.write(json.dumps({'question': question, 'query': query}) + '\n')
+            self._logged += 1
+        except OSError as e:
+            print(f"Question index could not be saved: {str(e)}")
+
+    def _add(self, question: str, query: Dict[str, Any]) -> None:
+        normalized = normalize_question(question)
+        row = self._rows.get(normalized)
+        if row is not None:
+            # Same wording - keep the latest translation
+            self.queries[row] = copy.deepcopy(query)
+            return
+        tf = self._term_frequencies(question)
+        if len(self.questions) < self.max_entries:
+            row = len(self.questions)
+            if row == len(self._tf):
+                grown = np.zeros((min(2 * row, self.max_entries), self.dims), dtype=np.float32)
+                grown[:row] = self._tf
+                self._tf = grown
+            self.questions.append(question)
+            self.queries.append(copy.deepcopy(query))
+        else:
+            # Overwrite the oldest pair to stay bounded
+            row = self._oldest
+            self._oldest = (row + 1) % self.max_entries
+            self._df -= (self._tf[row] > 0)
+            del self._rows[normalize_question(self.questions[row])]
+            self.questions[row] = question
+            self.queries[row] = copy.deepcopy(query)
+        self._tf[row] = tf
+        self._df += (tf > 0)
+        self._rows[normalized] = row
+        self._weighted = None
+
+    def add(self, question: str, query: Dict[str, Any]) -> None:
+        """Record a successfully translated question (incremental, no refit)"""
+        with self._lock:
+            self._add(question, query)
+            self._save(question, query)
+
+    def nearest(self, question: str) -> Optional[Tuple[float, int]]:
+        """Return (similarity, position) of the closest stored question"""
+        if not self.questions:
+            return None
+        if self._weighted is None:
+            idf = self._idf()
+            self._weighted = idf, self._normalize_rows(self._tf[:len(self.questions)] * idf)
+        idf, stored_vectors = self._weighted
+        query_vector = self._normalize_rows(self._term_frequencies(question) * idf)
+        similarities = stored_vectors @ query_vector
+        best = int(np.argmax(similarities))
+        return float(similarities[best]), best
+
+    def _known_filter_values(self, field: str) -> List[str]:
+        values = set()
+        for query in self.queries:
+            value = query.get('filters', {}).get(field)
+            if isinstance(value, str) and value and not value.replace(',', '').isdigit():
+                values.add(value)
+        # Prefer longer values so "Road Bikes" wins over "Bikes"
+        return sorted(values, key=len, reverse=True)
+
+    def _adapt(self, stored_question: str, stored_query: Dict[str, Any], question: str) -> Optional[Dict[str, Any]]:
+        """Swap numbers and filter values from the stored question for the new one, or give up"""
+        query = copy.deepcopy(stored_query)
+        old_years, old_numbers = extract_numbers(stored_question)
+        new_years, new_numbers = extract_numbers(question)
+
+        # Top N: the stored limit came from the stored question's number
+        if old_numbers or new_numbers:
+            if len(old_numbers) != len(new_numbers):
+                return None
+            if old_numbers and str(query.get('limit')) == old_numbers[0]:
+                query['limit'] = int(new_numbers[0])
+            elif old_numbers != new_numbers:
+                return None
+
+        # Years: rewrite any filter value built from the stored question's years
+        if old_years != new_years:
+            if len(old_years) != len(new_years):
+                return None
+            year_map = dict(zip(old_years, new_years))
+            for field, value in query.get('filters', {}).items():
+                parts = [p.strip() for p in str(value).split(',')]
+                if any(p in year_map for p in parts):
+                    query['filters'][field] = ','.join(year_map.get(p, p) for p in parts)
+
+        # Entities: a filter value named in the stored question must be named (or swapped) in the new one
+        old_text = normalize_question(stored_question)
+        new_text = normalize_question(question)
+        for field, value in list(query.get('filters', {}).items()):
+            normalized_value = normalize_question(str(value))
+            if not normalized_value or normalized_value.replace(' ', '').isdigit():
+                continue
+            if normalized_value not in old_text or normalized_value in new_text:
+                continue
+            replacement = None
+            for candidate in self._known_filter_values(field):
+                if normalize_question(candidate) in new_text:
+                    replacement = candidate
+                    break
+            if replacement is None:
+                return None
+            query['filters'][field] = replacement
+
+        return query
+
+    def lookup(self, question: str, conversation_history: Optional[list] = None) -> Optional[Dict[str, Any]]:
+        """
+        Reuse a stored query for a paraphrase of a past question
+
+        Args:
+            question: Natural language question
+            conversation_history: Previous messages; follow-up phrasing is never answered from the index
+
+        Returns:
+            Adapted query dict, or None when no stored question is close enough
+        """
+        with self._lock:
+            if conversation_history and is_follow_up(question):
+                self.misses += 1
+                return None
+            match = self.nearest(question)
+            if match is None or match[0] < self.threshold:
+                self.misses += 1
+                return None
+            query = self._adapt(self.questions[match[1]], self.queries[match[1]], question)
+            if query is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+        return query
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self.questions),
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+            }
+
+
+def same_query(a: Dict[str, Any], b: Dict[str, Any]) -> bool:
+    """Compare two queries the way Looker would answer them"""
+    def canonical(query):
+        filters = {k: ','.join(str(x) for x in v) if isinstance(v, list) else str(v)
+                   for k, v in (query.get('filters') or {}).items()}
+        return (
+            query.get('explore'),
+            sorted(query.get('dimensions', []) + query.get('measures', [])),
+            filters,
+            str(query.get('limit', 10)),
+        )
+    return canonical(a) == canonical(b)
+
+
+def evaluate(seed: List[Dict[str, Any]], labelled: List[Dict[str, Any]], threshold: float) -> Dict[str, Any]:
+    """
+    Offline evaluation: index the seed pairs, then answer the labelled questions
+
+    Precision counts answered questions whose query matches the label;
+    coverage is the share of labelled questions answered without the LLM.
+    """
+    index = QuestionIndex(threshold=threshold)
+    for pair in seed:
+        index.add(pair['question'], pair['query'])
+
+    latencies = []
+    answered = correct = 0
+    misses = []
+    for pair in labelled:
+        start = time.perf_counter()
+        query = index.lookup(pair['question'])
+        latencies.append((time.perf_counter() - start) * 1000)
+        if query is None:
+            continue
+        answered += 1
+        if same_query(query, pair['query']):
+            correct += 1
+        else:
+            misses.append(pair['question'])
+
+    latencies = np.array(latencies) if latencies else np.zeros(1)
+    return {
+        'threshold': threshold,
+        'seed_pairs': len(seed),
+        'labelled': len(labelled),
+        'answered': answered,
+        'coverage': answered / len(labelled) if labelled else 0.0,
+        'precision': correct / answered if answered else 0.0,
+        'latency_ms_p50': float(np.percentile(latencies, 50)),
+        'latency_ms_p95': float(np.percentile(latencies, 95)),
+        'wrong_answers': misses,
+    }
+
+
+def _read_jsonl(path: str) -> List[Dict[str, Any]]:
+    with open(path, 'r') as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Evaluate the question similarity index offline")
+    parser.add_argument('labelled', help="JSONL of {question, query, [seed]} pairs")
+    parser.add_argument('--threshold', type=float, nargs='+', default=[0.75, 0.8, 0.85, 0.9])
+    args = parser.parse_args(argv)
+
+    pairs = _read_jsonl(args.labelled)
+    seed = [p for p in pairs if p.get('seed')]
+    labelled = [p for p in pairs if not p.get('seed')]
+    for threshold in args.threshold:
+        report = evaluate(seed, labelled, threshold)
+        print(json.dumps(report))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
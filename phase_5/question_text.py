@@ -0,0 +1,18 @@
+import re
+
+NUMBER_WORDS = {
+    'one': '1', 'two': '2', 'three': '3', 'four': '4', 'five': '5',
+    'six': '6', 'seven': '7', 'eight': '8', 'nine': '9', 'ten': '10',
+    'eleven': '11', 'twelve': '12', 'thirteen': '13', 'fourteen': '14',
+    'fifteen': '15', 'sixteen': '16', 'seventeen': '17', 'eighteen': '18',
+    'nineteen': '19', 'twenty': '20', 'thirty': '30', 'forty': '40',
+    'fifty': '50', 'hundred': '100'
+}
+
+
+def normalize_question(question: str) -> str:
+    """Lowercase, strip punctuation, collapse whitespace and turn number words into digits"""
+    text = question.lower().replace("'", '')
+    text = re.sub(r'[^\w\s]', ' ', text)
+    words = [NUMBER_WORDS.get(word, word) for word in text.split()]
+    return ' '.join(words)
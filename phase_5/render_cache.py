@@ -0,0 +1,181 @@
+"""
+Per-message render artifacts, built once and memoized by message ID
+
+Streamlit reruns the whole script on every interaction, and app.py redraws
+every message of the conversation each time. What a message needs for
+display (chart columns, the Plotly figure, metric tiles, statistics and
+the CSV download bytes) only depends on its results, so
+build_artifacts() computes it on the message's first render and RenderCache
+keeps it, bounded, in the session. Only the last HISTORY_RENDER_LAST
+messages render in full; older ones show a one-line summary until expanded.
+
+Artifacts are as large as the result they are built from (the CSV bytes
+alone usually are larger), so each set is charged to its result in the
+session's result store and counts toward RESULT_STORE_SESSION_MB and
+RESULT_STORE_TOTAL_MB. When the store spills the result, its artifacts are
+dropped too and rebuilt from the reloaded result the next time it is drawn.
+
+Streamlit still serializes a cached figure on each redraw; caching skips
+rebuilding it with Plotly Express, which is where the time goes.
+"""
+import os
+import time
+import threading
+from collections import OrderedDict
+from contextlib import nullcontext
+from typing import Any, Callable, Dict, List
+
+import pandas as pd
+
+from charts import chart_columns, build_chart
+from large_results import spooled_csv
+
+# Messages rendered in full at the bottom of the conversation; older ones are summarized
+HISTORY_RENDER_LAST = int(os.getenv('HISTORY_RENDER_LAST', '5'))
+# Artifact sets kept per session (least recently rendered dropped first)
+RENDER_CACHE_ENTRIES = int(os.getenv('RENDER_CACHE_ENTRIES', '20'))
+
+MONEY_WORDS = ('amount', 'sales', 'revenue')
+
+
+def _label(col: str, joiner: str = ' ') -> str:
+    return col.replace('_', ' ').replace('.', joiner).title()
+
+
+def format_metric(col: str, value: float) -> str:
+    """Compact tile value: 1.2M / 3.4K / 567, with $ for money-like columns"""
+    money = '$' if any(word in col.lower() for word in MONEY_WORDS) else ''
+    if value > 1000000:
+        return f"{money}{value/1000000:.1f}M"
+    if value > 1000:
+        return f"{money}{value/1000:.1f}K"
+    return f"{money}{value:,.0f}"
+
+
+def build_artifacts(df: pd.DataFrame, large: bool = False, trace=None) -> Dict[str, Any]:
+    """
+    Everything the history needs to draw one answer
+
+    Args:
+        df: The message's results
+        large: Whether it came through large-result mode (table preview, spooled CSV)
+        trace: The message's open trace, so the first chart build is timed as its "chart" span
+
+    Returns:
+        Dict with metrics, figure, stats, csv/csv_path, the chart columns and their
+        approximate size in bytes (never the DataFrame itself, which the result
+        store may spill to disk)
+    """
+    artifacts: Dict[str, Any] = {'figure': None, 'metrics': [], 'stats': [], 'csv': None, 'csv_path': None}
+    dimension_col = measure_col = None
+    if len(df) > 0 and len(df.columns) >= 2:
+        # Dimension (grouping) and measure (metric) columns, picked by name
+        dimension_col, measure_col = chart_columns(df)
+    artifacts['dimension_col'], artifacts['measure_col'] = dimension_col, measure_col
+
+    # A numeric dimension (e.g. year) is plotted as a category, so it is not a metric either
+    numeric_cols = [col for col in df.select_dtypes(include=['number']).columns if col != dimension_col]
+
+    if not df.empty:
+        for col in df.columns[:4]:
+            if col in numeric_cols:
+                value = df[col].sum() if len(df) > 1 else df[col].iloc[0]
+                artifacts['metrics'].append((_label(col), format_metric(col, value)))
+
+    if dimension_col and measure_col:
+        # Bar chart for comparisons, line chart for trends
+        with (trace.span('chart') if trace is not None else nullcontext()):
+            artifacts['figure'] = build_chart(df, dimension_col, measure_col)
+
+    for col in numeric_cols[:2]:
+        artifacts['stats'].append((_label(col, ' - '), df[col].max(), df[col].min(), df[col].mean()))
+
+    # Spooled large results are read from their file when downloaded, not re-serialized
+    artifacts['csv_path'] = spooled_csv(df) if large else None
+    if artifacts['csv_path'] is None:
+        artifacts['csv'] = df.to_csv(index=False).encode('utf-8')
+    artifacts['bytes'] = len(artifacts['csv'] or b'')
+    if artifacts['figure'] is not None:
+        # The figure keeps its own copy of the two plotted columns
+        artifacts['bytes'] += int(df[[dimension_col, measure_col]].memory_usage(deep=True, index=False).sum())
+    return artifacts
+
+
+class RenderCache:
+    """
+    LRU of message ID -> render artifacts, kept in st.session_state
+
+    With results (the session's SessionResults), each set is charged to the
+    result it was built from; the store may then drop it from another
+    session's thread when it spills that result.
+    """
+
+    def __init__(self, max_entries: int = RENDER_CACHE_ENTRIES, results=None):
+        self.max_entries = max_entries
+        self.results = results
+        self._entries: "OrderedDict[Any, Dict[str, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.build_ms = 0.0
+
+    def get(self, message_id: Any, build: Callable[[], Dict[str, Any]]) -> Dict[str, Any]:
+        with self._lock:
+            artifacts = self._entries.get(message_id)
+            if artifacts is not None:
+                self._entries.move_to_end(message_id)
+                self.hits += 1
+                return artifacts
+        self.misses += 1
+        start = time.perf_counter()
+        artifacts = build()
+        self.build_ms += (time.perf_counter() - start) * 1000
+        dropped = []
+        with self._lock:
+            self._entries[message_id] = artifacts
+            while len(self._entries) > self.max_entries:
+                dropped.append(self._entries.popitem(last=False)[0])
+        # Outside the lock: charging may spill results, and spilling calls discard()
+        if self.results is not None:
+            for old_id in dropped:
+                self.results.charge(old_id, 0)
+            self.results.charge(message_id, artifacts.get('bytes', 0),
+                                release=lambda: self.discard([message_id]))
+        return artifacts
+
+    def discard(self, message_ids: List[Any]) -> None:
+        with self._lock:
+            for message_id in message_ids:
+                self._entries.pop(message_id, None)
+
+    def total_bytes(self) -> int:
+        with self._lock:
+            return sum(artifacts.get('bytes', 0) for artifacts in self._entries.values())
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            'entries': len(self._entries),
+            'bytes': self.total_bytes(),
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+            'avg_build_ms': self.build_ms / self.misses if self.misses else 0.0,
+        }
+
+
+def message_id(msg: Dict[str, Any]) -> Any:
+    """Stable key for a message (messages from before IDs existed fall back to their timestamp)"""
+    return msg.get('id', msg.get('timestamp'))
+
+
+def summary_line(msg: Dict[str, Any]) -> str:
+    """One-line stand-in for a collapsed older answer"""
+    if 'error' in msg:
+        return f"Error: {msg['error'][:120]}"
+    parts = [f"{msg.get('row_count', 0):,} rows"]
+    explore = (msg.get('query') or {}).get('explore')
+    if explore:
+        parts.append(explore)
+    parts.append(f"{msg.get('response_time', 0):.2f}s")
+    return ' · '.join(parts)
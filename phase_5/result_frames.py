@@ -0,0 +1,242 @@
+"""
+Typed, Arrow-backed DataFrames for query results
+
+The JSON path turns every cell into a Python object (json.loads -> list of
+dicts -> pd.DataFrame) and leaves pandas to guess dtypes. Here the LookML
+type of each requested field decides the column type up front, and the
+payload is parsed column-wise by Arrow:
+
+- measures: count/count_distinct -> int64, everything else -> float64
+- number dimensions and year timeframes -> numeric (int64 when integral)
+- yesno dimensions -> bool
+- string, tier and other timeframe dimensions -> dictionary-encoded, so
+  repeated values are stored once; they arrive in pandas as categoricals
+
+Numeric columns stay Arrow-backed (pd.ArrowDtype) in the DataFrame.
+
+    python result_frames.py --rows 5000 50000 500000   # parse time / peak memory vs the JSON path
+"""
+import io
+import os
+import sys
+import json
+import time
+import argparse
+import subprocess
+from typing import Dict, Any, Iterator, List, Optional, Union
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv as pa_csv
+
+# Measure types whose values are always whole numbers
+INTEGER_MEASURES = {'count', 'count_distinct'}
+# Timeframes that are plain numbers rather than labels
+NUMERIC_TIMEFRAMES = {'date_year', 'date_day_of_month', 'date_month_num', 'date_quarter_of_year'}
+
+DICTIONARY = pa.dictionary(pa.int32(), pa.string())
+
+
+def field_types(catalog: Dict[str, Any], explore: str, fields: List[str]) -> Dict[str, Dict[str, str]]:
+    """kind and LookML type of each requested field (string dimension when unknown)"""
+    explore_fields = catalog.get('explores', {}).get(explore, {}).get('fields', {})
+    return {
+        field: {
+            'kind': explore_fields.get(field, {}).get('kind', 'dimension'),
+            'type': explore_fields.get(field, {}).get('type', 'string'),
+        }
+        for field in fields
+    }
+
+
+def arrow_type(meta: Dict[str, str]) -> Optional[pa.DataType]:
+    """Target Arrow type for a field; None lets the parser infer a number"""
+    if meta['kind'] == 'measure':
+        return pa.int64() if meta['type'] in INTEGER_MEASURES else pa.float64()
+    if meta['type'] == 'yesno':
+        return pa.bool_()
+    if meta['type'] == 'number' or meta['type'] in NUMERIC_TIMEFRAMES:
+        return None
+    return DICTIONARY
+
+
+def _to_pandas(table: pa.Table) -> pd.DataFrame:
+    # Dictionary columns become pandas categoricals; everything else keeps its Arrow type
+    return table.to_pandas(types_mapper=lambda t: None if pa.types.is_dictionary(t) else pd.ArrowDtype(t))
+
+
+def _csv_convert_options(fields: List[str], types: Dict[str, Dict[str, str]]) -> pa_csv.ConvertOptions:
+    column_types = {}
+    for field in fields:
+        target = arrow_type(types.get(field, {'kind': 'dimension', 'type': 'string'}))
+        if target is not None:
+            column_types[field] = target
+    return pa_csv.ConvertOptions(
+        column_types=column_types,
+        strings_can_be_null=True,
+        true_values=['Yes', 'yes', 'true', 'TRUE'],
+        false_values=['No', 'no', 'false', 'FALSE'],
+    )
+
+
+def frame_from_csv(payload: Union[str, bytes], fields: List[str], types: Dict[str, Dict[str, str]]) -> pd.DataFrame:
+    """
+    Parse a Looker CSV result into a typed DataFrame
+
+    Looker's CSV header holds field labels, not names, so columns are named
+    positionally from the query's field list (Looker keeps that order).
+    """
+    data = payload.encode('utf-8') if isinstance(payload, str) else payload
+    table = pa_csv.read_csv(
+        io.BytesIO(data),
+        read_options=pa_csv.ReadOptions(column_names=fields, skip_rows=1),
+        convert_options=_csv_convert_options(fields, types),
+    )
+    return _to_pandas(table)
+
+
+def csv_batches(payload: Union[str, bytes], fields: List[str], types: Dict[str, Dict[str, str]],
+                block_size: int = 1 << 20) -> Iterator[pa.RecordBatch]:
+    """The same parse as frame_from_csv, one block (about block_size bytes of CSV) at a time"""
+    data = payload.encode('utf-8') if isinstance(payload, str) else payload
+    reader = pa_csv.open_csv(
+        io.BytesIO(data),
+        read_options=pa_csv.ReadOptions(column_names=fields, skip_rows=1, block_size=block_size),
+        convert_options=_csv_convert_options(fields, types),
+    )
+    for batch in reader:
+        yield batch
+
+
+def frame_from_arrow(table: pa.Table, types: Dict[str, Dict[str, str]]) -> pd.DataFrame:
+    """Cast an Arrow result (e.g. from DuckDB) to the LookML types, then hand it to pandas"""
+    columns = []
+    for name, column in zip(table.column_names, table.columns):
+        meta = types.get(name, {'kind': 'dimension', 'type': 'string'})
+        target = arrow_type(meta)
+        if target is None:
+            # Numbers arrive as DECIMAL from SUM/AVG in DuckDB
+            if pa.types.is_decimal(column.type):
+                column = column.cast(pa.float64())
+        elif target == DICTIONARY:
+            if not pa.types.is_dictionary(column.type):
+                column = pc.dictionary_encode(column.cast(pa.string()))
+        elif column.type != target:
+            column = column.cast(target)
+        columns.append(column)
+    return _to_pandas(pa.Table.from_arrays(columns, names=table.column_names))
+
+
+# --- benchmark -------------------------------------------------------------------------------
+
+BENCHMARK_FIELDS = [
+    ('dim_product.product_name', 'dimension', 'string'),
+    ('dim_product.category_name', 'dimension', 'string'),
+    ('dim_territory.territory_name', 'dimension', 'string'),
+    ('dim_date_order.year', 'dimension', 'number'),
+    ('dim_date_order.month_name', 'dimension', 'string'),
+    ('fct_sales.total_sales_amount', 'measure', 'sum'),
+    ('fct_sales.total_quantity', 'measure', 'sum'),
+    ('fct_sales.order_count', 'measure', 'count_distinct'),
+]
+
+
+def _benchmark_payloads(rows: int, out_dir: str, seed: int) -> Dict[str, str]:
+    """A product x territory x month shaped result as Looker JSON and CSV files"""
+    rng = np.random.default_rng(seed)
+    months = ['January', 'February', 'March', 'April', 'May', 'June', 'July',
+              'August', 'September', 'October', 'November', 'December']
+    frame = pd.DataFrame({
+        'dim_product.product_name': [f"Product {i}" for i in rng.integers(0, 504, rows)],
+        'dim_product.category_name': np.array(['Bikes', 'Components', 'Clothing', 'Accessories'])[rng.integers(0, 4, rows)],
+        'dim_territory.territory_name': [f"Territory {i}" for i in rng.integers(0, 10, rows)],
+        'dim_date_order.year': rng.integers(2011, 2015, rows),
+        'dim_date_order.month_name': np.array(months)[rng.integers(0, 12, rows)],
+        'fct_sales.total_sales_amount': np.round(rng.lognormal(8, 1.5, rows), 4),
+        'fct_sales.total_quantity': rng.integers(1, 500, rows).astype(float),
+        'fct_sales.order_count': rng.integers(1, 200, rows),
+    })
+    paths = {'json': os.path.join(out_dir, f"result_{rows}.json"),
+             'csv': os.path.join(out_dir, f"result_{rows}.csv")}
+    frame.to_json(paths['json'], orient='records')
+    # Looker writes labels in the header row
+    labels = [name.split('.')[-1].replace('_', ' ').title() for name in frame.columns]
+    frame.to_csv(paths['csv'], index=False, header=labels)
+    return paths
+
+
+def _parse(payload: bytes, mode: str) -> pd.DataFrame:
+    if mode == 'json':
+        return pd.DataFrame(json.loads(payload))
+    fields = [name for name, _, _ in BENCHMARK_FIELDS]
+    types = {name: {'kind': kind, 'type': lookml_type} for name, kind, lookml_type in BENCHMARK_FIELDS}
+    return frame_from_csv(payload, fields, types)
+
+
+def _measure(path: str, mode: str) -> Dict[str, Any]:
+    """Parse one payload in this (fresh) process: once under tracemalloc, then timed"""
+    import gc
+    import tracemalloc
+    with open(path, 'rb') as f:
+        payload = f.read()
+
+    # Python/NumPy allocations are traced; Arrow buffers come from its own pool, whose peak is separate.
+    # Memory first, while the pool's high-water mark still belongs to this parse alone
+    arrow_before = pa.default_memory_pool().max_memory()
+    tracemalloc.start()
+    df = _parse(payload, mode)
+    _, python_peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    arrow_peak = max(0, pa.default_memory_pool().max_memory() - arrow_before)
+    frame_bytes = int(df.memory_usage(deep=True).sum())
+    numeric = all(pd.api.types.is_numeric_dtype(df[name]) for name, kind, _ in BENCHMARK_FIELDS if kind == 'measure')
+    del df
+    gc.collect()
+
+    start = time.perf_counter()
+    df = _parse(payload, mode)
+    seconds = time.perf_counter() - start
+    return {
+        'rows': len(df),
+        'payload_mb': round(len(payload) / 1e6, 2),
+        'parse_ms': round(seconds * 1000, 1),
+        'peak_mb': round((python_peak + arrow_peak) / 1e6, 1),
+        'frame_mb': round(frame_bytes / 1e6, 2),
+        'numeric_measures': numeric,
+    }
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Compare JSON -> list of dicts -> DataFrame with typed CSV ingestion")
+    parser.add_argument('--rows', type=int, nargs='+', default=[5000, 50000, 500000])
+    parser.add_argument('--seed', type=int, default=7)
+    parser.add_argument('--keep', default=None, help="Directory to keep the generated payloads in")
+    parser.add_argument('--measure', nargs=2, metavar=('MODE', 'PATH'), help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.measure:
+        print(json.dumps(_measure(args.measure[1], args.measure[0])))
+        return 0
+
+    import tempfile
+    out_dir = args.keep or tempfile.mkdtemp(prefix='result_frames_')
+    os.makedirs(out_dir, exist_ok=True)
+    print(f"{'rows':>8} {'path':<6} {'payload MB':>10} {'parse ms':>9} {'peak MB':>8} {'frame MB':>9} {'numeric':>8}")
+    for rows in args.rows:
+        paths = _benchmark_payloads(rows, out_dir, args.seed)
+        for mode in ('json', 'csv'):
+            # One process per case so peak RSS is not inherited from the previous one
+            output = subprocess.run(
+                [sys.executable, os.path.abspath(__file__), '--measure', mode, paths[mode]],
+                check=True, capture_output=True, text=True,
+            ).stdout
+            result = json.loads(output)
+            print(f"{rows:>8} {mode:<6} {result['payload_mb']:>10} {result['parse_ms']:>9} "
+                  f"{result['peak_mb']:>8} {result['frame_mb']:>9} {str(result['numeric_measures']):>8}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
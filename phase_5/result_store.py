@@ -0,0 +1,491 @@
+"""
+Conversation results kept under a memory budget, spilled to Parquet on disk
+
+Every answer used to keep its full DataFrame in st.session_state for as
+long as the session lived. Now app.py hands results to a ResultStore (one
+per process, shared by all sessions) and keeps only the message ID:
+
+- on insert, columns are downcast to the smallest type that holds them
+  exactly (int64 counts -> int16/int32, float64 -> float32 only when no
+  value changes, repeated strings -> categoricals)
+- results stay in memory while their session is under
+  RESULT_STORE_SESSION_MB and the process under RESULT_STORE_TOTAL_MB;
+  past either budget the least recently used ones are written to
+  zstd-compressed Parquet in RESULT_STORE_DIR and dropped from memory
+- a spilled result is read back when it is needed again (its answer is
+  drawn, or the conversation is exported), and counts as recent again
+- what a session builds from a result for display (render_cache.py's
+  chart and CSV download bytes) is charged to the result, and dropped
+  with its in-memory copy when it is spilled
+
+Results never change, so a result is written at most once; spilling it a
+second time only drops the in-memory copy. Results the conversation store
+already holds are never written here at all: spilling drops them and they
+are read back from SQLite. A session's files, including the CSVs that
+large results were spooled to (large_results.py), are deleted when
+Streamlit discards its session state; discarding a result deletes its CSV.
+
+    python result_store.py --sessions 8 --results 40 --session-mb 8 --total-mb 32   # memory vs disk
+"""
+import os
+import sys
+import glob
+import time
+import uuid
+import shutil
+import argparse
+import threading
+import weakref
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from large_results import remove_spool
+
+RESULT_STORE_DIR = os.getenv(
+    'RESULT_STORE_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), '.result_store')
+)
+RESULT_STORE_SESSION_MB = float(os.getenv('RESULT_STORE_SESSION_MB', '64'))
+RESULT_STORE_TOTAL_MB = float(os.getenv('RESULT_STORE_TOTAL_MB', '512'))
+RESULT_STORE_TTL_HOURS = float(os.getenv('RESULT_STORE_TTL_HOURS', '24'))
+
+MB = 1024 * 1024
+INTEGER_STEPS = [(np.int8, pa.int8()), (np.int16, pa.int16()), (np.int32, pa.int32())]
+
+
+def _downcast_column(column: pd.Series) -> pd.Series:
+    dtype = column.dtype
+    if isinstance(dtype, pd.ArrowDtype):
+        arrow_type = dtype.pyarrow_dtype
+        if pa.types.is_integer(arrow_type) and arrow_type.bit_width > 8 and column.notna().any():
+            low, high = column.min(), column.max()
+            for numpy_type, target in INTEGER_STEPS:
+                if target.bit_width >= arrow_type.bit_width:
+                    break
+                if np.iinfo(numpy_type).min <= low and high <= np.iinfo(numpy_type).max:
+                    return column.astype(pd.ArrowDtype(target))
+        elif pa.types.is_float64(arrow_type):
+            narrowed = column.astype(pd.ArrowDtype(pa.float32()))
+            if (narrowed.astype(dtype) == column).fillna(True).all():
+                return narrowed
+        return column
+    if pd.api.types.is_integer_dtype(dtype):
+        return pd.to_numeric(column, downcast='integer')
+    if pd.api.types.is_float_dtype(dtype):
+        narrowed = column.astype(np.float32)
+        if ((narrowed.astype(dtype) == column) | column.isna()).all():
+            return narrowed
+        return column
+    if dtype == object and pd.api.types.infer_dtype(column, skipna=True) == 'string':
+        if column.nunique() <= len(column) // 2:
+            return column.astype('category')
+    return column
+
+
+def downcast(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Copy of df with each column in the smallest type that holds its values exactly
+
+    Floats only become float32 when every value survives the round trip, so
+    money columns with cents normally stay float64.
+    """
+    out = pd.DataFrame({col: _downcast_column(df[col]) for col in df.columns}, index=df.index)
+    out.attrs = dict(df.attrs)
+    return out
+
+
+def _frame_bytes(df: pd.DataFrame) -> int:
+    return int(df.memory_usage(deep=True, index=False).sum())
+
+
+def _expire(store_dir: str) -> None:
+    # Files left behind by processes that exited without cleaning up
+    cutoff = time.time() - RESULT_STORE_TTL_HOURS * 3600
+    for path in glob.glob(os.path.join(store_dir, '*', '*.parquet')):
+        try:
+            if os.path.getmtime(path) < cutoff:
+                os.remove(path)
+        except OSError:
+            pass
+
+
+class _Entry:
+    def __init__(self, session_id: str, key: Any, frame: pd.DataFrame, original_bytes: int):
+        self.session_id = session_id
+        self.key = key
+        self.frame: Optional[pd.DataFrame] = frame
+        self.attrs = dict(frame.attrs)
+        self.rows = len(frame)
+        self.bytes = _frame_bytes(frame)
+        self.original_bytes = original_bytes
+        self.path: Optional[str] = None
+        self.disk_bytes = 0
+        # Set when the result is also kept elsewhere (the conversation store): spilling
+        # then only drops the in-memory copy, and this reads it back
+        self.reload: Optional[Callable[[], Optional[pd.DataFrame]]] = None
+        # Render artifacts built from the result, counted in the budgets while it is
+        # in memory; release drops them when it is spilled
+        self.extra_bytes = 0
+        self.release: Optional[Callable[[], None]] = None
+        # Serializes spill/reload of this entry without holding up the whole store
+        self.lock = threading.Lock()
+
+
+class ResultStore:
+    """
+    Results of every session, in memory up to a per-session and a process budget
+
+    Keys only need to be unique within a session (app.py uses message IDs).
+    The result most recently put or read in a session is never spilled, even
+    when it alone is over budget - it is about to be drawn.
+    """
+
+    def __init__(self, store_dir: str = RESULT_STORE_DIR, session_mb: float = RESULT_STORE_SESSION_MB,
+                 total_mb: float = RESULT_STORE_TOTAL_MB):
+        self.store_dir = store_dir
+        self.session_budget = int(session_mb * MB)
+        self.total_budget = int(total_mb * MB)
+        self._lock = threading.Lock()
+        self._entries: Dict[Tuple[str, Any], _Entry] = {}
+        # In-memory entries, least recently used first
+        self._memory: "OrderedDict[Tuple[str, Any], _Entry]" = OrderedDict()
+        self._session_bytes: Dict[str, int] = {}
+        self._total_bytes = 0
+        self._expired = False
+        self.spills = 0
+        self.writes = 0
+        self.loads = 0
+        self.load_ms = 0.0
+
+    # --- bookkeeping (callers hold self._lock) ---
+
+    def _admit(self, entry: _Entry) -> None:
+        id_ = (entry.session_id, entry.key)
+        if id_ not in self._memory:
+            self._session_bytes[entry.session_id] = self._session_bytes.get(entry.session_id, 0) + entry.bytes
+            self._total_bytes += entry.bytes
+        self._memory[id_] = entry
+        self._memory.move_to_end(id_)
+
+    def _evict(self, entry: _Entry) -> None:
+        id_ = (entry.session_id, entry.key)
+        if self._memory.pop(id_, None) is not None:
+            self._session_bytes[entry.session_id] -= entry.bytes + entry.extra_bytes
+            self._total_bytes -= entry.bytes + entry.extra_bytes
+            entry.extra_bytes = 0
+
+    def _victims(self, keep: _Entry) -> List[_Entry]:
+        """Least recently used entries to spill so both budgets hold again"""
+        victims = []
+        for candidate in list(self._memory.values()):
+            if self._session_bytes.get(keep.session_id, 0) <= self.session_budget:
+                break
+            if candidate.session_id == keep.session_id and candidate is not keep:
+                self._evict(candidate)
+                victims.append(candidate)
+        for candidate in list(self._memory.values()):
+            if self._total_bytes <= self.total_budget:
+                break
+            if candidate is not keep:
+                self._evict(candidate)
+                victims.append(candidate)
+        return victims
+
+    # --- disk ---
+
+    def _session_dir(self, session_id: str) -> str:
+        return os.path.join(self.store_dir, session_id)
+
+    def _spill(self, entry: _Entry) -> None:
+        # No longer charged (see _evict), so whatever was built from it goes too
+        release, entry.release = entry.release, None
+        if release is not None:
+            release()
+        with entry.lock:
+            with self._lock:
+                # Read again (and so re-admitted) since it was picked
+                if (entry.session_id, entry.key) in self._memory or entry.frame is None:
+                    return
+            if entry.path is None and entry.reload is None:
+                if not self._expired:
+                    os.makedirs(self.store_dir, exist_ok=True)
+                    _expire(self.store_dir)
+                    self._expired = True
+                session_dir = self._session_dir(entry.session_id)
+                os.makedirs(session_dir, exist_ok=True)
+                path = os.path.join(session_dir, f"{uuid.uuid4().hex}.parquet")
+                table = pa.Table.from_pandas(entry.frame, preserve_index=False)
+                pq.write_table(table, path, compression='zstd')
+                entry.path = path
+                entry.disk_bytes = os.path.getsize(path)
+                self.writes += 1
+            entry.frame = None
+            self.spills += 1
+
+    def _load(self, entry: _Entry) -> Optional[pd.DataFrame]:
+        start = time.perf_counter()
+        if entry.path is not None:
+            # Dictionary columns come back as categoricals, Arrow-backed ones as ArrowDtype
+            frame = pq.read_table(entry.path).to_pandas()
+        else:
+            frame = entry.reload()
+            if frame is None:
+                return None
+        frame.attrs = dict(entry.attrs)
+        self.loads += 1
+        self.load_ms += (time.perf_counter() - start) * 1000
+        return frame
+
+    # --- public API ---
+
+    def put(self, session_id: str, key: Any, df: pd.DataFrame,
+            reload: Optional[Callable[[], Optional[pd.DataFrame]]] = None) -> pd.DataFrame:
+        """
+        Store df (downcast) under key and return the stored frame
+
+        reload, when given, can fetch the same result again from wherever it is
+        persisted; the store then never writes its own spill file for it.
+        """
+        original_bytes = _frame_bytes(df)
+        entry = _Entry(session_id, key, downcast(df), original_bytes)
+        entry.reload = reload
+        with self._lock:
+            old = self._entries.pop((session_id, key), None)
+            if old is not None:
+                self._evict(old)
+            self._entries[(session_id, key)] = entry
+            self._admit(entry)
+            victims = self._victims(entry)
+        if old is not None and old.path:
+            self._remove_file(old.path)
+        if old is not None and old.attrs.get('csv_path') != entry.attrs.get('csv_path'):
+            remove_spool(old.attrs.get('csv_path'))
+        for victim in victims:
+            self._spill(victim)
+        return entry.frame
+
+    def get(self, session_id: str, key: Any,
+            loader: Optional[Callable[[Any], Optional[pd.DataFrame]]] = None) -> Optional[pd.DataFrame]:
+        """
+        The result stored under key (read back from disk if it was spilled), or None
+
+        A key the store has never seen (e.g. a message from history loaded in an
+        earlier process) is fetched with loader(key) when one is given.
+        """
+        with self._lock:
+            entry = self._entries.get((session_id, key))
+        if entry is None:
+            if loader is None:
+                return None
+            start = time.perf_counter()
+            df = loader(key)
+            if df is None:
+                return None
+            self.loads += 1
+            self.load_ms += (time.perf_counter() - start) * 1000
+            return self.put(session_id, key, df, reload=lambda: loader(key))
+
+        with self._lock:
+            frame = entry.frame
+            if frame is not None and (session_id, key) in self._memory:
+                self._memory.move_to_end((session_id, key))
+                return frame
+
+        with entry.lock:
+            frame = entry.frame
+            if frame is None:
+                frame = entry.frame = self._load(entry)
+                if frame is None:
+                    return None
+            with self._lock:
+                self._admit(entry)
+                victims = self._victims(entry)
+        for victim in victims:
+            self._spill(victim)
+        return frame
+
+    def charge(self, session_id: str, key: Any, nbytes: int,
+               release: Optional[Callable[[], None]] = None) -> bool:
+        """
+        Count nbytes built from an in-memory result against its budgets
+
+        Replaces the result's previous charge. release is called when the result
+        is spilled, and should free what was charged. Returns False (nothing
+        charged) when the result is not in memory.
+        """
+        with self._lock:
+            entry = self._entries.get((session_id, key))
+            if entry is None or (session_id, key) not in self._memory:
+                return False
+            delta = nbytes - entry.extra_bytes
+            self._session_bytes[session_id] += delta
+            self._total_bytes += delta
+            entry.extra_bytes = nbytes
+            entry.release = release
+            victims = self._victims(entry)
+        for victim in victims:
+            self._spill(victim)
+        return True
+
+    def discard(self, session_id: str, keys: List[Any]) -> None:
+        """Forget results, e.g. those of a deleted conversation"""
+        paths, spools = [], []
+        with self._lock:
+            for key in keys:
+                entry = self._entries.pop((session_id, key), None)
+                if entry is not None:
+                    self._evict(entry)
+                    if entry.path:
+                        paths.append(entry.path)
+                    spools.append(entry.attrs.get('csv_path'))
+        for path in paths:
+            self._remove_file(path)
+        for path in spools:
+            remove_spool(path)
+
+    def drop_session(self, session_id: str) -> None:
+        """Forget every result of a session and delete its files"""
+        spools = []
+        with self._lock:
+            for id_ in [id_ for id_ in self._entries if id_[0] == session_id]:
+                entry = self._entries.pop(id_)
+                self._evict(entry)
+                spools.append(entry.attrs.get('csv_path'))
+            self._session_bytes.pop(session_id, None)
+        shutil.rmtree(self._session_dir(session_id), ignore_errors=True)
+        for path in spools:
+            remove_spool(path)
+
+    @staticmethod
+    def _remove_file(path: str) -> None:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    def session_report(self, session_id: str) -> Dict[str, Any]:
+        """Memory and disk use of one session's results"""
+        with self._lock:
+            entries = [entry for id_, entry in self._entries.items() if id_[0] == session_id]
+            in_memory = [entry for entry in entries if (session_id, entry.key) in self._memory]
+            return {
+                'results': len(entries),
+                'in_memory': len(in_memory),
+                'spilled': len(entries) - len(in_memory),
+                'rows': sum(entry.rows for entry in entries),
+                'memory_bytes': self._session_bytes.get(session_id, 0),
+                'budget_bytes': self.session_budget,
+                'disk_bytes': sum(entry.disk_bytes for entry in entries if entry.path),
+                'render_bytes': sum(entry.extra_bytes for entry in in_memory),
+                'downcast_saved_bytes': sum(entry.original_bytes - entry.bytes for entry in entries),
+            }
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'sessions': len({session_id for session_id, _ in self._entries}),
+                'results': len(self._entries),
+                'in_memory': len(self._memory),
+                'memory_bytes': self._total_bytes,
+                'budget_bytes': self.total_budget,
+                'disk_bytes': sum(entry.disk_bytes for entry in self._entries.values() if entry.path),
+                'spills': self.spills,
+                'writes': self.writes,
+                'loads': self.loads,
+                'avg_load_ms': self.load_ms / self.loads if self.loads else 0.0,
+            }
+
+
+class SessionResults:
+    """
+    One Streamlit session's view of the store, kept in st.session_state
+
+    When Streamlit discards the session state this object goes with it, and
+    the session's results are dropped from the store. With a loader (e.g.
+    ConversationStore.load_result), results are read back from where they
+    are persisted instead of being spilled to the store's own files.
+    """
+
+    def __init__(self, store: 'ResultStore', session_id: Optional[str] = None,
+                 loader: Optional[Callable[[Any], Optional[pd.DataFrame]]] = None):
+        self.store = store
+        self.session_id = session_id or uuid.uuid4().hex
+        self.loader = loader
+        weakref.finalize(self, store.drop_session, self.session_id)
+
+    def put(self, key: Any, df: pd.DataFrame, persisted: bool = False) -> pd.DataFrame:
+        """Store a result; persisted=True when the loader can fetch it again by key"""
+        loader = self.loader
+        reload = (lambda: loader(key)) if persisted and loader is not None else None
+        return self.store.put(self.session_id, key, df, reload=reload)
+
+    def get(self, key: Any) -> Optional[pd.DataFrame]:
+        return self.store.get(self.session_id, key, loader=self.loader)
+
+    def charge(self, key: Any, nbytes: int, release: Optional[Callable[[], None]] = None) -> bool:
+        return self.store.charge(self.session_id, key, nbytes, release)
+
+    def discard(self, keys: List[Any]) -> None:
+        self.store.discard(self.session_id, keys)
+
+    def report(self) -> Dict[str, Any]:
+        return self.store.session_report(self.session_id)
+
+
+# Process-wide store shared by every Streamlit session
+result_store = ResultStore()
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Fill a ResultStore from several sessions and report memory vs disk")
+    parser.add_argument('--sessions', type=int, default=8)
+    parser.add_argument('--results', type=int, default=40, help="Results per session")
+    parser.add_argument('--rows', type=int, default=20000, help="Rows per result")
+    parser.add_argument('--session-mb', type=float, default=8.0)
+    parser.add_argument('--total-mb', type=float, default=32.0)
+    parser.add_argument('--seed', type=int, default=7)
+    args = parser.parse_args(argv)
+
+    import tempfile
+    from result_frames import BENCHMARK_FIELDS, _benchmark_payloads, frame_from_csv
+
+    work_dir = tempfile.mkdtemp(prefix='result_store_')
+    with open(_benchmark_payloads(args.rows, work_dir, args.seed)['csv'], 'rb') as f:
+        payload = f.read()
+    fields = [name for name, _, _ in BENCHMARK_FIELDS]
+    types = {name: {'kind': kind, 'type': lookml_type} for name, kind, lookml_type in BENCHMARK_FIELDS}
+    frame = frame_from_csv(payload, fields, types)
+
+    store = ResultStore(os.path.join(work_dir, 'store'), args.session_mb, args.total_mb)
+    start = time.perf_counter()
+    for i in range(args.results):
+        for session in range(args.sessions):
+            store.put(f"session{session}", i, frame)
+    put_seconds = time.perf_counter() - start
+
+    # Scroll back through one session's oldest answers
+    start = time.perf_counter()
+    for i in range(min(10, args.results)):
+        store.get('session0', i)
+    reload_ms = (time.perf_counter() - start) * 1000
+
+    stats = store.stats()
+    held = args.sessions * args.results * _frame_bytes(frame)
+    print(f"{args.sessions} sessions x {args.results} results x {args.rows:,} rows "
+          f"({_frame_bytes(frame) / MB:.1f} MB each as parsed)")
+    print(f"without the store: {held / MB:,.0f} MB held in memory")
+    print(f"with the store:    {stats['memory_bytes'] / MB:,.0f} MB in memory "
+          f"(budget {stats['budget_bytes'] / MB:,.0f} MB), {stats['disk_bytes'] / MB:,.0f} MB on disk")
+    print(f"inserts: {put_seconds:.2f}s ({stats['writes']} Parquet writes); "
+          f"10 reloads: {reload_ms:.0f} ms")
+    print(f"session0: {store.session_report('session0')}")
+    shutil.rmtree(work_dir, ignore_errors=True)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
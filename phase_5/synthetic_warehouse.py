@@ -0,0 +1,975 @@
+"""
+Synthetic Adventure Works warehouse at any scale
+
+Generates every dim_* and fct_* table in the column layout of the Dataform
+definitions (phase_3/dataform/definitions) as Parquet files that
+local_warehouse.py can query. Everything is vectorized with NumPy/Arrow and
+fct_sales is written in order-level chunks, so memory stays flat from 10M to
+1B rows:
+
+- Skew: products and customers are drawn from a bounded Zipf distribution
+  (--product-skew / --customer-skew, 0 = uniform); popularity ranks are
+  scattered across keys so best sellers are not all in one category
+- Seasonality: order dates follow yearly growth, a monthly cycle peaking in
+  June and a weekend dip, over the same date range as dim_date
+- Referential integrity: every foreign key exists in its dimension. Each
+  dimension has a -1 "Unknown" member and facts use it where the Dataform
+  COALESCE would (online orders have no salesperson, unscrapped work orders
+  no scrap reason) plus a configurable share of unmatched keys
+
+The partitioned facts are written as hive partitions by the year of their
+partition column (fct_sales/order_year=YYYY/part-N.parquet, likewise
+fct_purchases by order_year and fct_work_orders by start_year), large
+dimensions as directories of parts, small tables as single files.
+
+    python synthetic_warehouse.py --sales-rows 10000000 --out warehouse
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import datetime
+from typing import Dict, Any, List, Optional, Iterator
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+DEFAULT_OUT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'warehouse')
+
+UNKNOWN_KEY = -1
+UNKNOWN_NAME = 'Unknown'
+
+# (territory_id, name, country_code, group, country_name, share of customers)
+TERRITORIES = [
+    (1, 'Northwest', 'US', 'North America', 'United States', 0.19),
+    (2, 'Northeast', 'US', 'North America', 'United States', 0.02),
+    (3, 'Central', 'US', 'North America', 'United States', 0.02),
+    (4, 'Southwest', 'US', 'North America', 'United States', 0.22),
+    (5, 'Southeast', 'US', 'North America', 'United States', 0.02),
+    (6, 'Canada', 'CA', 'North America', 'Canada', 0.09),
+    (7, 'France', 'FR', 'Europe', 'France', 0.09),
+    (8, 'Germany', 'DE', 'Europe', 'Germany', 0.09),
+    (9, 'Australia', 'AU', 'Pacific', 'Australia', 0.18),
+    (10, 'United Kingdom', 'GB', 'Europe', 'United Kingdom', 0.08),
+]
+
+# (city, state code, state name, postal code) per territory
+CITIES = {
+    1: [('Seattle', 'WA', 'Washington', '98104'), ('Portland', 'OR', 'Oregon', '97205'), ('Bellingham', 'WA', 'Washington', '98225')],
+    2: [('New York', 'NY', 'New York', '10007'), ('Boston', 'MA', 'Massachusetts', '02108')],
+    3: [('Chicago', 'IL', 'Illinois', '60601'), ('Detroit', 'MI', 'Michigan', '48226')],
+    4: [('Los Angeles', 'CA', 'California', '90012'), ('San Diego', 'CA', 'California', '92101'), ('Phoenix', 'AZ', 'Arizona', '85004')],
+    5: [('Atlanta', 'GA', 'Georgia', '30303'), ('Miami', 'FL', 'Florida', '33130')],
+    6: [('Vancouver', 'BC', 'British Columbia', 'V7L 4J4'), ('Toronto', 'ON', 'Ontario', 'M4B 1V7')],
+    7: [('Paris', '75', 'Seine (Paris)', '75007'), ('Lyon', '69', 'Rhone', '69002')],
+    8: [('Berlin', 'BB', 'Brandenburg', '10791'), ('Hamburg', 'HH', 'Hamburg', '20354')],
+    9: [('Sydney', 'NSW', 'New South Wales', '2000'), ('Melbourne', 'VIC', 'Victoria', '3000')],
+    10: [('London', 'ENG', 'England', 'SW8 4BG'), ('Birmingham', 'ENG', 'England', 'B29 6SL')],
+}
+
+# (category_id, category, list price range, [subcategories])
+CATEGORIES = [
+    (1, 'Bikes', (540.0, 3580.0), ['Mountain Bikes', 'Road Bikes', 'Touring Bikes']),
+    (2, 'Components', (20.0, 1430.0), ['Handlebars', 'Bottom Brackets', 'Brakes', 'Chains', 'Cranksets',
+                                       'Derailleurs', 'Forks', 'Headsets', 'Mountain Frames', 'Pedals',
+                                       'Road Frames', 'Saddles', 'Touring Frames', 'Wheels']),
+    (3, 'Clothing', (8.0, 90.0), ['Bib-Shorts', 'Caps', 'Gloves', 'Jerseys', 'Shorts', 'Socks', 'Tights', 'Vests']),
+    (4, 'Accessories', (2.3, 160.0), ['Bike Racks', 'Bike Stands', 'Bottles and Cages', 'Cleaners', 'Fenders',
+                                      'Helmets', 'Hydration Packs', 'Lights', 'Locks', 'Panniers', 'Pumps',
+                                      'Tires and Tubes']),
+]
+COLORS = ['Black', 'Red', 'Silver', 'Blue', 'Yellow', 'Multi', 'White', 'Grey']
+SIZES = ['38', '42', '44', '48', '52', '58', '62', 'S', 'M', 'L', 'XL']
+
+LOCATIONS = [
+    (1, 'Tool Crib', 0.0, 0.0), (2, 'Sheet Metal Racks', 0.0, 0.0), (3, 'Paint Shop', 0.0, 0.0),
+    (4, 'Paint Storage', 0.0, 0.0), (5, 'Metal Storage', 0.0, 0.0), (6, 'Miscellaneous Storage', 0.0, 0.0),
+    (7, 'Finished Goods Storage', 0.0, 0.0), (10, 'Frame Forming', 22.5, 96.0), (20, 'Frame Welding', 25.0, 108.0),
+    (30, 'Debur and Polish', 14.5, 120.0), (40, 'Paint', 15.75, 120.0), (45, 'Specialized Paint', 18.0, 80.0),
+    (50, 'Subassembly', 12.25, 120.0), (60, 'Final Assembly', 12.25, 120.0),
+]
+
+SHIP_METHODS = [
+    (1, 'XRQ - TRUCK GROUND', 3.95, 0.99), (2, 'ZY - EXPRESS', 9.95, 1.99), (3, 'OVERSEAS - DELUXE', 29.95, 2.99),
+    (4, 'OVERNIGHT J-FAST', 21.95, 1.29), (5, 'CARGO TRANSPORT 5', 8.99, 1.49),
+]
+
+SCRAP_REASONS = [
+    'Brake assembly not as ordered', 'Color incorrect', 'Drill pattern incorrect', 'Drill size too large',
+    'Drill size too small', 'Gouge in metal', 'Handling damage', 'Paint process failed', 'Primer process failed',
+    'Seat assembly not as ordered', 'Stress test failed', 'Thermoform temperature too high',
+    'Thermoform temperature too low', 'Trim length too long', 'Trim length too short', 'Wheel misaligned',
+]
+
+# (id, description, discount, type, category, min qty, max qty)
+SPECIAL_OFFERS = [
+    (1, 'No Discount', 0.0, 'No Discount', 'No Discount', 0, None),
+    (2, 'Volume Discount 11 to 14', 0.02, 'Volume Discount', 'Reseller', 11, 14),
+    (3, 'Volume Discount 15 to 24', 0.05, 'Volume Discount', 'Reseller', 15, 24),
+    (4, 'Volume Discount 25 to 40', 0.10, 'Volume Discount', 'Reseller', 25, 40),
+    (5, 'Volume Discount 41 to 60', 0.15, 'Volume Discount', 'Reseller', 41, 60),
+    (6, 'Volume Discount over 60', 0.20, 'Volume Discount', 'Reseller', 61, None),
+    (7, 'Mountain-100 Clearance Sale', 0.35, 'Discontinued Product', 'Reseller', 0, None),
+    (8, 'Sport Helmet Discount-2002', 0.10, 'Seasonal Discount', 'Reseller', 0, None),
+    (9, 'Road-650 Overstock', 0.30, 'Excess Inventory', 'Reseller', 0, None),
+    (10, 'Mountain Tire Sale', 0.50, 'Excess Inventory', 'Customer', 0, None),
+    (11, 'Sport Helmet Discount-2003', 0.15, 'Seasonal Discount', 'Reseller', 0, None),
+    (12, 'LL Road Frame Sale', 0.35, 'Excess Inventory', 'Reseller', 0, None),
+    (13, 'Touring-3000 Promotion', 0.15, 'New Product', 'Reseller', 0, None),
+    (14, 'Touring-1000 Promotion', 0.20, 'New Product', 'Reseller', 0, None),
+    (15, 'Half-Price Pedal Sale', 0.50, 'Seasonal Discount', 'Customer', 0, None),
+    (16, 'Mountain-500 Silver Clearance Sale', 0.40, 'Discontinued Product', 'Reseller', 0, None),
+]
+
+# Salespeople (business entity id, name, territory) as in Adventure Works
+SALESPEOPLE = [
+    (274, 'Stephen Jiang', None), (275, 'Michael Blythe', 2), (276, 'Linda Mitchell', 4),
+    (277, 'Jillian Carson', 3), (278, 'Garrett Vargas', 6), (279, 'Tsvi Reiter', 5),
+    (280, 'Pamela Ansman-Wolfe', 1), (281, 'Shu Ito', 4), (282, 'José Saraiva', 6),
+    (283, 'David Campbell', 1), (284, 'Tete Mensa-Annan', 1), (285, 'Syed Abbas', None),
+    (286, 'Lynn Tsoflias', 9), (287, 'Amy Alberts', None), (288, 'Rachel Valdez', 8),
+    (289, 'Jae Pak', 10), (290, 'Ranjit Varkey Chudukatil', 7),
+]
+EMPLOYEE_COUNT = 290
+BUYER_KEYS = list(range(251, 263))
+JOB_TITLES = ['Production Technician - WC10', 'Production Technician - WC20', 'Production Technician - WC30',
+              'Production Technician - WC40', 'Production Technician - WC50', 'Production Technician - WC60',
+              'Production Supervisor - WC10', 'Production Supervisor - WC40', 'Marketing Specialist',
+              'Accountant', 'Application Specialist', 'Quality Assurance Technician', 'Stocker',
+              'Shipping and Receiving Clerk', 'Scheduling Assistant', 'Janitor']
+
+CURRENCIES = [('USD', 'US Dollar'), ('EUR', 'EURO'), ('GBP', 'United Kingdom Pound'), ('CAD', 'Canadian Dollar'),
+              ('AUD', 'Australian Dollar'), ('JPY', 'Yen'), ('CNY', 'Yuan Renminbi'), ('MXN', 'Mexican Peso'),
+              ('BRL', 'Brazilian Real'), ('INR', 'Indian Rupee'), ('CHF', 'Swiss Franc'), ('SEK', 'Swedish Krona')]
+
+FIRST_NAMES = ['James', 'Mary', 'John', 'Patricia', 'Robert', 'Jennifer', 'Michael', 'Linda', 'David', 'Elizabeth',
+               'William', 'Susan', 'Richard', 'Jessica', 'Joseph', 'Sarah', 'Thomas', 'Karen', 'Carlos', 'Nancy',
+               'Daniel', 'Lisa', 'Matthew', 'Betty', 'Anthony', 'Sandra', 'Mark', 'Ashley', 'Wei', 'Kimberly',
+               'Hiroshi', 'Emily', 'Luis', 'Donna', 'Kevin', 'Michelle', 'Brian', 'Carol', 'George', 'Amanda',
+               'Edward', 'Melissa', 'Ronald', 'Deborah', 'Jacob', 'Stephanie', 'Ryan', 'Rebecca', 'Gary', 'Laura']
+LAST_NAMES = ['Smith', 'Johnson', 'Williams', 'Brown', 'Jones', 'Garcia', 'Miller', 'Davis', 'Rodriguez', 'Martinez',
+              'Hernandez', 'Lopez', 'Gonzalez', 'Wilson', 'Anderson', 'Thomas', 'Taylor', 'Moore', 'Jackson', 'Martin',
+              'Lee', 'Perez', 'Thompson', 'White', 'Harris', 'Sanchez', 'Clark', 'Ramirez', 'Lewis', 'Robinson',
+              'Walker', 'Young', 'Allen', 'King', 'Wright', 'Scott', 'Torres', 'Nguyen', 'Hill', 'Flores',
+              'Green', 'Adams', 'Nelson', 'Baker', 'Hall', 'Rivera', 'Campbell', 'Mitchell', 'Carter', 'Chen']
+STORE_WORDS = ['Bike', 'Cycle', 'Sports', 'Wheel', 'Trail', 'Mountain', 'Road', 'Urban', 'Pedal', 'Speed']
+STORE_SUFFIXES = ['Shop', 'Outlet', 'Store', 'Supply', 'Warehouse', 'Emporium', 'Depot', 'Center']
+STREETS = ['Main St.', 'Oak Ave.', 'Pine Rd.', 'Maple Dr.', 'Cedar Ln.', 'Lake Blvd.', 'Hill St.', 'Park Way']
+CARD_TYPES = ['SuperiorCard', 'Distinguish', 'ColonialVoice', 'Vista']
+REVIEW_COMMENTS = {
+    'Positive': ['Great bike, rides smoothly and shifts well.', 'Excellent quality for the price.',
+                 'Comfortable and durable, would buy again.', 'Works exactly as described.'],
+    'Neutral': ['Decent product but the fit runs small.', 'It does the job, nothing special.'],
+    'Negative': ['Broke after a few weeks of use.', 'Not worth the money, poor build quality.'],
+}
+
+# Bikes and frames come off the production line; the rest is bought in
+MANUFACTURED_SUBCATEGORIES = {'Mountain Bikes', 'Road Bikes', 'Touring Bikes', 'Mountain Frames',
+                              'Road Frames', 'Touring Frames', 'Wheels', 'Forks', 'Handlebars', 'Cranksets'}
+
+
+def zipf_ranks(rng: np.random.Generator, n_items: int, skew: float, size: int) -> np.ndarray:
+    """
+    Draw 0-based popularity ranks from a bounded Zipf(skew) over n_items
+
+    Inverse-CDF sampling of the continuous power law on [1, n_items + 1], so
+    it is O(size) with no per-item table and works for hundreds of millions
+    of items. skew=0 is uniform.
+    """
+    u = rng.random(size)
+    upper = float(n_items + 1)
+    if skew <= 0:
+        x = 1.0 + u * n_items
+    elif abs(skew - 1.0) < 1e-9:
+        x = np.power(upper, u)
+    else:
+        a = 1.0 - skew
+        x = np.power(1.0 + u * (upper ** a - 1.0), 1.0 / a)
+    return np.minimum(x.astype(np.int64) - 1, n_items - 1)
+
+
+def scatter_ranks(ranks: np.ndarray, n_items: int) -> np.ndarray:
+    """Map popularity ranks to 0-based item indexes with a fixed bijection (rank * step mod n)"""
+    step = max(1, int(n_items * 0.6180339887))
+    while np.gcd(step, n_items) != 1:
+        step += 1
+    return (ranks * step) % n_items
+
+
+def key_hash(keys: np.ndarray, salt: int) -> np.ndarray:
+    """Deterministic uniform [0, 1) per key, so dimension attributes can be re-derived in fact chunks"""
+    mixed = (keys.astype(np.uint64) * np.uint64(2654435761) + np.uint64(salt * 40503)) % np.uint64(4294967296)
+    mixed = (mixed ^ (mixed >> np.uint64(15))) * np.uint64(2246822519) % np.uint64(4294967296)
+    return mixed.astype(np.float64) / 4294967296.0
+
+
+def with_unknown_row(table: pa.Table, key: str, name_columns: List[str]) -> pa.Table:
+    """Append the -1 member fact keys fall back to; name columns read 'Unknown', everything else NULL"""
+    row = {}
+    for field in table.schema:
+        if field.name == key:
+            row[field.name] = [UNKNOWN_KEY]
+        elif field.name in name_columns:
+            row[field.name] = [UNKNOWN_NAME]
+        else:
+            row[field.name] = [None]
+    return pa.concat_tables([table, pa.table(row, schema=table.schema)])
+
+
+def _strings(values: List[str]) -> pa.Array:
+    return pa.array(values, type=pa.string())
+
+
+def _pick(pool: List[str], indexes: np.ndarray) -> pa.Array:
+    return pc.take(_strings(pool), pa.array(indexes))
+
+
+def _padded(numbers: np.ndarray, width: int) -> pa.Array:
+    return pc.utf8_lpad(pc.cast(pa.array(numbers), pa.string()), width, '0')
+
+
+def _join(*parts) -> pa.Array:
+    return pc.binary_join_element_wise(*parts, '')
+
+
+class SyntheticWarehouse:
+    """
+    Writes a synthetic star schema shaped like the Dataform tables
+
+    Args:
+        out_dir: Directory local_warehouse.py reads (LOCAL_WAREHOUSE_DIR)
+        sales_rows: fct_sales line items; the other facts scale from it
+        customers: dim_customer size (default sales_rows / 6, like Adventure Works)
+        products: dim_product size
+        product_skew / customer_skew: Zipf exponents (0 = uniform)
+        seasonality: Amplitude of the monthly cycle (0 = flat)
+        growth: Year-over-year order volume multiplier
+        unknown_rate: Share of fact foreign keys that miss their dimension (-1)
+        chunk_rows: Rows per Parquet part; bounds peak memory
+    """
+
+    def __init__(self, out_dir: Optional[str] = None, sales_rows: int = 1_000_000, customers: Optional[int] = None,
+                 products: int = 504, product_skew: float = 0.8, customer_skew: float = 0.6,
+                 seasonality: float = 0.25, growth: float = 1.35, weekend_factor: float = 0.8,
+                 unknown_rate: float = 0.001, start: str = '2011-01-01', end: str = '2014-12-31',
+                 chunk_rows: int = 500_000, seed: int = 7):
+        self.out_dir = out_dir or os.getenv('LOCAL_WAREHOUSE_DIR', DEFAULT_OUT_DIR)
+        self.sales_rows = int(sales_rows)
+        self.customers = int(customers) if customers else min(max(self.sales_rows // 6, 1000), 20_000_000)
+        self.products = int(products)
+        self.product_skew = product_skew
+        self.customer_skew = customer_skew
+        self.unknown_rate = unknown_rate
+        self.chunk_rows = int(chunk_rows)
+        self.seed = seed
+        self.loaded_at = pa.scalar(datetime.datetime.now(datetime.timezone.utc), type=pa.timestamp('us', tz='UTC'))
+
+        self.dates = np.arange(np.datetime64(start, 'D'), np.datetime64(end, 'D') + 1)
+        self.date_keys = self._date_keys(self.dates)
+        self.date_cdf = self._date_cdf(seasonality, growth, weekend_factor)
+
+        self.territory_cdf = np.cumsum([t[5] for t in TERRITORIES])
+        self.territory_cdf /= self.territory_cdf[-1]
+        self.vendors = 104
+        self._build_products()
+        self._build_salesperson_lookup()
+
+    # -- shared lookups -------------------------------------------------------
+
+    @staticmethod
+    def _date_keys(dates: np.ndarray) -> np.ndarray:
+        years = dates.astype('datetime64[Y]').astype(np.int64) + 1970
+        months = dates.astype('datetime64[M]').astype(np.int64) % 12 + 1
+        days = (dates - dates.astype('datetime64[M]')).astype(np.int64) + 1
+        return years * 10000 + months * 100 + days
+
+    def _date_cdf(self, seasonality: float, growth: float, weekend_factor: float) -> np.ndarray:
+        years_in = (self.dates - self.dates[0]).astype(np.float64) / 365.25
+        months = self.dates.astype('datetime64[M]').astype(np.int64) % 12 + 1
+        weekday = (self.dates.astype(np.int64) + 3) % 7  # 0 = Monday
+        weights = (growth ** years_in) * (1.0 + seasonality * np.cos(2 * np.pi * (months - 6) / 12.0))
+        weights = weights * np.where(weekday >= 5, weekend_factor, 1.0)
+        cdf = np.cumsum(weights)
+        return cdf / cdf[-1]
+
+    def _sample_days(self, rng: np.random.Generator, size: int, margin: int = 0) -> np.ndarray:
+        """Seasonal day indexes into self.dates, leaving room for later due/ship dates"""
+        days = np.searchsorted(self.date_cdf, rng.random(size), side='right')
+        return np.minimum(days, len(self.dates) - 1 - margin)
+
+    def _build_products(self) -> None:
+        rng = np.random.default_rng([self.seed, 1])
+        subcategories = [(cat_id, cat, prices, sub) for cat_id, cat, prices, subs in CATEGORIES for sub in subs]
+        # Bikes are few products but carry the revenue; weight the mix like the real catalogue
+        weights = np.array([{1: 3.0, 2: 1.0, 3: 0.8, 4: 0.7}[s[0]] for s in subcategories])
+        sub_index = np.sort(rng.choice(len(subcategories), size=self.products, p=weights / weights.sum()))
+        low = np.array([subcategories[i][2][0] for i in sub_index])
+        high = np.array([subcategories[i][2][1] for i in sub_index])
+        self.product_subcategory = sub_index
+        self.product_subcategories = subcategories
+        self.product_price = np.round(low + (high - low) * rng.random(self.products) ** 2, 4)
+        self.product_cost = np.round(self.product_price * rng.uniform(0.45, 0.65, self.products), 4)
+        self.product_color = rng.integers(0, len(COLORS), self.products)
+        self.product_size = rng.integers(0, len(SIZES), self.products)
+        names = [subcategories[i][3] for i in sub_index]
+        self.manufactured = np.flatnonzero([name in MANUFACTURED_SUBCATEGORIES for name in names]) + 1
+        self.purchased = np.flatnonzero([name not in MANUFACTURED_SUBCATEGORIES for name in names]) + 1
+
+    def _build_salesperson_lookup(self) -> None:
+        by_territory = {t[0]: [sp[0] for sp in SALESPEOPLE if sp[2] == t[0]] for t in TERRITORIES}
+        width = max(len(v) for v in by_territory.values())
+        self.sp_table = np.full((len(TERRITORIES) + 1, width), UNKNOWN_KEY, dtype=np.int64)
+        self.sp_count = np.ones(len(TERRITORIES) + 1, dtype=np.int64)
+        for territory, keys in by_territory.items():
+            self.sp_table[territory, :len(keys)] = keys
+            self.sp_count[territory] = max(1, len(keys))
+
+    def customer_territory(self, customer_keys: np.ndarray) -> np.ndarray:
+        return np.searchsorted(self.territory_cdf, key_hash(customer_keys, 1), side='right') + 1
+
+    def customer_is_store(self, customer_keys: np.ndarray) -> np.ndarray:
+        return key_hash(customer_keys, 2) < 0.035
+
+    def _unknown(self, rng: np.random.Generator, keys: np.ndarray) -> np.ndarray:
+        if self.unknown_rate > 0:
+            keys[rng.random(len(keys)) < self.unknown_rate] = UNKNOWN_KEY
+        return keys
+
+    # -- output ---------------------------------------------------------------
+
+    def _reset(self, table: str) -> None:
+        """Remove a previous run's file or directory so stale parts never mix with new ones"""
+        single = os.path.join(self.out_dir, f"{table}.parquet")
+        if os.path.isfile(single):
+            os.remove(single)
+        shutil.rmtree(os.path.join(self.out_dir, table), ignore_errors=True)
+
+    def _write_single(self, name: str, table: pa.Table) -> int:
+        self._reset(name)
+        pq.write_table(table, os.path.join(self.out_dir, f"{name}.parquet"), compression='zstd')
+        return table.num_rows
+
+    def _write_parts(self, name: str, chunks: Iterator[pa.Table], partition: Optional[str] = None) -> int:
+        """Stream chunks into <name>/[partition=value/]part-NNNNN.parquet; only one chunk is in memory"""
+        self._reset(name)
+        rows = 0
+        for index, chunk in enumerate(chunks):
+            if partition is None:
+                groups = [(None, chunk)]
+            else:
+                values = chunk.column(partition).to_numpy()
+                groups = [(value, chunk.filter(pa.array(values == value)).drop_columns([partition]))
+                          for value in np.unique(values)]
+            for value, group in groups:
+                directory = os.path.join(self.out_dir, name) if value is None else \
+                    os.path.join(self.out_dir, name, f"{partition}={value}")
+                os.makedirs(directory, exist_ok=True)
+                pq.write_table(group, os.path.join(directory, f"part-{index:05d}.parquet"), compression='zstd')
+            rows += chunk.num_rows
+        return rows
+
+    def _chunk_sizes(self, total: int) -> Iterator[int]:
+        for start in range(0, total, self.chunk_rows):
+            yield min(self.chunk_rows, total - start)
+
+    # -- dimensions -----------------------------------------------------------
+
+    def dim_date(self) -> pa.Table:
+        dates = self.dates
+        weekday = (dates.astype(np.int64) + 3) % 7
+        months = dates.astype('datetime64[M]').astype(np.int64) % 12 + 1
+        month_names = [datetime.date(2000, m, 1).strftime('%B') for m in range(1, 13)]
+        day_names = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
+        return pa.table({
+            'date_key': pa.array(self.date_keys),
+            'full_date': pa.array(dates),
+            'year': pa.array(self.date_keys // 10000),
+            'month_number': pa.array(months),
+            'month_name': _pick(month_names, months - 1),
+            'quarter': pa.array((months - 1) // 3 + 1),
+            'day_of_month': pa.array(self.date_keys % 100),
+            'day_name': _pick(day_names, weekday),
+            'is_weekend': pa.array(weekday >= 5),
+        })
+
+    def dim_product(self) -> pa.Table:
+        keys = np.arange(1, self.products + 1)
+        subs = self.product_subcategories
+        sub_id = self.product_subcategory + 1
+        names = [f"{subs[s][3].split(' ')[0]}-{100 * (1 + k % 9)} {COLORS[c]}, {SIZES[z]}"
+                 for k, s, c, z in zip(keys, self.product_subcategory, self.product_color, self.product_size)]
+        table = pa.table({
+            'product_key': pa.array(keys),
+            'product_id': pa.array(keys),
+            'product_name': _strings(names),
+            'product_number': _join(_strings([subs[s][3][:2].upper() for s in self.product_subcategory]),
+                                    pa.scalar('-'), _padded(keys, 4)),
+            'color': _pick(COLORS, self.product_color),
+            'list_price': pa.array(self.product_price),
+            'standard_cost': pa.array(self.product_cost),
+            'subcategory_id': pa.array(sub_id),
+            'subcategory_name': _strings([subs[s][3] for s in self.product_subcategory]),
+            'category_id': pa.array(np.array([subs[s][0] for s in self.product_subcategory])),
+            'category_name': _strings([subs[s][1] for s in self.product_subcategory]),
+        })
+        return with_unknown_row(table, 'product_key', ['product_name', 'category_name', 'subcategory_name'])
+
+    def _customer_chunks(self) -> Iterator[Dict[str, pa.Table]]:
+        """dim_customer, dim_address and dim_credit_card share keys, so they are built chunk by chunk together"""
+        start = 1
+        for index, size in enumerate(self._chunk_sizes(self.customers)):
+            rng = np.random.default_rng([self.seed, 2, index])
+            keys = np.arange(start, start + size, dtype=np.int64)
+            start += size
+            territory = self.customer_territory(keys)
+            store = self.customer_is_store(keys)
+            first = rng.integers(0, len(FIRST_NAMES), size)
+            last = rng.integers(0, len(LAST_NAMES), size)
+            store_name = _join(_pick(STORE_WORDS, rng.integers(0, len(STORE_WORDS), size)), pa.scalar(' '),
+                               _pick(STORE_SUFFIXES, rng.integers(0, len(STORE_SUFFIXES), size)))
+            customer = pa.table({
+                'customer_key': pa.array(keys),
+                'customer_id': pa.array(keys),
+                'account_number': _join(pa.scalar('AW'), _padded(keys, 8)),
+                'person_id': pa.array(keys + 20000),
+                'store_id': pa.array(np.where(store, keys + 100000, 0), mask=~store),
+                'territory_id': pa.array(territory),
+                'customer_name': _join(_pick(FIRST_NAMES, first), pa.scalar(' '), _pick(LAST_NAMES, last)),
+                'person_type': pa.array(np.where(store, 'SC', 'IN')),
+                'store_name': pc.if_else(pa.array(store), store_name, pa.scalar(None, pa.string())),
+                'loaded_at': pa.repeat(self.loaded_at, size),
+            })
+
+            # One address per customer: bill-to and ship-to keys in fct_sales are the customer key
+            flat = [(t, city) for t in sorted(CITIES) for city in CITIES[t]]
+            offsets = np.cumsum([0] + [len(CITIES[t]) for t in sorted(CITIES)])
+            lookup = offsets[territory - 1] + (key_hash(keys, 3) * np.diff(offsets)[territory - 1]).astype(np.int64)
+            city = _pick([c[0] for _, c in flat], lookup)
+            address = pa.table({
+                'address_key': pa.array(keys),
+                'address_id': pa.array(keys),
+                'address_line1': _join(pc.cast(pa.array(rng.integers(1, 9999, size)), pa.string()), pa.scalar(' '),
+                                       _pick(STREETS, rng.integers(0, len(STREETS), size))),
+                'address_line2': pa.nulls(size, pa.string()),
+                'city': city,
+                'state_province_code': _pick([c[1] for _, c in flat], lookup),
+                'state_province_name': _pick([c[2] for _, c in flat], lookup),
+                'country_code': _pick([TERRITORIES[t - 1][2] for t, _ in flat], lookup),
+                'country_name': _pick([TERRITORIES[t - 1][4] for t, _ in flat], lookup),
+                'postal_code': _pick([c[3] for _, c in flat], lookup),
+                'loaded_at': pa.repeat(self.loaded_at, size),
+            })
+
+            card = pa.table({
+                'credit_card_key': pa.array(keys),
+                'credit_card_id': pa.array(keys),
+                'card_type': _pick(CARD_TYPES, rng.integers(0, len(CARD_TYPES), size)),
+                'card_number_masked': _join(pa.scalar('XXXX-XXXX-XXXX-'), _padded(rng.integers(0, 10000, size), 4)),
+                'exp_month': pa.array(rng.integers(1, 13, size)),
+                'exp_year': pa.array(rng.integers(2011, 2017, size)),
+                'loaded_at': pa.repeat(self.loaded_at, size),
+            })
+            yield {'dim_customer': customer, 'dim_address': address, 'dim_credit_card': card}
+
+    def write_customer_dims(self) -> Dict[str, int]:
+        """Stream the three customer-sized dimensions, with their -1 members in the final part"""
+        names = ['dim_customer', 'dim_address', 'dim_credit_card']
+        unknown_names = {'dim_customer': ['customer_name'], 'dim_address': ['city', 'country_name'],
+                         'dim_credit_card': ['card_type']}
+        for name in names:
+            self._reset(name)
+            os.makedirs(os.path.join(self.out_dir, name))
+        rows = dict.fromkeys(names, 0)
+        for index, tables in enumerate(self._customer_chunks()):
+            for name, table in tables.items():
+                if index == 0:
+                    key = table.schema.names[0]
+                    table = with_unknown_row(table, key, unknown_names[name])
+                pq.write_table(table, os.path.join(self.out_dir, name, f"part-{index:05d}.parquet"),
+                               compression='zstd')
+                rows[name] += table.num_rows
+        return rows
+
+    def dim_territory(self) -> pa.Table:
+        table = pa.table({
+            'territory_key': pa.array([t[0] for t in TERRITORIES]),
+            'territory_id': pa.array([t[0] for t in TERRITORIES]),
+            'territory_name': _strings([t[1] for t in TERRITORIES]),
+            'country_code': _strings([t[2] for t in TERRITORIES]),
+            'territory_group': _strings([t[3] for t in TERRITORIES]),
+            'country_name': _strings([t[4] for t in TERRITORIES]),
+            'loaded_at': pa.repeat(self.loaded_at, len(TERRITORIES)),
+        })
+        return with_unknown_row(table, 'territory_key', ['territory_name', 'territory_group', 'country_name'])
+
+    def dim_salesperson(self) -> pa.Table:
+        rng = np.random.default_rng([self.seed, 3])
+        n = len(SALESPEOPLE)
+        quota = np.where([sp[2] is None for sp in SALESPEOPLE], np.nan, rng.choice([250000.0, 300000.0], n))
+        ytd = np.round(rng.uniform(170000, 4300000, n), 4)
+        table = pa.table({
+            'salesperson_key': pa.array([sp[0] for sp in SALESPEOPLE]),
+            'business_entity_id': pa.array([sp[0] for sp in SALESPEOPLE]),
+            'territory_id': pa.array([sp[2] for sp in SALESPEOPLE], type=pa.int64()),
+            'sales_quota': pa.array(quota, from_pandas=True),
+            'bonus': pa.array(np.round(rng.uniform(0, 6700, n), 0)),
+            'commission_pct': pa.array(np.where([sp[2] is None for sp in SALESPEOPLE], 0.0,
+                                                rng.choice([0.01, 0.012, 0.015, 0.018, 0.019, 0.02], n))),
+            'sales_ytd': pa.array(ytd),
+            'sales_last_year': pa.array(np.round(ytd * rng.uniform(0.6, 1.1, n), 4)),
+            'salesperson_name': _strings([sp[1] for sp in SALESPEOPLE]),
+            'job_title': _strings(['North American Sales Manager' if sp[0] == 274 else
+                                   'European Sales Manager' if sp[0] == 287 else
+                                   'Pacific Sales Manager' if sp[0] == 285 else
+                                   'Sales Representative' for sp in SALESPEOPLE]),
+            'loaded_at': pa.repeat(self.loaded_at, n),
+        })
+        return with_unknown_row(table, 'salesperson_key', ['salesperson_name'])
+
+    def dim_employee(self) -> pa.Table:
+        rng = np.random.default_rng([self.seed, 4])
+        n = EMPLOYEE_COUNT
+        keys = np.arange(1, n + 1)
+        titles = np.array(rng.choice(JOB_TITLES, n), dtype=object)
+        for sp in SALESPEOPLE:
+            titles[sp[0] - 1] = 'Sales Representative'
+        titles[np.array(BUYER_KEYS) - 1] = 'Buyer'
+        titles[0] = 'Chief Executive Officer'
+        first = rng.integers(0, len(FIRST_NAMES), n)
+        last = rng.integers(0, len(LAST_NAMES), n)
+        names = [f"{FIRST_NAMES[f]} {LAST_NAMES[l]}" for f, l in zip(first, last)]
+        for sp in SALESPEOPLE:
+            names[sp[0] - 1] = sp[1]
+        birth = np.datetime64('1952-01-01') + rng.integers(0, 365 * 40, n).astype('timedelta64[D]')
+        hire = np.datetime64('2006-06-01') + rng.integers(0, 365 * 7, n).astype('timedelta64[D]')
+        table = pa.table({
+            'employee_key': pa.array(keys),
+            'business_entity_id': pa.array(keys),
+            'national_id': pc.cast(pa.array(rng.integers(10_000_000, 999_999_999, n)), pa.string()),
+            'login_id': _join(pa.scalar('adventure-works\\'), _strings([name.split(' ')[0].lower() for name in names]),
+                              pc.cast(pa.array(keys % 10), pa.string())),
+            'job_title': _strings(list(titles)),
+            'birth_date': pa.array(birth),
+            'marital_status': _pick(['M', 'S'], rng.integers(0, 2, n)),
+            'gender': _pick(['M', 'F'], rng.integers(0, 2, n)),
+            'hire_date': pa.array(hire),
+            'is_salaried': pa.array(rng.random(n) < 0.18),
+            'vacation_hours': pa.array(rng.integers(0, 100, n)),
+            'sick_leave_hours': pa.array(rng.integers(20, 80, n)),
+            'is_current': pa.array(np.ones(n, dtype=bool)),
+            'full_name': _strings(names),
+            'loaded_at': pa.repeat(self.loaded_at, n),
+        })
+        return with_unknown_row(table, 'employee_key', ['full_name', 'job_title'])
+
+    def dim_vendor(self) -> pa.Table:
+        rng = np.random.default_rng([self.seed, 5])
+        n = self.vendors
+        keys = np.arange(1492, 1492 + n)
+        names = _join(_pick(STORE_WORDS, rng.integers(0, len(STORE_WORDS), n)), pa.scalar(' '),
+                      _pick(['Bicycles', 'Components', 'Sports', 'Products', 'Company', 'Industries', 'Works'],
+                            rng.integers(0, 7, n)))
+        table = pa.table({
+            'vendor_key': pa.array(keys),
+            'business_entity_id': pa.array(keys),
+            'account_number': _join(pc.utf8_upper(pc.utf8_slice_codeunits(pc.replace_substring(names, ' ', ''), 0, 6)),
+                                    pa.scalar('0'), _padded(keys % 10000, 4)),
+            'vendor_name': names,
+            'credit_rating': pa.array(rng.choice([1, 1, 1, 2, 3, 4, 5], n)),
+            'is_preferred_vendor': pa.array(rng.random(n) < 0.9),
+            'is_active': pa.array(rng.random(n) < 0.95),
+            'loaded_at': pa.repeat(self.loaded_at, n),
+        })
+        return with_unknown_row(table, 'vendor_key', ['vendor_name'])
+
+    def dim_location(self) -> pa.Table:
+        table = pa.table({
+            'location_key': pa.array([l[0] for l in LOCATIONS]),
+            'location_id': pa.array([l[0] for l in LOCATIONS]),
+            'location_name': _strings([l[1] for l in LOCATIONS]),
+            'cost_rate': pa.array([l[2] for l in LOCATIONS]),
+            'availability': pa.array([l[3] for l in LOCATIONS]),
+            'loaded_at': pa.repeat(self.loaded_at, len(LOCATIONS)),
+        })
+        return with_unknown_row(table, 'location_key', ['location_name'])
+
+    def dim_ship_method(self) -> pa.Table:
+        table = pa.table({
+            'ship_method_key': pa.array([s[0] for s in SHIP_METHODS]),
+            'ship_method_id': pa.array([s[0] for s in SHIP_METHODS]),
+            'ship_method_name': _strings([s[1] for s in SHIP_METHODS]),
+            'ship_base_cost': pa.array([s[2] for s in SHIP_METHODS]),
+            'ship_rate': pa.array([s[3] for s in SHIP_METHODS]),
+            'loaded_at': pa.repeat(self.loaded_at, len(SHIP_METHODS)),
+        })
+        return with_unknown_row(table, 'ship_method_key', ['ship_method_name'])
+
+    def dim_scrap_reason(self) -> pa.Table:
+        n = len(SCRAP_REASONS)
+        table = pa.table({
+            'scrap_reason_key': pa.array(np.arange(1, n + 1)),
+            'scrap_reason_id': pa.array(np.arange(1, n + 1)),
+            'scrap_reason_name': _strings(SCRAP_REASONS),
+            'loaded_at': pa.repeat(self.loaded_at, n),
+        })
+        return with_unknown_row(table, 'scrap_reason_key', ['scrap_reason_name'])
+
+    def dim_special_offer(self) -> pa.Table:
+        start = self.dates[0]
+        table = pa.table({
+            'special_offer_key': pa.array([o[0] for o in SPECIAL_OFFERS]),
+            'special_offer_id': pa.array([o[0] for o in SPECIAL_OFFERS]),
+            'special_offer_description': _strings([o[1] for o in SPECIAL_OFFERS]),
+            'discount_pct': pa.array([o[2] for o in SPECIAL_OFFERS]),
+            'offer_type': _strings([o[3] for o in SPECIAL_OFFERS]),
+            'offer_category': _strings([o[4] for o in SPECIAL_OFFERS]),
+            'start_date': pa.array(np.repeat(start, len(SPECIAL_OFFERS)).astype('datetime64[us]')),
+            'end_date': pa.array(np.repeat(self.dates[-1], len(SPECIAL_OFFERS)).astype('datetime64[us]')),
+            'min_quantity': pa.array([o[5] for o in SPECIAL_OFFERS], type=pa.int64()),
+            'max_quantity': pa.array([o[6] for o in SPECIAL_OFFERS], type=pa.int64()),
+            'loaded_at': pa.repeat(self.loaded_at, len(SPECIAL_OFFERS)),
+        })
+        return with_unknown_row(table, 'special_offer_key', ['special_offer_description', 'offer_type',
+                                                             'offer_category'])
+
+    def dim_currency(self) -> pa.Table:
+        n = len(CURRENCIES)
+        table = pa.table({
+            'currency_key': pa.array(np.arange(1, n + 1)),
+            'currency_code': _strings([c[0] for c in CURRENCIES]),
+            'currency_name': _strings([c[1] for c in CURRENCIES]),
+            'loaded_at': pa.repeat(self.loaded_at, n),
+        })
+        return with_unknown_row(table, 'currency_key', ['currency_name'])
+
+    # -- facts ----------------------------------------------------------------
+
+    def _sales_chunks(self) -> Iterator[pa.Table]:
+        """
+        fct_sales in chunks of whole orders
+
+        Order-level attributes (customer, dates, territory, salesperson) are
+        drawn once per order and repeated over its lines; order totals come
+        from a bincount of the line totals, so every line of an order carries
+        the same subtotal, tax, freight and total due.
+        """
+        discount = np.array([0.0] + [o[2] for o in SPECIAL_OFFERS])
+        order_id, line_id = 43659, 1
+        for index, target in enumerate(self._chunk_sizes(self.sales_rows)):
+            rng = np.random.default_rng([self.seed, 10, index])
+            # Draw a few more orders than needed and cut at exactly `target` lines
+            n_orders = int(target / 2.2) + 64
+            customer = scatter_ranks(zipf_ranks(rng, self.customers, self.customer_skew, n_orders), self.customers) + 1
+            store = self.customer_is_store(customer)
+            lines = np.where(store, rng.geometric(0.12, n_orders).clip(1, 40), rng.geometric(0.62, n_orders).clip(1, 8))
+            while lines.sum() < target:
+                lines = np.concatenate([lines, lines])
+                customer = np.concatenate([customer, customer])
+                store = np.concatenate([store, store])
+            ends = np.cumsum(lines)
+            n_orders = int(np.searchsorted(ends, target) + 1)
+            lines, customer, store = lines[:n_orders], customer[:n_orders], store[:n_orders]
+            lines[-1] -= int(ends[n_orders - 1] - target)
+
+            territory = self.customer_territory(customer)
+            day = self._sample_days(rng, n_orders, margin=12)
+            sp_slot = (rng.random(n_orders) * self.sp_count[territory]).astype(np.int64)
+            salesperson = np.where(store, self.sp_table[territory, sp_slot], UNKNOWN_KEY)
+            ship_method = np.where(store, 5, 1)
+            card = np.where(store & (rng.random(n_orders) < 0.5), UNKNOWN_KEY, customer)
+            ids = np.arange(order_id, order_id + n_orders)
+            order_id += n_orders
+
+            # Per-line draws
+            order_of_line = np.repeat(np.arange(n_orders), lines)
+            n = len(order_of_line)
+            is_store = store[order_of_line]
+            product = scatter_ranks(zipf_ranks(rng, self.products, self.product_skew, n), self.products)
+            quantity = np.where(is_store, rng.geometric(0.3, n).clip(1, 80), 1)
+            unit_price = np.round(self.product_price[product] * np.where(is_store, 0.6, 1.0), 4)
+            # Volume discounts for resellers, occasional promotions for everyone else
+            offer = np.select([quantity > 60, quantity > 40, quantity > 24, quantity > 14, quantity > 10],
+                              [6, 5, 4, 3, 2], default=1)
+            promo = rng.random(n) < 0.03
+            offer = np.where(promo & (offer == 1), rng.integers(7, 17, n), offer)
+            price_discount = discount[offer]
+            gross = quantity * unit_price
+            line_total = np.round(gross * (1.0 - price_discount), 6)
+            subtotal = np.round(np.bincount(order_of_line, weights=line_total, minlength=n_orders), 4)
+            tax = np.round(subtotal * 0.08, 4)
+            freight = np.round(subtotal * 0.025, 4)
+
+            order_day = day[order_of_line]
+            order_keys = self.date_keys[order_day]
+            cust = customer[order_of_line]
+            sales = pa.table({
+                'sales_order_detail_id': pa.array(np.arange(line_id, line_id + n)),
+                'sales_order_id': pa.array(ids[order_of_line]),
+                'sales_order_number': _join(pa.scalar('SO'), pc.cast(pa.array(ids[order_of_line]), pa.string())),
+                'customer_key': pa.array(self._unknown(rng, cust.copy())),
+                'product_key': pa.array(self._unknown(rng, product + 1)),
+                'territory_key': pa.array(self._unknown(rng, territory[order_of_line])),
+                'salesperson_key': pa.array(salesperson[order_of_line]),
+                'ship_method_key': pa.array(self._unknown(rng, ship_method[order_of_line])),
+                'special_offer_key': pa.array(self._unknown(rng, offer)),
+                'credit_card_key': pa.array(self._unknown(rng, card[order_of_line])),
+                'bill_to_address_key': pa.array(self._unknown(rng, cust.copy())),
+                'ship_to_address_key': pa.array(self._unknown(rng, cust.copy())),
+                'order_date_key': pa.array(order_keys),
+                'due_date_key': pa.array(self.date_keys[order_day + 12]),
+                'ship_date_key': pa.array(self.date_keys[order_day + 7]),
+                'order_date': pa.array(self.dates[order_day]),
+                'order_quantity': pa.array(quantity),
+                'unit_price': pa.array(unit_price),
+                'unit_price_discount': pa.array(price_discount),
+                'line_total': pa.array(line_total),
+                'order_subtotal': pa.array(subtotal[order_of_line]),
+                'tax_amount': pa.array(tax[order_of_line]),
+                'freight': pa.array(freight[order_of_line]),
+                'total_due': pa.array((subtotal + tax + freight)[order_of_line]),
+                'discount_amount': pa.array(gross * price_discount),
+                'is_online_order': pa.array(~is_store),
+                'order_status': pa.array(np.full(n, 5)),
+                'purchase_order_number': pc.if_else(
+                    pa.array(is_store),
+                    _join(pa.scalar('PO'), pc.cast(pa.array(ids[order_of_line] * 7 % 10_000_000_000), pa.string())),
+                    pa.scalar(None, pa.string())),
+                'account_number': _join(pa.scalar('10-4030-'), _padded(cust, 6)),
+                # Last touched when the order shipped; the wide table loads on this watermark
+                'source_modified_date': pa.array(self.dates[order_day + 7]),
+                'loaded_at': pa.repeat(self.loaded_at, n),
+                'order_year': pa.array(order_keys // 10000),
+            })
+            line_id += n
+            yield sales
+
+    def _purchase_chunks(self, total: int) -> Iterator[pa.Table]:
+        order_id, line_id = 1, 1
+        for index, target in enumerate(self._chunk_sizes(total)):
+            rng = np.random.default_rng([self.seed, 11, index])
+            lines = rng.geometric(0.55, target).clip(1, 5)
+            ends = np.cumsum(lines)
+            n_orders = int(np.searchsorted(ends, target) + 1)
+            lines = lines[:n_orders]
+            lines[-1] -= int(ends[n_orders - 1] - target)
+            order_of_line = np.repeat(np.arange(n_orders), lines)
+            n = len(order_of_line)
+
+            vendor = 1492 + scatter_ranks(zipf_ranks(rng, self.vendors, 0.8, n_orders), self.vendors)
+            employee = rng.choice(BUYER_KEYS, n_orders)
+            ship_method = rng.integers(1, 6, n_orders)
+            day = self._sample_days(rng, n_orders, margin=9)
+            status = rng.choice([1, 2, 3, 4, 4, 4, 4, 4, 4, 4], n_orders)
+            products = self.purchased if len(self.purchased) else np.arange(1, self.products + 1)
+            product = products[scatter_ranks(zipf_ranks(rng, len(products), 0.7, n), len(products))]
+            quantity = rng.choice([3, 60, 100, 300, 550], n)
+            unit_price = np.round(self.product_cost[product - 1] * 0.9, 4)
+            line_total = np.round(quantity * unit_price, 4)
+            rejected = np.where(rng.random(n) < 0.05, (quantity * rng.uniform(0.05, 0.3, n)).astype(np.int64), 0)
+            subtotal = np.round(np.bincount(order_of_line, weights=line_total, minlength=n_orders), 4)
+            tax = np.round(subtotal * 0.08, 4)
+            freight = np.round(subtotal * 0.025, 4)
+            ids = np.arange(order_id, order_id + n_orders)
+            order_id += n_orders
+            yield pa.table({
+                'purchase_order_key': pa.array(np.arange(line_id, line_id + n)),
+                'purchase_order_id': pa.array(ids[order_of_line]),
+                'product_key': pa.array(self._unknown(rng, product.copy())),
+                'vendor_key': pa.array(self._unknown(rng, vendor[order_of_line])),
+                'employee_key': pa.array(self._unknown(rng, employee[order_of_line])),
+                'ship_method_key': pa.array(self._unknown(rng, ship_method[order_of_line])),
+                'order_date_key': pa.array(self.date_keys[day[order_of_line]]),
+                'ship_date_key': pa.array(self.date_keys[day[order_of_line] + 9]),
+                'order_date': pa.array(self.dates[day[order_of_line]]),
+                'order_quantity': pa.array(quantity),
+                'unit_price': pa.array(unit_price),
+                'line_total': pa.array(line_total),
+                'received_quantity': pa.array(quantity.astype(np.float64)),
+                'rejected_quantity': pa.array(rejected.astype(np.float64)),
+                'stocked_quantity': pa.array((quantity - rejected).astype(np.float64)),
+                'order_subtotal': pa.array(subtotal[order_of_line]),
+                'tax_amount': pa.array(tax[order_of_line]),
+                'freight': pa.array(freight[order_of_line]),
+                'total_due': pa.array((subtotal + tax + freight)[order_of_line]),
+                'order_status': pa.array(status[order_of_line]),
+                'revision_number': pa.array(rng.integers(4, 14, n_orders)[order_of_line]),
+                'loaded_at': pa.repeat(self.loaded_at, n),
+                'order_year': pa.array(self.date_keys[day[order_of_line]] // 10000),
+            })
+            line_id += n
+
+    def _work_order_chunks(self, total: int) -> Iterator[pa.Table]:
+        work_order_id = 1
+        for index, n in enumerate(self._chunk_sizes(total)):
+            rng = np.random.default_rng([self.seed, 12, index])
+            products = self.manufactured if len(self.manufactured) else np.arange(1, self.products + 1)
+            product = products[scatter_ranks(zipf_ranks(rng, len(products), self.product_skew, n), len(products))]
+            quantity = rng.geometric(0.08, n).clip(1, 1000)
+            scrapped = np.where(rng.random(n) < 0.01, np.maximum(1, (quantity * rng.uniform(0, 0.1, n)).astype(np.int64)), 0)
+            scrapped = np.minimum(scrapped, quantity)
+            scrap_reason = np.where(scrapped > 0, rng.integers(1, len(SCRAP_REASONS) + 1, n), UNKNOWN_KEY)
+            days = rng.integers(10, 21, n)
+            start = self._sample_days(rng, n, margin=21)
+            ids = np.arange(work_order_id, work_order_id + n)
+            work_order_id += n
+            yield pa.table({
+                'work_order_key': pa.array(ids),
+                'work_order_id': pa.array(ids),
+                'product_key': pa.array(self._unknown(rng, product.copy())),
+                'scrap_reason_key': pa.array(scrap_reason),
+                'start_date_key': pa.array(self.date_keys[start]),
+                'end_date_key': pa.array(self.date_keys[start + days]),
+                'due_date_key': pa.array(self.date_keys[start + 11]),
+                'start_date': pa.array(self.dates[start]),
+                'order_quantity': pa.array(quantity),
+                'stocked_quantity': pa.array(quantity - scrapped),
+                'scrapped_quantity': pa.array(scrapped),
+                'good_quantity': pa.array(quantity - scrapped),
+                'scrap_rate': pa.array(scrapped / quantity),
+                'production_days': pa.array(days),
+                'loaded_at': pa.repeat(self.loaded_at, n),
+                'start_year': pa.array(self.date_keys[start] // 10000),
+            })
+
+    def fct_product_inventory(self) -> pa.Table:
+        rng = np.random.default_rng([self.seed, 13])
+        locations = np.array([l[0] for l in LOCATIONS])
+        # Each product is stocked in a handful of locations
+        present = rng.random((self.products, len(locations))) < 0.2
+        present[np.arange(self.products), rng.integers(0, len(locations), self.products)] = True
+        product_index, location_index = np.nonzero(present)
+        n = len(product_index)
+        product = product_index + 1
+        location = locations[location_index]
+        quantity = np.where(rng.random(n) < 0.15, rng.integers(0, 100, n), rng.integers(100, 1000, n))
+        return pa.table({
+            'inventory_key': _join(pc.cast(pa.array(product), pa.string()), pa.scalar('-'),
+                                   pc.cast(pa.array(location), pa.string())),
+            'product_key': pa.array(self._unknown(rng, product.copy())),
+            'location_key': pa.array(self._unknown(rng, location.copy())),
+            # The Dataform snapshot uses CURRENT_DATE(); the last generated day keeps the key inside dim_date
+            'snapshot_date_key': pa.array(np.full(n, self.date_keys[-1])),
+            'quantity_on_hand': pa.array(quantity),
+            'shelf': _pick(list('ABCDEFGHIJKLN'), rng.integers(0, 13, n)),
+            'bin_number': pa.array(rng.integers(0, 61, n)),
+            'loaded_at': pa.repeat(self.loaded_at, n),
+        })
+
+    def fct_product_reviews(self, total: int) -> pa.Table:
+        rng = np.random.default_rng([self.seed, 14])
+        product = scatter_ranks(zipf_ranks(rng, self.products, self.product_skew, total), self.products) + 1
+        rating = rng.choice([1, 2, 3, 4, 5], total, p=[0.08, 0.07, 0.15, 0.30, 0.40])
+        sentiment = np.where(rating >= 4, 'Positive', np.where(rating == 3, 'Neutral', 'Negative'))
+        comments = [REVIEW_COMMENTS[s][i % len(REVIEW_COMMENTS[s])]
+                    for s, i in zip(sentiment.tolist(), rng.integers(0, 4, total).tolist())]
+        comments = _strings(comments)
+        return pa.table({
+            'review_key': pa.array(np.arange(1, total + 1)),
+            'product_key': pa.array(self._unknown(rng, product)),
+            'review_date': pa.array(self.dates[self._sample_days(rng, total)]),
+            'reviewer_name': _join(_pick(FIRST_NAMES, rng.integers(0, len(FIRST_NAMES), total)), pa.scalar(' '),
+                                   _pick(LAST_NAMES, rng.integers(0, len(LAST_NAMES), total))),
+            'rating': pa.array(rating),
+            'comments': comments,
+            'comment_length': pc.utf8_length(comments).cast(pa.int64()),
+            'sentiment': pa.array(sentiment),
+            'loaded_at': pa.repeat(self.loaded_at, total),
+        })
+
+    # -- driver ---------------------------------------------------------------
+
+    def generate(self, tables: Optional[List[str]] = None) -> Dict[str, Any]:
+        """
+        Write the requested tables (default: all) and report rows and timings
+
+        Returns:
+            {'tables': {name: {'rows', 'seconds'}}, 'seconds', 'sales_rows_per_second', ...}
+        """
+        os.makedirs(self.out_dir, exist_ok=True)
+        small = {
+            'dim_date': self.dim_date, 'dim_product': self.dim_product, 'dim_territory': self.dim_territory,
+            'dim_salesperson': self.dim_salesperson, 'dim_employee': self.dim_employee,
+            'dim_vendor': self.dim_vendor, 'dim_location': self.dim_location,
+            'dim_ship_method': self.dim_ship_method, 'dim_scrap_reason': self.dim_scrap_reason,
+            'dim_special_offer': self.dim_special_offer, 'dim_currency': self.dim_currency,
+            'fct_product_inventory': self.fct_product_inventory,
+            'fct_product_reviews': lambda: self.fct_product_reviews(max(4, self.sales_rows // 30000)),
+        }
+        streamed = {
+            'fct_sales': lambda: self._write_parts('fct_sales', self._sales_chunks(), partition='order_year'),
+            'fct_purchases': lambda: self._write_parts(
+                'fct_purchases', self._purchase_chunks(max(1, int(self.sales_rows * 0.073))), partition='order_year'),
+            'fct_work_orders': lambda: self._write_parts(
+                'fct_work_orders', self._work_order_chunks(max(1, int(self.sales_rows * 0.6))), partition='start_year'),
+        }
+        customer_dims = ['dim_customer', 'dim_address', 'dim_credit_card']
+        wanted = tables or list(small) + customer_dims + list(streamed)
+        unknown = set(wanted) - set(small) - set(streamed) - set(customer_dims)
+        if unknown:
+            raise ValueError(f"Unknown tables: {', '.join(sorted(unknown))}")
+
+        report: Dict[str, Any] = {'out_dir': self.out_dir, 'tables': {}}
+        started = time.perf_counter()
+        for name in wanted:
+            if name in customer_dims:
+                if 'dim_customer' in report['tables']:
+                    continue
+                t0 = time.perf_counter()
+                for dim, rows in self.write_customer_dims().items():
+                    report['tables'][dim] = {'rows': rows, 'seconds': round(time.perf_counter() - t0, 3)}
+                    print(f"  {dim}: {rows:,} rows")
+                continue
+            t0 = time.perf_counter()
+            rows = streamed[name]() if name in streamed else self._write_single(name, small[name]())
+            report['tables'][name] = {'rows': rows, 'seconds': round(time.perf_counter() - t0, 3)}
+            print(f"  {name}: {rows:,} rows in {report['tables'][name]['seconds']:.1f}s")
+
+        report['seconds'] = round(time.perf_counter() - started, 3)
+        sales = report['tables'].get('fct_sales')
+        if sales and sales['seconds']:
+            report['sales_rows_per_second'] = int(sales['rows'] / sales['seconds'])
+        try:
+            import resource
+            # ru_maxrss is KiB on Linux
+            report['peak_rss_mb'] = round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+        except ImportError:
+            pass
+        return report
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Generate a synthetic Adventure Works warehouse as Parquet")
+    parser.add_argument('--out', default=None, help="Output directory (default: LOCAL_WAREHOUSE_DIR or warehouse/)")
+    parser.add_argument('--sales-rows', type=int, default=1_000_000)
+    parser.add_argument('--customers', type=int, default=None, help="Default: sales rows / 6, at most 20M")
+    parser.add_argument('--products', type=int, default=504)
+    parser.add_argument('--product-skew', type=float, default=0.8, help="Zipf exponent, 0 = uniform")
+    parser.add_argument('--customer-skew', type=float, default=0.6, help="Zipf exponent, 0 = uniform")
+    parser.add_argument('--seasonality', type=float, default=0.25, help="Monthly cycle amplitude, 0 = flat")
+    parser.add_argument('--growth', type=float, default=1.35, help="Year-over-year volume multiplier")
+    parser.add_argument('--unknown-rate', type=float, default=0.001, help="Share of fact keys set to -1")
+    parser.add_argument('--start', default='2011-01-01')
+    parser.add_argument('--end', default='2014-12-31')
+    parser.add_argument('--chunk-rows', type=int, default=500_000, help="Rows per Parquet part")
+    parser.add_argument('--tables', default=None, help="Comma-separated subset, e.g. fct_sales,dim_product")
+    parser.add_argument('--seed', type=int, default=7)
+    args = parser.parse_args(argv)
+
+    warehouse = SyntheticWarehouse(
+        args.out, sales_rows=args.sales_rows, customers=args.customers, products=args.products,
+        product_skew=args.product_skew, customer_skew=args.customer_skew, seasonality=args.seasonality,
+        growth=args.growth, unknown_rate=args.unknown_rate, start=args.start, end=args.end,
+        chunk_rows=args.chunk_rows, seed=args.seed,
+    )
+    print(f"Generating {warehouse.sales_rows:,} sales rows, {warehouse.customers:,} customers into {warehouse.out_dir}")
+    report = warehouse.generate(args.tables.split(',') if args.tables else None)
+    print(json.dumps(report, indent=2))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,338 @@
+import re
+import sys
+import json
+import time
+import argparse
+from typing import Dict, Any, List, Optional, Tuple
+
+from question_text import normalize_question
+from lookml_catalog import load_catalog
+from query_validator import limit_in_range
+
+# Measure phrases -> (explore, measure field). The measure decides the explore.
+MEASURES = {
+    'sales': ('sales_analysis', 'fct_sales.total_sales_amount'),
+    'revenue': ('sales_analysis', 'fct_sales.total_sales_amount'),
+    'sales amount': ('sales_analysis', 'fct_sales.total_sales_amount'),
+    'sales revenue': ('sales_analysis', 'fct_sales.total_sales_amount'),
+    'orders': ('sales_analysis', 'fct_sales.order_count'),
+    'order count': ('sales_analysis', 'fct_sales.order_count'),
+    'number of orders': ('sales_analysis', 'fct_sales.order_count'),
+    'average order value': ('sales_analysis', 'fct_sales.average_order_value'),
+    'aov': ('sales_analysis', 'fct_sales.average_order_value'),
+    'line items': ('sales_analysis', 'fct_sales.line_item_count'),
+    'inventory': ('inventory_analysis', 'fct_product_inventory.total_inventory'),
+    'stock': ('inventory_analysis', 'fct_product_inventory.total_inventory'),
+    'inventory level': ('inventory_analysis', 'fct_product_inventory.total_inventory'),
+    'stock level': ('inventory_analysis', 'fct_product_inventory.total_inventory'),
+    'average inventory': ('inventory_analysis', 'fct_product_inventory.average_inventory'),
+    'rating': ('product_reviews', 'fct_product_reviews.average_rating'),
+    'average rating': ('product_reviews', 'fct_product_reviews.average_rating'),
+    'product rating': ('product_reviews', 'fct_product_reviews.average_rating'),
+    'average product rating': ('product_reviews', 'fct_product_reviews.average_rating'),
+    'reviews': ('product_reviews', 'fct_product_reviews.review_count'),
+    'review count': ('product_reviews', 'fct_product_reviews.review_count'),
+    'number of reviews': ('product_reviews', 'fct_product_reviews.review_count'),
+    'purchases': ('purchasing_analysis', 'fct_purchases.total_purchase_amount'),
+    'purchase amount': ('purchasing_analysis', 'fct_purchases.total_purchase_amount'),
+    'purchasing': ('purchasing_analysis', 'fct_purchases.total_purchase_amount'),
+    'spend': ('purchasing_analysis', 'fct_purchases.total_purchase_amount'),
+    'order volume': ('purchasing_analysis', 'fct_purchases.total_order_quantity'),
+    'order volumes': ('purchasing_analysis', 'fct_purchases.total_order_quantity'),
+    'received quantity': ('purchasing_analysis', 'fct_purchases.total_received_quantity'),
+    'scrap rate': ('manufacturing_analysis', 'fct_work_orders.overall_scrap_rate'),
+    'scrap': ('manufacturing_analysis', 'fct_work_orders.total_scrapped_quantity'),
+    'scrapped quantity': ('manufacturing_analysis', 'fct_work_orders.total_scrapped_quantity'),
+    'work orders': ('manufacturing_analysis', 'fct_work_orders.work_order_count'),
+    'production': ('manufacturing_analysis', 'fct_work_orders.total_order_quantity'),
+}
+
+# Dimension phrases -> dimension field
+DIMENSIONS = {
+    'category': 'dim_product.category_name',
+    'product category': 'dim_product.category_name',
+    'subcategory': 'dim_product.subcategory_name',
+    'product subcategory': 'dim_product.subcategory_name',
+    'product': 'dim_product.product_name',
+    'customer': 'dim_customer.customer_name',
+    'customer type': 'dim_customer.customer_type',
+    'territory': 'dim_territory.territory_name',
+    'region': 'dim_territory.territory_name',
+    'country': 'dim_territory.country_name',
+    'year': 'dim_date_order.year',
+    'quarter': 'dim_date_order.quarter',
+    'month': 'dim_date_order.month_name',
+    'salesperson': 'dim_salesperson.salesperson_name',
+    'sales rep': 'dim_salesperson.salesperson_name',
+    'vendor': 'dim_vendor.vendor_name',
+    'supplier': 'dim_vendor.vendor_name',
+    'employee': 'dim_employee.full_name',
+    'location': 'dim_location.location_name',
+    'warehouse': 'dim_location.location_name',
+    'stock status': 'fct_product_inventory.stock_status',
+    'sentiment': 'fct_product_reviews.sentiment',
+    'scrap reason': 'dim_scrap_reason.scrap_reason_name',
+}
+
+# Plurals that don't just drop a trailing "s"
+PLURALS = {
+    'categories': 'category', 'subcategories': 'subcategory', 'territories': 'territory',
+    'countries': 'country', 'salespeople': 'salesperson', 'sales reps': 'sales rep',
+    'sales people': 'salesperson', 'sales persons': 'salesperson',
+}
+
+# Filter values the templates recognize, longest first when matching
+FILTER_VALUES = {
+    'dim_product.subcategory_name': [
+        'Mountain Bikes', 'Road Bikes', 'Touring Bikes', 'Helmets', 'Jerseys', 'Gloves',
+        'Socks', 'Shorts', 'Caps', 'Vests', 'Tights', 'Bib-Shorts', 'Bottles and Cages',
+        'Hydration Packs', 'Fenders', 'Lights', 'Locks', 'Pumps', 'Tires and Tubes',
+        'Bike Racks', 'Bike Stands', 'Cleaners', 'Panniers', 'Handlebars', 'Wheels',
+        'Saddles', 'Pedals', 'Chains', 'Cranksets', 'Derailleurs', 'Brakes', 'Forks',
+        'Mountain Frames', 'Road Frames', 'Touring Frames', 'Headsets', 'Bottom Brackets',
+    ],
+    'dim_product.category_name': ['Bikes', 'Components', 'Clothing', 'Accessories'],
+    'dim_territory.territory_name': [
+        'Northwest', 'Northeast', 'Central', 'Southwest', 'Southeast',
+        'Canada', 'France', 'Germany', 'Australia', 'United Kingdom',
+    ],
+}
+
+# Sample data covers 2011-2014, so "last year" is the latest full year (as in the prompt examples)
+LAST_YEAR = '2014'
+
+# Leading filler that carries no query meaning
+LEADING_FILLER = {
+    'show', 'me', 'what', 'whats', 'were', 'was', 'is', 'are', 'the', 'our', 'give', 'list',
+    'tell', 'please', 'can', 'you', 'i', 'want', 'to', 'see', 'get', 'display', 'find',
+}
+
+TOP_N = re.compile(r'^(?P<direction>top|best|highest|bottom|worst|lowest) (?P<n>\d+) (?P<entity>.+?) by (?P<measure>.+)$')
+WHICH_HAS = re.compile(r'^which (?P<entity>.+?) (?:has|had|have) (?:the )?(?P<direction>highest|most|best|lowest|least|worst) (?P<measure>.+)$')
+MEASURE_BY = re.compile(r'^(?P<measure>.+?) by (?P<dimension>.+?)(?: (?:for|in) (?P<year>20\d{2}))?$')
+MEASURE_FOR = re.compile(r'^(?P<measure>.+?) (?:for|of) (?P<value>.+?)(?: (?P<period>last year|(?:for |in )?20\d{2}))?$')
+
+ASCENDING = {'bottom', 'worst', 'lowest', 'least'}
+
+
+def _strip_filler(text: str) -> str:
+    words = text.split()
+    while words and words[0] in LEADING_FILLER:
+        words.pop(0)
+    return ' '.join(words)
+
+
+def resolve_measure(phrase: str) -> Optional[Tuple[str, str]]:
+    """Map a measure phrase to (explore, field), ignoring 'total'/'current'/'levels' padding"""
+    words = [w for w in phrase.split() if w not in ('total', 'current', 'the', 'our', 'overall')]
+    phrase = ' '.join(words)
+    if phrase.endswith(' levels'):
+        phrase = phrase[:-1]
+    return MEASURES.get(phrase)
+
+
+def resolve_dimension(phrase: str) -> Optional[str]:
+    """Map a dimension phrase (singular or plural) to a field"""
+    phrase = phrase.strip()
+    if phrase.startswith('each '):
+        phrase = phrase[5:]
+    phrase = PLURALS.get(phrase, phrase)
+    if phrase in DIMENSIONS:
+        return DIMENSIONS[phrase]
+    if phrase.endswith('s') and phrase[:-1] in DIMENSIONS:
+        return DIMENSIONS[phrase[:-1]]
+    return None
+
+
+def resolve_value(phrase: str) -> Optional[Tuple[str, str]]:
+    """Map a phrase like 'road bikes' to (filter field, canonical value)"""
+    for field, values in FILTER_VALUES.items():
+        for value in values:
+            if normalize_question(value) == phrase:
+                return field, value
+    return None
+
+
+def _default_limit(dimension: str) -> int:
+    if dimension.endswith('.month_name'):
+        return 12
+    if dimension.endswith('.quarter'):
+        return 4
+    return 10
+
+
+def _query(explore: str, dimension: str, measure: str, filters: Dict[str, str],
+           limit: int, ascending: bool = False) -> Dict[str, Any]:
+    return {
+        'explore': explore,
+        'dimensions': [dimension],
+        'measures': [measure],
+        'filters': filters,
+        'sorts': [f"{measure} {'asc' if ascending else 'desc'}"],
+        'limit': limit
+    }
+
+
+class TemplateTranslator:
+    """
+    Rule-based translator for the common question shapes
+
+    Recognizes "top N <entity> by <measure>", "which <entity> has the highest
+    <measure>", "<measure> by <dimension> [for <year>]" and "<measure> for
+    <value> [last year | <year>]" against the explores' field catalog. Returns
+    None unless every slot resolves and the dimension is reachable from the
+    measure's explore in the compiled LookML catalog, so anything uncertain
+    still goes to Gemini.
+    """
+
+    def __init__(self, catalog: Optional[Dict[str, Any]] = None):
+        self.catalog = catalog if catalog is not None else load_catalog()
+
+    def _reachable(self, explore: str, field: str) -> bool:
+        return field in self.catalog['explores'].get(explore, {}).get('fields', {})
+
+    def translate(self, question: str) -> Optional[Dict[str, Any]]:
+        match = self.match(question)
+        return match[1] if match else None
+
+    def match(self, question: str) -> Optional[Tuple[str, Dict[str, Any]]]:
+        """Return (template name, query) for a confident match, else None"""
+        text = _strip_filler(normalize_question(question))
+
+        m = TOP_N.match(text)
+        if m:
+            # "Top 0" or "top 5000000" is left to the model (and the validator's limit repair)
+            if not limit_in_range(int(m.group('n'))):
+                return None
+            return self._ranked('top_n', m, int(m.group('n')))
+
+        m = WHICH_HAS.match(text)
+        if m:
+            return self._ranked('which_has', m, 1)
+
+        m = MEASURE_BY.match(text)
+        if m:
+            resolved = resolve_measure(m.group('measure'))
+            dimension = resolve_dimension(m.group('dimension'))
+            if not resolved or not dimension:
+                return None
+            explore, measure = resolved
+            if not self._reachable(explore, dimension):
+                return None
+            filters = {}
+            if m.group('year'):
+                if not self._reachable(explore, 'dim_date_order.year'):
+                    return None
+                filters['dim_date_order.year'] = m.group('year')
+            return 'measure_by', _query(explore, dimension, measure, filters, _default_limit(dimension))
+
+        m = MEASURE_FOR.match(text)
+        if m:
+            resolved = resolve_measure(m.group('measure'))
+            value = resolve_value(m.group('value'))
+            if not resolved or not value:
+                return None
+            explore, measure = resolved
+            field, canonical = value
+            if not self._reachable(explore, field):
+                return None
+            filters = {field: canonical}
+            period = m.group('period')
+            if period:
+                if not self._reachable(explore, 'dim_date_order.year'):
+                    return None
+                filters['dim_date_order.year'] = LAST_YEAR if period == 'last year' else period.split()[-1]
+            return 'measure_for', _query(explore, field, measure, filters, 10)
+
+        return None
+
+    def _ranked(self, name: str, m, limit: int) -> Optional[Tuple[str, Dict[str, Any]]]:
+        resolved = resolve_measure(m.group('measure'))
+        dimension = resolve_dimension(m.group('entity'))
+        if not resolved or not dimension:
+            return None
+        explore, measure = resolved
+        if not self._reachable(explore, dimension):
+            return None
+        ascending = m.group('direction') in ASCENDING
+        # "Which vendors have the most ..." asks for a ranking, not a single winner
+        if name == 'which_has' and resolve_dimension(m.group('entity')) and m.group('entity') not in DIMENSIONS:
+            limit = 10
+        return name, _query(explore, dimension, measure, {}, limit, ascending)
+
+
+def _read_questions(path: str) -> List[Dict[str, Any]]:
+    """Read a JSONL corpus/log ({question, [query]}) or a plain list of questions"""
+    rows = []
+    stream = sys.stdin if path == '-' else open(path, 'r')
+    with stream:
+        for line in stream:
+            line = line.strip()
+            if not line:
+                continue
+            if line.startswith('{'):
+                rows.append(json.loads(line))
+            else:
+                rows.append({'question': line})
+    return rows
+
+
+def coverage_report(rows: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Share of questions handled locally, per template, plus precision where labelled
+
+    Rows with a "query" key are checked against the template output; a null
+    query marks a question the templates must leave to Gemini. Labelled
+    questions the templates skip are not errors, they just go to Gemini.
+    """
+    from question_index import same_query
+
+    translator = TemplateTranslator()
+    per_template: Dict[str, int] = {}
+    handled = checked = correct = 0
+    wrong, unmatched = [], []
+    start = time.perf_counter()
+    for row in rows:
+        match = translator.match(row['question'])
+        if match is None:
+            unmatched.append(row['question'])
+            continue
+        handled += 1
+        per_template[match[0]] = per_template.get(match[0], 0) + 1
+        if 'query' not in row:
+            continue
+        checked += 1
+        if row['query'] is not None and same_query(match[1], row['query']):
+            correct += 1
+        else:
+            wrong.append(row['question'])
+    elapsed = time.perf_counter() - start
+
+    return {
+        'questions': len(rows),
+        'handled_locally': handled,
+        'coverage': handled / len(rows) if rows else 0.0,
+        'per_template': per_template,
+        'labelled_handled': checked,
+        'precision': correct / checked if checked else None,
+        'wrong': wrong,
+        'avg_latency_us': elapsed / len(rows) * 1e6 if rows else 0.0,
+        'unmatched_sample': unmatched[:20],
+    }
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Template translator coverage report")
+    parser.add_argument('paths', nargs='+', help="Question log / labelled corpus (JSONL) or plain text, '-' for stdin")
+    args = parser.parse_args(argv)
+
+    rows = []
+    for path in args.paths:
+        rows.extend(_read_questions(path))
+    report = coverage_report(rows)
+    print(json.dumps(report, indent=2))
+    return 0 if not report['wrong'] else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,317 @@
+"""
+Per-question tracing spans on a monotonic clock, exported as JSONL and Prometheus text
+
+app.py starts one Trace per question; code further down the call stack
+(GeminiClient, LookerClient, LocalWarehouseClient) opens nested spans and
+sets flags through the module-level span()/annotate() helpers, which do
+nothing when no trace is active on the current thread. Finished traces are
+appended to TRACE_LOG_PATH and folded into per-span histograms in
+METRICS_PATH for a Prometheus textfile collector.
+
+    python tracing.py .traces.jsonl        # p50/p95 per span from a trace log
+"""
+import os
+import sys
+import json
+import time
+import uuid
+import argparse
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Dict, Any, List, Optional
+
+# Histogram buckets in seconds: cache hits are sub-millisecond, Gemini and Looker take seconds
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+_local = threading.local()
+
+
+class Span:
+    """One timed stage; offsets are relative to the start of its trace"""
+
+    def __init__(self, name: str, parent: Optional[str], start: float, attrs: Dict[str, Any]):
+        self.name = name
+        self.parent = parent
+        self.start = start
+        self.end: Optional[float] = None
+        self.attrs = attrs
+
+    @property
+    def duration_ms(self) -> float:
+        return ((self.end if self.end is not None else time.perf_counter()) - self.start) * 1000
+
+
+class Trace:
+    """The spans recorded while answering one question"""
+
+    def __init__(self, name: str, **attrs):
+        self.id = uuid.uuid4().hex[:16]
+        self.name = name
+        self.started_at = datetime.now().isoformat(timespec='milliseconds')
+        self.attrs = attrs
+        self.spans: List[Span] = []
+        self.exported = False
+        self._t0 = time.perf_counter()
+        self._stack: List[Span] = []
+
+    @contextmanager
+    def span(self, name: str, **attrs):
+        """Time a stage; nested spans record the enclosing span as parent"""
+        span = Span(name, self._stack[-1].name if self._stack else None, time.perf_counter(), attrs)
+        self.spans.append(span)
+        self._stack.append(span)
+        try:
+            yield span
+        except BaseException as e:
+            span.attrs['error'] = type(e).__name__
+            raise
+        finally:
+            span.end = time.perf_counter()
+            self._stack.pop()
+
+    def record(self, name: str, start: float, end: float, **attrs) -> Span:
+        """Add an already-finished stage (perf_counter timestamps), e.g. time spent queued"""
+        span = Span(name, self._stack[-1].name if self._stack else None, start, attrs)
+        span.end = end
+        self.spans.append(span)
+        return span
+
+    def annotate(self, **attrs) -> None:
+        """Set flags on the innermost open span, or on the trace itself outside any span"""
+        (self._stack[-1].attrs if self._stack else self.attrs).update(attrs)
+
+    def total_ms(self) -> float:
+        """From the trace start to the end of its last span"""
+        ends = [(span.end if span.end is not None else time.perf_counter()) - self._t0 for span in self.spans]
+        return max(ends, default=0.0) * 1000
+
+    def flags(self) -> Dict[str, Any]:
+        """Every span attribute merged, later spans winning, plus the trace's own"""
+        merged: Dict[str, Any] = {}
+        for span in self.spans:
+            merged.update(span.attrs)
+        merged.update(self.attrs)
+        return merged
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'trace_id': self.id,
+            'name': self.name,
+            'started_at': self.started_at,
+            'total_ms': round(self.total_ms(), 3),
+            'attrs': self.attrs,
+            'spans': [{
+                'name': span.name,
+                'parent': span.parent,
+                'offset_ms': round((span.start - self._t0) * 1000, 3),
+                'duration_ms': round(span.duration_ms, 3),
+                **({'attrs': span.attrs} if span.attrs else {}),
+            } for span in self.spans],
+        }
+
+
+def start_trace(name: str, **attrs) -> Trace:
+    """Begin a trace and make it current for this thread"""
+    trace = Trace(name, **attrs)
+    _local.trace = trace
+    return trace
+
+
+def current_trace() -> Optional[Trace]:
+    return getattr(_local, 'trace', None)
+
+
+def attach(trace: Optional[Trace]) -> None:
+    """Make an existing trace current on this thread, e.g. a pool worker running for its caller"""
+    _local.trace = trace
+
+
+def detach() -> None:
+    """Stop attaching spans on this thread (the trace object stays usable)"""
+    _local.trace = None
+
+
+@contextmanager
+def span(name: str, **attrs):
+    """Span on the current thread's trace, or a no-op when none is active"""
+    trace = current_trace()
+    if trace is None:
+        yield None
+        return
+    with trace.span(name, **attrs) as current:
+        yield current
+
+
+def annotate(**attrs) -> None:
+    trace = current_trace()
+    if trace is not None:
+        trace.annotate(**attrs)
+
+
+def percentile(values: List[float], pct: float) -> float:
+    """Nearest-rank percentile (0-100) of values, 0.0 when there are none"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+def span_rows(record: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Display rows for a trace dict: nested span names indented under their parent"""
+    depth: Dict[str, int] = {}
+    rows = []
+    for span in record['spans']:
+        level = depth.get(span['parent'], -1) + 1 if span['parent'] else 0
+        depth[span['name']] = level
+        rows.append({
+            'span': '\u2003' * level + span['name'],  # em spaces survive table rendering
+            'start (ms)': round(span['offset_ms'], 1),
+            'duration (ms)': round(span['duration_ms'], 1),
+            'flags': ', '.join(f"{key}={value}" for key, value in span.get('attrs', {}).items()),
+        })
+    return rows
+
+
+class TraceExporter:
+    """
+    Appends finished traces to a JSONL log and rewrites a Prometheus text file
+
+    Metrics (all cumulative for the process):
+    - aw_span_duration_seconds{span}: histogram per span name
+    - aw_span_flag_total{span, flag}: spans that carried a true flag (cache_hit, mock_fallback, ...)
+    - aw_translation_source_total{source}: how questions were translated
+    - aw_cache_lookups_total{span, explore, result}: result cache hits and misses per explore
+    - aw_requests_total{status}: finished traces by outcome
+    """
+
+    def __init__(self, jsonl_path: Optional[str] = None, metrics_path: Optional[str] = None,
+                 buckets=DEFAULT_BUCKETS):
+        self.jsonl_path = jsonl_path
+        self.metrics_path = metrics_path
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        self._histograms: Dict[str, Dict[str, Any]] = {}
+        self._flags: Dict[tuple, int] = {}
+        self._sources: Dict[str, int] = {}
+        self._cache_lookups: Dict[tuple, int] = {}
+        self._requests: Dict[str, int] = {}
+
+    def export(self, trace: Trace, status: str = 'ok') -> None:
+        """Record a finished trace once; later calls for the same trace are ignored"""
+        with self._lock:
+            if trace.exported:
+                return
+            trace.exported = True
+            record = trace.to_dict()
+            record['status'] = status
+            for span in record['spans']:
+                self._observe(span['name'], span['duration_ms'] / 1000)
+                for flag, value in span.get('attrs', {}).items():
+                    if value is True:
+                        key = (span['name'], flag)
+                        self._flags[key] = self._flags.get(key, 0) + 1
+                    elif flag == 'source':
+                        self._sources[value] = self._sources.get(value, 0) + 1
+                attrs = span.get('attrs', {})
+                if 'cache_hit' in attrs and attrs.get('explore'):
+                    key = (span['name'], attrs['explore'], 'hit' if attrs['cache_hit'] else 'miss')
+                    self._cache_lookups[key] = self._cache_lookups.get(key, 0) + 1
+            self._requests[status] = self._requests.get(status, 0) + 1
+            self._append(record)
+            self._write_metrics()
+
+    def _observe(self, name: str, seconds: float) -> None:
+        histogram = self._histograms.setdefault(name, {'buckets': [0] * len(self.buckets), 'sum': 0.0, 'count': 0})
+        for i, bound in enumerate(self.buckets):
+            if seconds <= bound:
+                histogram['buckets'][i] += 1
+        histogram['sum'] += seconds
+        histogram['count'] += 1
+
+    def _append(self, record: Dict[str, Any]) -> None:
+        if not self.jsonl_path:
+            return
+        try:
+            with open(self.jsonl_path, 'a') as f:
+                f.write(json.dumps(record, default=str) + '\n')
+        except OSError as e:
+            print(f"Trace log write failed: {str(e)}")
+
+    def render_metrics(self) -> str:
+        lines = [
+            '# HELP aw_span_duration_seconds Duration of request-path spans',
+            '# TYPE aw_span_duration_seconds histogram',
+        ]
+        for name in sorted(self._histograms):
+            histogram = self._histograms[name]
+            for bound, count in zip(self.buckets, histogram['buckets']):
+                lines.append(f'aw_span_duration_seconds_bucket{{span="{name}",le="{bound}"}} {count}')
+            lines.append(f'aw_span_duration_seconds_bucket{{span="{name}",le="+Inf"}} {histogram["count"]}')
+            lines.append(f'aw_span_duration_seconds_sum{{span="{name}"}} {histogram["sum"]:.6f}')
+            lines.append(f'aw_span_duration_seconds_count{{span="{name}"}} {histogram["count"]}')
+        lines += ['# HELP aw_span_flag_total Spans that carried a flag such as cache_hit or mock_fallback',
+                  '# TYPE aw_span_flag_total counter']
+        for (name, flag), count in sorted(self._flags.items()):
+            lines.append(f'aw_span_flag_total{{span="{name}",flag="{flag}"}} {count}')
+        lines += ['# HELP aw_translation_source_total Questions by translation path',
+                  '# TYPE aw_translation_source_total counter']
+        for source, count in sorted(self._sources.items()):
+            lines.append(f'aw_translation_source_total{{source="{source}"}} {count}')
+        lines += ['# HELP aw_cache_lookups_total Result cache lookups by explore',
+                  '# TYPE aw_cache_lookups_total counter']
+        for (name, explore, result), count in sorted(self._cache_lookups.items()):
+            lines.append(f'aw_cache_lookups_total{{span="{name}",explore="{explore}",result="{result}"}} {count}')
+        lines += ['# HELP aw_requests_total Questions answered, by outcome',
+                  '# TYPE aw_requests_total counter']
+        for status, count in sorted(self._requests.items()):
+            lines.append(f'aw_requests_total{{status="{status}"}} {count}')
+        return '\n'.join(lines) + '\n'
+
+    def _write_metrics(self) -> None:
+        if not self.metrics_path:
+            return
+        # Atomic replace so a scraping collector never reads a half-written file
+        tmp_path = f"{self.metrics_path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp_path, 'w') as f:
+                f.write(self.render_metrics())
+            os.replace(tmp_path, self.metrics_path)
+        except OSError as e:
+            print(f"Metrics file write failed: {str(e)}")
+
+
+# Process-wide exporter shared by every Streamlit session
+exporter = TraceExporter(
+    jsonl_path=os.getenv('TRACE_LOG_PATH', os.path.join(os.path.dirname(os.path.abspath(__file__)), '.traces.jsonl')),
+    metrics_path=os.getenv('METRICS_PATH', os.path.join(os.path.dirname(os.path.abspath(__file__)), '.metrics.prom')),
+)
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Summarize span durations from a trace log")
+    parser.add_argument('path', help="JSONL written by TraceExporter")
+    args = parser.parse_args(argv)
+
+    durations: Dict[str, List[float]] = {}
+    traces = 0
+    with open(args.path, 'r') as f:
+        for line in f:
+            if not line.strip():
+                continue
+            traces += 1
+            for span in json.loads(line)['spans']:
+                durations.setdefault(span['name'], []).append(span['duration_ms'])
+
+    print(f"{traces} traces")
+    print(f"{'span':<28} {'count':>6} {'p50 ms':>9} {'p95 ms':>9} {'max ms':>9}")
+    for name, values in sorted(durations.items(), key=lambda item: -sum(item[1])):
+        values.sort()
+        p50 = values[len(values) // 2]
+        p95 = values[min(len(values) - 1, int(len(values) * 0.95))]
+        print(f"{name:<28} {len(values):>6} {p50:>9.1f} {p95:>9.1f} {values[-1]:>9.1f}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())